@@ -25,7 +25,7 @@ mkdir -p /tmp/polypaint-deploy
 
 # Cross-compile binaries for ARM64 Linux (Graviton)
 echo "Compiling sweep..."
-aarch64-linux-musl-gcc -O3 -static -o lambda/sweep lambda/sweep_cli.c -lm
+aarch64-linux-musl-gcc -O3 -static -o lambda/sweep lambda/sweep_cli.c -lm -lpthread
 echo "Compiling lores_viewport..."
 aarch64-linux-musl-gcc -O3 -static -o lambda/lores_viewport lambda/lores_viewport.c -lm
 
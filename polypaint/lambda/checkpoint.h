@@ -0,0 +1,135 @@
+/*
+ * checkpoint: resumable state for sweep's long runs.  Included by
+ * sweep_cli.c.
+ *
+ * A checkpoint sits next to the output as <output>.ckpt:
+ *   "PPCK", uint32 version, uint64 fingerprint, uint64 payload_bytes,
+ *   payload, uint64 FNV-1a of the payload
+ * The payload is whatever the mode appends with ckptPut (loop index, warm
+ * roots, RNG state, output offset) and reads back in the same order with
+ * ckptGet.  The fingerprint hashes the settings that shape the output, so
+ * a checkpoint left by a different spec is ignored rather than resumed.
+ *
+ * ckptWrite is atomic: the file is written to <output>.ckpt.tmp, synced
+ * and renamed over the old checkpoint, so a kill at any point leaves
+ * either the previous checkpoint or the new one.  Callers sync the output
+ * data it describes first.
+ *
+ * Needs <stdio.h>, <stdlib.h>, <string.h>, <stdint.h>, <fcntl.h> and
+ * <unistd.h> from the including file.
+ */
+
+#define CKPT_MAGIC "PPCK"
+#define CKPT_VERSION 1
+#define CKPT_HEADER_BYTES 24
+
+#define FNV_OFFSET 0xcbf29ce484222325ULL
+#define FNV_PRIME 0x100000001b3ULL
+
+static uint64_t ckptHash(uint64_t h, const void *p, size_t n) {
+    const unsigned char *b = p;
+    for (size_t i = 0; i < n; i++) {
+        h ^= b[i];
+        h *= FNV_PRIME;
+    }
+    return h;
+}
+
+/* Growable payload */
+typedef struct {
+    unsigned char *data;
+    size_t n, cap;
+} CkptBuf;
+
+static int ckptPut(CkptBuf *b, const void *p, size_t n) {
+    if (b->n + n > b->cap) {
+        size_t cap = b->cap ? b->cap : 4096;
+        while (cap < b->n + n) cap *= 2;
+        unsigned char *grown = realloc(b->data, cap);
+        if (!grown) return -1;
+        b->data = grown;
+        b->cap = cap;
+    }
+    memcpy(b->data + b->n, p, n);
+    b->n += n;
+    return 0;
+}
+
+/* Read n bytes at *p; -1 past the end of the payload */
+static int ckptGet(const unsigned char **p, const unsigned char *end, void *out, size_t n) {
+    if ((size_t)(end - *p) < n) return -1;
+    memcpy(out, *p, n);
+    *p += n;
+    return 0;
+}
+
+static void ckptPath(char *out, size_t cap, const char *outPath, const char *suffix) {
+    snprintf(out, cap, "%s.ckpt%s", outPath, suffix);
+}
+
+static int ckptWrite(const char *outPath, uint64_t fingerprint, const CkptBuf *b) {
+    char tmp[1100], path[1100];
+    ckptPath(tmp, sizeof tmp, outPath, ".tmp");
+    ckptPath(path, sizeof path, outPath, "");
+
+    unsigned char hdr[CKPT_HEADER_BYTES];
+    uint32_t version = CKPT_VERSION;
+    uint64_t payloadBytes = b->n, sum = ckptHash(FNV_OFFSET, b->data, b->n);
+    memcpy(hdr, CKPT_MAGIC, 4);
+    memcpy(hdr + 4, &version, 4);
+    memcpy(hdr + 8, &fingerprint, 8);
+    memcpy(hdr + 16, &payloadBytes, 8);
+
+    int fd = open(tmp, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0) return -1;
+    int ok = write(fd, hdr, sizeof hdr) == (ssize_t)sizeof hdr &&
+             write(fd, b->data, b->n) == (ssize_t)b->n &&
+             write(fd, &sum, 8) == 8 &&
+             fsync(fd) == 0;
+    ok = close(fd) == 0 && ok;
+    if (!ok || rename(tmp, path) != 0) {
+        unlink(tmp);
+        return -1;
+    }
+    return 0;
+}
+
+/* The payload of a valid checkpoint for this fingerprint (malloc'd, *n
+ * bytes), or NULL if there is none */
+static unsigned char *ckptRead(const char *outPath, uint64_t fingerprint, size_t *n) {
+    char path[1100];
+    ckptPath(path, sizeof path, outPath, "");
+    FILE *f = fopen(path, "rb");
+    if (!f) return NULL;
+
+    unsigned char hdr[CKPT_HEADER_BYTES];
+    uint32_t version;
+    uint64_t fp, payloadBytes, sum;
+    unsigned char *data = NULL;
+    if (fread(hdr, 1, sizeof hdr, f) != sizeof hdr || memcmp(hdr, CKPT_MAGIC, 4) != 0)
+        goto bad;
+    memcpy(&version, hdr + 4, 4);
+    memcpy(&fp, hdr + 8, 8);
+    memcpy(&payloadBytes, hdr + 16, 8);
+    if (version != CKPT_VERSION || fp != fingerprint || payloadBytes > (1ULL << 40))
+        goto bad;
+    data = malloc(payloadBytes ? payloadBytes : 1);
+    if (!data || fread(data, 1, payloadBytes, f) != payloadBytes ||
+        fread(&sum, 8, 1, f) != 1 || sum != ckptHash(FNV_OFFSET, data, payloadBytes))
+        goto bad;
+    fclose(f);
+    *n = payloadBytes;
+    return data;
+
+bad:
+    fprintf(stderr, "Ignoring checkpoint %s (stale or damaged)\n", path);
+    free(data);
+    fclose(f);
+    return NULL;
+}
+
+static void ckptRemove(const char *outPath) {
+    char path[1100];
+    ckptPath(path, sizeof path, outPath, "");
+    unlink(path);
+}
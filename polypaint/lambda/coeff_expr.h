@@ -0,0 +1,542 @@
+/*
+ * coeff_expr: coefficient families written as expressions instead of
+ * hand-written C functions.  Included by sweep_cli.c and lores_viewport.c,
+ * so a new family needs neither a rebuild nor a lookupFunction entry.
+ *
+ * A program is a ';'-separated list of statements over x1, x2 in [0, 1):
+ *   name = expr        bind a temporary (may be rebound)
+ *   c[j] = expr        set coefficient j (0 = highest power)
+ *   c[a..b] = expr     set coefficients a..b; k is the index inside expr
+ *   reverse            reverse the coefficient order (the rev_ twins)
+ * The polynomial has (highest assigned j) + 1 coefficients; unassigned
+ * ones are zero.  Expressions have + - * / ^, unary minus, parentheses,
+ * numbers with an optional i suffix (100i), the constants i, pi and e, and
+ * exp, log, sqrt, sin, cos, tan, sinh, cosh, conj, re, im, abs and arg.
+ * z^n with a constant integer n compiles to repeated squaring.
+ *
+ * giga_5, for example:
+ *   t1 = exp(2i*pi*x1); t2 = exp(2i*pi*x2);
+ *   c[0] = 1; c[4] = 4; c[12] = 4; c[19] = -9; c[20] = -1.9; c[24] = 0.2;
+ *   c[6] = 100i*(t2^3 + t2^2 - t2 - 1);
+ *   c[8] = 100i*(t1^3 + t1^2 + t2 - 1);
+ *   c[14] = 100i*(t2^3 - t2^2 + t2 - 1);
+ *   c[25] = 0
+ *
+ * exprCompile turns a program into register bytecode once, at startup:
+ * every op writes its own register, constant subexpressions are folded,
+ * identical ops share one register, and ops that do not depend on x2 are
+ * marked uniform.  exprEval then evaluates up to EXPR_BATCH x2 values of
+ * one row at a time: each op is a loop over the batch, and uniform ops run
+ * once per batch instead of once per point.
+ *
+ * Needs MAX_COEFFS and M_PI from the including file.
+ */
+
+#define EXPR_BATCH 64
+#define EXPR_MAX_OPS 16384
+#define EXPR_MAX_NAMES 256
+#define EXPR_MAX_POWI 64
+
+enum {
+    XOP_CONST, XOP_X1, XOP_X2,
+    XOP_ADD, XOP_SUB, XOP_MUL, XOP_DIV, XOP_NEG, XOP_POWI, XOP_POW,
+    XOP_EXP, XOP_LOG, XOP_SQRT, XOP_SIN, XOP_COS, XOP_TAN, XOP_SINH, XOP_COSH,
+    XOP_CONJ, XOP_RE, XOP_IM, XOP_ABS, XOP_ARG
+};
+
+static const struct { const char *name; int op; } exprFuncs[] = {
+    {"exp", XOP_EXP}, {"log", XOP_LOG}, {"sqrt", XOP_SQRT},
+    {"sin", XOP_SIN}, {"cos", XOP_COS}, {"tan", XOP_TAN},
+    {"sinh", XOP_SINH}, {"cosh", XOP_COSH}, {"conj", XOP_CONJ},
+    {"re", XOP_RE}, {"im", XOP_IM}, {"abs", XOP_ABS}, {"arg", XOP_ARG},
+};
+
+/* One op; its result lives in the register with the op's own index. */
+typedef struct {
+    int op, a, b, n;      /* a, b: operand registers (-1 = unused); n: POWI exponent */
+    double re, im;        /* XOP_CONST value */
+    int uniform;          /* independent of x2 */
+} ExprOp;
+
+typedef struct {
+    ExprOp *ops;
+    int nOps;
+    int *exec;            /* live non-constant ops, in program order */
+    int nExec;
+    int coeffReg[MAX_COEFFS];  /* register per coefficient, -1 = zero */
+    int nCoeffs;
+    int reverse;
+} ExprProg;
+
+/* Per-thread register file: re/im[reg * EXPR_BATCH + lane]. */
+typedef struct {
+    const ExprProg *prog;
+    double *re, *im;
+} ExprState;
+
+/* ---- Complex arithmetic on one lane ---- */
+
+static void exprApply(const ExprOp *o, double aR, double aI, double bR, double bI,
+                      double *outR, double *outI)
+{
+    double r = 0, i = 0;
+    switch (o->op) {
+    case XOP_ADD: r = aR + bR; i = aI + bI; break;
+    case XOP_SUB: r = aR - bR; i = aI - bI; break;
+    case XOP_MUL: r = aR * bR - aI * bI; i = aR * bI + aI * bR; break;
+    case XOP_DIV: {
+        double d = bR * bR + bI * bI;
+        r = (aR * bR + aI * bI) / d;
+        i = (aI * bR - aR * bI) / d;
+        break;
+    }
+    case XOP_NEG: r = -aR; i = -aI; break;
+    case XOP_POWI: {
+        /* Repeated squaring; a negative exponent inverts at the end */
+        int n = o->n < 0 ? -o->n : o->n;
+        double pR = aR, pI = aI;
+        r = 1; i = 0;
+        while (n) {
+            if (n & 1) { double t = r * pR - i * pI; i = r * pI + i * pR; r = t; }
+            double t = pR * pR - pI * pI; pI = 2 * pR * pI; pR = t;
+            n >>= 1;
+        }
+        if (o->n < 0) { double d = r * r + i * i; r = r / d; i = -i / d; }
+        break;
+    }
+    case XOP_POW: {
+        /* a^b = exp(b log a) */
+        if (aR == 0 && aI == 0) break;
+        double lR = log(hypot(aR, aI)), lI = atan2(aI, aR);
+        double eR = bR * lR - bI * lI, eI = bR * lI + bI * lR;
+        double m = exp(eR);
+        r = m * cos(eI); i = m * sin(eI);
+        break;
+    }
+    case XOP_EXP: { double m = exp(aR); r = m * cos(aI); i = m * sin(aI); break; }
+    case XOP_LOG: r = log(hypot(aR, aI)); i = atan2(aI, aR); break;
+    case XOP_SQRT: {
+        double m = hypot(aR, aI);
+        r = sqrt((m + aR) / 2);
+        i = sqrt((m - aR) / 2);
+        if (aI < 0) i = -i;
+        break;
+    }
+    case XOP_SIN: r = sin(aR) * cosh(aI); i = cos(aR) * sinh(aI); break;
+    case XOP_COS: r = cos(aR) * cosh(aI); i = -sin(aR) * sinh(aI); break;
+    case XOP_TAN: {
+        double sR = sin(aR) * cosh(aI), sI = cos(aR) * sinh(aI);
+        double cR = cos(aR) * cosh(aI), cI = -sin(aR) * sinh(aI);
+        double d = cR * cR + cI * cI;
+        r = (sR * cR + sI * cI) / d;
+        i = (sI * cR - sR * cI) / d;
+        break;
+    }
+    case XOP_SINH: r = sinh(aR) * cos(aI); i = cosh(aR) * sin(aI); break;
+    case XOP_COSH: r = cosh(aR) * cos(aI); i = sinh(aR) * sin(aI); break;
+    case XOP_CONJ: r = aR; i = -aI; break;
+    case XOP_RE: r = aR; break;
+    case XOP_IM: r = aI; break;
+    case XOP_ABS: r = hypot(aR, aI); break;
+    case XOP_ARG: r = atan2(aI, aR); break;
+    }
+    *outR = r;
+    *outI = i;
+}
+
+/* ---- Compiler ---- */
+
+typedef struct {
+    const char *p;
+    ExprProg *prog;
+    char names[EXPR_MAX_NAMES][32];
+    int nameReg[EXPR_MAX_NAMES];
+    int nNames;
+    int k, haveK;         /* index while unrolling c[a..b] */
+    char *err;
+    int errLen;
+} ExprParser;
+
+static int exprFail(ExprParser *ps, const char *msg) {
+    if (!ps->err[0])
+        snprintf(ps->err, ps->errLen, "%s at \"%.20s\"", msg, ps->p);
+    return -1;
+}
+
+static void exprSkip(ExprParser *ps) {
+    while (*ps->p == ' ' || *ps->p == '\t' || *ps->p == '\n' || *ps->p == '\r')
+        ps->p++;
+}
+
+static int exprIsIdent(char c, int first) {
+    return (c >= 'a' && c <= 'z') || (c >= 'A' && c <= 'Z') || c == '_' ||
+           (!first && c >= '0' && c <= '9');
+}
+
+/* Append an op, folding constants and reusing an identical earlier op. */
+static int exprEmit(ExprParser *ps, int op, int a, int b, int n, double re, double im) {
+    ExprProg *pr = ps->prog;
+    if ((op == XOP_ADD || op == XOP_MUL) && a > b) { int t = a; a = b; b = t; }
+    if (a >= 0 && pr->ops[a].op == XOP_CONST && (b < 0 || pr->ops[b].op == XOP_CONST)) {
+        ExprOp o = {op, a, b, n, 0, 0, 1};
+        exprApply(&o, pr->ops[a].re, pr->ops[a].im,
+                  b >= 0 ? pr->ops[b].re : 0, b >= 0 ? pr->ops[b].im : 0, &re, &im);
+        op = XOP_CONST; a = b = -1; n = 0;
+    }
+    for (int r = 0; r < pr->nOps; r++) {
+        const ExprOp *o = &pr->ops[r];
+        if (o->op == op && o->a == a && o->b == b && o->n == n &&
+            (op != XOP_CONST || (o->re == re && o->im == im)))
+            return r;
+    }
+    if (pr->nOps >= EXPR_MAX_OPS) return exprFail(ps, "program too long");
+    ExprOp *o = &pr->ops[pr->nOps];
+    o->op = op; o->a = a; o->b = b; o->n = n;
+    o->re = op == XOP_CONST ? re : 0;
+    o->im = op == XOP_CONST ? im : 0;
+    o->uniform = op != XOP_X2 &&
+                 (a < 0 || pr->ops[a].uniform) && (b < 0 || pr->ops[b].uniform);
+    return pr->nOps++;
+}
+
+static int exprParseSum(ExprParser *ps);
+static int exprParseUnary(ExprParser *ps);
+
+static int exprParsePrimary(ExprParser *ps) {
+    exprSkip(ps);
+    const char *s = ps->p;
+    if ((*s >= '0' && *s <= '9') || *s == '.') {
+        char *end;
+        double v = strtod(s, &end);
+        if (end == s) return exprFail(ps, "bad number");
+        ps->p = end;
+        if (*ps->p == 'i' && !exprIsIdent(ps->p[1], 0)) {
+            ps->p++;
+            return exprEmit(ps, XOP_CONST, -1, -1, 0, 0, v);
+        }
+        return exprEmit(ps, XOP_CONST, -1, -1, 0, v, 0);
+    }
+    if (*s == '(') {
+        ps->p++;
+        int r = exprParseSum(ps);
+        if (r < 0) return r;
+        exprSkip(ps);
+        if (*ps->p != ')') return exprFail(ps, "expected ')'");
+        ps->p++;
+        return r;
+    }
+    if (!exprIsIdent(*s, 1)) return exprFail(ps, "expected a value");
+
+    char name[32];
+    int len = 0;
+    while (exprIsIdent(*ps->p, 0)) {
+        if (len < 31) name[len++] = *ps->p;
+        ps->p++;
+    }
+    name[len] = '\0';
+    exprSkip(ps);
+
+    if (*ps->p == '(') {
+        for (size_t f = 0; f < sizeof(exprFuncs) / sizeof(exprFuncs[0]); f++) {
+            if (strcmp(name, exprFuncs[f].name) != 0) continue;
+            ps->p++;
+            int a = exprParseSum(ps);
+            if (a < 0) return a;
+            exprSkip(ps);
+            if (*ps->p != ')') return exprFail(ps, "expected ')'");
+            ps->p++;
+            return exprEmit(ps, exprFuncs[f].op, a, -1, 0, 0, 0);
+        }
+        ps->p = s;
+        return exprFail(ps, "unknown function");
+    }
+    for (int v = ps->nNames - 1; v >= 0; v--)
+        if (strcmp(name, ps->names[v]) == 0) return ps->nameReg[v];
+    if (strcmp(name, "x1") == 0) return exprEmit(ps, XOP_X1, -1, -1, 0, 0, 0);
+    if (strcmp(name, "x2") == 0) return exprEmit(ps, XOP_X2, -1, -1, 0, 0, 0);
+    if (strcmp(name, "i") == 0) return exprEmit(ps, XOP_CONST, -1, -1, 0, 0, 1);
+    if (strcmp(name, "pi") == 0) return exprEmit(ps, XOP_CONST, -1, -1, 0, M_PI, 0);
+    if (strcmp(name, "e") == 0) return exprEmit(ps, XOP_CONST, -1, -1, 0, exp(1.0), 0);
+    if (strcmp(name, "k") == 0 && ps->haveK)
+        return exprEmit(ps, XOP_CONST, -1, -1, 0, ps->k, 0);
+    ps->p = s;
+    return exprFail(ps, "unknown name");
+}
+
+static int exprParsePower(ExprParser *ps) {
+    int a = exprParsePrimary(ps);
+    if (a < 0) return a;
+    exprSkip(ps);
+    if (*ps->p != '^') return a;
+    ps->p++;
+    int b = exprParseUnary(ps);  /* right-associative, allows x^-1 */
+    if (b < 0) return b;
+    const ExprOp *e = &ps->prog->ops[b];
+    if (e->op == XOP_CONST && e->im == 0 && e->re == floor(e->re) &&
+        fabs(e->re) <= EXPR_MAX_POWI)
+        return exprEmit(ps, XOP_POWI, a, -1, (int)e->re, 0, 0);
+    return exprEmit(ps, XOP_POW, a, b, 0, 0, 0);
+}
+
+static int exprParseUnary(ExprParser *ps) {
+    exprSkip(ps);
+    if (*ps->p == '-') {
+        ps->p++;
+        int a = exprParseUnary(ps);
+        return a < 0 ? a : exprEmit(ps, XOP_NEG, a, -1, 0, 0, 0);
+    }
+    if (*ps->p == '+') {
+        ps->p++;
+        return exprParseUnary(ps);
+    }
+    return exprParsePower(ps);
+}
+
+static int exprParseProduct(ExprParser *ps) {
+    int a = exprParseUnary(ps);
+    while (a >= 0) {
+        exprSkip(ps);
+        char c = *ps->p;
+        if (c != '*' && c != '/') break;
+        ps->p++;
+        int b = exprParseUnary(ps);
+        if (b < 0) return b;
+        a = exprEmit(ps, c == '*' ? XOP_MUL : XOP_DIV, a, b, 0, 0, 0);
+    }
+    return a;
+}
+
+static int exprParseSum(ExprParser *ps) {
+    int a = exprParseProduct(ps);
+    while (a >= 0) {
+        exprSkip(ps);
+        char c = *ps->p;
+        if (c != '+' && c != '-') break;
+        ps->p++;
+        int b = exprParseProduct(ps);
+        if (b < 0) return b;
+        a = exprEmit(ps, c == '+' ? XOP_ADD : XOP_SUB, a, b, 0, 0, 0);
+    }
+    return a;
+}
+
+static int exprParseInt(ExprParser *ps, int *out) {
+    exprSkip(ps);
+    char *end;
+    long v = strtol(ps->p, &end, 10);
+    if (end == ps->p) return exprFail(ps, "expected an integer");
+    ps->p = end;
+    *out = (int)v;
+    return 0;
+}
+
+static int exprParseStatement(ExprParser *ps) {
+    ExprProg *pr = ps->prog;
+    exprSkip(ps);
+    if (*ps->p == ';' || *ps->p == '\0') return 0;
+    if (!exprIsIdent(*ps->p, 1)) return exprFail(ps, "expected a statement");
+
+    const char *s = ps->p;
+    char name[32];
+    int len = 0;
+    while (exprIsIdent(*ps->p, 0)) {
+        if (len < 31) name[len++] = *ps->p;
+        ps->p++;
+    }
+    name[len] = '\0';
+    exprSkip(ps);
+
+    if (strcmp(name, "reverse") == 0) {
+        pr->reverse = !pr->reverse;
+        return 0;
+    }
+    if (strcmp(name, "c") == 0 && *ps->p == '[') {
+        int lo, hi;
+        ps->p++;
+        if (exprParseInt(ps, &lo) < 0) return -1;
+        hi = lo;
+        exprSkip(ps);
+        if (ps->p[0] == '.' && ps->p[1] == '.') {
+            ps->p += 2;
+            if (exprParseInt(ps, &hi) < 0) return -1;
+        }
+        exprSkip(ps);
+        if (*ps->p != ']') return exprFail(ps, "expected ']'");
+        ps->p++;
+        exprSkip(ps);
+        if (*ps->p != '=') return exprFail(ps, "expected '='");
+        ps->p++;
+        if (lo < 0 || hi < lo || hi >= MAX_COEFFS) {
+            ps->p = s;
+            return exprFail(ps, "coefficient index out of range");
+        }
+        /* Unroll the range: k is a constant in each copy, so k-only
+         * subexpressions fold away */
+        const char *body = ps->p;
+        for (int k = lo; k <= hi; k++) {
+            ps->p = body;
+            ps->k = k;
+            ps->haveK = 1;
+            int r = exprParseSum(ps);
+            ps->haveK = 0;
+            if (r < 0) return r;
+            pr->coeffReg[k] = r;
+        }
+        if (hi + 1 > pr->nCoeffs) pr->nCoeffs = hi + 1;
+        return 0;
+    }
+    if (*ps->p != '=') return exprFail(ps, "expected '='");
+    ps->p++;
+    if (strcmp(name, "x1") == 0 || strcmp(name, "x2") == 0 || strcmp(name, "k") == 0) {
+        ps->p = s;
+        return exprFail(ps, "cannot assign to a parameter");
+    }
+    int r = exprParseSum(ps);
+    if (r < 0) return r;
+    int v = 0;
+    while (v < ps->nNames && strcmp(ps->names[v], name) != 0) v++;
+    if (v == ps->nNames) {
+        if (ps->nNames >= EXPR_MAX_NAMES) return exprFail(ps, "too many names");
+        strcpy(ps->names[ps->nNames++], name);
+    }
+    ps->nameReg[v] = r;
+    return 0;
+}
+
+static void exprFree(ExprProg *pr) {
+    if (!pr) return;
+    free(pr->ops);
+    free(pr->exec);
+    free(pr);
+}
+
+/* Compile `src`; returns NULL and a message in err on failure. */
+static ExprProg *exprCompile(const char *src, char *err, int errLen) {
+    ExprProg *pr = calloc(1, sizeof(ExprProg));
+    if (!pr || !(pr->ops = malloc(EXPR_MAX_OPS * sizeof(ExprOp)))) {
+        snprintf(err, errLen, "out of memory");
+        exprFree(pr);
+        return NULL;
+    }
+    for (int j = 0; j < MAX_COEFFS; j++) pr->coeffReg[j] = -1;
+
+    ExprParser *ps = calloc(1, sizeof(ExprParser));
+    if (!ps) {
+        snprintf(err, errLen, "out of memory");
+        exprFree(pr);
+        return NULL;
+    }
+    ps->p = src;
+    ps->prog = pr;
+    ps->err = err;
+    ps->errLen = errLen;
+    err[0] = '\0';
+
+    int rc = 0;
+    for (;;) {
+        if ((rc = exprParseStatement(ps)) < 0) break;
+        exprSkip(ps);
+        if (*ps->p == '\0') break;
+        if (*ps->p != ';') { rc = exprFail(ps, "expected ';'"); break; }
+        ps->p++;
+    }
+    free(ps);
+    if (rc == 0 && pr->nCoeffs < 2) {
+        snprintf(err, errLen, "need at least 2 coefficients");
+        rc = -1;
+    }
+    if (rc < 0) {
+        exprFree(pr);
+        return NULL;
+    }
+
+    /* Keep only ops some coefficient depends on (operands precede users) */
+    char *live = calloc(pr->nOps, 1);
+    pr->exec = malloc(pr->nOps * sizeof(int));
+    if (!live || !pr->exec) {
+        snprintf(err, errLen, "out of memory");
+        free(live);
+        exprFree(pr);
+        return NULL;
+    }
+    for (int j = 0; j < pr->nCoeffs; j++)
+        if (pr->coeffReg[j] >= 0) live[pr->coeffReg[j]] = 1;
+    for (int r = pr->nOps - 1; r >= 0; r--) {
+        if (!live[r]) continue;
+        if (pr->ops[r].a >= 0) live[pr->ops[r].a] = 1;
+        if (pr->ops[r].b >= 0) live[pr->ops[r].b] = 1;
+    }
+    for (int r = 0; r < pr->nOps; r++)
+        if (live[r] && pr->ops[r].op != XOP_CONST) pr->exec[pr->nExec++] = r;
+    free(live);
+    return pr;
+}
+
+/* ---- Evaluation ---- */
+
+static int exprStateInit(ExprState *st, const ExprProg *pr) {
+    size_t n = (size_t)pr->nOps * EXPR_BATCH;
+    st->prog = pr;
+    st->re = calloc(n, sizeof(double));
+    st->im = calloc(n, sizeof(double));
+    if (!st->re || !st->im) return -1;
+    /* Constants are uniform: lane 0 only, set once */
+    for (int r = 0; r < pr->nOps; r++) {
+        if (pr->ops[r].op != XOP_CONST) continue;
+        st->re[(size_t)r * EXPR_BATCH] = pr->ops[r].re;
+        st->im[(size_t)r * EXPR_BATCH] = pr->ops[r].im;
+    }
+    return 0;
+}
+
+static void exprStateFree(ExprState *st) {
+    free(st->re);
+    free(st->im);
+    st->re = st->im = NULL;
+}
+
+/* Evaluate the coefficients at (x1, x2[l]) for l < n (n <= EXPR_BATCH).
+ * Lane l's coefficients go to cRe/cIm[l * nCoeffs .. (l + 1) * nCoeffs). */
+static void exprEval(ExprState *st, double x1, const double *x2, int n,
+                     double *cRe, double *cIm)
+{
+    const ExprProg *pr = st->prog;
+    double *R = st->re, *I = st->im;
+
+    for (int e = 0; e < pr->nExec; e++) {
+        int r = pr->exec[e];
+        const ExprOp *o = &pr->ops[r];
+        double *dR = R + (size_t)r * EXPR_BATCH, *dI = I + (size_t)r * EXPR_BATCH;
+        if (o->op == XOP_X1) { dR[0] = x1; dI[0] = 0; continue; }
+        if (o->op == XOP_X2) {
+            for (int l = 0; l < n; l++) { dR[l] = x2[l]; dI[l] = 0; }
+            continue;
+        }
+        /* Uniform operands are read from lane 0 (stride 0) */
+        const double *aR = R + (size_t)o->a * EXPR_BATCH, *aI = I + (size_t)o->a * EXPR_BATCH;
+        int as = pr->ops[o->a].uniform ? 0 : 1;
+        const double *bR = aR, *bI = aI;
+        int bs = 0;
+        if (o->b >= 0) {
+            bR = R + (size_t)o->b * EXPR_BATCH;
+            bI = I + (size_t)o->b * EXPR_BATCH;
+            bs = pr->ops[o->b].uniform ? 0 : 1;
+        }
+        int lanes = o->uniform ? 1 : n;
+        for (int l = 0; l < lanes; l++)
+            exprApply(o, aR[l * as], aI[l * as], bR[l * bs], bI[l * bs], &dR[l], &dI[l]);
+    }
+
+    int nc = pr->nCoeffs;
+    for (int j = 0; j < nc; j++) {
+        int r = pr->coeffReg[j];
+        int dst = pr->reverse ? nc - 1 - j : j;
+        const double *sR = r >= 0 ? R + (size_t)r * EXPR_BATCH : NULL;
+        const double *sI = r >= 0 ? I + (size_t)r * EXPR_BATCH : NULL;
+        int ss = r >= 0 && !pr->ops[r].uniform ? 1 : 0;
+        for (int l = 0; l < n; l++) {
+            cRe[l * nc + dst] = sR ? sR[l * ss] : 0;
+            cIm[l * nc + dst] = sI ? sI[l * ss] : 0;
+        }
+    }
+}
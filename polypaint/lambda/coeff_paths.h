@@ -0,0 +1,571 @@
+/*
+ * coeff_paths: the browser's coefficient path catalogue for sweep's
+ * animation mode.  Included by sweep_cli.c.
+ *
+ * A path is a closed table of N absolute positions, as index.html's
+ * computeCurveN builds it and serializeFastModeData flattens it for the
+ * fast-mode workers (cloud offsets already added to the home position).
+ * step_loop.c's lookup drives it: at elapsed time e the entry sits at
+ * u = frac(e * speed * dir) of the way round, interpolated between
+ * neighbouring points, or snapped to point floor(u * N) for clouds.
+ *
+ * pathBuild generates a table natively from a path name:
+ *   parametric   circle horizontal vertical figure8 lissajous cardioid
+ *                astroid deltoid rose epitrochoid hypotrochoid butterfly
+ *                star square, and the space-filling hilbert (Moore) peano
+ *                sierpinski; the home point is curve[0] and the shape is
+ *                rotated by angle (a fraction of a turn) about it
+ *   orbital      o-spiral o-ellipse (about 0), c-spiral c-ellipse (about
+ *                ctr_re/ctr_im, the centroid the browser bakes in)
+ *   lattices     grid-cloud grid-serpentine disk-grid disk-spiral elkal
+ *                golden-spiral hex-grid grid-perlin
+ *   random       random disk-cloud sq-cloud annulus-cloud spokes
+ *                jitter-grid, drawn from the spec's seeded generator
+ *   orbit        orb-<parametric> (D-nodes): the shape about 0, offset at
+ *                run time by a reference C-node (steploop's "orbit_ref")
+ * A "-dither" suffix is the base path plus per-step dither.  The random
+ * clouds cannot match a browser session point for point (it draws from
+ * Math.random); send the browser's own table as "curve" to reproduce one.
+ *
+ * Dither uses step_loop.c's xorshift128, so a seed fixes the whole run.
+ *
+ * Needs <math.h>, <stdlib.h>, <string.h> and M_PI from the including file.
+ */
+
+#define PATH_SAMPLES 200        /* COEFF_TRAIL_SAMPLES */
+#define PATH_SAMPLES_HI 1500    /* COEFF_TRAIL_SAMPLES_HI */
+#define PATH_MAX_POINTS 10000000
+
+/* Per-path parameters: the browser's "extra" keys, snake_cased */
+typedef struct {
+    int points;
+    double freqA, freqB;              /* lissajous */
+    double mult, turns;               /* spirals; disk-spiral turns, 0 = auto */
+    double width;                     /* ellipses, percent */
+    double ctrRe, ctrIm;              /* c-spiral, c-ellipse */
+    double pow, rIn, jit;             /* clouds */
+    int spokes, rings;
+    double innerTurns, innerRatio;    /* elkal */
+    double noiseScale, noiseAmp;      /* grid-perlin */
+} PathExtra;
+
+static void pathExtraDefaults(PathExtra *ex) {
+    memset(ex, 0, sizeof(*ex));
+    ex->freqA = 3; ex->freqB = 2;
+    ex->mult = 1.5;
+    ex->width = 50;
+    ex->pow = 1; ex->rIn = 0.5; ex->jit = 0.35;
+    ex->spokes = 12; ex->rings = 8;
+    ex->innerTurns = 0.5; ex->innerRatio = 0.5;
+    ex->noiseScale = 3; ex->noiseAmp = 0.3;
+}
+
+/* ---- PRNG: xorshift128, as in step_loop.c ---- */
+
+typedef struct {
+    unsigned int s[4];
+    double spare;
+    int hasSpare;
+} PathRng;
+
+static void pathRngSeed(PathRng *r, unsigned long long seed) {
+    /* Seed 0 is step_loop.c's fallback state; others go through splitmix64 */
+    static const unsigned int fallback[4] = {0xDEADBEEF, 0x12345678, 0xABCDEF01, 0x87654321};
+    for (int i = 0; i < 4; i++) {
+        if (!seed) { r->s[i] = fallback[i]; continue; }
+        seed += 0x9E3779B97F4A7C15ULL;
+        unsigned long long z = seed;
+        z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+        z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+        r->s[i] = (unsigned int)(z ^ (z >> 31)) | (i == 0);
+    }
+    r->hasSpare = 0;
+}
+
+static unsigned int pathRngNext(PathRng *r) {
+    unsigned int t = r->s[3], s = r->s[0];
+    r->s[3] = r->s[2]; r->s[2] = r->s[1]; r->s[1] = s;
+    t ^= t << 11;
+    t ^= t >> 8;
+    r->s[0] = t ^ s ^ (s >> 19);
+    return r->s[0];
+}
+
+static double pathRngUniform(PathRng *r) {
+    return (double)(pathRngNext(r) >> 1) / 2147483648.0;   /* [0, 1) */
+}
+
+static double pathRngGauss(PathRng *r) {
+    if (r->hasSpare) { r->hasSpare = 0; return r->spare; }
+    double u, v;
+    do { u = pathRngUniform(r); } while (u == 0.0);
+    v = pathRngUniform(r);
+    double m = sqrt(-2.0 * log(u)), theta = 2.0 * M_PI * v;
+    r->spare = m * sin(theta);
+    r->hasSpare = 1;
+    return m * cos(theta);
+}
+
+/* Dither distributions, as the browser's _ditherPair */
+#define DITHER_NORMAL 0
+#define DITHER_UNIFORM 1
+#define DITHER_DISK 2
+
+static int pathDitherDist(const char *name) {
+    if (!name[0] || strcmp(name, "normal") == 0) return DITHER_NORMAL;
+    if (strcmp(name, "uniform") == 0) return DITHER_UNIFORM;
+    if (strcmp(name, "disk") == 0) return DITHER_DISK;
+    return -1;
+}
+
+static void pathDither(PathRng *r, int dist, double sigma, double *dRe, double *dIm) {
+    if (dist == DITHER_DISK) {
+        double angle = pathRngUniform(r) * 2.0 * M_PI;
+        double rho = sqrt(pathRngUniform(r)) * sigma;
+        *dRe = rho * cos(angle);
+        *dIm = rho * sin(angle);
+    } else if (dist == DITHER_UNIFORM) {
+        *dRe = (pathRngUniform(r) - 0.5) * 2.0 * sigma;
+        *dIm = (pathRngUniform(r) - 0.5) * 2.0 * sigma;
+    } else {
+        *dRe = pathRngGauss(r) * sigma;
+        *dIm = pathRngGauss(r) * sigma;
+    }
+}
+
+/* ---- Space-filling curves: L-system turtles normalized to [-1, 1]^2 ---- */
+
+typedef struct {
+    double *pts;      /* x, y pairs */
+    int n, cap;
+    int angle, dirs;  /* heading in units of 2*pi/dirs */
+    double x, y;
+} Turtle;
+
+static void turtleForward(Turtle *t) {
+    if (t->dirs == 4) {
+        static const int dx[4] = {1, 0, -1, 0}, dy[4] = {0, 1, 0, -1};
+        t->x += dx[t->angle]; t->y += dy[t->angle];
+    } else {
+        double a = t->angle * M_PI / 3;
+        t->x += cos(a); t->y += sin(a);
+    }
+    if (t->n >= t->cap) return;
+    t->pts[2 * t->n] = t->x;
+    t->pts[2 * t->n + 1] = t->y;
+    t->n++;
+}
+
+/* Expand `sym` under rules for L and R (index 0, 1) `depth` times and walk
+ * it; + turns clockwise and - counter-clockwise, as in index.html */
+static void turtleRun(Turtle *t, const char *sym, const char *const *rules, int depth) {
+    for (const char *c = sym; *c; c++) {
+        if ((*c == 'L' || *c == 'R') && depth > 0)
+            turtleRun(t, rules[*c == 'R'], rules, depth - 1);
+        else if (*c == 'F') turtleForward(t);
+        else if (*c == '+') t->angle = (t->angle + t->dirs - 1) % t->dirs;
+        else if (*c == '-') t->angle = (t->angle + 1) % t->dirs;
+    }
+}
+
+/* Sierpinski arrowhead: A -> B-A-B, B -> A+B+A, F at depth 0, + = left */
+static void turtleArrowhead(Turtle *t, char sym, int depth) {
+    if (depth == 0) { turtleForward(t); return; }
+    char a = sym == 'A' ? 'B' : 'A';
+    int turn = sym == 'A' ? 5 : 1;
+    turtleArrowhead(t, a, depth - 1);
+    t->angle = (t->angle + turn) % 6;
+    turtleArrowhead(t, sym, depth - 1);
+    t->angle = (t->angle + turn) % 6;
+    turtleArrowhead(t, a, depth - 1);
+}
+
+static void turtleNormalize(Turtle *t) {
+    double minX = 0, maxX = 0, minY = 0, maxY = 0;
+    for (int i = 0; i < t->n; i++) {
+        double x = t->pts[2 * i], y = t->pts[2 * i + 1];
+        minX = fmin(minX, x); maxX = fmax(maxX, x);
+        minY = fmin(minY, y); maxY = fmax(maxY, y);
+    }
+    double cx = (minX + maxX) / 2, cy = (minY + maxY) / 2;
+    double span = fmax(maxX - minX, maxY - minY);
+    if (span == 0) span = 1;
+    for (int i = 0; i < t->n; i++) {
+        t->pts[2 * i] = 2 * (t->pts[2 * i] - cx) / span;
+        t->pts[2 * i + 1] = 2 * (t->pts[2 * i + 1] - cy) / span;
+    }
+}
+
+/* Moore order 4 (256 segments), Peano order 3 (729), arrowhead order 5 (243) */
+static Turtle *spaceFillingCurve(int which) {
+    static Turtle cache[3];
+    Turtle *t = &cache[which];
+    if (t->pts) return t;
+    int segs = which == 0 ? 256 : which == 1 ? 729 : 243;
+    t->cap = segs + 1;
+    t->pts = malloc(sizeof(double) * 2 * t->cap);
+    t->pts[0] = t->pts[1] = 0;
+    t->n = 1;
+    t->x = t->y = 0;
+    if (which == 0) {
+        static const char *const moore[2] = {"-RF+LFL+FR-", "+LF-RFR-FL+"};
+        t->dirs = 4; t->angle = 1;
+        turtleRun(t, "LFL+F+LFL", moore, 3);
+    } else if (which == 1) {
+        static const char *const peano[2] = {"LFRFL-F-RFLFR+F+LFRFL", "RFLFR+F+LFRFL-F-RFLFR"};
+        t->dirs = 4; t->angle = 0;
+        turtleRun(t, "L", peano, 3);
+    } else {
+        t->dirs = 6; t->angle = 1;   /* odd order starts from B, heading 60 degrees */
+        turtleArrowhead(t, 'B', 5);
+    }
+    turtleNormalize(t);
+    return t;
+}
+
+static const double *turtlePoint(const Turtle *t, long d) {
+    return t->pts + 2 * (((d % t->n) + t->n) % t->n);
+}
+
+/* ---- Perlin 2D noise (Ken Perlin's reference permutation) ---- */
+
+static const unsigned char perlinP[256] = {
+    151,160,137,91,90,15,131,13,201,95,96,53,194,233,7,225,
+    140,36,103,30,69,142,8,99,37,240,21,10,23,190,6,148,
+    247,120,234,75,0,26,197,62,94,252,219,203,117,35,11,32,
+    57,177,33,88,237,149,56,87,174,20,125,136,171,168,68,175,
+    74,165,71,134,139,48,27,166,77,146,158,231,83,111,229,122,
+    60,211,133,230,220,105,92,41,55,46,245,40,244,102,143,54,
+    65,25,63,161,1,216,80,73,209,76,132,187,208,89,18,169,
+    200,196,135,130,116,188,159,86,164,100,109,198,173,186,3,64,
+    52,217,226,250,124,123,5,202,38,147,118,126,255,82,85,212,
+    207,206,59,227,47,16,58,17,182,189,28,42,223,183,170,213,
+    119,248,152,2,44,154,163,70,221,153,101,155,167,43,172,9,
+    129,22,39,253,19,98,108,110,79,113,224,232,178,185,112,104,
+    218,246,97,228,251,34,242,193,238,210,144,12,191,179,162,241,
+    81,51,145,235,249,14,239,107,49,192,214,31,181,199,106,157,
+    184,84,204,176,115,121,50,45,127,4,150,254,138,236,205,93,
+    222,114,67,29,24,72,243,141,128,195,78,66,215,61,156,180};
+
+static double perlinDot(int gi, double x, double y) {
+    static const int grad[8][2] = {{1,1},{-1,1},{1,-1},{-1,-1},{1,0},{-1,0},{0,1},{0,-1}};
+    return grad[gi & 7][0] * x + grad[gi & 7][1] * y;
+}
+
+static double perlin2D(double x, double y) {
+    int xi = (int)floor(x) & 255, yi = (int)floor(y) & 255;
+    double xf = x - floor(x), yf = y - floor(y);
+    double u = xf * xf * xf * (xf * (xf * 6 - 15) + 10);
+    double v = yf * yf * yf * (yf * (yf * 6 - 15) + 10);
+#define PERM(i) perlinP[(i) & 255]
+    int aa = PERM(PERM(xi) + yi), ab = PERM(PERM(xi) + yi + 1);
+    int ba = PERM(PERM(xi + 1) + yi), bb = PERM(PERM(xi + 1) + yi + 1);
+#undef PERM
+    double x1 = perlinDot(aa, xf, yf) + (perlinDot(ba, xf - 1, yf) - perlinDot(aa, xf, yf)) * u;
+    double x2 = perlinDot(ab, xf, yf - 1) + (perlinDot(bb, xf - 1, yf - 1) - perlinDot(ab, xf, yf - 1)) * u;
+    return x1 + (x2 - x1) * v;
+}
+
+/* ---- Parametric shapes: animPathFn about the origin, t in [0, 1) ---- */
+
+/* 1 and the offset in (re, im) if `name` is a parametric path, else 0 */
+static int pathShape(const char *name, double t, double r, const PathExtra *ex,
+                     double *re, double *im) {
+    double wt = 2 * M_PI * t;
+    double x = 0, y = 0;
+    if (strcmp(name, "circle") == 0) { x = r * cos(wt); y = r * sin(wt); }
+    else if (strcmp(name, "horizontal") == 0) x = r * cos(wt);
+    else if (strcmp(name, "vertical") == 0) y = r * cos(wt);
+    else if (strcmp(name, "figure8") == 0) {
+        double d = 1 + sin(wt) * sin(wt);
+        x = r * cos(wt) / d; y = r * sin(wt) * cos(wt) / d;
+    } else if (strcmp(name, "lissajous") == 0) {
+        double la = ex->freqA ? ex->freqA : 3, lb = ex->freqB ? ex->freqB : 2;
+        x = r * sin(la * wt + M_PI / 4); y = r * sin(lb * wt);
+    } else if (strcmp(name, "cardioid") == 0) {
+        double s = 0.5 * (1 + cos(wt));
+        x = r * s * cos(wt); y = r * s * sin(wt);
+    } else if (strcmp(name, "astroid") == 0) {
+        x = r * cos(wt) * cos(wt) * cos(wt); y = r * sin(wt) * sin(wt) * sin(wt);
+    } else if (strcmp(name, "deltoid") == 0) {
+        x = r * (2 * cos(wt) + cos(2 * wt)) / 3; y = r * (2 * sin(wt) - sin(2 * wt)) / 3;
+    } else if (strcmp(name, "rose") == 0) {
+        double rr = r * cos(3 * wt);
+        x = rr * cos(wt); y = rr * sin(wt);
+    } else if (strcmp(name, "epitrochoid") == 0) {
+        x = r * (4 * cos(wt) - cos(4 * wt)) / 5; y = r * (4 * sin(wt) - sin(4 * wt)) / 5;
+    } else if (strcmp(name, "hypotrochoid") == 0) {
+        x = r * (3 * cos(wt) + cos(1.5 * wt)) / 4; y = r * (3 * sin(wt) - sin(1.5 * wt)) / 4;
+    } else if (strcmp(name, "butterfly") == 0) {
+        double rb = exp(cos(wt)) - 2 * cos(4 * wt) + pow(sin(wt / 12), 5);
+        x = r / 3.5 * rb * cos(wt); y = r / 3.5 * rb * sin(wt);
+    } else if (strcmp(name, "star") == 0) {
+        /* 10 vertices alternating outer / inner (0.38) radius */
+        double seg = t - floor(t), idx = seg * 10;
+        int vi = (int)floor(idx) % 10;
+        double frac = idx - floor(idx);
+        double a1 = vi / 10.0 * 2 * M_PI - M_PI / 2, a2 = (vi + 1) / 10.0 * 2 * M_PI - M_PI / 2;
+        double r1 = vi % 2 == 0 ? r : r * 0.38, r2 = (vi + 1) % 2 == 0 ? r : r * 0.38;
+        x = r1 * cos(a1) * (1 - frac) + r2 * cos(a2) * frac;
+        y = r1 * sin(a1) * (1 - frac) + r2 * sin(a2) * frac;
+    } else if (strcmp(name, "square") == 0) {
+        double seg = t - floor(t), f;
+        if (seg < 0.25)      { f = seg / 0.25;          x = 1 - 2 * f;  y = 1; }
+        else if (seg < 0.5)  { f = (seg - 0.25) / 0.25; x = -1;         y = 1 - 2 * f; }
+        else if (seg < 0.75) { f = (seg - 0.5) / 0.25;  x = -1 + 2 * f; y = -1; }
+        else                 { f = (seg - 0.75) / 0.25; x = 1;          y = -1 + 2 * f; }
+        x *= r; y *= r;
+    } else if (strcmp(name, "hilbert") == 0) {
+        const Turtle *tt = spaceFillingCurve(0);
+        double seg = (t - floor(t)) * 256, fr = seg - floor(seg);
+        long i0 = (long)floor(seg) % 256, i1 = (i0 + 1) % 256;
+        const double *p0 = turtlePoint(tt, i0), *p1 = turtlePoint(tt, i1);
+        x = r * (p0[0] * (1 - fr) + p1[0] * fr); y = r * (p0[1] * (1 - fr) + p1[1] * fr);
+    } else if (strcmp(name, "peano") == 0 || strcmp(name, "sierpinski") == 0) {
+        /* Not closed: out and back */
+        int peano = name[0] == 'p';
+        const Turtle *tt = spaceFillingCurve(peano ? 1 : 2);
+        long np = peano ? 729 : 243;
+        double seg = (t - floor(t)) * 2 * np, fr = seg - floor(seg);
+        long fl = (long)floor(seg), i0, i1;
+        if (seg < np) { i0 = fl % np; i1 = i0 + 1 < np ? i0 + 1 : np - 1; }
+        else { i0 = np - 1 - (fl - np) % np; i1 = i0 > 0 ? i0 - 1 : 0; }
+        const double *p0 = turtlePoint(tt, i0), *p1 = turtlePoint(tt, i1);
+        x = r * (p0[0] * (1 - fr) + p1[0] * fr); y = r * (p0[1] * (1 - fr) + p1[1] * fr);
+    } else {
+        return 0;
+    }
+    *re = x; *im = y;
+    return 1;
+}
+
+static int pathHiRes(const char *name) {
+    return strcmp(name, "hilbert") == 0 || strcmp(name, "peano") == 0 ||
+           strcmp(name, "sierpinski") == 0 || strcmp(name, "o-spiral") == 0 ||
+           strcmp(name, "c-spiral") == 0;
+}
+
+/* ---- Table builder ---- */
+
+typedef struct {
+    double *pts;      /* absolute re, im pairs */
+    int n;
+    int cloud;        /* snap to the nearest index instead of interpolating */
+} PathTable;
+
+static int pathPush(PathTable *p, int cap, double re, double im) {
+    if (p->n >= cap) return 0;
+    p->pts[2 * p->n] = re;
+    p->pts[2 * p->n + 1] = im;
+    p->n++;
+    return 1;
+}
+
+/* Build the table for path `name` (without "-dither") starting from home
+ * (homeRe, homeIm).  Returns 0 on success, -1 if the name is unknown. */
+static int pathBuild(const char *name, double homeRe, double homeIm,
+                     double radius, double angle, const PathExtra *ex,
+                     PathRng *rng, PathTable *out) {
+    int N = ex->points > 0 ? ex->points : pathHiRes(name) ? PATH_SAMPLES_HI : PATH_SAMPLES;
+    if (N > PATH_MAX_POINTS) N = PATH_MAX_POINTS;
+    double R = radius, halfR = radius / 2;
+    int side = (int)fmax(2, round(sqrt(N)));
+    int cap = N;
+    if (strcmp(name, "disk-grid") == 0)
+        side = (int)fmax(2, round(sqrt(N * 4 / M_PI)));
+    if (strstr(name, "grid")) cap = side * side;
+    if (strcmp(name, "disk-spiral") == 0) cap = 2 * (int)fmax(4, ceil(N / 2.0));
+    if (strcmp(name, "elkal") == 0) {
+        int rings = ex->rings > 2 ? ex->rings : 2;
+        cap = rings * (int)fmax(3, round((double)N / rings));
+    }
+    out->pts = malloc(sizeof(double) * 2 * (size_t)cap);
+    out->n = 0;
+    out->cloud = 1;
+    if (!out->pts) return -1;
+    PathTable *p = out;
+
+    if (strcmp(name, "random") == 0) {
+        for (int k = 0; k < N; k++) {
+            double x = pathRngGauss(rng) * R;
+            pathPush(p, cap, homeRe + x, homeIm + pathRngGauss(rng) * R);
+        }
+    } else if (strcmp(name, "disk-cloud") == 0) {
+        for (int k = 0; k < N; k++) {
+            double theta = pathRngUniform(rng) * 2 * M_PI;
+            double rho = pow(pathRngUniform(rng), ex->pow);
+            pathPush(p, cap, homeRe + R * rho * cos(theta), homeIm + R * rho * sin(theta));
+        }
+    } else if (strcmp(name, "sq-cloud") == 0) {
+        for (int k = 0; k < N; k++) {
+            double rx = pathRngUniform(rng) * 2 - 1, ry = pathRngUniform(rng) * 2 - 1;
+            double x = copysign(pow(fabs(rx), ex->pow), rx);
+            double y = copysign(pow(fabs(ry), ex->pow), ry);
+            pathPush(p, cap, homeRe + R * x, homeIm + R * y);
+        }
+    } else if (strcmp(name, "grid-cloud") == 0 || strcmp(name, "grid-serpentine") == 0 ||
+               strcmp(name, "disk-grid") == 0 || strcmp(name, "jitter-grid") == 0) {
+        int serp = name[5] == 's', disk = name[0] == 'd', jitter = name[0] == 'j';
+        double cell = R / (side - 1);
+        for (int row = 0; row < side; row++)
+            for (int col = 0; col < side; col++) {
+                int c = serp && row % 2 ? side - 1 - col : col;
+                double x = ((double)c / (side - 1) - 0.5) * R;
+                double y = ((double)row / (side - 1) - 0.5) * R;
+                if (disk && x * x + y * y > halfR * halfR) continue;
+                if (jitter) {
+                    x += (pathRngUniform(rng) * 2 - 1) * ex->jit * cell;
+                    y += (pathRngUniform(rng) * 2 - 1) * ex->jit * cell;
+                }
+                pathPush(p, cap, homeRe + x, homeIm + y);
+            }
+    } else if (strcmp(name, "disk-spiral") == 0) {
+        int halfN = (int)fmax(4, ceil(N / 2.0));
+        int turns = ex->turns > 0 ? (int)round(ex->turns)
+                                  : (int)fmax(2, round(sqrt(halfN) / 2));
+        /* Inward, then back out without repeating the center */
+        for (int j = 0; j < 2 * halfN - 1; j++) {
+            int i = j < halfN ? j : 2 * halfN - 2 - j;
+            double t = (double)i / (halfN - 1), rr = halfR * (1 - t);
+            double theta = turns * 2 * M_PI * t;
+            pathPush(p, cap, homeRe + rr * cos(theta), homeIm + rr * sin(theta));
+        }
+    } else if (strcmp(name, "elkal") == 0) {
+        int rings = ex->rings > 2 ? ex->rings : 2;
+        double r0 = 1.0 / rings;
+        int per = (int)fmax(3, round((double)N / rings));
+        for (int ri = 0; ri < rings; ri++) {
+            double tr = (ri + 0.5) / rings;
+            double rho = halfR * (r0 + (1 - r0) * tr);
+            double ratio = ex->innerRatio + (1 - ex->innerRatio) * tr;
+            double rot = 2 * M_PI * ex->innerTurns * (1 - tr);
+            for (int k = 0; k < per; k++) {
+                double a = 2 * M_PI * k / per;
+                double px = rho * cos(a), py = rho * sin(a) * ratio;
+                pathPush(p, cap, homeRe + px * cos(rot) - py * sin(rot),
+                         homeIm + px * sin(rot) + py * cos(rot));
+            }
+        }
+    } else if (strcmp(name, "annulus-cloud") == 0) {
+        for (int k = 0; k < N; k++) {
+            double th = pathRngUniform(rng) * 2 * M_PI;
+            double u = pow(pathRngUniform(rng), ex->pow);
+            double rho = (ex->rIn + (1 - ex->rIn) * u) * halfR;
+            pathPush(p, cap, homeRe + rho * cos(th), homeIm + rho * sin(th));
+        }
+    } else if (strcmp(name, "spokes") == 0) {
+        int m = ex->spokes > 2 ? ex->spokes : 2;
+        for (int k = 0; k < N; k++) {
+            double th = 2 * M_PI * (k % m) / m;
+            double rho = pow(pathRngUniform(rng), ex->pow) * halfR;
+            pathPush(p, cap, homeRe + rho * cos(th), homeIm + rho * sin(th));
+        }
+    } else if (strcmp(name, "golden-spiral") == 0) {
+        double golden = M_PI * (3 - sqrt(5));
+        for (int k = 0; k < N; k++) {
+            double rr = halfR * sqrt((double)(k + 1) / N), th = (k + 1) * golden;
+            pathPush(p, cap, homeRe + rr * cos(th), homeIm + rr * sin(th));
+        }
+    } else if (strcmp(name, "hex-grid") == 0 || strcmp(name, "grid-perlin") == 0) {
+        int perlin = name[0] == 'g';
+        double dx = R / (side - 1), dy = dx * sqrt(3) / 2, amp = ex->noiseAmp * R;
+        for (int row = 0; row < side; row++) {
+            double y = (row - (side - 1) / 2.0) * dy, xoff = (row % 2) * 0.5 * dx;
+            for (int col = 0; col < side; col++) {
+                double x = (col - (side - 1) / 2.0) * dx + xoff, dRe = 0, dIm = 0;
+                if (perlin) {
+                    double nx = (double)col / (side - 1) * ex->noiseScale;
+                    double ny = (double)row / (side - 1) * ex->noiseScale;
+                    dRe = perlin2D(nx, ny) * amp;
+                    dIm = perlin2D(nx + 97.3, ny + 43.7) * amp;
+                }
+                pathPush(p, cap, homeRe + x + dRe, homeIm + y + dIm);
+            }
+        }
+    } else if (strcmp(name, "o-spiral") == 0 || strcmp(name, "c-spiral") == 0) {
+        /* Out from the home radius to mult x, one turn at R1, back in */
+        double refRe = name[0] == 'c' ? ex->ctrRe : 0, refIm = name[0] == 'c' ? ex->ctrIm : 0;
+        double turns = ex->turns ? ex->turns : 2;
+        double dx = homeRe - refRe, dy = homeIm - refIm;
+        double R0 = sqrt(dx * dx + dy * dy), th0 = atan2(dy, dx), R1 = R0 * ex->mult;
+        double total = 2 * turns + 1, t1 = turns / total, t2 = (turns + 1) / total;
+        out->cloud = 0;
+        for (int k = 0; k < N; k++) {
+            double t = (double)k / N, rr, th;
+            if (t <= t1) {
+                double f = t1 > 0 ? t / t1 : 0;
+                rr = R0 + (R1 - R0) * f; th = th0 + f * turns * 2 * M_PI;
+            } else if (t <= t2) {
+                double f = t2 > t1 ? (t - t1) / (t2 - t1) : 0;
+                rr = R1; th = th0 + (turns + f) * 2 * M_PI;
+            } else {
+                double f = 1 > t2 ? (t - t2) / (1 - t2) : 0;
+                rr = R1 + (R0 - R1) * f; th = th0 + (turns + 1 + f * turns) * 2 * M_PI;
+            }
+            pathPush(p, cap, refRe + rr * cos(th), refIm + rr * sin(th));
+        }
+    } else if (strcmp(name, "o-ellipse") == 0 || strcmp(name, "c-ellipse") == 0) {
+        /* Vertices at home and the reference point; width is the minor axis % */
+        double refRe = name[0] == 'c' ? ex->ctrRe : 0, refIm = name[0] == 'c' ? ex->ctrIm : 0;
+        double dx = homeRe - refRe, dy = homeIm - refIm;
+        double cx = (homeRe + refRe) / 2, cy = (homeIm + refIm) / 2;
+        double a = sqrt(dx * dx + dy * dy) / 2, b = a * ex->width / 100;
+        double ux = a > 0 ? dx / (2 * a) : 1, uy = a > 0 ? dy / (2 * a) : 0;
+        out->cloud = 0;
+        for (int k = 0; k < N; k++) {
+            double wt = 2 * M_PI * k / N;
+            pathPush(p, cap, cx + a * cos(wt) * ux - b * sin(wt) * uy,
+                     cy + a * cos(wt) * uy + b * sin(wt) * ux);
+        }
+    } else if (strncmp(name, "orb-", 4) == 0) {
+        /* Orbit (D-nodes): the inner shape about 0, not shifted to home; the
+         * step loop adds the reference C-node's position every step */
+        double ca = cos(angle * 2 * M_PI), sa = sin(angle * 2 * M_PI), x, y;
+        if (!pathShape(name + 4, 0, radius, ex, &x, &y)) {
+            free(out->pts);
+            out->pts = NULL;
+            return -1;
+        }
+        out->cloud = 0;
+        for (int k = 0; k < N; k++) {
+            pathShape(name + 4, (double)k / N, radius, ex, &x, &y);
+            pathPush(p, cap, x * ca - y * sa, x * sa + y * ca);
+        }
+    } else {
+        /* Parametric: offsets from the shape's start, rotated, from home */
+        double x0, y0, ca = cos(angle * 2 * M_PI), sa = sin(angle * 2 * M_PI);
+        if (!pathShape(name, 0, radius, ex, &x0, &y0)) {
+            free(out->pts);
+            out->pts = NULL;
+            return -1;
+        }
+        out->cloud = 0;
+        for (int k = 0; k < N; k++) {
+            double x, y;
+            pathShape(name, (double)k / N, radius, ex, &x, &y);
+            x -= x0; y -= y0;
+            pathPush(p, cap, homeRe + x * ca - y * sa, homeIm + x * sa + y * ca);
+        }
+    }
+    return 0;
+}
+
+/* Position on the table at elapsed time e: step_loop.c's lookup */
+static void pathSample(const PathTable *p, double e, double speed, int ccw,
+                       double *re, double *im) {
+    double t = e * speed * (ccw ? -1.0 : 1.0);
+    double u = t - floor(t);
+    if (!isfinite(u)) u = 0;
+    double rawIdx = u * p->n;
+    int lo = (int)rawIdx;
+    if (lo >= p->n) lo = p->n - 1;
+    if (p->cloud) {
+        *re = p->pts[2 * lo];
+        *im = p->pts[2 * lo + 1];
+        return;
+    }
+    int hi = lo + 1 == p->n ? 0 : lo + 1;
+    double frac = rawIdx - lo;
+    *re = p->pts[2 * lo] * (1 - frac) + p->pts[2 * hi] * frac;
+    *im = p->pts[2 * lo + 1] * (1 - frac) + p->pts[2 * hi + 1] * frac;
+}
@@ -4,22 +4,42 @@ Lambda handler for polypaint render pipeline.
 Routes:
   POST /render               — orchestrate server-side image rendering
   POST /compute-render-stripe — per-stripe worker (compute roots + render PNG)
+  POST /compute-render-batch — several stripes per worker, merged locally
   POST /reduce-pair          — merge two PNGs via additive blending
-  POST /encode-upload        — encode final PNG to JPEG/PNG and upload
+  POST /encode-upload        — encode final PNG to JPEG/PNG (or a DZI tile pyramid) and upload
+  POST /render-animation     — render a numbered frame sequence from one root solve
+  POST /render-snapshot      — re-render a browser snapshot (or book page) at print resolution
+  POST /compute-snapshot-stripe — per-stripe worker (the snapshot's step loop over a step range)
+  POST /status               — progress and preview of a running render
+  POST /cancel               — ask a running render to stop
 """
+import base64
 import json
+import math
 import os
+import random
+import re
 import subprocess
+import threading
 import time
 import uuid
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from botocore.exceptions import ClientError
 
 BUCKET = os.environ.get("BUCKET", "polypaint")
-s3 = boto3.client("s3")
-# Large connection pool for parallel Lambda invocations (stripe fan-out + tree-reduce)
-lambda_client = boto3.client("lambda", config=Config(max_pool_connections=200))
+s3 = boto3.client("s3", config=Config(max_pool_connections=32))
+# Raw intermediates move between S3 and /tmp files as parallel ranged GETs /
+# multipart PUTs of 16 MB parts, never as whole in-memory copies
+S3_TRANSFER = TransferConfig(multipart_threshold=16 * 1024 * 1024,
+                             multipart_chunksize=16 * 1024 * 1024,
+                             max_concurrency=16)
+# Global budget of in-flight worker invocations per coordinator; the Lambda
+# client's connection pool is shared by every phase and sized to match
+INVOKE_CONCURRENCY = int(os.environ.get("MAX_INVOKE_CONCURRENCY", "200"))
+lambda_client = boto3.client("lambda", config=Config(max_pool_connections=INVOKE_CONCURRENCY))
 SWEEP = os.path.join(os.path.dirname(__file__), "sweep")
 LORES_VIEWPORT = os.path.join(os.path.dirname(__file__), "lores_viewport")
 IMGPIPE = os.path.join(os.path.dirname(__file__), "imgpipe")
@@ -32,17 +52,102 @@ def _imgpipe_env():
         env["LD_LIBRARY_PATH"] = "/opt/lib:" + ld
     return env
 PRESIGN_EXPIRY = 3600  # 1 hour
+# Encoded images up to this size can be returned inline as base64; 4 MB
+# becomes ~5.3 MB of base64, under the 6 MB Lambda response payload limit
+INLINE_MAX_BYTES = 4 * 1024 * 1024
 FUNCTION_NAME = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "polypaint-solver")
+MAX_FRAMES = 1000
+# Frame megapixels one animation worker renders and uploads (~300 MB of
+# raws); longer sequences split into frame chunks, each its own fan-out
+FRAME_MPIX_PER_WORKER = 100
+MAX_VARIANTS = 32
+# Per-variant settings applied by imgpipe --roots2image; gamma, format and
+# quality are applied coordinator-side in the reduce and encode
+VARIANT_VIEW_KEYS = ("color", "match", "palette", "constant_color")
+# Colors sweep's render mode plots directly (see fused_render_ok)
+FUSED_COLORS = ("rainbow", "constant")
+# Quantized root files ("root_encoding"): bins per pixel at the render scale
+ROOT_QUANTA_PER_PIXEL = 4
+# Progressive preview: every PREVIEW_FACTOR-th row/column, 1/PREVIEW_FACTOR size
+# (decimated further so the longer side stays within PREVIEW_MAX_SIDE)
+PREVIEW_FACTOR = 8
+PREVIEW_MAX_SIDE = 2048
+# Canvases wider or taller than MAX_FRAME render as RENDER_TILE-square tiles
+MAX_FRAME = 16384
+RENDER_TILE = 4096
+CANCEL_POLL_S = 1.0
+# Straggler hedging: once HEDGE_QUANTILE of the stripes are done, re-invoke any
+# stripe that has been running longer than HEDGE_MULTIPLIER x the median time.
+HEDGE_QUANTILE = 0.75
+HEDGE_MULTIPLIER = 2.0
+HEDGE_POLL_S = 0.05
+# Per-invocation retry: bounded attempts with jittered exponential backoff
+MAX_ATTEMPTS = 3
+RETRY_BASE_S = 0.5
+# Throttled invocations (account/function concurrency limit) back off with
+# full jitter and do not use up attempts, for at most THROTTLE_MAX_S
+THROTTLE_BASE_S = 0.2
+THROTTLE_CAP_S = 10.0
+THROTTLE_MAX_S = 120.0
+# Stripe batching: keep at least BATCH_MIN_WORKERS invocations in flight;
+# a batch holds one stripe image per concurrent stripe plus the local merge
+BATCH_MIN_WORKERS = 10
+# Render planner: timing blocks of recent striped renders, fitted to a cost
+# model once PLANNER_MIN_RECORDS exist (else the fixed stripe-count rule)
+PLANNER_HISTORY_KEY = "planner/history.json"
+PLANNER_HISTORY_MAX = 200
+PLANNER_MIN_RECORDS = 3
+# A fitted plan stays within this factor of the heuristic stripe count until
+# the history has PLANNER_TRUSTED_RECORDS records, and within it of the
+# largest stripe count the history has seen after that
+PLANNER_CLAMP_FACTOR = 4
+PLANNER_TRUSTED_RECORDS = 20
+LAMBDA_MEMORY_MB = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "10240"))
+# Snapshot renders (/render-snapshot): index.html's path "extra" keys as
+# sweep's snake_case animation keys, and the paths whose point count is
+# extra.points when set rather than the step count
+SNAPSHOT_EXTRA_KEYS = {
+    "freqA": "freq_a", "freqB": "freq_b", "mult": "mult", "turns": "turns",
+    "width": "width", "ctrRe": "ctr_re", "ctrIm": "ctr_im", "pow": "pow",
+    "rIn": "r_in", "jit": "jit", "spokes": "spokes", "rings": "rings",
+    "innerTurns": "inner_turns", "innerRatio": "inner_ratio",
+    "noiseScale": "noise_scale", "noiseAmp": "noise_amp",
+}
+SNAPSHOT_POINTS_PATHS = ("golden-spiral", "hex-grid", "jitter-grid", "grid-perlin")
+# bitmapColorMode -> steploop "color"; modes not listed are rainbow ("index")
+SNAPSHOT_COLOR_MODES = {
+    "uniform": "uniform",
+    "proximity": "proximity", "custom-prox-8": "proximity", "custom-prox-4": "proximity",
+    "derivative": "derivative",
+    "rel-proximity": "rel-proximity", "custom-relprox-4": "rel-proximity",
+}
+SNAPSHOT_JS_ONLY_MODES = ("idx-prox", "ratio")
+SNAPSHOT_PALETTES = ("inferno", "viridis", "magma", "plasma", "turbo",
+                     "cividis", "warm", "cool")
+SNAPSHOT_MORPH_PATHS = ("line", "circle", "ellipse", "figure8", "d-node", "c-node")
+FAST_PASS_SECONDS = 1.0
 
 
 def handler(event, context):
     path = event.get("rawPath", event.get("path", "/"))
     if path.endswith("/compute-render-stripe"):
         return handle_compute_render_stripe(event)
+    elif path.endswith("/compute-render-batch"):
+        return handle_compute_render_batch(event)
     elif path.endswith("/reduce-pair"):
         return handle_reduce_pair(event)
     elif path.endswith("/encode-upload"):
         return handle_encode_upload(event)
+    elif path.endswith("/render-animation"):
+        return handle_render_animation(event)
+    elif path.endswith("/compute-snapshot-stripe"):
+        return handle_compute_snapshot_stripe(event)
+    elif path.endswith("/render-snapshot"):
+        return handle_render_snapshot(event)
+    elif path.endswith("/status"):
+        return handle_status(event)
+    elif path.endswith("/cancel"):
+        return handle_cancel(event)
     else:
         return handle_render_v2(event)
 
@@ -64,25 +169,727 @@ def ok_response(body):
     }
 
 
-def err_response(code, msg):
+def err_response(code, msg, **extra):
     return {
         "statusCode": code,
         "headers": {"Content-Type": "application/json", "Access-Control-Allow-Origin": "*"},
-        "body": json.dumps({"error": msg}),
+        "body": json.dumps({"error": msg, **extra}),
     }
 
 
+class InvokeLimiter:
+    """Process-wide cap on in-flight worker invocations, adjusted AIMD-style.
+
+    Starts at `limit`.  A throttled invocation halves the cap (at most once
+    per second, so one burst of throttles counts once) and every success
+    raises it by one, so a coordinator that hits the account concurrency
+    limit slows down instead of failing stripes."""
+
+    def __init__(self, limit):
+        self.max_limit = limit
+        self.limit = limit
+        self.in_flight = 0
+        self.throttled = 0
+        self.last_cut = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= self.limit:
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                if time.time() - self.last_cut > 1.0:
+                    self.limit = max(1, self.limit // 2)
+                    self.last_cut = time.time()
+            elif self.limit < self.max_limit:
+                self.limit += 1
+            self.cond.notify_all()
+
+
+invoke_limiter = InvokeLimiter(INVOKE_CONCURRENCY)
+
+
+def is_throttle(e):
+    code = getattr(e, "response", {}).get("Error", {}).get("Code", "")
+    return (code in ("TooManyRequestsException", "ThrottlingException")
+            or isinstance(e, lambda_client.exceptions.TooManyRequestsException))
+
+
+def invoke_worker(route, body, max_attempts=1, trace=None, label=None):
+    """Synchronously invoke this function on `route` and return the parsed body.
+    Failed attempts (worker error or invocation error) are retried up to
+    `max_attempts` total with jittered exponential backoff.  Callers must
+    only retry routes whose outputs go to deterministic keys.
+    Every invocation goes through the shared InvokeLimiter; throttled ones
+    back off and retry without using up an attempt.
+    With a Trace, each attempt and the worker's own spans are recorded."""
+    payload = json.dumps({"rawPath": route, "body": json.dumps(body)})
+    tid = trace.new_tid(label or route) if trace else 0
+    attempt = 1
+    throttles = 0
+    t_first = time.time()
+    while True:
+        t_inv = time.time()
+        throttled = False
+        invoke_limiter.acquire()
+        try:
+            try:
+                resp = lambda_client.invoke(
+                    FunctionName=FUNCTION_NAME,
+                    InvocationType="RequestResponse",
+                    Payload=payload,
+                )
+            except Exception as e:
+                throttled = is_throttle(e)
+                raise
+            finally:
+                invoke_limiter.release(throttled)
+            result = json.loads(resp["Payload"].read())
+            if result.get("statusCode") != 200:
+                raise RuntimeError(f"{route} failed: "
+                                   f"{result.get('body', result.get('errorMessage', ''))}")
+            out = json.loads(result["body"])
+            spans = out.pop("spans", [])
+            if trace:
+                trace.add(f"invoke {route}", t_inv, time.time(), tid=tid, attempt=attempt)
+                trace.extend(spans, pid=1, tid=tid)
+            return out
+        except Exception as e:
+            if trace:
+                trace.add(f"invoke {route}", t_inv, time.time(), tid=tid,
+                          attempt=attempt, throttled=throttled, error=str(e)[:200])
+            if throttled and time.time() - t_first < THROTTLE_MAX_S:
+                throttles += 1
+                time.sleep(random.uniform(0, min(THROTTLE_CAP_S,
+                                                 THROTTLE_BASE_S * 2 ** throttles)))
+                continue
+            if attempt >= max_attempts:
+                raise
+            time.sleep(RETRY_BASE_S * (2 ** (attempt - 1)) * (0.5 + random.random()))
+            attempt += 1
+
+
+def make_span(name, t_start, t_end, **args):
+    """Worker-side span: wall-clock start and duration in microseconds."""
+    return {"name": name, "ts": int(t_start * 1e6),
+            "dur": int((t_end - t_start) * 1e6), "args": args}
+
+
+class Trace:
+    """Collects Chrome-trace-format events for one render job.
+
+    pid 0 holds coordinator phases and one thread row per invocation
+    (submit to return); pid 1 holds the spans reported by each worker,
+    on the same tid as the invocation that ran it.  The gap between an
+    invocation's start and its worker's first span is queueing + cold start.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._next_tid = 1
+
+    def new_tid(self, label):
+        with self._lock:
+            tid = self._next_tid
+            self._next_tid += 1
+            for pid in (0, 1):
+                self.events.append({"name": "thread_name", "ph": "M", "pid": pid,
+                                    "tid": tid, "args": {"name": label}})
+        return tid
+
+    def add(self, name, t_start, t_end, pid=0, tid=0, **args):
+        self.extend([make_span(name, t_start, t_end, **args)], pid, tid)
+
+    def extend(self, spans, pid, tid):
+        with self._lock:
+            for sp in spans:
+                self.events.append({"name": sp["name"], "cat": "render", "ph": "X",
+                                    "ts": sp["ts"], "dur": sp["dur"],
+                                    "pid": pid, "tid": tid, "args": sp.get("args", {})})
+
+    def to_json(self):
+        meta = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "coordinator"}},
+                {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "workers"}}]
+        return json.dumps({"traceEvents": meta + self.events, "displayTimeUnit": "ms"})
+
+
+def save_trace(trace, job_id):
+    """Upload a job's Chrome trace JSON; returns (key, presigned url)."""
+    key = f"renders/{job_id}/trace.json"
+    s3.put_object(Bucket=BUCKET, Key=key, Body=trace.to_json(),
+                  ContentType="application/json")
+    url = s3.generate_presigned_url(
+        "get_object", Params={"Bucket": BUCKET, "Key": key},
+        ExpiresIn=PRESIGN_EXPIRY)
+    return key, url
+
+
+def delete_keys(keys):
+    """Best-effort S3 batch delete: up to 1000 objects per call."""
+    for i in range(0, len(keys), 1000):
+        batch = keys[i:i + 1000]
+        try:
+            s3.delete_objects(Bucket=BUCKET, Delete={
+                "Objects": [{"Key": k} for k in batch],
+                "Quiet": True,
+            })
+        except Exception:
+            pass
+
+
+def s3_download(key, path):
+    """Stream an S3 object to a local file (parallel ranged GETs)."""
+    s3.download_file(BUCKET, key, path, Config=S3_TRANSFER)
+
+
+def s3_upload(path, key, content_type="application/octet-stream"):
+    """Stream a local file to S3 (parallel multipart PUT); returns its size."""
+    s3.upload_file(path, BUCKET, key, ExtraArgs={"ContentType": content_type},
+                   Config=S3_TRANSFER)
+    return os.path.getsize(path)
+
+
+def s3_exists(key):
+    try:
+        s3.head_object(Bucket=BUCKET, Key=key)
+        return True
+    except ClientError:
+        return False
+
+
 
 # ---- Render pipeline v2: separated compute + libvips image ----
 
 
+def coeff_spec(func_name, expr=None):
+    """Coefficient-family fields of a sweep/lores_viewport spec: a built-in
+    function name, plus an "expr" program (coeff_expr.h) that replaces it.
+    "expr" goes first: the binaries' findKey takes the first quoted match,
+    which would otherwise be a function name of "expr"."""
+    spec = {"expr": expr} if expr else {}
+    spec["function"] = func_name
+    return spec
+
+
+def run_tile_parts(args, on_part, what, input=None, timeout=840, env=None):
+    """Run a tiled sweep render or imgpipe --roots2image.  Each tile part
+    is reported on a stdout line as soon as it is written (raw_canvas.h)
+    and handed to on_part, so it can be uploaded and deleted while the run
+    goes on; returns the metadata on the last line."""
+    proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True, env=env)
+    stderr = []
+    drain = threading.Thread(target=lambda: stderr.append(proc.stderr.read()))
+    drain.start()
+    timer = threading.Timer(timeout, proc.kill)
+    timer.start()
+    meta = None
+    try:
+        proc.stdin.write(input or "")
+        proc.stdin.close()
+        for line in proc.stdout:
+            entry = json.loads(line)
+            if "path" in entry:
+                on_part(entry)
+            else:
+                meta = entry
+    finally:
+        timer.cancel()
+        proc.wait()
+        drain.join()
+    if proc.returncode != 0 or meta is None:
+        raise RuntimeError(f"{what} failed: {''.join(stderr).strip()}")
+    return meta
+
+
+def roots2image(bin_path, raw_path, width, height, degree, view, tile=0, on_part=None):
+    """Render a sweep .bin to a raw image with imgpipe --roots2image.
+    `view` supplies center_re/center_im/scale and the color settings.
+    With `tile`, writes tile parts {raw_path minus .raw}_{tx}_{ty}_p{k}.raw
+    instead, handing each to on_part as it appears (see run_tile_parts),
+    and lists the hit tiles in the returned "tiles"."""
+    args = [IMGPIPE, "--roots2image", bin_path, raw_path,
+            f"--width={width}", f"--height={height}",
+            f"--center_re={view['center_re']}", f"--center_im={view['center_im']}",
+            f"--scale={view['scale']}", f"--degree={degree}",
+            f"--color={view.get('color', 'rainbow')}",
+            f"--match={view.get('match', 'none')}",
+            f"--palette={view.get('palette', 'inferno')}",
+            f"--constant_color={view.get('constant_color', 'ffffff')}"]
+    if tile:
+        args.append(f"--tile={tile}")
+        if view.get("resident_tiles"):
+            args.append(f"--resident_tiles={view['resident_tiles']}")
+        return run_tile_parts(args, on_part, "imgpipe roots2image",
+                              timeout=300, env=_imgpipe_env())
+    result = subprocess.run(
+        args,
+        capture_output=True, text=True,
+        timeout=300, env=_imgpipe_env()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"imgpipe roots2image failed: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def root_encoding_spec(encoding, view, width, height, views=()):
+    """Grid-spec fields for a quantized root file (root_codec.h) instead of
+    the float32 .bin: "q16" or "delta", or {} for "f32".  The bins are a
+    1/ROOT_QUANTA_PER_PIXEL pixel of `view` (finer if `views` zoom in
+    further), on a lattice through the view's pixel corner, so every bin
+    falls inside one of its pixels and the view renders exactly as from
+    float32."""
+    if encoding in (None, "f32"):
+        return {}
+    scale = view["scale"]
+    zoom = max([1.0] + [v["scale"] / scale for v in views if "scale" in v])
+    return {"encoding": encoding,
+            "quantum": 1.0 / (ROOT_QUANTA_PER_PIXEL * math.ceil(zoom) * scale),
+            "anchor_re": view["center_re"] - width / 2 / scale,
+            "anchor_im": view["center_im"] + height / 2 / scale}
+
+
+def fused_render_ok(view):
+    """True if sweep's render mode can plot `view` while solving: rainbow or
+    constant color with no imgpipe matching.  Proximity coloring and
+    matching need the whole root set, so they keep the .bin + roots2image
+    path, as does a request with "fused": false."""
+    return (view.get("fused", True)
+            and view.get("color", "rainbow") in FUSED_COLORS
+            and view.get("match", "none") == "none")
+
+
+def sweep_render(spec, raw_path, width, height, view, tile=0, timeout=840,
+                 on_part=None):
+    """Solve and plot in one sweep run ("mode": "render"), so the f32 .bin is
+    never written.  `spec` is a grid spec; `view` supplies the viewport and
+    color as for roots2image, whose output (raw_path, or tile parts handed
+    to on_part with `tile`) and roots_plotted/roots_clipped/tiles fields
+    sweep reproduces.  Returns sweep's metadata."""
+    spec = {**spec, "mode": "render",
+            "width": width, "height": height,
+            "center_re": view["center_re"], "center_im": view["center_im"],
+            "scale": view["scale"],
+            "color": view.get("color", "rainbow"),
+            "constant_color": view.get("constant_color", "ffffff")}
+    if tile:
+        spec["tile"] = tile
+        if view.get("resident_tiles"):
+            spec["resident_tiles"] = view["resident_tiles"]
+        return run_tile_parts([SWEEP, raw_path], on_part, "sweep render",
+                              input=json.dumps(spec), timeout=timeout)
+    result = subprocess.run(
+        [SWEEP, raw_path],
+        input=json.dumps(spec),
+        capture_output=True, text=True,
+        timeout=timeout
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"sweep render failed: {result.stderr.strip()}")
+    return json.loads(result.stdout)
+
+
+def dzsave_upload(raw_path, key_base, quality=90, tile_size=254, overlap=1,
+                  tile_format="jpeg"):
+    """Cut a raw image into a Deep Zoom pyramid and upload it under key_base.
+    Writes {key_base}.dzi and {key_base}_files/<level>/<x>_<y>.<fmt>;
+    returns the pyramid manifest."""
+    import concurrent.futures
+    import shutil
+
+    out_dir = f"/tmp/dz_{uuid.uuid4().hex[:8]}"
+    os.makedirs(out_dir)
+    out_base = os.path.join(out_dir, "image")
+    try:
+        result = subprocess.run(
+            [IMGPIPE, "--dzsave", raw_path, out_base,
+             f"--tile_size={tile_size}", f"--overlap={overlap}",
+             f"--suffix={tile_format}", f"--quality={quality}"],
+            capture_output=True, text=True, timeout=600, env=_imgpipe_env())
+        if result.returncode != 0:
+            raise RuntimeError(f"imgpipe dzsave failed: {result.stderr.strip()}")
+        meta = json.loads(result.stdout)
+
+        tiles_dir = out_base + "_files"
+        tile_type = "image/png" if meta["format"] == "png" else "image/jpeg"
+        uploads = []
+        for root, _, files in os.walk(tiles_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, tiles_dir).replace(os.sep, "/")
+                uploads.append((path, f"{key_base}_files/{rel}"))
+
+        def put_tile(item):
+            path, key = item
+            with open(path, "rb") as f:
+                s3.put_object(Bucket=BUCKET, Key=key, Body=f, ContentType=tile_type)
+            return os.path.getsize(path)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=32) as pool:
+            total_bytes = sum(pool.map(put_tile, uploads))
+
+        dzi_key = key_base + ".dzi"
+        with open(out_base + ".dzi", "rb") as f:
+            dzi_bytes = f.read()
+        s3.put_object(Bucket=BUCKET, Key=dzi_key, Body=dzi_bytes,
+                      ContentType="application/xml")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return {
+        "dzi_key": dzi_key,
+        "dzi_url": s3.generate_presigned_url(
+            "get_object", Params={"Bucket": BUCKET, "Key": dzi_key},
+            ExpiresIn=PRESIGN_EXPIRY),
+        "tiles_prefix": key_base + "_files/",
+        "width": meta["width"], "height": meta["height"],
+        "levels": meta["levels"], "tile_size": meta["tile_size"],
+        "overlap": meta["overlap"], "tile_format": meta["format"],
+        "n_tiles": len(uploads),
+        "file_size": total_bytes + len(dzi_bytes),
+    }
+
+
+class RenderCancelled(Exception):
+    """Raised when a cancel marker is found for the running job."""
+
+
+def cancel_key(job_id):
+    return f"renders/{job_id}/cancel"
+
+
+def list_keys(prefix):
+    """Every S3 key under `prefix`."""
+    keys, token = [], {}
+    while True:
+        page = s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix, **token)
+        keys += [o["Key"] for o in page.get("Contents", [])]
+        if not page.get("IsTruncated"):
+            return keys
+        token = {"ContinuationToken": page["NextContinuationToken"]}
+
+
+def job_scratch_keys(job_id, preview=False):
+    """Intermediate objects of a striped job: stripe and batch raws and
+    sidecars (every view, tile and hedge copy), merge outputs, the saved
+    plan and the cancel marker, plus the preview with `preview`.  Listed from S3 rather than
+    derived from the results, so units that never reported back are
+    included."""
+    prefix = f"renders/{job_id}/"
+    scratch = ("stripe_", "batch_", "merge", "plan.", "cancel") + (("preview.",) if preview else ())
+    return [k for k in list_keys(prefix) if k[len(prefix):].startswith(scratch)]
+
+
+def publish_status(job_id, **fields):
+    """Overwrite renders/{job_id}/status.json; read back through /status."""
+    s3.put_object(Bucket=BUCKET, Key=f"renders/{job_id}/status.json",
+                  Body=json.dumps({"job_id": job_id, "updated": time.time(), **fields}),
+                  ContentType="application/json")
+
+
+def job_status(job_id):
+    """Last published status of a job, or None."""
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=f"renders/{job_id}/status.json")
+    except ClientError:
+        return None
+    return json.loads(obj["Body"].read()).get("status")
+
+
+def copy_suffix(params):
+    """Key suffix of a hedged copy's objects ("copy" in a worker body or its
+    result); empty for unhedged work."""
+    return f"_c{params['copy']}" if "copy" in params else ""
+
+
+def discard_unused(params, meta_key, keys, meta):
+    """Worker side of /cancel and hedging: delete the objects this worker
+    wrote when nothing will read them, which the coordinator's cleanup can
+    have missed.  That is when the job was cancelled while it ran, or, for a
+    hedged copy, when the job completed or the other copy's result was
+    promoted to the unit's sidecar `meta_key`.  A hedged copy that finishes
+    after its job failed, with no result promoted, promotes `meta` itself
+    so a resume can reuse it.  Returns whether the objects were deleted."""
+    status = job_status(params["job_id"])
+    unused = status == "cancelled"
+    if "copy" in params and not unused:
+        try:
+            obj = s3.get_object(Bucket=BUCKET, Key=meta_key)
+            unused = json.loads(obj["Body"].read()).get("copy") != params["copy"]
+        except ClientError:
+            unused = status == "complete"
+            if status == "failed":
+                s3.put_object(Bucket=BUCKET, Key=meta_key, Body=json.dumps(meta),
+                              ContentType="application/json")
+    if unused:
+        delete_keys(keys)
+    return unused
+
+
+def handle_status(event):
+    """Return the last published status of a job: {job_id, status, preview_url, ...}."""
+    params = parse_body(event)
+    job_id = params["job_id"]
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=f"renders/{job_id}/status.json")
+    except ClientError:
+        return err_response(404, f"unknown job: {job_id}")
+    return ok_response(json.loads(obj["Body"].read()))
+
+
+def handle_cancel(event):
+    """Drop a cancel marker; the coordinator stops at its next check."""
+    params = parse_body(event)
+    job_id = params["job_id"]
+    s3.put_object(Bucket=BUCKET, Key=cancel_key(job_id), Body=b"",
+                  ContentType="application/octet-stream")
+    return ok_response({"job_id": job_id, "status": "cancelling"})
+
+
+def run_hedged(fn, items, quantile=HEDGE_QUANTILE, multiplier=HEDGE_MULTIPLIER,
+               cancel_check=None, on_result=None, on_discard=None):
+    """Run fn(item, copy) for every item in parallel with speculative
+    re-execution.
+
+    Once `quantile` of the items have finished, any item still running for
+    longer than `multiplier` x the median completion time gets a second copy
+    submitted.  `copy` is 0 for the original and 1 for the hedge, so the two
+    can write distinct S3 keys.  Whichever copy finishes first wins.
+    `cancel_check`, if given, is polled every CANCEL_POLL_S and raises
+    RenderCancelled to abandon the remaining items.
+    `on_result`, if given, is called with each item's winning result as
+    soon as it arrives.  `on_discard`, if given, is called with the result
+    of each losing copy when it finishes, which can be after this returns.
+    Returns (results in item order, {"hedges_fired", "hedges_won"}).
+    """
+    import concurrent.futures
+    import statistics
+
+    n = len(items)
+    # Room for one hedge per item, within the invocation budget; losing
+    # copies are abandoned, not awaited
+    pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(2 * n, INVOKE_CONCURRENCY)))
+    owner = {}         # future -> (item index, is_hedge)
+    started = {}       # item index -> start time of the original copy
+    results = [None] * n
+    finished = [False] * n
+    durations = []
+    hedged = set()
+    hedges_won = 0
+    last_cancel_check = time.time()
+
+    def run(i, item, copy):
+        # Items queued behind the pool limit are not stragglers yet
+        started.setdefault(i, time.time())
+        return fn(item, copy)
+
+    def discard(fut):
+        if not fut.cancelled() and fut.exception() is None:
+            on_discard(fut.result())
+
+    for i, item in enumerate(items):
+        owner[pool.submit(run, i, item, 0)] = (i, False)
+    pending = set(owner)
+
+    try:
+        while not all(finished):
+            done, pending = concurrent.futures.wait(
+                pending, timeout=HEDGE_POLL_S,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                i, is_hedge = owner[fut]
+                if finished[i]:
+                    # The other copy already won
+                    if on_discard:
+                        discard(fut)
+                    continue
+                exc = fut.exception()
+                if exc is not None:
+                    # Fail only when no other copy of this item is still running
+                    if any(owner[f][0] == i for f in pending):
+                        continue
+                    raise exc
+                results[i] = fut.result()
+                finished[i] = True
+                durations.append(time.time() - started[i])
+                if is_hedge:
+                    hedges_won += 1
+                if on_result:
+                    on_result(results[i])
+
+            if durations and len(durations) >= quantile * n:
+                threshold = multiplier * statistics.median(durations)
+                now = time.time()
+                for i in range(n):
+                    if (not finished[i] and i not in hedged and i in started
+                            and now - started[i] > threshold):
+                        hedged.add(i)
+                        fut = pool.submit(run, i, items[i], 1)
+                        owner[fut] = (i, True)
+                        pending.add(fut)
+
+            if cancel_check and time.time() - last_cancel_check > CANCEL_POLL_S:
+                last_cancel_check = time.time()
+                cancel_check()
+    finally:
+        # Losing copies still running are not awaited; their results are
+        # discarded when they arrive
+        if on_discard:
+            for fut in pending:
+                if finished[owner[fut][0]]:
+                    fut.add_done_callback(discard)
+        pool.shutdown(wait=False)
+
+    return results, {"hedges_fired": len(hedged), "hedges_won": hedges_won}
+
+
+def load_history():
+    try:
+        obj = s3.get_object(Bucket=BUCKET, Key=PLANNER_HISTORY_KEY)
+        return json.loads(obj["Body"].read())
+    except Exception:
+        return []
+
+
+def record_history(record):
+    """Append one job's timing record to the planner history (best-effort:
+    concurrent jobs may drop each other's records)."""
+    try:
+        history = load_history()[-(PLANNER_HISTORY_MAX - 1):] + [record]
+        s3.put_object(Bucket=BUCKET, Key=PLANNER_HISTORY_KEY,
+                      Body=json.dumps(history), ContentType="application/json")
+    except Exception:
+        pass
+
+
+def fit_cost_model(history, func_name):
+    """Per-unit costs (medians) from past striped renders; records for the
+    same function are preferred when there are enough of them.
+
+      compute_us = compute_per * cells * degree^2   (Ehrlich-Aberth)
+      render_us  = render_per * cells * degree      (one plot per root)
+      overhead   = stripe wall time not explained by its share of the work
+                   (cold start, spawn, upload, imbalance)
+      reduce     = per-round latency per megapixel
+      encode     = per megapixel
+    Returns None when there is too little history."""
+    import statistics
+
+    history = [r for r in history if r.get("degree", 0) > 0 and r.get("cells")]
+    same = [r for r in history if r["function"] == func_name]
+    records = same if len(same) >= PLANNER_MIN_RECORDS else history
+    if len(records) < PLANNER_MIN_RECORDS:
+        return None
+
+    def med(values):
+        return statistics.median(values) if values else 0.0
+
+    return {
+        "compute_per": med([r["total_compute_us"] / (r["cells"] * r["degree"] ** 2)
+                            for r in records]),
+        "render_per": med([r["total_render_us"] / (r["cells"] * r["degree"])
+                           for r in records]),
+        "overhead_us": med([max(0.0, r["compute_wall_us"] - (r["total_compute_us"]
+                                + r["total_render_us"]) / r["n_stripes"])
+                            for r in records]),
+        "reduce_round_us_per_mpix": med([r["reduce_us"] / max(1, r["reduce_rounds"]) / r["mpix"]
+                                         for r in records]),
+        "encode_us_per_mpix": med([r["encode_us"] / r["mpix"] for r in records]),
+        "records": len(records),
+        "max_n_stripes": max(r["n_stripes"] for r in records),
+    }
+
+
+def predict_render(model, n_stripes, per_worker, cells, degree, mpix):
+    """Predicted phase times (us) and worker cost (summed worker-us) of a plan."""
+    work = (model["compute_per"] * cells * degree ** 2
+            + model["render_per"] * cells * degree)
+    invocations = -(-n_stripes // per_worker)
+    rounds = math.ceil(math.log2(invocations)) if invocations > 1 else 0
+    round_us = model["reduce_round_us_per_mpix"] * mpix
+    compute_wall = model["overhead_us"] + work / n_stripes
+    reduce_us = round_us * rounds
+    encode_us = model["encode_us_per_mpix"] * mpix
+    return {
+        "compute_wall_us": int(compute_wall),
+        "reduce_us": int(reduce_us),
+        "encode_us": int(encode_us),
+        "total_us": int(compute_wall + reduce_us + encode_us),
+        "cost_us": int(work + invocations * model["overhead_us"]
+                       + (invocations - 1) * round_us + encode_us),
+    }
+
+
+def plan_render(func_name, n1, n2, width, height, degree, cost_budget_s=None):
+    """Pick n_stripes and stripes_per_worker for a striped render.
+
+    Without enough history the fixed rule applies: one stripe per 50k
+    cells, clamped to 2-10, and a `cost_budget_s` is reported as not
+    applied.  With it, stripe counts are scored with the
+    fitted cost model and the fastest plan within `cost_budget_s` (summed
+    worker-seconds) wins, or the cheapest if none fits.  The model only
+    knows the stripe counts its records ran with, so candidates stay within
+    PLANNER_CLAMP_FACTOR of the heuristic count until there are
+    PLANNER_TRUSTED_RECORDS records, and of the largest recorded count
+    after that.  Reduce fan-in is the pairwise /reduce-pair tree, so it is
+    always 2."""
+    cells = n1 * n2
+    mpix = width * height / 1e6
+    heuristic = min(max(cells // 50000, 2), 10)
+    model = fit_cost_model(load_history(), func_name)
+    if model is None:
+        plan = {"source": "heuristic", "n_stripes": heuristic,
+                "stripes_per_worker": choose_stripes_per_worker(heuristic, width, height),
+                "fan_in": 2}
+        if cost_budget_s is not None:
+            # No model to price plans with, so the budget cannot be enforced
+            plan.update(cost_budget_s=cost_budget_s, budget_applied=False)
+        return plan
+
+    if model["records"] < PLANNER_TRUSTED_RECORDS:
+        lo = max(2, heuristic // PLANNER_CLAMP_FACTOR)
+        hi = heuristic * PLANNER_CLAMP_FACTOR
+    else:
+        lo, hi = 2, model["max_n_stripes"] * PLANNER_CLAMP_FACTOR
+    candidates = []
+    for n in range(lo, min(hi, 500) + 1):
+        per_worker = choose_stripes_per_worker(n, width, height)
+        candidates.append((n, per_worker,
+                           predict_render(model, n, per_worker, cells, degree, mpix)))
+    within = [c for c in candidates
+              if cost_budget_s is None or c[2]["cost_us"] <= cost_budget_s * 1e6]
+    if within:
+        n, per_worker, predicted = min(within, key=lambda c: c[2]["total_us"])
+    else:
+        n, per_worker, predicted = min(candidates, key=lambda c: c[2]["cost_us"])
+    return {"source": "history", "n_stripes": n, "stripes_per_worker": per_worker,
+            "fan_in": 2, "history_records": model["records"],
+            "stripe_range": [lo, min(hi, 500)],
+            "cost_budget_s": cost_budget_s, "predicted": predicted}
+
+
 def handle_compute_render_stripe(event):
     """Per-stripe worker: compute roots via sweep binary, render to raw via imgpipe.
     1. Run sweep --mode=grid to produce /tmp/stripe.bin (f32 root positions)
     2. Run imgpipe --roots2image to produce /tmp/stripe.raw (12-byte header + pixels)
     3. Upload stripe.raw to S3
     4. Return metadata
+    Steps 2-3 repeat per entry of an optional "views" list, sharing the roots.
+    With "render_tile", step 2 writes canvas tiles in parts, a bounded
+    number of tiles held at once, and each part is uploaded as
+    stripe_{idx}_t{tx}_{ty}_p{k}.raw while the render goes on.
+    Without "views", colors that fused_render_ok accepts merge steps 1-2 into
+    one sweep render-mode run, and no .bin is written.
     """
+    t_start = time.time()
     params = parse_body(event)
     job_id = params["job_id"]
     stripe_idx = params["stripe_idx"]
@@ -91,87 +898,342 @@ def handle_compute_render_stripe(event):
     degree = params["degree"]
 
     bin_path = "/tmp/stripe.bin"
-    raw_path = "/tmp/stripe.raw"
+    views = params.get("views")
+    render_tile = params.get("render_tile", 0)
+    fused = fused_render_ok(params) and (render_tile or not views)
 
-    # Step 1: compute roots
+    # Step 1: compute roots (fused: and render them)
     spec = {
         "mode": "grid",
-        "function": params["function"],
+        **coeff_spec(params["function"], params.get("expr")),
         "n1": params["n1"],
         "n2": params["n2"],
         "i1_start": params["i1_start"],
         "i1_end": params["i1_end"],
         "match_roots": False,  # no need for root tracking in render
+        # One serpentine chain per vCPU (10 GB Lambdas expose ~6)
+        "threads": params.get("threads") or os.cpu_count() or 1,
+        "simd": params.get("simd", False),
     }
+    # Tiled: tile parts upload as they are written, so /tmp holds only
+    # the parts not yet uploaded (raw_canvas.h)
+    uploaded = []
+    key_base = f"renders/{job_id}/stripe_{stripe_idx}{copy_suffix(params)}"
+    part_pool = part_uploads = None
+    if render_tile:
+        import concurrent.futures
+        part_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        part_uploads = []
+
+        def upload_part(entry):
+            tx, ty, k = entry["tile"]
+            key = f"{key_base}_t{tx}_{ty}_p{k}.raw"
+            size = s3_upload(entry["path"], key)
+            os.remove(entry["path"])
+            return key, size
+
+        def on_part(entry):
+            part_uploads.append(part_pool.submit(upload_part, entry))
+
     t0 = time.time()
-    result = subprocess.run(
-        [SWEEP, bin_path],
-        input=json.dumps(spec),
-        capture_output=True, text=True,
-        timeout=840
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f"sweep failed: {result.stderr.strip()}")
-    compute_meta = json.loads(result.stdout)
+    if not fused:
+        # A frame chunk's bins follow the deepest zoom of the whole
+        # animation ("max_scale"), so chunking does not change them
+        bin_views = list(views or ()) + (
+            [{"scale": params["max_scale"]}] if "max_scale" in params else [])
+        spec.update(root_encoding_spec(params.get("root_encoding"), params,
+                                       width, height, bin_views))
+    if fused:
+        raw_path = "/tmp/stripe_tile.raw" if render_tile else "/tmp/stripe_v0.raw"
+        compute_meta = sweep_render(spec, raw_path, width, height, params,
+                                    tile=render_tile,
+                                    on_part=on_part if render_tile else None)
+    else:
+        result = subprocess.run(
+            [SWEEP, bin_path],
+            input=json.dumps(spec),
+            capture_output=True, text=True,
+            timeout=840
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"sweep failed: {result.stderr.strip()}")
+        compute_meta = json.loads(result.stdout)
     compute_us = int((time.time() - t0) * 1e6)
 
-    # Step 2: render roots to raw image via imgpipe
-    t1 = time.time()
-    color_mode = params.get("color", "rainbow")
-    match_mode = params.get("match", "none")
-    palette = params.get("palette", "inferno")
-    constant_color = params.get("constant_color", "ffffff")
-    imgpipe_args = [
-        IMGPIPE, "--roots2image", bin_path, raw_path,
-        f"--width={width}", f"--height={height}",
-        f"--center_re={params['center_re']}", f"--center_im={params['center_im']}",
-        f"--scale={params['scale']}", f"--degree={degree}",
-        f"--color={color_mode}", f"--match={match_mode}",
-        f"--palette={palette}", f"--constant_color={constant_color}",
-    ]
-    result = subprocess.run(
-        imgpipe_args,
-        capture_output=True, text=True,
-        timeout=300, env=_imgpipe_env()
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f"imgpipe roots2image failed: {result.stderr.strip()}")
-    render_meta = json.loads(result.stdout)
-    render_us = int((time.time() - t1) * 1e6)
-
-    # Step 3: upload raw image to S3
-    s3_key = f"renders/{job_id}/stripe_{stripe_idx}.raw"
-    with open(raw_path, "rb") as f:
-        raw_data = f.read()
-    s3.put_object(Bucket=BUCKET, Key=s3_key,
-                  Body=raw_data, ContentType="application/octet-stream")
-
-    # Cleanup tmp
-    for p in [bin_path, raw_path]:
+    # Step 2: render roots to one raw image per view via imgpipe.
+    # Without "views" there is a single view taken from the request itself.
+    # With "views" (animation frames, presentation variants) each entry
+    # overrides viewport/color settings and gets its own _v{n} output key.
+    # A fused sweep has already written the image.
+    view_results = []
+    spans = []
+    render_us = 0
+    raw_size = 0
+    tiles = []
+    # A hedged copy writes its own keys; see fan_out_stripes
+    if render_tile:
+        t1 = time.time()
+        render_meta = compute_meta if fused else roots2image(
+            bin_path, "/tmp/stripe_tile.raw", width, height, degree, params,
+            tile=render_tile, on_part=on_part)
+        t2 = time.time()
+        render_us = int((t2 - t1) * 1e6)
+        part_pool.shutdown()
+        for fut in part_uploads:
+            key, size = fut.result()
+            uploaded.append(key)
+            raw_size += size
+        tiles = [[tx, ty, parts] for tx, ty, _, parts in render_meta["tiles"]]
+        view_results.append({"s3_key": None,
+                             "roots_plotted": render_meta["roots_plotted"],
+                             "roots_clipped": render_meta["roots_clipped"]})
+        if not fused:
+            spans.append(make_span("roots2image", t1, t2, tiles=len(tiles)))
+        spans.append(make_span("s3 put", t2, time.time(), bytes=raw_size))
+    for v, view in enumerate([] if render_tile else views or [{}]):
+        t1 = time.time()
+        raw_path = f"/tmp/stripe_v{v}.raw"
+        render_meta = compute_meta if fused else roots2image(
+            bin_path, raw_path, width, height, degree, {**params, **view})
+        t2 = time.time()
+        render_us += int((t2 - t1) * 1e6)
+
+        # Step 3: upload raw image to S3
+        if views:
+            s3_key = f"{key_base}_v{v}.raw"
+        else:
+            s3_key = f"{key_base}.raw"
+        put_bytes = s3_upload(raw_path, s3_key)
+        uploaded.append(s3_key)
+        t3 = time.time()
+        raw_size += put_bytes
         try:
-            os.remove(p)
+            os.remove(raw_path)
         except OSError:
             pass
+        view_results.append({"s3_key": s3_key,
+                             "roots_plotted": render_meta["roots_plotted"],
+                             "roots_clipped": render_meta["roots_clipped"]})
+        if not fused:
+            spans.append(make_span("roots2image", t1, t2, view=v))
+        spans.append(make_span("s3 put", t2, t3, bytes=put_bytes))
 
-    return ok_response({
+    # Cleanup tmp
+    try:
+        os.remove(bin_path)
+    except OSError:
+        pass
+
+    meta = {
         "stripe_idx": stripe_idx,
-        "s3_key": s3_key,
-        "raw_size": len(raw_data),
+        "rows": [params["i1_start"], params["i1_end"]],
+        "s3_key": view_results[0]["s3_key"],
+        "raw_size": raw_size,
         "compute_us": compute_us,
         "render_us": render_us,
-        "roots_plotted": render_meta["roots_plotted"],
-        "roots_clipped": render_meta["roots_clipped"],
+        "roots_plotted": view_results[0]["roots_plotted"],
+        "roots_clipped": view_results[0]["roots_clipped"],
         "n_t": compute_meta["n_t"],
         "degree": compute_meta["degree"],
         "avg_iterations": compute_meta["avg_iterations"],
-    })
+        "fused": bool(fused),
+    }
+    if views and not render_tile:
+        meta["views"] = view_results
+    if render_tile:
+        meta["tiles"] = tiles
+    # Sidecar written after the raw images: its presence marks the stripe
+    # complete, so a resumed job can skip it.  A hedged copy's is written by
+    # the coordinator if it wins.
+    meta_key = f"renders/{job_id}/stripe_{stripe_idx}.json"
+    if "copy" in params:
+        meta["copy"] = params["copy"]
+    else:
+        s3.put_object(Bucket=BUCKET, Key=meta_key,
+                      Body=json.dumps(meta), ContentType="application/json")
+        uploaded.append(meta_key)
+    discard_unused(params, meta_key, uploaded, meta)
+    meta["spans"] = [
+        make_span("compute-render-stripe", t_start, time.time(), stripe_idx=stripe_idx),
+        make_span("sweep", t0, t0 + compute_us / 1e6, n_t=compute_meta["n_t"],
+                  fused=bool(fused), threads=compute_meta.get("threads", [])),
+    ] + spans
+    return ok_response(meta)
+
+
+def choose_stripes_per_worker(n_stripes, width, height):
+    """Stripes per batch invocation from worker memory and vCPUs.
+    Each concurrent stripe holds a full W x H x 3 image; the local merge
+    needs two more.  Batches stay small enough to keep BATCH_MIN_WORKERS
+    invocations running."""
+    raw_mb = width * height * 3 / (1 << 20)
+    mem_slots = int(LAMBDA_MEMORY_MB * 0.6 // max(raw_mb, 1)) - 2
+    concurrency = max(1, min(os.cpu_count() or 1, mem_slots))
+    return max(1, min(concurrency, n_stripes // BATCH_MIN_WORKERS))
+
+
+def handle_compute_render_batch(event):
+    """Batch worker: several stripes in one invocation.
+    Computes and renders each stripe range with local concurrency, merges the
+    stripe images locally with imgpipe --reduce and uploads a single raw,
+    so a batch costs one invocation, one upload and one reduce input.
+    Input: stripe fields + {batch_idx, stripes: [[stripe_idx, i1_start, i1_end], ...]}
+    Output: renders/{job_id}/batch_{batch_idx}.raw (+ .json sidecar)
+    """
+    import concurrent.futures
+    import shutil
+
+    t_start = time.time()
+    params = parse_body(event)
+    job_id = params["job_id"]
+    batch_idx = params["batch_idx"]
+    stripes = params["stripes"]
+    width = params["width"]
+    height = params["height"]
+    degree = params["degree"]
+    gamma = params.get("gamma", 2.2)
+    cpus = os.cpu_count() or 1
+    concurrency = max(1, min(len(stripes), params.get("concurrency") or cpus))
+    # Split the vCPUs between concurrent sweeps
+    threads = max(1, cpus // concurrency)
+    fused = fused_render_ok(params)
+
+    # Unique scratch dir: concurrent stripes and warm-container reuse never
+    # share tmp paths
+    work_dir = f"/tmp/batch_{uuid.uuid4().hex[:8]}"
+    os.makedirs(work_dir)
+    spans = []
+
+    def run_stripe(stripe):
+        idx, i1_start, i1_end = stripe
+        bin_path = f"{work_dir}/stripe_{idx}.bin"
+        raw_path = f"{work_dir}/stripe_{idx}.raw"
+        spec = {
+            "mode": "grid",
+            **coeff_spec(params["function"], params.get("expr")),
+            "n1": params["n1"],
+            "n2": params["n2"],
+            "i1_start": i1_start,
+            "i1_end": i1_end,
+            "match_roots": False,
+            "threads": threads,
+            "simd": params.get("simd", False),
+            **root_encoding_spec(params.get("root_encoding"), params, width, height),
+        }
+        t0 = time.time()
+        if fused:
+            compute_meta = render_meta = sweep_render(
+                spec, raw_path, width, height, params)
+            t1 = t2 = time.time()
+        else:
+            result = subprocess.run(
+                [SWEEP, bin_path],
+                input=json.dumps(spec),
+                capture_output=True, text=True,
+                timeout=840
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"sweep failed: {result.stderr.strip()}")
+            compute_meta = json.loads(result.stdout)
+            t1 = time.time()
+            render_meta = roots2image(bin_path, raw_path, width, height, degree, params)
+            t2 = time.time()
+            os.remove(bin_path)
+            spans.append(make_span("roots2image", t1, t2, stripe_idx=idx))
+        spans.append(make_span("sweep", t0, t1, stripe_idx=idx, n_t=compute_meta["n_t"],
+                               fused=fused))
+        return {
+            "raw_path": raw_path,
+            "compute_us": int((t1 - t0) * 1e6),
+            "render_us": int((t2 - t1) * 1e6),
+            "roots_plotted": render_meta["roots_plotted"],
+            "roots_clipped": render_meta["roots_clipped"],
+            "n_t": compute_meta["n_t"],
+            "degree": compute_meta["degree"],
+            "avg_iterations": compute_meta["avg_iterations"],
+        }
+
+    def merge_pair(pair):
+        left, right, out = pair
+        result = subprocess.run(
+            [IMGPIPE, "--reduce", left, right, out, f"--gamma={gamma}"],
+            capture_output=True, text=True,
+            timeout=120, env=_imgpipe_env()
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"imgpipe reduce failed: {result.stderr.strip()}")
+        os.remove(left)
+        os.remove(right)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            parts = list(pool.map(run_stripe, stripes))
+
+            # Local pairwise merge, same blend as the /reduce-pair tree
+            t_merge = time.time()
+            paths = [p["raw_path"] for p in parts]
+            round_num = 0
+            while len(paths) > 1:
+                pairs = [(paths[i], paths[i + 1], f"{work_dir}/merge_{round_num}_{i // 2}.raw")
+                         for i in range(0, len(paths) - 1, 2)]
+                list(pool.map(merge_pair, pairs))
+                paths = [out for _, _, out in pairs] + (paths[-1:] if len(paths) % 2 else [])
+                round_num += 1
+
+        t_upload = time.time()
+        s3_key = f"renders/{job_id}/batch_{batch_idx}{copy_suffix(params)}.raw"
+        raw_size = s3_upload(paths[0], s3_key)
+        t_done = time.time()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total_steps = sum(p["n_t"] for p in parts)
+    meta = {
+        "batch_idx": batch_idx,
+        "stripes": [st[0] for st in stripes],
+        "rows": [[st[1], st[2]] for st in stripes],
+        "s3_key": s3_key,
+        "raw_size": raw_size,
+        "compute_us": sum(p["compute_us"] for p in parts),
+        "render_us": sum(p["render_us"] for p in parts),
+        "roots_plotted": sum(p["roots_plotted"] for p in parts),
+        "roots_clipped": sum(p["roots_clipped"] for p in parts),
+        "n_t": total_steps,
+        "degree": parts[0]["degree"],
+        "avg_iterations": (sum(p["avg_iterations"] * p["n_t"] for p in parts)
+                           / total_steps if total_steps > 0 else 0),
+        "fused": fused,
+    }
+    # Sidecar marks the batch complete for resume (a hedged copy's is
+    # written by the coordinator if it wins)
+    meta_key = f"renders/{job_id}/batch_{batch_idx}.json"
+    uploaded = [s3_key]
+    if "copy" in params:
+        meta["copy"] = params["copy"]
+    else:
+        s3.put_object(Bucket=BUCKET, Key=meta_key,
+                      Body=json.dumps(meta), ContentType="application/json")
+        uploaded.append(meta_key)
+    discard_unused(params, meta_key, uploaded, meta)
+    meta["spans"] = [
+        make_span("compute-render-batch", t_start, time.time(),
+                  batch_idx=batch_idx, stripes=len(stripes), concurrency=concurrency),
+        make_span("local merge", t_merge, t_upload, rounds=round_num),
+        make_span("s3 put", t_upload, t_done, bytes=raw_size),
+    ] + spans
+    return ok_response(meta)
 
 
 def handle_reduce_pair(event):
     """Merge two raw images via imgpipe --reduce. Used by tree-reduce fan-out.
-    Input: {job_id, left_key, right_key, out_key}
+    Input: {job_id, left_key, right_key, out_key, gamma, blend}
+    Blend "add" (the default) sums in linear light; "over" paints the right
+    image's opaque pixels over the left (RGBA stripes, e.g. snapshot renders).
     Downloads left and right from S3, merges, uploads result.
     """
+    import concurrent.futures
+
+    t_start = time.time()
     params = parse_body(event)
     left_key = params["left_key"]
     right_key = params["right_key"]
@@ -181,18 +1243,18 @@ def handle_reduce_pair(event):
     right_path = "/tmp/right.raw"
     out_path = "/tmp/merged.raw"
 
-    # Download both images
-    obj = s3.get_object(Bucket=BUCKET, Key=left_key)
-    with open(left_path, "wb") as f:
-        f.write(obj["Body"].read())
-    obj = s3.get_object(Bucket=BUCKET, Key=right_key)
-    with open(right_path, "wb") as f:
-        f.write(obj["Body"].read())
+    # Download both images concurrently, streamed to disk
+    t0 = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(s3_download, [left_key, right_key], [left_path, right_path]))
 
     # Merge
+    t1 = time.time()
     gamma = params.get("gamma", 2.2)
     reduce_cmd = [IMGPIPE, "--reduce", left_path, right_path, out_path,
                   f"--gamma={gamma}"]
+    if params.get("blend", "add") == "over":
+        reduce_cmd.append("--over")
     result = subprocess.run(
         reduce_cmd, capture_output=True, text=True,
         timeout=120, env=_imgpipe_env()
@@ -201,10 +1263,9 @@ def handle_reduce_pair(event):
         raise RuntimeError(f"imgpipe reduce failed: {result.stderr.strip()}")
 
     # Upload result
-    with open(out_path, "rb") as f:
-        raw_data = f.read()
-    s3.put_object(Bucket=BUCKET, Key=out_key,
-                  Body=raw_data, ContentType="application/octet-stream")
+    t2 = time.time()
+    size = s3_upload(out_path, out_key)
+    t3 = time.time()
 
     for p in [left_path, right_path, out_path]:
         try:
@@ -212,15 +1273,23 @@ def handle_reduce_pair(event):
         except OSError:
             pass
 
-    return ok_response({"out_key": out_key, "size": len(raw_data)})
+    return ok_response({"out_key": out_key, "size": size, "spans": [
+        make_span("reduce-pair", t_start, time.time(), out_key=out_key),
+        make_span("s3 get", t0, t1),
+        make_span("reduce", t1, t2),
+        make_span("s3 put", t2, t3, bytes=size),
+    ]})
 
 
 def handle_encode_upload(event):
     """Encode a raw image in S3 to JPEG/PNG and upload the result.
     Runs on a worker Lambda so the coordinator never touches image data.
-    Input: {raw_key, out_key, format, quality}
-    Returns: {out_key, file_size, image_url}
+    Input: {raw_key, out_key, format, quality, tile_size, tile_overlap, tile_format,
+            background}
+    An RGBA raw is flattened onto `background` (RRGGBB, default black).
+    Returns: {out_key, file_size, image_url} (+ pyramid for format "dzi")
     """
+    t_start = time.time()
     params = parse_body(event)
     raw_key = params["raw_key"]
     out_key = params["out_key"]
@@ -228,34 +1297,65 @@ def handle_encode_upload(event):
     quality = params.get("quality", 90)
 
     in_path = "/tmp/encode_in.raw"
-    ext = "jpeg" if fmt != "png" else "png"
+    ext = fmt if fmt in ("png", "dzi") else "jpeg"
     out_path = f"/tmp/encode_out.{ext}"
 
     # Download source raw image
-    obj = s3.get_object(Bucket=BUCKET, Key=raw_key)
-    with open(in_path, "wb") as f:
-        f.write(obj["Body"].read())
+    t0 = time.time()
+    s3_download(raw_key, in_path)
+
+    if ext == "dzi":
+        # Tile pyramid: dzsave + parallel tile upload in one step
+        t1 = time.time()
+        pyramid = dzsave_upload(
+            in_path, out_key[:-len(".dzi")], quality=quality,
+            tile_size=params.get("tile_size", 254),
+            overlap=params.get("tile_overlap", 1),
+            tile_format=params.get("tile_format", "jpeg"))
+        os.remove(in_path)
+        return ok_response({
+            "out_key": pyramid["dzi_key"],
+            "file_size": pyramid["file_size"],
+            "image_url": pyramid["dzi_url"],
+            "pyramid": pyramid,
+            "spans": [
+                make_span("encode-upload", t_start, time.time(), out_key=out_key),
+                make_span("s3 get", t0, t1),
+                make_span("dzsave + upload", t1, time.time(),
+                          tiles=pyramid["n_tiles"], bytes=pyramid["file_size"]),
+            ],
+        })
 
     # Encode
+    t1 = time.time()
     encode_args = [IMGPIPE, "--encode", in_path, out_path]
     if ext == "jpeg":
         encode_args.append(f"--quality={quality}")
+    if params.get("background"):
+        encode_args.append(f"--background={params['background']}")
     result = subprocess.run(encode_args, capture_output=True, text=True,
                             timeout=300, env=_imgpipe_env())
     if result.returncode != 0:
         raise RuntimeError(f"imgpipe encode failed: {result.stderr.strip()}")
     encode_meta = json.loads(result.stdout)
 
-    # Upload
+    # Upload; with "inline", small images are also returned as base64 and
+    # the upload is skipped only if "upload" is explicitly false
+    t2 = time.time()
     content_type = "image/jpeg" if ext == "jpeg" else "image/png"
-    with open(out_path, "rb") as f:
-        s3.put_object(Bucket=BUCKET, Key=out_key,
-                      Body=f, ContentType=content_type)
-
-    image_url = s3.generate_presigned_url(
-        "get_object",
-        Params={"Bucket": BUCKET, "Key": out_key},
-        ExpiresIn=PRESIGN_EXPIRY)
+    inline = {}
+    if params.get("inline", False) and encode_meta["file_size"] <= INLINE_MAX_BYTES:
+        with open(out_path, "rb") as f:
+            inline = {"image_b64": base64.b64encode(f.read()).decode("ascii"),
+                      "image_mime": content_type}
+    image_url = None
+    if not inline or params.get("upload", True):
+        s3_upload(out_path, out_key, content_type)
+        image_url = s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": BUCKET, "Key": out_key},
+            ExpiresIn=PRESIGN_EXPIRY)
+    t3 = time.time()
 
     for p in [in_path, out_path]:
         try:
@@ -263,46 +1363,425 @@ def handle_encode_upload(event):
         except OSError:
             pass
 
+    spans = [
+        make_span("encode-upload", t_start, time.time(), out_key=out_key),
+        make_span("s3 get", t0, t1),
+        make_span("encode", t1, t2),
+    ]
+    if image_url:
+        spans.append(make_span("s3 put", t2, t3, bytes=encode_meta["file_size"]))
     return ok_response({
-        "out_key": out_key,
+        "out_key": out_key if image_url else None,
         "file_size": encode_meta["file_size"],
         "image_url": image_url,
+        **inline,
+        "spans": spans,
     })
 
 
-def handle_render_v2(event):
-    """Render pipeline v2: lores_viewport + parallel compute+render stripes + tree-reduce.
-    Uses libvips (via imgpipe binary) instead of Pillow."""
+class FanOutError(RuntimeError):
+    """A stripe failed after all attempts; finished stripes remain in S3."""
+
+    def __init__(self, msg, stripes_done):
+        super().__init__(msg)
+        self.stripes_done = stripes_done
+
+
+class ResumeMismatch(ValueError):
+    """A resumed job's sidecars do not match its stripe layout."""
+
+
+def fan_out_stripes(job_id, n1, n_stripes, stripe_body, params, trace=None,
+                    cancel_check=None, per_worker=1, on_result=None, view_chunks=None):
+    """Split rows 0..n1 into n_stripes and run /compute-render-stripe on each.
+
+    `stripe_body` holds the fields shared by every stripe.  With per_worker
+    > 1, consecutive stripes are grouped into /compute-render-batch calls
+    and each result covers a batch.  With `view_chunks` (a list of "views"
+    lists), every stripe runs once per chunk, as stripe c * n_stripes + s,
+    rendering chunk c's views.  Honors the request's
+    hedge/max_attempts/resume settings.  Hedged copies write their objects
+    under a "_c{copy}" suffix and no sidecar; the winner's result becomes
+    the unit's sidecar and the loser's objects are deleted.  `on_result` is
+    called with each result (resumed ones first) as soon as it is
+    available.  Returns
+    (per-invocation results in stripe order, hedge stats, number resumed);
+    raises FanOutError if an invocation fails after all attempts, and
+    ResumeMismatch if a resume finds sidecars from a different layout.
+    """
     import concurrent.futures
 
-    params = parse_body(event)
-    job_id = params.get("job_id", "render_" + str(uuid.uuid4())[:8])
-    fmt = params.get("format", "jpeg").lower()
-    quality = params.get("quality", 90)
-    width = params.get("width", 4096)
-    height = params.get("height", 4096)
-    func_name = params.get("function", "giga_5")
-    n1 = params.get("n1", 100)
-    n2 = params.get("n2", 100)
-    n_stripes = params.get("n_stripes", 1)
-    color_mode = params.get("color", "rainbow")
-    match_mode = params.get("match", "none")
-    palette = params.get("palette", "inferno")
-    constant_color = params.get("constant_color", "ffffff")
-    gamma = params.get("gamma", 2.2)
+    hedge = params.get("hedge", True)
+    max_attempts = max(1, params.get("max_attempts", MAX_ATTEMPTS))
+    resume = params.get("resume", False)
 
-    # Auto-decide stripe count
-    if n_stripes <= 1 and n1 * n2 > 50000:
-        n_stripes = min(max(n1 * n2 // 50000, 2), 10)
-    n_stripes = max(1, min(n_stripes, 500))
+    rows_per = n1 // n_stripes
+    stripes = []
+    for s in range(n_stripes):
+        i1_start = s * rows_per
+        i1_end = (s + 1) * rows_per if s < n_stripes - 1 else n1
+        stripes.append((s, i1_start, i1_end))
+    if view_chunks:
+        stripes = [(c * n_stripes + s, start, end)
+                   for c in range(len(view_chunks)) for s, start, end in stripes]
+
+    if per_worker > 1:
+        # Work units are batches of consecutive stripes
+        unit = "batch"
+        units = [(b, stripes[i:i + per_worker])
+                 for b, i in enumerate(range(0, len(stripes), per_worker))]
+    else:
+        unit = "stripe"
+        units = [(idx, (idx, start, end)) for idx, start, end in stripes]
+
+    def invoke_cr_stripe(unit_info, copy=None):
+        idx, work = unit_info
+        body = {**stripe_body, "job_id": job_id}
+        if copy is not None:
+            body["copy"] = copy
+        if unit == "batch":
+            return invoke_worker("/compute-render-batch", {
+                **body,
+                "batch_idx": idx,
+                "stripes": work,
+            }, max_attempts=max_attempts, trace=trace, label=f"batch {idx}")
+        _, start, end = work
+        if view_chunks:
+            body["views"] = view_chunks[idx // n_stripes]
+        return invoke_worker("/compute-render-stripe", {
+            **body,
+            "stripe_idx": idx,
+            "i1_start": start, "i1_end": end,
+        }, max_attempts=max_attempts, trace=trace, label=f"stripe {idx}")
+
+    def promote(meta):
+        # The first copy to finish becomes the unit's result
+        s3.put_object(Bucket=BUCKET, Key=f"renders/{job_id}/{unit}_{meta[f'{unit}_idx']}.json",
+                      Body=json.dumps({k: v for k, v in meta.items() if k != "spans"}),
+                      ContentType="application/json")
+        if on_result:
+            on_result(meta)
+
+    def discard(meta):
+        delete_keys(list_keys(
+            f"renders/{job_id}/{unit}_{meta[f'{unit}_idx']}{copy_suffix(meta)}"))
 
-    # Phase 1: viewport via lores_viewport binary
-    t_vp = time.time()
+    t0 = time.time()
+    # Resume: units whose metadata sidecar exists already finished in an
+    # earlier attempt of this job_id.  Every sidecar must be one of this
+    # layout's units and cover the same rows, or the merge would drop or
+    # double-count stripes.
+    resumed = {}
+    if resume:
+        expected = {idx: ([[st[1], st[2]] for st in work] if unit == "batch"
+                          else [work[1], work[2]])
+                    for idx, work in units}
+        prefix = f"renders/{job_id}/"
+        for key in list_keys(prefix):
+            m = re.fullmatch(r"(stripe|batch)_(\d+)\.json", key[len(prefix):])
+            if not m:
+                continue
+            idx = int(m.group(2))
+            if m.group(1) != unit or idx not in expected:
+                raise ResumeMismatch(
+                    f"{key[len(prefix):]} is not part of the layout being resumed "
+                    f"({n_stripes} stripes, {per_worker} per worker)")
+            obj = s3.get_object(Bucket=BUCKET, Key=key)
+            meta = json.loads(obj["Body"].read())
+            if meta.get("rows", expected[idx]) != expected[idx]:
+                raise ResumeMismatch(
+                    f"{key[len(prefix):]} covers rows {meta['rows']}, "
+                    f"expected {expected[idx]}")
+            resumed[idx] = meta
+    todo = [u for u in units if u[0] not in resumed]
+    if on_result:
+        for meta in resumed.values():
+            on_result(meta)
+
+    try:
+        if hedge and todo:
+            fresh, hedge_stats = run_hedged(
+                invoke_cr_stripe, todo,
+                quantile=params.get("hedge_quantile", HEDGE_QUANTILE),
+                multiplier=params.get("hedge_multiplier", HEDGE_MULTIPLIER),
+                cancel_check=cancel_check, on_result=promote, on_discard=discard)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max(1, min(len(todo), INVOKE_CONCURRENCY))) as pool:
+                futures = [pool.submit(invoke_cr_stripe, u) for u in todo]
+                if on_result:
+                    for fut in concurrent.futures.as_completed(futures):
+                        on_result(fut.result())
+                fresh = [fut.result() for fut in futures]
+            hedge_stats = {"hedges_fired": 0, "hedges_won": 0}
+    except RenderCancelled:
+        raise
+    except Exception as e:
+        done = sum(len(work) if unit == "batch" else 1
+                   for idx, work in units
+                   if idx in resumed or s3_exists(f"renders/{job_id}/{unit}_{idx}.json"))
+        raise FanOutError(f"stripe fan-out failed: {e}", done) from e
+    results = sorted(list(resumed.values()) + fresh, key=lambda r: r[f"{unit}_idx"])
+    if trace:
+        trace.add("compute", t0, time.time(), n_stripes=n_stripes,
+                  invocations=len(units), resumed=len(resumed), **hedge_stats)
+    n_resumed = sum(len(r["stripes"]) if unit == "batch" else 1
+                    for r in resumed.values())
+    return results, hedge_stats, n_resumed
+
+
+def tree_reduce(job_id, keys, merge_prefix, gamma, max_attempts=1,
+                resume=False, trace=None, blend="add"):
+    """Pairwise tree-reduce of raw images via parallel /reduce-pair invocations.
+    Round r writes {merge_prefix}_{r}_{i}.raw.  Pairs are always neighbours
+    in `keys`, so blend "over" (later keys painted over earlier ones) keeps
+    the key order.  Returns
+    ([final key], intermediate keys for cleanup, number of rounds)."""
+    import concurrent.futures
+
+    all_temp_keys = []  # track intermediate keys for cleanup
+    round_num = 0
+
+    def invoke_reduce_pair(pair_info):
+        left_key, right_key, out_key = pair_info
+        if resume and s3_exists(out_key):
+            return {"out_key": out_key, "resumed": True}
+        return invoke_worker("/reduce-pair", {
+            "job_id": job_id,
+            "left_key": left_key,
+            "right_key": right_key,
+            "out_key": out_key,
+            "gamma": gamma,
+            "blend": blend,
+        }, max_attempts=max_attempts, trace=trace, label=f"reduce {out_key.rsplit('/', 1)[-1]}")
+
+    # One pool for every round, sized for the widest (first) round
+    pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(len(keys) // 2, INVOKE_CONCURRENCY)))
+    try:
+        while len(keys) > 1:
+            pairs = []
+            next_keys = []
+            for i in range(0, len(keys), 2):
+                if i + 1 < len(keys):
+                    out_key = f"{merge_prefix}_{round_num}_{i // 2}.raw"
+                    pairs.append((keys[i], keys[i + 1], out_key))
+                    next_keys.append(out_key)
+                    all_temp_keys.append(out_key)
+                else:
+                    next_keys.append(keys[i])
+
+            t_round = time.time()
+            list(pool.map(invoke_reduce_pair, pairs))
+            if trace:
+                trace.add(f"reduce round {round_num}", t_round, time.time(),
+                          pairs=len(pairs), prefix=merge_prefix.rsplit("/", 1)[-1])
+
+            keys = next_keys
+            round_num += 1
+    finally:
+        pool.shutdown()
+
+    return keys, all_temp_keys, round_num
+
+
+class PipelinedReduce:
+    """Reduce-on-arrival: merge partial images as soon as two are available.
+
+    Stripe keys are add()ed as their workers finish.  Whenever two partial
+    results are ready a /reduce-pair is launched, and its output rejoins the
+    ready pool, so the merge tree builds while slow stripes still compute
+    instead of running one barrier round at a time.  Pairing follows arrival
+    order, so merge keys ({merge_prefix}_p{n}.raw) are not reproducible
+    across attempts; resumed jobs use tree_reduce instead.
+    """
+
+    def __init__(self, job_id, merge_prefix, gamma, max_attempts=1, trace=None,
+                 max_workers=50):
+        import concurrent.futures
+
+        self.job_id = job_id
+        self.merge_prefix = merge_prefix
+        self.gamma = gamma
+        self.max_attempts = max_attempts
+        self.trace = trace
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.cond = threading.Condition()
+        self.ready = []        # (key, tree depth) awaiting a partner
+        self.in_flight = 0
+        self.temp_keys = []
+        self.n_merges = 0
+        self.error = None
+        self.stopped = False
+
+    def add(self, key, depth=0):
+        with self.cond:
+            self.ready.append((key, depth))
+            self._launch()
+
+    def _launch(self):
+        # Caller holds self.cond
+        while len(self.ready) >= 2 and self.error is None and not self.stopped:
+            (left, d_left), (right, d_right) = self.ready.pop(0), self.ready.pop(0)
+            out_key = f"{self.merge_prefix}_p{self.n_merges}.raw"
+            self.n_merges += 1
+            self.temp_keys.append(out_key)
+            self.in_flight += 1
+            self.pool.submit(self._reduce, left, right, out_key,
+                             max(d_left, d_right) + 1)
+
+    def _reduce(self, left, right, out_key, depth):
+        try:
+            invoke_worker("/reduce-pair", {
+                "job_id": self.job_id,
+                "left_key": left,
+                "right_key": right,
+                "out_key": out_key,
+                "gamma": self.gamma,
+            }, max_attempts=self.max_attempts, trace=self.trace,
+                label=f"reduce {out_key.rsplit('/', 1)[-1]}")
+        except Exception as e:
+            with self.cond:
+                self.error = e
+                self.in_flight -= 1
+                self.cond.notify_all()
+            return
+        with self.cond:
+            self.in_flight -= 1
+            self.ready.append((out_key, depth))
+            self._launch()
+            self.cond.notify_all()
+
+    def stop(self):
+        """Launch no more merges and wait for those in flight (cancel)."""
+        with self.cond:
+            self.stopped = True
+            while self.in_flight:
+                self.cond.wait()
+        self.pool.shutdown(wait=False)
+
+    def finish(self):
+        """Wait until every added key has merged into one.  Call after the
+        last add().  Returns ([final key], intermediate keys, tree depth)."""
+        with self.cond:
+            while self.error is None and (self.in_flight or len(self.ready) > 1):
+                self.cond.wait()
+        self.pool.shutdown(wait=False)
+        if self.error is not None:
+            raise self.error
+        key, depth = self.ready[0]
+        return [key], self.temp_keys, depth
+
+
+def reduce_encode_tiles(job_id, results, ext, quality, gamma, max_attempts=1,
+                        resume=False, trace=None):
+    """Tree-reduce and encode each canvas tile independently, tiles in parallel.
+    A tile is merged only from the stripes that hit it; tiles no stripe hit
+    stay black and are left out.  A stripe's parts of one tile are first
+    added with saturation (gamma 0), which reproduces the tile as one
+    buffer would have plotted it, then the stripes blend with `gamma`.
+    Encoded tiles go to renders/{job_id}/tiles/tile_{tx}_{ty}.{ext}.
+    Returns (tile entries, intermediate keys for cleanup, max reduce
+    rounds)."""
+    import concurrent.futures
+
+    hit = {}
+    for r in results:
+        base = f"renders/{job_id}/stripe_{r['stripe_idx']}{copy_suffix(r)}"
+        for tx, ty, parts in r["tiles"]:
+            hit.setdefault((tx, ty), []).append(
+                (r["stripe_idx"], [f"{base}_t{tx}_{ty}_p{k}.raw" for k in range(parts)]))
+
+    def finish_tile(item):
+        (tx, ty), stripes = item
+        keys, temp_keys, part_rounds = [], [], 0
+        for idx, parts in stripes:
+            merged, temps, rounds = tree_reduce(
+                job_id, parts, f"renders/{job_id}/merge_t{tx}_{ty}_s{idx}", 0,
+                max_attempts=max_attempts, resume=resume, trace=trace)
+            keys += merged
+            temp_keys += temps
+            part_rounds = max(part_rounds, rounds)
+        keys, temps, rounds = tree_reduce(
+            job_id, keys, f"renders/{job_id}/merge_t{tx}_{ty}", gamma,
+            max_attempts=max_attempts, resume=resume, trace=trace)
+        temp_keys += temps
+        rounds += part_rounds
+        tile_key = f"renders/{job_id}/tiles/tile_{tx}_{ty}.{ext}"
+        enc = invoke_worker("/encode-upload", {
+            "raw_key": keys[0],
+            "out_key": tile_key,
+            "format": ext,
+            "quality": quality,
+        }, max_attempts=max_attempts, trace=trace, label=f"encode tile {tx},{ty}")
+        return ({"tx": tx, "ty": ty, "key": tile_key, "file_size": enc["file_size"]},
+                temp_keys, rounds)
+
+    if not hit:
+        return [], [], 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(hit), 50)) as pool:
+        done = list(pool.map(finish_tile, sorted(hit.items(), key=lambda kv: kv[0][::-1])))
+    return ([d[0] for d in done], [k for d in done for k in d[1]],
+            max(d[2] for d in done))
+
+
+def render_preview(job_id, func_name, n1, n2, width, height, degree, view,
+                   factor=PREVIEW_FACTOR, quality=80, expr=None):
+    """Render a decimated thumbnail locally: every `factor`-th row and column
+    of the n1 x n2 grid into a (width/factor) x (height/factor) image with the
+    same viewport (scale/factor) and color settings, so root density per
+    pixel matches the full render.  Uploads renders/{job_id}/preview.jpeg."""
+    factor = max(factor, -(-max(width, height) // PREVIEW_MAX_SIDE))
+    bin_path = "/tmp/preview.bin"
+    raw_path = "/tmp/preview.raw"
+    jpeg_path = "/tmp/preview.jpeg"
+    pw = max(1, width // factor)
+    ph = max(1, height // factor)
+    spec = {
+        "mode": "grid",
+        **coeff_spec(func_name, expr),
+        "n1": max(1, n1 // factor), "n2": max(1, n2 // factor),
+        "match_roots": False,
+        "threads": os.cpu_count() or 1,
+    }
+    view = {**view, "scale": view["scale"] / factor}
+    if fused_render_ok(view):
+        sweep_render(spec, raw_path, pw, ph, view, timeout=120)
+    else:
+        spec.update(root_encoding_spec(view.get("root_encoding"), view, pw, ph))
+        result = subprocess.run([SWEEP, bin_path], input=json.dumps(spec),
+                                capture_output=True, text=True, timeout=120)
+        if result.returncode != 0:
+            raise RuntimeError(f"preview sweep failed: {result.stderr.strip()}")
+        roots2image(bin_path, raw_path, pw, ph, degree, view)
+    result = subprocess.run([IMGPIPE, "--encode", raw_path, jpeg_path, f"--quality={quality}"],
+                            capture_output=True, text=True, timeout=60, env=_imgpipe_env())
+    if result.returncode != 0:
+        raise RuntimeError(f"preview encode failed: {result.stderr.strip()}")
+    key = f"renders/{job_id}/preview.jpeg"
+    with open(jpeg_path, "rb") as f:
+        s3.put_object(Bucket=BUCKET, Key=key, Body=f, ContentType="image/jpeg")
+    for p in [bin_path, raw_path, jpeg_path]:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+    url = s3.generate_presigned_url(
+        "get_object", Params={"Bucket": BUCKET, "Key": key}, ExpiresIn=PRESIGN_EXPIRY)
+    return {"preview_key": key, "preview_url": url,
+            "preview_width": pw, "preview_height": ph}
+
+
+def compute_viewport(params, func_name, n1, n2, width, height):
+    """Viewport for a render: lores_viewport quantile framing when auto_scale
+    (the default), else the explicit center/scale with the degree probed.
+    Returns (center_re, center_im, scale, degree, viewport_info)."""
     auto_scale = params.get("auto_scale", True)
     quantile = params.get("quantile", 0.0)
     shim = params.get("shim", 0.05)
     if auto_scale:
-        vp_spec = json.dumps({"function": func_name, "n1": n1, "n2": n2,
+        vp_spec = json.dumps({**coeff_spec(func_name, params.get("expr")),
+                               "n1": n1, "n2": n2,
                                "quantile": quantile, "shim": shim})
         vp_result = subprocess.run(
             [LORES_VIEWPORT],
@@ -330,7 +1809,8 @@ def handle_render_v2(event):
         center_im = params.get("center_im", 0)
         scale = params.get("scale", 1.0)
         # Probe degree by running lores_viewport anyway (fast)
-        vp_spec = json.dumps({"function": func_name, "n1": 2, "n2": 2})
+        vp_spec = json.dumps({**coeff_spec(func_name, params.get("expr")),
+                              "n1": 2, "n2": 2})
         vp_result = subprocess.run(
             [LORES_VIEWPORT], input=vp_spec,
             capture_output=True, text=True, timeout=30
@@ -340,66 +1820,157 @@ def handle_render_v2(event):
             "center_re": center_re, "center_im": center_im,
             "scale": scale, "manual": True,
         }
+    return center_re, center_im, scale, degree, viewport_info
+
+
+def handle_render_v2(event):
+    """Render pipeline v2: lores_viewport + parallel compute+render stripes + tree-reduce.
+    Uses libvips (via imgpipe binary) instead of Pillow."""
+    params = parse_body(event)
+    if params.get("variants"):
+        return handle_render_variants(params)
+    job_id = params.get("job_id", "render_" + str(uuid.uuid4())[:8])
+    fmt = params.get("format", "jpeg").lower()
+    quality = params.get("quality", 90)
+    width = params.get("width", 4096)
+    height = params.get("height", 4096)
+    func_name = params.get("function", "expr" if params.get("expr") else "giga_5")
+    n1 = params.get("n1", 100)
+    n2 = params.get("n2", 100)
+    n_stripes = params.get("n_stripes", 1)
+    color_mode = params.get("color", "rainbow")
+    match_mode = params.get("match", "none")
+    palette = params.get("palette", "inferno")
+    constant_color = params.get("constant_color", "ffffff")
+    gamma = params.get("gamma", 2.2)
+    tile_size = params.get("tile_size", 254)
+    tile_overlap = params.get("tile_overlap", 1)
+    tile_format = params.get("tile_format", "jpeg")
+    render_tile = params.get("render_tile") or (
+        RENDER_TILE if max(width, height) > MAX_FRAME else 0)
+    max_attempts = max(1, params.get("max_attempts", MAX_ATTEMPTS))
+    resume = params.get("resume", False)
+    trace = Trace() if params.get("trace", True) else None
+    throttled_before = invoke_limiter.throttled
+
+    # Phase 1: viewport via lores_viewport binary
+    t_vp = time.time()
+    auto_scale = params.get("auto_scale", True)
+    center_re, center_im, scale, degree, viewport_info = compute_viewport(
+        params, func_name, n1, n2, width, height)
     viewport_us = int((time.time() - t_vp) * 1e6)
+    if trace:
+        trace.add("viewport", t_vp, time.time(), auto_scale=auto_scale)
+
+    # Auto-decide stripe count (planner; needs the degree from the viewport).
+    # A resume reuses the layout its first run saved: the planner's history
+    # may have changed since, and the sidecars only fit the original one.
+    plan_key = f"renders/{job_id}/plan.json"
+    layout = None
+    if resume and s3_exists(plan_key):
+        layout = json.loads(s3.get_object(Bucket=BUCKET, Key=plan_key)["Body"].read())
+    plan = layout["plan"] if layout else None
+    if layout:
+        n_stripes = layout["n_stripes"]
+    elif n_stripes <= 1 and n1 * n2 > 50000:
+        plan = plan_render(func_name, n1, n2, width, height, degree,
+                           cost_budget_s=params.get("cost_budget_s"))
+        n_stripes = plan["n_stripes"]
+    n_stripes = max(1, min(n_stripes, 500))
+
+    if render_tile and fmt == "dzi":
+        return err_response(400, "format dzi is not supported for tiled canvases")
 
-    if n_stripes <= 1:
+    if n_stripes <= 1 and not render_tile:
         # Single-pass: compute roots + render in one invocation on this Lambda
         bin_path = "/tmp/stripe.bin"
         raw_path = "/tmp/stripe.raw"
-        final_path = "/tmp/final." + ("jpeg" if fmt != "png" else "png")
+        ext = fmt if fmt in ("png", "dzi") else "jpeg"
+        final_path = f"/tmp/final.{ext}"
 
         spec = {
             "mode": "grid",
-            "function": func_name,
+            **coeff_spec(func_name, params.get("expr")),
             "n1": n1, "n2": n2,
             "match_roots": False,
+            "threads": params.get("threads") or os.cpu_count() or 1,
+            "simd": params.get("simd", False),
         }
-        result = subprocess.run(
-            [SWEEP, bin_path],
-            input=json.dumps(spec),
-            capture_output=True, text=True,
-            timeout=840
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f"sweep failed: {result.stderr.strip()}")
-        compute_meta = json.loads(result.stdout)
-
-        result = subprocess.run(
-            [IMGPIPE, "--roots2image", bin_path, raw_path,
-             f"--width={width}", f"--height={height}",
-             f"--center_re={center_re}", f"--center_im={center_im}",
-             f"--scale={scale}", f"--degree={degree}",
-             f"--color={color_mode}", f"--match={match_mode}",
-             f"--palette={palette}", f"--constant_color={constant_color}"],
-            capture_output=True, text=True,
-            timeout=300, env=_imgpipe_env()
-        )
-        if result.returncode != 0:
-            raise RuntimeError(f"imgpipe roots2image failed: {result.stderr.strip()}")
-        render_meta = json.loads(result.stdout)
+        view = {
+            "center_re": center_re, "center_im": center_im, "scale": scale,
+            "color": color_mode, "match": match_mode,
+            "palette": palette, "constant_color": constant_color,
+        }
+        fused = fused_render_ok(params)
+        t_sweep = time.time()
+        if fused:
+            compute_meta = render_meta = sweep_render(spec, raw_path, width, height, view)
+            t_render = time.time()
+        else:
+            spec.update(root_encoding_spec(params.get("root_encoding"), view, width, height))
+            result = subprocess.run(
+                [SWEEP, bin_path],
+                input=json.dumps(spec),
+                capture_output=True, text=True,
+                timeout=840
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"sweep failed: {result.stderr.strip()}")
+            compute_meta = json.loads(result.stdout)
+
+            t_render = time.time()
+            render_meta = roots2image(bin_path, raw_path, width, height, degree, view)
 
         # Encode to final format
-        encode_args = [IMGPIPE, "--encode", raw_path, final_path]
-        if fmt != "png":
-            encode_args.append(f"--quality={quality}")
-        result = subprocess.run(encode_args, capture_output=True, text=True,
-                                timeout=120, env=_imgpipe_env())
-        if result.returncode != 0:
-            raise RuntimeError(f"imgpipe encode failed: {result.stderr.strip()}")
-        encode_meta = json.loads(result.stdout)
-
-        # Upload
-        ext = "jpeg" if fmt != "png" else "png"
-        content_type = "image/jpeg" if ext == "jpeg" else "image/png"
+        t_encode = time.time()
         image_key = f"renders/{job_id}/image.{ext}"
-        with open(final_path, "rb") as f:
-            image_bytes = f.read()
-        s3.put_object(Bucket=BUCKET, Key=image_key,
-                      Body=image_bytes, ContentType=content_type)
-        image_url = s3.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": BUCKET, "Key": image_key},
-            ExpiresIn=PRESIGN_EXPIRY)
+        output_info = {}
+        if ext == "dzi":
+            manifest = dzsave_upload(
+                raw_path, image_key[:-len(".dzi")], quality=quality,
+                tile_size=tile_size, overlap=tile_overlap, tile_format=tile_format)
+            output_info = {"pyramid": manifest}
+            file_size = manifest["file_size"]
+            image_url = manifest["dzi_url"]
+            t_upload = time.time()
+        else:
+            encode_args = [IMGPIPE, "--encode", raw_path, final_path]
+            if ext == "jpeg":
+                encode_args.append(f"--quality={quality}")
+            result = subprocess.run(encode_args, capture_output=True, text=True,
+                                    timeout=120, env=_imgpipe_env())
+            if result.returncode != 0:
+                raise RuntimeError(f"imgpipe encode failed: {result.stderr.strip()}")
+            file_size = json.loads(result.stdout)["file_size"]
+
+            # With "inline", small images also go back as base64; the S3
+            # upload is skipped only if "upload" is explicitly false
+            t_upload = time.time()
+            content_type = "image/jpeg" if ext == "jpeg" else "image/png"
+            with open(final_path, "rb") as f:
+                image_bytes = f.read()
+            if params.get("inline", False) and file_size <= INLINE_MAX_BYTES:
+                output_info = {"image_b64": base64.b64encode(image_bytes).decode("ascii"),
+                           "image_mime": content_type}
+            if "image_b64" not in output_info or params.get("upload", True):
+                s3.put_object(Bucket=BUCKET, Key=image_key,
+                              Body=image_bytes, ContentType=content_type)
+                image_url = s3.generate_presigned_url(
+                    "get_object",
+                    Params={"Bucket": BUCKET, "Key": image_key},
+                    ExpiresIn=PRESIGN_EXPIRY)
+            else:
+                image_key = image_url = None
+        trace_info = {}
+        if trace:
+            trace.add("sweep", t_sweep, t_render, n_t=compute_meta["n_t"], fused=fused)
+            if not fused:
+                trace.add("roots2image", t_render, t_encode)
+            trace.add("encode", t_encode, t_upload)
+            if image_key:
+                trace.add("s3 put", t_upload, time.time(), bytes=file_size)
+            trace_key, trace_url = save_trace(trace, job_id)
+            trace_info = {"trace_key": trace_key, "trace_url": trace_url}
 
         for p in [bin_path, raw_path, final_path]:
             try:
@@ -417,132 +1988,196 @@ def handle_render_v2(event):
             "roots_clipped": render_meta["roots_clipped"],
             "elapsed_us": compute_meta["elapsed_us"],
             "avg_iterations": compute_meta["avg_iterations"],
-            "format": ext, "file_size": encode_meta["file_size"],
+            "fused": fused,
+            "format": ext, "file_size": file_size,
             "image_url": image_url, "image_key": image_key,
+            **output_info,
+            **trace_info,
         })
 
     # --- Parallel striped render (v2) ---
     # Coordinator is thin: all heavy work (compute, render, reduce, encode)
     # runs on worker Lambdas.  Coordinator only makes invoke() calls.
 
-    # Phase 2: fan-out compute+render stripes
-    rows_per = n1 // n_stripes
-    stripes = []
-    for s in range(n_stripes):
-        i1_start = s * rows_per
-        i1_end = (s + 1) * rows_per if s < n_stripes - 1 else n1
-        stripes.append((s, i1_start, i1_end))
-
-    def invoke_cr_stripe(stripe_info):
-        idx, start, end = stripe_info
-        payload = {
-            "rawPath": "/compute-render-stripe",
-            "body": json.dumps({
-                "job_id": job_id,
-                "stripe_idx": idx,
-                "function": func_name,
-                "n1": n1, "n2": n2,
-                "i1_start": start, "i1_end": end,
-                "width": width, "height": height,
-                "degree": degree,
-                "center_re": center_re,
-                "center_im": center_im,
-                "scale": scale,
-                "color": color_mode,
-                "match": match_mode,
-                "palette": palette,
-                "constant_color": constant_color,
-            }),
-        }
-        resp = lambda_client.invoke(
-            FunctionName=FUNCTION_NAME,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(payload),
-        )
-        result = json.loads(resp["Payload"].read())
-        if result.get("statusCode") != 200:
-            raise RuntimeError(f"Stripe {idx} failed: {result.get('body', '')}")
-        return json.loads(result["body"])
-
+    def check_cancel():
+        if s3_exists(cancel_key(job_id)):
+            raise RenderCancelled(job_id)
+
+    reducer = None
+
+    def drop_reducer():
+        # Pipelined merge keys follow arrival order, so nothing (not even a
+        # resume) can reuse them once the job stops early
+        if reducer:
+            reducer.stop()
+            delete_keys(reducer.temp_keys)
+
+    def cancelled_response(preview):
+        # Status first: workers still running see it before the scratch
+        # objects (and the preview) go
+        publish_status(job_id, status="cancelled")
+        drop_reducer()
+        delete_keys(job_scratch_keys(job_id, preview=True))
+        return ok_response({"job_id": job_id, "status": "cancelled"})
+
+    # Phase 1b: progressive preview from a decimated grid, published before
+    # the fan-out so a client polling /status can show it (and /cancel)
+    preview = {}
+    preview_us = 0
+    if params.get("preview", True):
+        t_pv = time.time()
+        preview = render_preview(job_id, func_name, n1, n2, width, height, degree, {
+            "center_re": center_re, "center_im": center_im, "scale": scale,
+            "color": color_mode, "match": match_mode,
+            "palette": palette, "constant_color": constant_color,
+            "fused": params.get("fused", True),
+            "root_encoding": params.get("root_encoding"),
+        }, factor=params.get("preview_factor", PREVIEW_FACTOR), expr=params.get("expr"))
+        preview_us = int((time.time() - t_pv) * 1e6)
+        if trace:
+            trace.add("preview", t_pv, time.time())
+    publish_status(job_id, status="computing", n_stripes=n_stripes, **preview)
+    try:
+        check_cancel()
+    except RenderCancelled:
+        return cancelled_response(preview)
+
+    # Phase 2: fan-out compute+render stripes, batched per worker when there
+    # are many (tiled canvases keep one stripe per worker)
+    per_worker = params.get("stripes_per_worker")
+    if layout:
+        per_worker = layout["stripes_per_worker"]
+    if per_worker is None and plan:
+        per_worker = plan["stripes_per_worker"]
+    if per_worker is None:
+        per_worker = 1 if render_tile else choose_stripes_per_worker(n_stripes, width, height)
+    per_worker = 1 if render_tile else max(1, per_worker)
+    if not layout:
+        s3.put_object(Bucket=BUCKET, Key=plan_key, Body=json.dumps({
+            "n_stripes": n_stripes, "stripes_per_worker": per_worker,
+            "fan_in": 2, "plan": plan}), ContentType="application/json")
+    # Reduce-on-arrival: merges start as soon as two stripes are done.
+    # Resumed jobs keep the round-by-round tree, whose merge keys can be reused.
+    reducer = None
+    if not render_tile and not resume and params.get("pipeline_reduce", True):
+        reducer = PipelinedReduce(job_id, f"renders/{job_id}/merge", gamma,
+                                  max_attempts=max_attempts, trace=trace)
     t0 = time.time()
-    with concurrent.futures.ThreadPoolExecutor(max_workers=n_stripes) as pool:
-        results = list(pool.map(invoke_cr_stripe, stripes))
+    try:
+        results, hedge_stats, n_resumed = fan_out_stripes(job_id, n1, n_stripes, {
+            **coeff_spec(func_name, params.get("expr")),
+            "n1": n1, "n2": n2,
+            "width": width, "height": height,
+            "degree": degree,
+            "center_re": center_re,
+            "center_im": center_im,
+            "scale": scale,
+            "color": color_mode,
+            "match": match_mode,
+            "palette": palette,
+            "constant_color": constant_color,
+            "threads": params.get("threads", 0),
+            "simd": params.get("simd", False),
+            "fused": params.get("fused", True),
+            "root_encoding": params.get("root_encoding", "f32"),
+            "render_tile": render_tile,
+            "resident_tiles": params.get("resident_tiles", 0),
+            "gamma": gamma,
+        }, params, trace=trace, cancel_check=check_cancel, per_worker=per_worker,
+            on_result=(lambda r: reducer.add(r["s3_key"])) if reducer else None)
+    except RenderCancelled:
+        return cancelled_response(preview)
+    except ResumeMismatch as e:
+        drop_reducer()
+        publish_status(job_id, status="failed", error=str(e), **preview)
+        return err_response(400, str(e), job_id=job_id)
+    except FanOutError as e:
+        # Completed stripes stay in S3; resubmit with the same job_id and
+        # "resume": true to finish only the missing ones.
+        drop_reducer()
+        publish_status(job_id, status="failed", error=str(e), **preview)
+        return err_response(502, str(e), job_id=job_id, resumable=True,
+                            stripes_done=e.stripes_done, n_stripes=n_stripes)
     compute_wall_us = int((time.time() - t0) * 1e6)
-
-    # Phase 3: tree-reduce via parallel Lambda invocations
-    t_reduce = time.time()
-    all_temp_keys = []  # track intermediate keys for cleanup
-
-    keys = [f"renders/{job_id}/stripe_{s}.raw" for s in range(n_stripes)]
-    round_num = 0
-
-    def invoke_reduce_pair(pair_info):
-        left_key, right_key, out_key = pair_info
-        payload = {
-            "rawPath": "/reduce-pair",
-            "body": json.dumps({
-                "job_id": job_id,
-                "left_key": left_key,
-                "right_key": right_key,
-                "out_key": out_key,
-                "gamma": gamma,
-            }),
+    # Merges already launched while stripes were still computing
+    reduces_overlapped = reducer.n_merges if reducer else 0
+    try:
+        check_cancel()
+    except RenderCancelled:
+        return cancelled_response(preview)
+    publish_status(job_id, status="reducing", n_stripes=n_stripes, **preview)
+
+    ext = fmt if fmt in ("png", "dzi") else "jpeg"
+    if render_tile:
+        # Phase 3+4 (tiled): every tile reduces and encodes on its own, so no
+        # worker ever holds more than one tile of the canvas
+        t_reduce = time.time()
+        tiles, _, round_num = reduce_encode_tiles(
+            job_id, results, ext, quality, gamma,
+            max_attempts=max_attempts, resume=resume, trace=trace)
+        reduce_us = int((time.time() - t_reduce) * 1e6)
+
+        t_encode = time.time()
+        image_key = f"renders/{job_id}/tiles/index.json"
+        tiles_x = -(-width // render_tile)
+        tiles_y = -(-height // render_tile)
+        manifest = {
+            "job_id": job_id, "width": width, "height": height,
+            "tile": render_tile, "tiles_x": tiles_x, "tiles_y": tiles_y,
+            "format": ext,
+            "tiles": [{**t,
+                       "x": t["tx"] * render_tile, "y": t["ty"] * render_tile,
+                       "width": min(render_tile, width - t["tx"] * render_tile),
+                       "height": min(render_tile, height - t["ty"] * render_tile)}
+                      for t in tiles],
         }
-        resp = lambda_client.invoke(
-            FunctionName=FUNCTION_NAME,
-            InvocationType="RequestResponse",
-            Payload=json.dumps(payload),
-        )
-        result = json.loads(resp["Payload"].read())
-        if result.get("statusCode") != 200:
-            raise RuntimeError(f"reduce-pair failed: {result.get('body', '')}")
-        return json.loads(result["body"])
-
-    while len(keys) > 1:
-        pairs = []
-        next_keys = []
-        for i in range(0, len(keys), 2):
-            if i + 1 < len(keys):
-                out_key = f"renders/{job_id}/merge_{round_num}_{i // 2}.raw"
-                pairs.append((keys[i], keys[i + 1], out_key))
-                next_keys.append(out_key)
-                all_temp_keys.append(out_key)
-            else:
-                next_keys.append(keys[i])
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(pairs)) as pool:
-            list(pool.map(invoke_reduce_pair, pairs))
-
-        keys = next_keys
-        round_num += 1
-
-    reduce_us = int((time.time() - t_reduce) * 1e6)
-
-    # Phase 4: encode + upload via worker Lambda (coordinator touches no image data)
-    t_encode = time.time()
-    ext = "jpeg" if fmt != "png" else "png"
-    image_key = f"renders/{job_id}/image.{ext}"
-    encode_payload = {
-        "rawPath": "/encode-upload",
-        "body": json.dumps({
+        s3.put_object(Bucket=BUCKET, Key=image_key, Body=json.dumps(manifest),
+                      ContentType="application/json")
+        image_url = s3.generate_presigned_url(
+            "get_object", Params={"Bucket": BUCKET, "Key": image_key},
+            ExpiresIn=PRESIGN_EXPIRY)
+        file_size = sum(t["file_size"] for t in tiles)
+        output_info = {"tiles": {k: manifest[k] for k in
+                                 ("tile", "tiles_x", "tiles_y")},
+                       "n_tiles": len(tiles)}
+        encode_us = int((time.time() - t_encode) * 1e6)
+    else:
+        # Phase 3: finish the pipelined merge tree, or tree-reduce via
+        # parallel Lambda invocations
+        t_reduce = time.time()
+        if reducer:
+            keys, _, round_num = reducer.finish()
+            if trace:
+                trace.add("reduce tail", t_reduce, time.time(),
+                          merges=reducer.n_merges, overlapped=reduces_overlapped)
+        else:
+            keys = [r["s3_key"] for r in results]
+            keys, _, round_num = tree_reduce(
+                job_id, keys, f"renders/{job_id}/merge", gamma,
+                max_attempts=max_attempts, resume=resume, trace=trace)
+
+        reduce_us = int((time.time() - t_reduce) * 1e6)
+
+        # Phase 4: encode + upload via worker Lambda (coordinator touches no image data)
+        t_encode = time.time()
+        image_key = f"renders/{job_id}/image.{ext}"
+        encode_body = invoke_worker("/encode-upload", {
             "raw_key": keys[0],
             "out_key": image_key,
             "format": ext,
             "quality": quality,
-        }),
-    }
-    resp = lambda_client.invoke(
-        FunctionName=FUNCTION_NAME,
-        InvocationType="RequestResponse",
-        Payload=json.dumps(encode_payload),
-    )
-    encode_result = json.loads(resp["Payload"].read())
-    if encode_result.get("statusCode") != 200:
-        raise RuntimeError(f"encode-upload failed: {encode_result.get('body', '')}")
-    encode_body = json.loads(encode_result["body"])
-    image_url = encode_body["image_url"]
-    file_size = encode_body["file_size"]
-    encode_us = int((time.time() - t_encode) * 1e6)
+            "tile_size": tile_size,
+            "tile_overlap": tile_overlap,
+            "tile_format": tile_format,
+            "inline": params.get("inline", False),
+            "upload": params.get("upload", True),
+        }, max_attempts=max_attempts, trace=trace, label="encode")
+        output_info = {k: encode_body[k] for k in ("pyramid", "image_b64", "image_mime")
+                       if k in encode_body}
+        image_key = encode_body["out_key"]
+        image_url = encode_body["image_url"]
+        file_size = encode_body["file_size"]
+        encode_us = int((time.time() - t_encode) * 1e6)
 
     # Aggregate stats
     total_plotted = sum(r["roots_plotted"] for r in results)
@@ -553,23 +2188,39 @@ def handle_render_v2(event):
     avg_iters = (sum(r["avg_iterations"] * r["n_t"] for r in results)
                  / total_steps if total_steps > 0 else 0)
 
+    # Feed the planner: this job's timing, and predicted vs actual
+    if not render_tile and not n_resumed:
+        record_history({
+            "function": func_name, "degree": degree,
+            "cells": n1 * n2, "mpix": width * height / 1e6,
+            "n_stripes": n_stripes, "stripes_per_worker": per_worker,
+            "total_compute_us": total_compute, "total_render_us": total_render,
+            "compute_wall_us": compute_wall_us, "reduce_us": reduce_us,
+            "reduce_rounds": round_num, "encode_us": encode_us,
+            "t": time.time(),
+        })
+    plan_info = {}
+    if plan:
+        plan["actual"] = {
+            "compute_wall_us": compute_wall_us, "reduce_us": reduce_us,
+            "encode_us": encode_us,
+            "total_us": compute_wall_us + reduce_us + encode_us,
+        }
+        plan_info = {"plan": plan}
+
     # Phase 5: cleanup temp S3 keys (batch delete — single API call)
     t_cleanup = time.time()
-    cleanup_keys = [f"renders/{job_id}/stripe_{s}.raw" for s in range(n_stripes)]
-    cleanup_keys.extend(all_temp_keys)
-    if keys[0] != image_key:
-        cleanup_keys.append(keys[0])
-    # S3 batch delete: up to 1000 objects per call
-    for i in range(0, len(cleanup_keys), 1000):
-        batch = cleanup_keys[i:i + 1000]
-        try:
-            s3.delete_objects(Bucket=BUCKET, Delete={
-                "Objects": [{"Key": k} for k in batch],
-                "Quiet": True,
-            })
-        except Exception:
-            pass
+    # Status first, so a hedge copy finishing late discards its objects
+    publish_status(job_id, status="complete", image_url=image_url, **preview)
+    cleanup_keys = job_scratch_keys(job_id)
+    delete_keys(cleanup_keys)
     cleanup_us = int((time.time() - t_cleanup) * 1e6)
+    trace_info = {}
+    if trace:
+        trace.add("encode", t_encode, t_cleanup)
+        trace.add("cleanup", t_cleanup, time.time(), keys=len(cleanup_keys))
+        trace_key, trace_url = save_trace(trace, job_id)
+        trace_info = {"trace_key": trace_key, "trace_url": trace_url}
 
     return ok_response({
         "job_id": job_id, "status": "complete",
@@ -580,21 +2231,799 @@ def handle_render_v2(event):
         "roots_plotted": total_plotted,
         "roots_clipped": total_clipped,
         "n_stripes": n_stripes,
+        "stripes_per_worker": per_worker,
         "avg_iterations": avg_iters,
         "format": ext, "file_size": file_size,
         "image_url": image_url, "image_key": image_key,
         "viewport": viewport_info,
         "color": color_mode, "match": match_mode,
         "palette": palette, "gamma": gamma,
+        **output_info,
+        **plan_info,
+        **preview,
+        **trace_info,
         # Per-phase timing (microseconds)
         "timing": {
             "viewport_us": viewport_us,
+            "preview_us": preview_us,
             "compute_wall_us": compute_wall_us,
             "reduce_us": reduce_us,
             "reduce_rounds": round_num,
+            "reduces_overlapped": reduces_overlapped,
             "encode_us": encode_us,
             "cleanup_us": cleanup_us,
             "total_compute_us": total_compute,
             "total_render_us": total_render,
+            "hedges_fired": hedge_stats["hedges_fired"],
+            "hedges_won": hedge_stats["hedges_won"],
+            "stripes_resumed": n_resumed,
+            "throttled_invokes": invoke_limiter.throttled - throttled_before,
+            "invoke_limit": invoke_limiter.limit,
+        },
+    })
+
+
+def handle_render_animation(event):
+    """Render K frames of a viewport sweep from a single root computation.
+
+    The viewport is computed once; frame k zooms geometrically from the base
+    scale to `zoom` x scale and pans linearly from the base center to
+    `center_end` ([re, im]) as k goes 0..K-1.  An explicit "views" list
+    (center_re/center_im/scale and color overrides per frame) replaces the
+    generated sweep.  Each stripe worker solves its roots once and renders
+    a chunk of frames from them (FRAME_MPIX_PER_WORKER, or
+    "frames_per_worker"), so long sequences fan out over stripes x chunks;
+    frames then reduce and encode in parallel.
+    Output: renders/{job_id}/frames/frame_{k:05d}.{ext} plus index.json.
+    """
+    import concurrent.futures
+
+    params = parse_body(event)
+    job_id = params.get("job_id", "anim_" + str(uuid.uuid4())[:8])
+    fmt = params.get("format", "jpeg").lower()
+    ext = "jpeg" if fmt != "png" else "png"
+    quality = params.get("quality", 90)
+    width = params.get("width", 1920)
+    height = params.get("height", 1080)
+    func_name = params.get("function", "expr" if params.get("expr") else "giga_5")
+    n1 = params.get("n1", 100)
+    n2 = params.get("n2", 100)
+    n_stripes = params.get("n_stripes", 1)
+    gamma = params.get("gamma", 2.2)
+    max_attempts = max(1, params.get("max_attempts", MAX_ATTEMPTS))
+    resume = params.get("resume", False)
+    trace = Trace() if params.get("trace", True) else None
+
+    n_frames = len(params["views"]) if params.get("views") else params.get("frames", 24)
+    if n_frames > MAX_FRAMES:
+        return err_response(400, f"at most {MAX_FRAMES} frames per animation")
+    if max(width, height) > MAX_FRAME:
+        return err_response(400, f"animations need width and height <= {MAX_FRAME}")
+    if n_stripes <= 1 and n1 * n2 > 50000:
+        n_stripes = min(max(n1 * n2 // 50000, 2), 10)
+    n_stripes = max(1, min(n_stripes, 500))
+
+    # Phase 1: one shared viewport
+    t_vp = time.time()
+    center_re, center_im, scale, degree, viewport_info = compute_viewport(
+        params, func_name, n1, n2, width, height)
+    if trace:
+        trace.add("viewport", t_vp, time.time())
+
+    views = params.get("views")
+    if not views:
+        n_frames = max(1, n_frames)
+        zoom = params.get("zoom", 1.0)
+        end_re, end_im = params.get("center_end") or (center_re, center_im)
+        views = []
+        for k in range(n_frames):
+            f = k / (n_frames - 1) if n_frames > 1 else 0.0
+            views.append({
+                "center_re": center_re + f * (end_re - center_re),
+                "center_im": center_im + f * (end_im - center_im),
+                "scale": scale * zoom ** f,
+            })
+    n_frames = len(views)
+    per_worker = params.get("frames_per_worker") or max(
+        1, int(FRAME_MPIX_PER_WORKER // (width * height / 1e6)))
+    chunks = [views[i:i + per_worker] for i in range(0, n_frames, per_worker)]
+
+    # Phase 2: stripes solve once per chunk and render its frames
+    publish_status(job_id, status="computing", n_stripes=n_stripes, n_frames=n_frames)
+    t0 = time.time()
+    try:
+        results, hedge_stats, n_resumed = fan_out_stripes(job_id, n1, n_stripes, {
+            **coeff_spec(func_name, params.get("expr")),
+            "n1": n1, "n2": n2,
+            "width": width, "height": height,
+            "degree": degree,
+            "center_re": center_re,
+            "center_im": center_im,
+            "scale": scale,
+            "color": params.get("color", "rainbow"),
+            "match": params.get("match", "none"),
+            "palette": params.get("palette", "inferno"),
+            "constant_color": params.get("constant_color", "ffffff"),
+            "threads": params.get("threads", 0),
+            "simd": params.get("simd", False),
+            "root_encoding": params.get("root_encoding", "f32"),
+            "max_scale": max(v.get("scale", scale) for v in views),
+        }, params, trace=trace, view_chunks=chunks)
+    except ResumeMismatch as e:
+        publish_status(job_id, status="failed", error=str(e))
+        return err_response(400, str(e), job_id=job_id)
+    except FanOutError as e:
+        publish_status(job_id, status="failed", error=str(e))
+        return err_response(502, str(e), job_id=job_id, resumable=True,
+                            stripes_done=e.stripes_done, n_stripes=n_stripes)
+    compute_wall_us = int((time.time() - t0) * 1e6)
+
+    # Phase 3: per-frame reduce + encode, frames in parallel.  Results are
+    # chunk-major, so frame k's stripes are chunk k // per_worker's, in order.
+    t_frames = time.time()
+    stripe_views = [(r["views"], r["stripe_idx"] // n_stripes * per_worker) for r in results]
+
+    def frame_views(k):
+        return [v[k - first] for v, first in stripe_views if first <= k < first + len(v)]
+
+    def finish_frame(k):
+        keys = [v["s3_key"] for v in frame_views(k)]
+        keys, _, _ = tree_reduce(
+            job_id, keys, f"renders/{job_id}/merge_v{k}", gamma,
+            max_attempts=max_attempts, resume=resume, trace=trace)
+        frame_key = f"renders/{job_id}/frames/frame_{k:05d}.{ext}"
+        enc = invoke_worker("/encode-upload", {
+            "raw_key": keys[0],
+            "out_key": frame_key,
+            "format": ext,
+            "quality": quality,
+        }, max_attempts=max_attempts, trace=trace, label=f"encode frame {k}")
+        return {"index": k, "key": frame_key, "file_size": enc["file_size"],
+                "image_url": enc["image_url"],
+                "center_re": views[k].get("center_re", center_re),
+                "center_im": views[k].get("center_im", center_im),
+                "scale": views[k].get("scale", scale),
+                "roots_plotted": sum(v["roots_plotted"] for v in frame_views(k))}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(n_frames, 50)) as pool:
+        frames = list(pool.map(finish_frame, range(n_frames)))
+    frames_us = int((time.time() - t_frames) * 1e6)
+    if trace:
+        trace.add("frames", t_frames, time.time(), n_frames=n_frames)
+
+    # Manifest: frame keys in order, with the view each one used
+    manifest_key = f"renders/{job_id}/frames/index.json"
+    manifest = {
+        "job_id": job_id, "function": func_name,
+        "width": width, "height": height, "format": ext,
+        "n_frames": n_frames, "viewport": viewport_info,
+        "frames": [{k: fr[k] for k in ("index", "key", "file_size", "center_re",
+                                       "center_im", "scale", "roots_plotted")}
+                   for fr in frames],
+    }
+    s3.put_object(Bucket=BUCKET, Key=manifest_key, Body=json.dumps(manifest),
+                  ContentType="application/json")
+    manifest_url = s3.generate_presigned_url(
+        "get_object", Params={"Bucket": BUCKET, "Key": manifest_key},
+        ExpiresIn=PRESIGN_EXPIRY)
+
+    # Cleanup: stripe images, sidecars and merges
+    publish_status(job_id, status="complete", manifest_url=manifest_url)
+    delete_keys(job_scratch_keys(job_id))
+
+    trace_info = {}
+    if trace:
+        trace_key, trace_url = save_trace(trace, job_id)
+        trace_info = {"trace_key": trace_key, "trace_url": trace_url}
+
+    total_steps = sum(r["n_t"] for r in results)
+    return ok_response({
+        "job_id": job_id, "status": "complete",
+        "pipeline": "libvips",
+        "width": width, "height": height,
+        "degree": degree, "n1": n1, "n2": n2,
+        "function": func_name,
+        "n_stripes": n_stripes, "n_frames": n_frames, "frames_per_worker": per_worker,
+        "avg_iterations": (sum(r["avg_iterations"] * r["n_t"] for r in results)
+                           / total_steps if total_steps > 0 else 0),
+        "format": ext,
+        "manifest_key": manifest_key, "manifest_url": manifest_url,
+        "frame_urls": [fr["image_url"] for fr in frames],
+        "viewport": viewport_info,
+        **trace_info,
+        "timing": {
+            "compute_wall_us": compute_wall_us,
+            "frames_us": frames_us,
+            "total_compute_us": sum(r["compute_us"] for r in results),
+            "total_render_us": sum(r["render_us"] for r in results),
+            "hedges_fired": hedge_stats["hedges_fired"],
+            "hedges_won": hedge_stats["hedges_won"],
+            "stripes_resumed": n_resumed,
+        },
+    })
+
+
+def handle_render_variants(params):
+    """Render N presentation variants of one root computation.
+
+    `variants` is a list of color/match/palette/constant_color/gamma/format/
+    quality overrides on the request's own settings.  Each stripe worker
+    solves its roots once and runs roots2image per variant (the worker's
+    "views"); variants then reduce with their own gamma and encode in
+    parallel.  Output: renders/{job_id}/variants/variant_{k}.{ext}.
+    """
+    import concurrent.futures
+
+    job_id = params.get("job_id", "render_" + str(uuid.uuid4())[:8])
+    width = params.get("width", 4096)
+    height = params.get("height", 4096)
+    func_name = params.get("function", "expr" if params.get("expr") else "giga_5")
+    n1 = params.get("n1", 100)
+    n2 = params.get("n2", 100)
+    n_stripes = params.get("n_stripes", 1)
+    max_attempts = max(1, params.get("max_attempts", MAX_ATTEMPTS))
+    resume = params.get("resume", False)
+    trace = Trace() if params.get("trace", True) else None
+    throttled_before = invoke_limiter.throttled
+
+    if max(width, height) > MAX_FRAME:
+        return err_response(400, f"variants need width and height <= {MAX_FRAME}")
+    base = {
+        "color": params.get("color", "rainbow"),
+        "match": params.get("match", "none"),
+        "palette": params.get("palette", "inferno"),
+        "constant_color": params.get("constant_color", "ffffff"),
+        "gamma": params.get("gamma", 2.2),
+        "format": params.get("format", "jpeg").lower(),
+        "quality": params.get("quality", 90),
+    }
+    if len(params["variants"]) > MAX_VARIANTS:
+        return err_response(400, f"at most {MAX_VARIANTS} variants, "
+                                 f"got {len(params['variants'])}")
+    variants = [{**base, **v} for v in params["variants"]]
+    n_variants = len(variants)
+
+    if n_stripes <= 1 and n1 * n2 > 50000:
+        n_stripes = min(max(n1 * n2 // 50000, 2), 10)
+    n_stripes = max(1, min(n_stripes, 500))
+    # Gamma is the blend between stripes; a single stripe has nothing to blend
+    if n_stripes == 1 and any("gamma" in v for v in params["variants"]):
+        return err_response(400, "a variant's gamma only changes how stripes blend; "
+                                 "it needs n_stripes > 1")
+
+    # Phase 1: one shared viewport
+    t_vp = time.time()
+    center_re, center_im, scale, degree, viewport_info = compute_viewport(
+        params, func_name, n1, n2, width, height)
+    if trace:
+        trace.add("viewport", t_vp, time.time())
+
+    # Phase 2: stripes solve once and render every variant
+    publish_status(job_id, status="computing", n_stripes=n_stripes, n_variants=n_variants)
+    t0 = time.time()
+    try:
+        results, hedge_stats, n_resumed = fan_out_stripes(job_id, n1, n_stripes, {
+            **coeff_spec(func_name, params.get("expr")),
+            "n1": n1, "n2": n2,
+            "width": width, "height": height,
+            "degree": degree,
+            "center_re": center_re,
+            "center_im": center_im,
+            "scale": scale,
+            "threads": params.get("threads", 0),
+            "simd": params.get("simd", False),
+            "root_encoding": params.get("root_encoding", "f32"),
+            "views": [{k: v[k] for k in VARIANT_VIEW_KEYS} for v in variants],
+        }, params, trace=trace)
+    except ResumeMismatch as e:
+        publish_status(job_id, status="failed", error=str(e))
+        return err_response(400, str(e), job_id=job_id)
+    except FanOutError as e:
+        publish_status(job_id, status="failed", error=str(e))
+        return err_response(502, str(e), job_id=job_id, resumable=True,
+                            stripes_done=e.stripes_done, n_stripes=n_stripes)
+    compute_wall_us = int((time.time() - t0) * 1e6)
+
+    # Phase 3: per-variant reduce + encode, variants in parallel
+    t_variants = time.time()
+
+    def finish_variant(k):
+        variant = variants[k]
+        ext = "png" if variant["format"].lower() == "png" else "jpeg"
+        keys = [r["views"][k]["s3_key"] for r in results]
+        keys, _, _ = tree_reduce(
+            job_id, keys, f"renders/{job_id}/merge_v{k}", variant["gamma"],
+            max_attempts=max_attempts, resume=resume, trace=trace)
+        out_key = f"renders/{job_id}/variants/variant_{k}.{ext}"
+        enc = invoke_worker("/encode-upload", {
+            "raw_key": keys[0],
+            "out_key": out_key,
+            "format": ext,
+            "quality": variant["quality"],
+        }, max_attempts=max_attempts, trace=trace, label=f"encode variant {k}")
+        return {"index": k, **variant, "format": ext,
+                "image_key": out_key, "image_url": enc["image_url"],
+                "file_size": enc["file_size"],
+                "roots_plotted": sum(r["views"][k]["roots_plotted"] for r in results)}
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(n_variants, INVOKE_CONCURRENCY)) as pool:
+        done = list(pool.map(finish_variant, range(n_variants)))
+    variants_us = int((time.time() - t_variants) * 1e6)
+    if trace:
+        trace.add("variants", t_variants, time.time(), n_variants=n_variants)
+
+    # Cleanup: stripe images, sidecars and merges
+    publish_status(job_id, status="complete")
+    delete_keys(job_scratch_keys(job_id))
+
+    trace_info = {}
+    if trace:
+        trace_key, trace_url = save_trace(trace, job_id)
+        trace_info = {"trace_key": trace_key, "trace_url": trace_url}
+
+    total_steps = sum(r["n_t"] for r in results)
+    return ok_response({
+        "job_id": job_id, "status": "complete",
+        "pipeline": "libvips",
+        "width": width, "height": height,
+        "degree": degree, "n1": n1, "n2": n2,
+        "function": func_name,
+        "n_stripes": n_stripes, "n_variants": n_variants,
+        "avg_iterations": (sum(r["avg_iterations"] * r["n_t"] for r in results)
+                           / total_steps if total_steps > 0 else 0),
+        "variants": done,
+        "viewport": viewport_info,
+        **trace_info,
+        "timing": {
+            "compute_wall_us": compute_wall_us,
+            "variants_us": variants_us,
+            "total_compute_us": sum(r["compute_us"] for r in results),
+            "total_render_us": sum(r["render_us"] for r in results),
+            "hedges_fired": hedge_stats["hedges_fired"],
+            "hedges_won": hedge_stats["hedges_won"],
+            "stripes_resumed": n_resumed,
+            "throttled_invokes": invoke_limiter.throttled - throttled_before,
+            "invoke_limit": invoke_limiter.limit,
+        },
+    })
+
+
+# ---- Browser snapshots on the batch pipeline ----
+
+def _js_round(x):
+    """Math.round: halves round up."""
+    return int(math.floor(x + 0.5))
+
+
+def _hsv_rgb(h, s, v):
+    """index.html's hsvToRgb."""
+    h = h % 360
+    c = v * s
+    x = c * (1 - abs((h / 60) % 2 - 1))
+    m = v - c
+    r, g, b = [(c, x, 0), (x, c, 0), (0, c, x),
+               (0, x, c), (x, 0, c), (c, 0, x)][min(int(h // 60), 5)]
+    return [_js_round((r + m) * 255), _js_round((g + m) * 255), _js_round((b + m) * 255)]
+
+
+def _rainbow_rgb(t):
+    """d3.interpolateRainbow(t) (a cubehelix ramp) as [r, g, b]."""
+    ts = abs(t - 0.5)
+    h = math.radians(360 * t - 100 + 120)
+    s, lum = 1.5 - 1.5 * ts, 0.8 - 0.9 * ts
+    a = s * lum * (1 - lum)
+    ch, sh = math.cos(h), math.sin(h)
+    rgb = (lum + a * (-0.14861 * ch + 1.78277 * sh),
+           lum + a * (-0.29227 * ch - 0.90649 * sh),
+           lum + a * (1.97294 * ch))
+    return [max(0, min(255, _js_round(255 * v))) for v in rgb]
+
+
+def _custom_palette(stops):
+    """applyCustomProxPalette*: `stops` colors lerped out to 16 entries."""
+    n = len(stops)
+    pal = []
+    for k in range(16):
+        t = k / 15 * (n - 1)
+        i0 = min(int(t), n - 2)
+        f = t - i0
+        pal.append([_js_round(stops[i0][c] * (1 - f) + stops[i0 + 1][c] * f)
+                    for c in range(3)])
+    return pal
+
+
+def _snapshot_band(doc, key, lo, hi, default):
+    v = doc.get(key)
+    return v if isinstance(v, (int, float)) and lo <= v <= hi else default
+
+
+def _snapshot_nodes(entries, n, extent, d_nodes=False):
+    """applyLoadedState's coefficient (or D-node) rebuild: home, path type
+    with the old names migrated, and rAbs from a legacy percentage radius."""
+    nodes = []
+    for i in range(n):
+        saved = entries[i] if i < len(entries) else None
+        if isinstance(saved, list):
+            # Oldest snapshots store bare [re, im] positions
+            saved = {"pos": saved}
+        if not saved:
+            saved = {"pos": [0, 0]}
+        path = saved.get("pathType") or "none"
+        extra = saved.get("extra") or {}
+        if d_nodes and path in ("none", "follow-c"):
+            home = saved["pos"]
+        else:
+            home = saved.get("home") or saved["pos"]
+        if path in ("spiral", "spiral-dither"):
+            path = "o-" + path
+        elif path in ("c-ellipse", "c-ellipse-dither") and extra.get("ctrRe") is None:
+            path = "o-" + path[2:]
+        r_abs = saved.get("rAbs")
+        if r_abs is None:
+            r_abs = (saved["radius"] / 100 * extent
+                     if saved.get("radius") is not None else 0.5)
+        nodes.append({"home": [home[0], home[1]], "path": path, "radius": r_abs,
+                      "speed": saved.get("speed", 1), "angle": saved.get("angle", 0),
+                      "ccw": bool(saved.get("ccw", False)), "extra": extra})
+    return nodes
+
+
+def _snapshot_animations(nodes, steps):
+    """computeCurveN + serializeFastModeData's entries for the animated
+    nodes, as sweep animation entries."""
+    anims = []
+    for i, node in enumerate(nodes):
+        path = node["path"]
+        if path in ("none", "follow-c"):
+            continue
+        extra = node["extra"]
+        base = path[:-len("-dither")] if path.endswith("-dither") else path
+        anim = {"coeff_index": i, "path": path, "radius": node["radius"],
+                "angle": node["angle"], "speed": node["speed"], "ccw": node["ccw"]}
+        for js_key, key in SNAPSHOT_EXTRA_KEYS.items():
+            if extra.get(js_key) is not None:
+                anim[key] = extra[js_key]
+        pts = extra.get("points") or 0
+        anim["points"] = pts if base in SNAPSHOT_POINTS_PATHS and pts > 0 else steps
+        if path.endswith("-dither"):
+            if extra.get("sigma") is not None:
+                anim["dither"] = extra["sigma"]
+            if extra.get("ditherDist"):
+                anim["dither_dist"] = extra["ditherDist"]
+        if path.startswith("orb-"):
+            anim["orbit_ref"] = extra.get("refC", 0)
+        anims.append(anim)
+    return anims
+
+
+def snapshot_spec(doc, steps, width, height):
+    """Translate a browser snapshot (index.html's saveState document) into a
+    sweep "steploop" spec, as applyLoadedState restores it and
+    serializeFastModeData hands it to the fast-mode workers.
+    Returns (spec, canvas color as RRGGBB, the snapshot's worker count).
+    Raises ValueError for snapshots the native step loop cannot replay."""
+    if not isinstance(doc.get("coefficients"), list):
+        raise ValueError("not a coefficient snapshot")
+    n = (doc.get("degree") or 5) + 1
+
+    entries = doc["coefficients"]
+    homes = []
+    for i in range(n):
+        c = entries[i] if i < len(entries) else None
+        if isinstance(c, dict):
+            c = c.get("home") or c.get("pos")
+        homes.append(c or [0, 0])
+    extent = max((math.hypot(a[0] - b[0], a[1] - b[1])
+                  for i, a in enumerate(homes) for b in homes[i + 1:]), default=0) or 1
+    c_nodes = _snapshot_nodes(entries, n, extent)
+
+    # Morph is always on; without a saved target list D sits on C
+    morph = doc.get("morph") or {}
+    targets = morph.get("target")
+    if isinstance(targets, list) and len(targets) == n:
+        d_nodes = _snapshot_nodes(targets, n, extent, d_nodes=True)
+    else:
+        d_nodes = [{"home": c["home"], "path": "none"} for c in c_nodes]
+    morph_path = morph.get("cdPathType") or "c-node"
+    if morph_path not in SNAPSHOT_MORPH_PATHS:
+        raise ValueError(f"morph path {morph_path!r} is not supported")
+    dither_end = morph.get("cdDitherEndSigma", 0) or 0
+    dither = {
+        "morph_dither_start": morph.get("cdDitherStartSigma", dither_end) or 0,
+        "morph_dither_mid": (morph.get("cdDitherMidSigma")
+                             if morph.get("cdDitherMidSigma") is not None
+                             else morph.get("cdDitherSigma", 0)) or 0,
+        "morph_dither_end": dither_end,
+    }
+
+    pinned = [list(r[:2]) for r in doc.get("pinnedRoots") or []]
+    n_roots = n - 1 + len(pinned)
+
+    # Colors
+    mode = doc.get("bitmapColorMode")
+    if mode == "custom-prox":
+        mode = "custom-prox-8"
+    if not mode:
+        mode = doc.get("rootColorMode") or ("rainbow" if doc.get("rootColoring", True)
+                                            else "uniform")
+    if mode in SNAPSHOT_JS_ONLY_MODES:
+        raise ValueError(f"color mode {mode!r} is only implemented in the browser's JS worker")
+    uniform = doc.get("bitmapUniformColor") or doc.get("uniformRootColor") or [255, 255, 255]
+
+    def custom(key, count, hue0):
+        stops = doc.get(key)
+        if not (isinstance(stops, list) and len(stops) == count):
+            stops = [_hsv_rgb(i * 360 / count + hue0, 1, 1) for i in range(count)]
+        return _custom_palette(stops)
+
+    if doc.get("bitmapProxCustomRP4Active") or mode == "custom-relprox-4":
+        prox_palette = custom("bitmapProxCustomRP4", 4, 45)
+    elif doc.get("bitmapProxCustom4Active") or mode == "custom-prox-4":
+        prox_palette = custom("bitmapProxCustom4", 4, 0)
+    elif doc.get("bitmapProxCustomActive"):
+        prox_palette = custom("bitmapProxCustom", 8, 0)
+    elif doc.get("bitmapProxPalette") in SNAPSHOT_PALETTES:
+        prox_palette = doc["bitmapProxPalette"]
+    else:
+        prox_palette = "inferno"
+    deriv_palette = doc.get("bitmapDerivPalette")
+    if deriv_palette not in SNAPSHOT_PALETTES:
+        deriv_palette = "bwr"
+
+    spec = {
+        "mode": "steploop",
+        "coefficients": [c["home"] for c in c_nodes],
+        "pinned": pinned,
+        "pinned_epsilon": doc.get("pinnedEpsilon") or 0,
+        "n_t": steps,
+        "seconds": FAST_PASS_SECONDS,
+        "animations": _snapshot_animations(c_nodes, steps),
+        "morph_targets": [d["home"] for d in d_nodes],
+        "morph_animations": _snapshot_animations(d_nodes, steps),
+        "follow_c": [i for i, d in enumerate(d_nodes) if d["path"] == "follow-c"],
+        "morph_rate": morph.get("rate", 0.01),
+        "morph_path": morph_path,
+        "morph_ccw": bool(morph.get("cdCcw")),
+        "morph_ellipse_minor": morph.get("cdEllipseMinor", 0.5),
+        **{k: v / 100 * extent for k, v in dither.items()},
+        "morph_dither_pow": morph.get("cdDitherPow", 0.5),
+        "morph_dither_dist": morph.get("cdDitherDist") or "normal",
+        "width": width, "height": height,
+        "range": ((doc.get("panels") or {}).get("roots") or {}).get("range") or 2.0,
+        "center_re": 0.0, "center_im": 0.0,
+        "color": SNAPSHOT_COLOR_MODES.get(mode, "index"),
+        "match": (doc.get("bitmapMatchStrategy")
+                  if doc.get("bitmapMatchStrategy") in ("assign4", "assign1", "hungarian1")
+                  else "assign4"),
+        "colors": [_rainbow_rgb(i / n_roots) for i in range(n_roots)],
+        "uniform_color": list(uniform[:3]),
+        "prox_palette": prox_palette,
+        "deriv_palette": deriv_palette,
+        "prox_gamma": _snapshot_band(doc, "bitmapProxGamma", 0.1, 3.0, 1.0),
+        "selected": sorted(i for i in doc.get("selectedCoeffs") or [] if 0 <= i < n) or None,
+    }
+    if spec["selected"] is None:
+        del spec["selected"]
+    for prefix, js in (("prox", "Prox"), ("rel_prox", "RelProx"), ("deriv", "Deriv")):
+        floor = _snapshot_band(doc, f"bitmap{js}Floor", 0, 1, 0)
+        spec[f"{prefix}_floor"] = floor
+        spec[f"{prefix}_ceiling"] = max(floor, _snapshot_band(doc, f"bitmap{js}Ceiling", 0, 1, 1))
+        spec[f"{prefix}_freq"] = _snapshot_band(doc, f"bitmap{js}Freq", 0, 10, 0)
+
+    # Warm start: the saved roots, then the pinned roots; sweep seeds the
+    # unit circle when the saved set does not match the degree
+    roots = doc.get("roots") or []
+    if len(roots) == n - 1:
+        spec["roots"] = [list(r[:2]) for r in roots] + pinned
+
+    canvas = str(doc.get("bitmapCanvasColor") or "#000000").lstrip("#")
+    if len(canvas) != 6 or any(ch not in "0123456789abcdefABCDEF" for ch in canvas):
+        canvas = "000000"
+    workers = doc.get("numWorkers")
+    workers = workers if isinstance(workers, int) and 1 <= workers <= 16 else 1
+    return spec, canvas, workers
+
+
+def load_snapshot(params):
+    """The snapshot document a /render-snapshot request names: inline
+    "snapshot", an S3 "snapshot_key", or page "page" of the book config at
+    "book_key" (a page index, "cover" or "back"; the page image's .json
+    sibling is its snapshot).  Returns (document, source description)."""
+    if params.get("snapshot"):
+        return params["snapshot"], "inline"
+    key = params.get("snapshot_key")
+    if not key:
+        book_key = params.get("book_key")
+        if not book_key:
+            raise ValueError("need snapshot, snapshot_key or book_key")
+        book = json.loads(s3.get_object(Bucket=BUCKET, Key=book_key)["Body"].read())
+        page = params.get("page", 0)
+        if page in ("cover", "back"):
+            image = book.get(f"{page}_image")
+        else:
+            pages = book.get("pages") or []
+            if not isinstance(page, int) or not 0 <= page < len(pages):
+                raise ValueError(f"book has no page {page!r}")
+            image = pages[page].get("image")
+        if not image:
+            raise ValueError(f"book page {page!r} has no image")
+        key = image.rsplit(".", 1)[0] + ".json"
+    try:
+        doc = json.loads(s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+    except ClientError as e:
+        raise ValueError(f"cannot read snapshot {key}: {e}")
+    return doc, key
+
+
+def handle_compute_snapshot_stripe(event):
+    """Per-stripe worker for /render-snapshot: run sweep's steploop mode over
+    one step range and upload the RGBA raw.
+    Input: a steploop spec plus {job_id, out_key}
+    Returns: {out_key, painted, avg_iterations, elapsed_us, roots}
+    """
+    t_start = time.time()
+    params = parse_body(event)
+    out_key = params.pop("out_key")
+    params.pop("job_id", None)
+    raw_path = "/tmp/snapshot_stripe.raw"
+
+    t0 = time.time()
+    result = subprocess.run(
+        [SWEEP, raw_path],
+        input=json.dumps(params),
+        capture_output=True, text=True,
+        timeout=840
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"sweep steploop failed: {result.stderr.strip()}")
+    meta = json.loads(result.stdout)
+
+    t1 = time.time()
+    size = s3_upload(raw_path, out_key)
+    t2 = time.time()
+    os.remove(raw_path)
+
+    return ok_response({
+        "out_key": out_key,
+        "painted": meta["painted"],
+        "avg_iterations": meta["avg_iterations"],
+        "elapsed_us": meta["elapsed_us"],
+        "roots": meta["roots"],
+        "spans": [
+            make_span("snapshot-stripe", t_start, time.time(), out_key=out_key),
+            make_span("steploop", t0, t1, steps=meta["step_end"] - meta["step_start"]),
+            make_span("s3 put", t1, t2, bytes=size),
+        ],
+    })
+
+
+def handle_render_snapshot(event):
+    """Re-render a browser snapshot (snaps/*.json, or a book_config.json page)
+    at print resolution.
+
+    The snapshot becomes a sweep steploop spec (snapshot_spec).  Each pass
+    runs the fast mode's step loop over `steps` steps split into `n_stripes`
+    step ranges, one worker each, all warm-started from the same roots as the
+    browser's workers are; the next pass starts one FAST_PASS_SECONDS later
+    from the last stripe's final roots.  Stripe images composite in step
+    order (imgpipe --reduce --over) and are flattened onto the snapshot's
+    canvas color.  "range"/"center_re"/"center_im" override the viewport.
+    Output: renders/{job_id}/snapshot.{ext}
+    """
+    params = parse_body(event)
+    job_id = params.get("job_id", "snap_" + str(uuid.uuid4())[:8])
+    fmt = params.get("format", "png").lower()
+    ext = "jpeg" if fmt in ("jpeg", "jpg") else "png"
+    quality = params.get("quality", 90)
+    steps = max(1, int(params.get("steps", 10000)))
+    width = params.get("width", 2000)
+    height = params.get("height", width)
+    passes = max(1, min(int(params.get("passes", 1)), 100))
+    seed = int(params.get("seed", 0))
+    max_attempts = max(1, params.get("max_attempts", MAX_ATTEMPTS))
+    trace = Trace() if params.get("trace", True) else None
+    t_start = time.time()
+
+    if not (1 <= width <= MAX_FRAME and 1 <= height <= MAX_FRAME):
+        return err_response(400, f"canvas {width}x{height} outside 1..{MAX_FRAME}")
+    try:
+        doc, source = load_snapshot(params)
+        spec, canvas, n_workers = snapshot_spec(doc, steps, width, height)
+    except ValueError as e:
+        return err_response(400, str(e), job_id=job_id)
+    n_stripes = max(1, min(params.get("n_stripes", n_workers), steps, 500))
+    spec["seed"] = seed
+    # Snapshots do not save the bitmap tab's zoom; the browser starts from
+    # the roots panel's range about 0, which a request can override
+    for key in ("range", "center_re", "center_im"):
+        if params.get(key) is not None:
+            spec[key] = params[key]
+
+    # Phase 1: passes in order, each one's stripes in parallel
+    import concurrent.futures
+
+    t0 = time.time()
+    keys, results = [], []
+    roots = spec.pop("roots", None)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(n_stripes, INVOKE_CONCURRENCY)) as pool:
+        for p in range(passes):
+            bodies = []
+            for s in range(n_stripes):
+                body = {**spec, "job_id": job_id,
+                        "step_start": s * steps // n_stripes,
+                        "step_end": (s + 1) * steps // n_stripes,
+                        "elapsed_offset": p * FAST_PASS_SECONDS,
+                        "dither_seed": seed + p * n_stripes + s + 1,
+                        "out_key": f"renders/{job_id}/pass_{p}_stripe_{s}.raw"}
+                if roots:
+                    body["roots"] = roots
+                bodies.append(body)
+            t_pass = time.time()
+            futures = [pool.submit(invoke_worker, "/compute-snapshot-stripe", b,
+                                   max_attempts=max_attempts, trace=trace,
+                                   label=b["out_key"].rsplit("/", 1)[-1])
+                       for b in bodies]
+            # Let every stripe of the pass settle, so none uploads after the
+            # cleanup; a failed pass's finished stripes go with earlier passes'
+            concurrent.futures.wait(futures)
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            if errors:
+                delete_keys(keys + [b["out_key"] for b in bodies])
+                return err_response(502, f"pass {p}: {errors[0]}", job_id=job_id)
+            pass_results = [f.result() for f in futures]
+            if trace:
+                trace.add(f"pass {p}", t_pass, time.time(), stripes=n_stripes)
+            roots = pass_results[-1]["roots"]
+            keys.extend(r["out_key"] for r in pass_results)
+            results.extend(pass_results)
+    compute_wall_us = int((time.time() - t0) * 1e6)
+
+    # Phase 2: composite in step order, then flatten onto the canvas color
+    t1 = time.time()
+    final_keys, temp_keys, n_rounds = tree_reduce(
+        job_id, list(keys), f"renders/{job_id}/merge", 1.0,
+        max_attempts=max_attempts, trace=trace, blend="over")
+    reduce_us = int((time.time() - t1) * 1e6)
+
+    t2 = time.time()
+    out_key = f"renders/{job_id}/snapshot.{ext}"
+    enc = invoke_worker("/encode-upload", {
+        "raw_key": final_keys[0],
+        "out_key": out_key,
+        "format": ext,
+        "quality": quality,
+        "background": canvas,
+    }, max_attempts=max_attempts, trace=trace, label="encode")
+    encode_us = int((time.time() - t2) * 1e6)
+
+    delete_keys(keys + temp_keys)
+    trace_info = {}
+    if trace:
+        trace_key, trace_url = save_trace(trace, job_id)
+        trace_info = {"trace_key": trace_key, "trace_url": trace_url}
+
+    return ok_response({
+        "job_id": job_id, "status": "complete",
+        "source": source,
+        "width": width, "height": height,
+        "steps": steps, "passes": passes, "n_stripes": n_stripes,
+        "color": spec["color"], "background": canvas,
+        "painted": sum(r["painted"] for r in results),
+        "avg_iterations": sum(r["avg_iterations"] for r in results) / len(results),
+        "roots": roots,
+        "format": ext,
+        "out_key": out_key,
+        "image_url": enc["image_url"],
+        "file_size": enc["file_size"],
+        **trace_info,
+        "timing": {
+            "compute_wall_us": compute_wall_us,
+            "total_compute_us": sum(r["elapsed_us"] for r in results),
+            "reduce_us": reduce_us,
+            "reduce_rounds": n_rounds,
+            "encode_us": encode_us,
+            "total_us": int((time.time() - t_start) * 1e6),
         },
     })
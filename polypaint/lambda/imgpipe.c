@@ -5,18 +5,39 @@
  * followed by raw uint8 pixel data. Avoids PNG encode/decode overhead
  * for intermediate stages; only --encode produces final JPEG/PNG.
  *
- * Three modes:
+ * Five modes:
  *   --roots2image stripe.bin out.raw --width=W --height=H
  *                 --center_re=X --center_im=Y --scale=S --degree=D
  *                 [--color=rainbow|proximity] [--match=none|greedy|hungarian]
  *                 [--palette=inferno|viridis|magma|plasma|turbo|cividis|warm|cool]
- *     Reads f32 root positions from .bin, renders to raw image.
+ *                 [--tile=T]
+ *     Reads f32 root positions from .bin, renders to raw image.  A quantized
+ *     root file (sweep "encoding", root_codec.h) is detected by its header
+ *     and decoded first.
+ *     With --tile, the canvas is cut into T x T tiles and only hit tiles are
+ *     written, as parts out_<tx>_<ty>_p<k>.raw (out = path minus .raw), each
+ *     reported on a stdout line as it is written (raw_canvas.h).  At most
+ *     --resident_tiles tile buffers are held at once, so memory does not
+ *     grow with the canvas, which may exceed the 16384 frame limit.
  *
- *   --reduce acc.raw next.raw out.raw [--gamma=2.2]
+ *   --reduce acc.raw next.raw out.raw [--gamma=2.2] [--over]
  *     Gamma-correct additive merge of two images (gamma=0 for raw saturating add).
+ *     With --over (RGBA inputs), next is painted over acc wherever its alpha
+ *     is set: sweep steploop stripes composite in order, as the browser does.
  *
- *   --encode input.raw out.jpeg --quality=Q
- *     Convert raw image to JPEG or PNG with specified quality.
+ *   --hist-merge out.hist in.hist [in.hist ...]
+ *     Add root-density histograms (sweep "histogram", root_hist.h) from
+ *     several stripes; auto-expanding ones are folded to the widest extent
+ *     first.
+ *
+ *   --encode input.raw out.jpeg --quality=Q [--background=RRGGBB]
+ *     Convert raw image to JPEG or PNG with specified quality.  An RGBA
+ *     input is flattened onto --background (default black) first.
+ *
+ *   --dzsave input.raw out_base [--tile_size=254] [--overlap=1]
+ *            [--suffix=jpeg|png] [--quality=Q]
+ *     Write a Deep Zoom pyramid: out_base.dzi plus out_base_files/<level>/<x>_<y>.<suffix>.
+ *     The raw file is loaded lazily, so the full image is never decoded into memory.
  *
  * Build (must link against libvips from Lambda layer):
  *   gcc -O3 -o imgpipe imgpipe.c -I/opt/include \
@@ -29,93 +50,20 @@
 #include <stdlib.h>
 #include <string.h>
 #include <math.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <stdint.h>
 #include <vips/vips.h>
 
+#include "root_codec.h"
+#include "root_hist.h"
+#include "palettes.h"
+#include "raw_canvas.h"
+
 #define MAXDEG 256
 
-/* ---- RGB type and palette definitions (16-step) ---- */
-
-typedef struct { unsigned char r, g, b; } RGB;
-
-/* Inferno: black → purple → orange → yellow */
-static const RGB PAL_INFERNO[16] = {
-    {0,0,4}, {16,11,53}, {43,15,95}, {72,12,119},
-    {101,14,118}, {126,34,102}, {148,56,81}, {168,81,60},
-    {186,108,41}, {203,137,25}, {217,169,13}, {228,201,27},
-    {235,232,68}, {247,249,115}, {252,254,164}, {252,255,164}
-};
-
-/* Viridis: purple → teal → green → yellow */
-static const RGB PAL_VIRIDIS[16] = {
-    {68,1,84}, {72,20,103}, {71,40,120}, {63,57,131},
-    {55,72,137}, {46,87,140}, {38,102,141}, {31,116,140},
-    {26,131,137}, {27,146,130}, {40,161,119}, {65,175,102},
-    {102,187,79}, {149,198,50}, {201,206,22}, {253,231,37}
-};
-
-/* Magma: black → purple → pink → cream */
-static const RGB PAL_MAGMA[16] = {
-    {0,0,4}, {13,7,49}, {38,11,93}, {65,8,123},
-    {93,14,126}, {119,31,114}, {142,52,98}, {163,75,82},
-    {184,101,68}, {204,130,56}, {221,162,47}, {234,196,53},
-    {242,228,82}, {249,249,121}, {253,254,168}, {252,253,191}
-};
-
-/* Plasma: purple → magenta → orange → yellow */
-static const RGB PAL_PLASMA[16] = {
-    {13,8,135}, {47,5,146}, {79,2,150}, {107,2,145},
-    {132,9,133}, {153,21,117}, {171,38,98}, {187,58,79},
-    {201,81,59}, {213,107,39}, {223,135,22}, {231,165,11},
-    {237,196,8}, {240,225,15}, {243,249,40}, {240,249,33}
-};
-
-/* Turbo: dark blue → cyan → green → yellow → red → dark red */
-static const RGB PAL_TURBO[16] = {
-    {48,18,59}, {57,68,148}, {43,118,196}, {28,163,206},
-    {20,200,178}, {44,222,128}, {96,237,79}, {156,240,43},
-    {208,230,30}, {242,204,20}, {255,170,14}, {252,130,15},
-    {236,89,16}, {210,49,14}, {175,18,8}, {122,4,3}
-};
-
-/* Cividis: blue → yellow (colorblind-friendly) */
-static const RGB PAL_CIVIDIS[16] = {
-    {0,32,76}, {0,46,96}, {23,60,108}, {48,73,113},
-    {72,85,116}, {93,97,119}, {113,110,121}, {132,122,119},
-    {151,134,115}, {170,147,108}, {189,160,98}, {208,174,84},
-    {226,189,65}, {242,205,43}, {254,222,19}, {253,238,6}
-};
-
-/* Warm: magenta → red → orange → yellow */
-static const RGB PAL_WARM[16] = {
-    {110,64,170}, {138,60,162}, {163,62,143}, {182,72,121},
-    {196,87,97}, {208,107,75}, {216,130,56}, {222,155,42},
-    {225,180,36}, {225,205,41}, {220,226,56}, {208,243,81},
-    {190,252,108}, {168,254,139}, {145,253,168}, {122,250,196}
-};
-
-/* Cool: green → blue → purple */
-static const RGB PAL_COOL[16] = {
-    {110,64,170}, {100,82,192}, {88,101,207}, {75,119,215},
-    {62,137,217}, {52,154,213}, {44,170,203}, {40,185,188},
-    {42,199,168}, {53,211,145}, {71,222,119}, {96,230,91},
-    {126,236,65}, {160,240,44}, {194,241,32}, {228,238,29}
-};
-
-/* Named palette table */
-typedef struct { const char *name; const RGB *colors; } PalEntry;
-static const PalEntry PALETTES[] = {
-    {"inferno", PAL_INFERNO},
-    {"viridis", PAL_VIRIDIS},
-    {"magma",   PAL_MAGMA},
-    {"plasma",  PAL_PLASMA},
-    {"turbo",   PAL_TURBO},
-    {"cividis", PAL_CIVIDIS},
-    {"warm",    PAL_WARM},
-    {"cool",    PAL_COOL},
-    {NULL, NULL}
-};
-
-#define N_PALETTES 8
 
 static const RGB *findPalette(const char *name) {
     if (!name) return PAL_INFERNO;
@@ -139,25 +87,6 @@ static void paletteRGB(const RGB *pal, double t,
     *b = (unsigned char)(pal[lo].b * (1-f) + pal[hi].b * f + 0.5);
 }
 
-/* ---- Rainbow palette (HSL, same as sweep_cli.c) ---- */
-
-static void rainbowRGB(int index, int total,
-                       unsigned char *r, unsigned char *g, unsigned char *b) {
-    double hue = (double)index / (total > 0 ? total : 1);
-    double h6 = hue * 6.0;
-    int hi = (int)h6;
-    double f = h6 - hi;
-    double q = 1.0 - f;
-    switch (hi % 6) {
-        case 0: *r = 255; *g = (unsigned char)(f * 255); *b = 0; break;
-        case 1: *r = (unsigned char)(q * 255); *g = 255; *b = 0; break;
-        case 2: *r = 0; *g = 255; *b = (unsigned char)(f * 255); break;
-        case 3: *r = 0; *g = (unsigned char)(q * 255); *b = 255; break;
-        case 4: *r = (unsigned char)(f * 255); *g = 0; *b = 255; break;
-        case 5: *r = 255; *g = 0; *b = (unsigned char)(q * 255); break;
-    }
-}
-
 /* ---- Parse --key=value from argv ---- */
 
 static const char *getArg(int argc, char **argv, const char *key) {
@@ -186,35 +115,63 @@ static const char *getArgStr(int argc, char **argv, const char *key, const char
 
 /* ---- Raw image I/O (12-byte header: uint32 W, H, bands + pixel data) ---- */
 
-static int raw_write(const char *path, const unsigned char *data,
-                     unsigned int w, unsigned int h, unsigned int bands) {
-    FILE *f = fopen(path, "wb");
-    if (!f) { fprintf(stderr, "Cannot create %s\n", path); return -1; }
-    fwrite(&w, 4, 1, f);
-    fwrite(&h, 4, 1, f);
-    fwrite(&bands, 4, 1, f);
-    fwrite(data, 1, (size_t)w * h * bands, f);
-    fclose(f);
-    return 0;
-}
-
-static unsigned char *raw_read(const char *path,
-                               unsigned int *w, unsigned int *h, unsigned int *bands) {
-    FILE *f = fopen(path, "rb");
-    if (!f) { fprintf(stderr, "Cannot open %s\n", path); return NULL; }
-    if (fread(w, 4, 1, f) != 1 || fread(h, 4, 1, f) != 1 || fread(bands, 4, 1, f) != 1) {
+/* rawWrite is in raw_canvas.h. */
+
+/* Memory-mapped raw image: pixel pages are file-backed page cache rather
+ * than heap, so large reduce inputs/outputs cost no anonymous memory. */
+typedef struct {
+    unsigned char *base;
+    size_t len;
+    unsigned char *pixels;   /* base + 12 */
+    unsigned int w, h, bands;
+} RawMap;
+
+static int raw_map(const char *path, RawMap *m) {
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) { fprintf(stderr, "Cannot open %s\n", path); return -1; }
+    struct stat st;
+    if (fstat(fd, &st) != 0 || st.st_size < 12) {
         fprintf(stderr, "Bad raw header in %s\n", path);
-        fclose(f); return NULL;
+        close(fd); return -1;
     }
-    size_t n = (size_t)*w * *h * *bands;
-    unsigned char *data = malloc(n);
-    if (!data) { fprintf(stderr, "Cannot allocate %zu bytes\n", n); fclose(f); return NULL; }
-    if (fread(data, 1, n, f) != n) {
+    m->len = (size_t)st.st_size;
+    m->base = mmap(NULL, m->len, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (m->base == MAP_FAILED) { fprintf(stderr, "Cannot map %s\n", path); return -1; }
+    memcpy(&m->w, m->base, 4);
+    memcpy(&m->h, m->base + 4, 4);
+    memcpy(&m->bands, m->base + 8, 4);
+    if (12 + (size_t)m->w * m->h * m->bands > m->len) {
         fprintf(stderr, "Short read in %s\n", path);
-        free(data); fclose(f); return NULL;
+        munmap(m->base, m->len); return -1;
     }
-    fclose(f);
-    return data;
+    m->pixels = m->base + 12;
+    madvise(m->base, m->len, MADV_SEQUENTIAL);
+    return 0;
+}
+
+static int raw_create_map(const char *path, unsigned int w, unsigned int h,
+                          unsigned int bands, RawMap *m) {
+    int fd = open(path, O_RDWR | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0) { fprintf(stderr, "Cannot create %s\n", path); return -1; }
+    m->len = 12 + (size_t)w * h * bands;
+    if (ftruncate(fd, (off_t)m->len) != 0) {
+        fprintf(stderr, "Cannot size %s\n", path);
+        close(fd); return -1;
+    }
+    m->base = mmap(NULL, m->len, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (m->base == MAP_FAILED) { fprintf(stderr, "Cannot map %s\n", path); return -1; }
+    m->w = w; m->h = h; m->bands = bands;
+    memcpy(m->base, &w, 4);
+    memcpy(m->base + 4, &h, 4);
+    memcpy(m->base + 8, &bands, 4);
+    m->pixels = m->base + 12;
+    return 0;
+}
+
+static void raw_unmap(RawMap *m) {
+    munmap(m->base, m->len);
 }
 
 /* ---- Root matching: greedy ---- */
@@ -322,7 +279,7 @@ static int do_roots2image(int argc, char **argv) {
                 "--width=W --height=H --center_re=X --center_im=Y --scale=S "
                 "--degree=D [--color=rainbow|proximity|constant] "
                 "[--match=none|greedy|hungarian] [--palette=inferno|...] "
-                "[--constant_color=RRGGBB]\n");
+                "[--constant_color=RRGGBB] [--tile=T] [--resident_tiles=N]\n");
         return 1;
     }
     const char *binPath = argv[2];
@@ -338,6 +295,8 @@ static int do_roots2image(int argc, char **argv) {
     const char *palName = getArgStr(argc, argv, "--palette", "inferno");
 
     const char *constColorStr = getArgStr(argc, argv, "--constant_color", "ffffff");
+    int tile = getArgInt(argc, argv, "--tile", 0);
+    int slots = getArgInt(argc, argv, "--resident_tiles", 0);
 
     enum ColorMode colorMode = COLOR_RAINBOW;
     if (strcmp(colorStr, "proximity") == 0) colorMode = COLOR_PROXIMITY;
@@ -356,10 +315,15 @@ static int do_roots2image(int argc, char **argv) {
 
     const RGB *proxPal = findPalette(palName);
 
-    if (W < 1 || W > 16384 || H < 1 || H > 16384) {
+    int maxDim = tile ? MAX_CANVAS : MAX_FRAME;
+    if (W < 1 || W > maxDim || H < 1 || H > maxDim) {
         fprintf(stderr, "Invalid dimensions: %dx%d\n", W, H);
         return 1;
     }
+    if (tile < 0 || tile > MAX_FRAME) {
+        fprintf(stderr, "Invalid tile size: %d\n", tile);
+        return 1;
+    }
     if (degree < 1 || degree > MAXDEG) {
         fprintf(stderr, "Invalid degree: %d\n", degree);
         return 1;
@@ -374,23 +338,61 @@ static int do_roots2image(int argc, char **argv) {
 
     int stride = degree * 2;  /* f32 per step: re,im for each root */
     long nPoints = fileSize / (stride * sizeof(float));
-    if (nPoints <= 0) { fprintf(stderr, "Empty root file\n"); fclose(fin); return 1; }
+    if (fileSize <= 0) { fprintf(stderr, "Empty root file\n"); fclose(fin); return 1; }
 
     float *roots = malloc(fileSize);
     if (!roots) { fprintf(stderr, "Cannot allocate %ld bytes\n", fileSize); fclose(fin); return 1; }
     fread(roots, 1, fileSize, fin);
     fclose(fin);
 
+    /* Quantized root file: decode the row blocks, in row order, to f32 */
+    RootsHeader rh;
+    int encoded = rootsReadHeader((const unsigned char *)roots, fileSize, &rh);
+    if (encoded < 0 || (encoded && rh.degree != degree)) {
+        fprintf(stderr, "Bad root file header in %s\n", binPath);
+        free(roots);
+        return 1;
+    }
+    if (encoded) {
+        const unsigned char *file = (const unsigned char *)roots;
+        nPoints = (long)rh.nBlocks * rh.blockSteps;
+        float *decoded = malloc((size_t)nPoints * stride * sizeof(float));
+        if (!decoded) {
+            fprintf(stderr, "Cannot allocate %ld points\n", nPoints);
+            free(roots);
+            return 1;
+        }
+        long at = 0;
+        for (uint32_t k = 0; k < rh.nBlocks; k++) {
+            uint64_t off;
+            memcpy(&off, file + rh.indexOffset + (size_t)k * 8, 8);
+            long n = off < (uint64_t)fileSize
+                ? rootsDecodeBlock(file + off, fileSize - off, degree, rh.encoding,
+                                   decoded + (size_t)at * stride, nPoints - at)
+                : -1;
+            if (n < 0) {
+                fprintf(stderr, "Corrupt root block %u in %s\n", k, binPath);
+                free(decoded); free(roots);
+                return 1;
+            }
+            at += n;
+        }
+        nPoints = at;
+        free(roots);
+        roots = decoded;
+    }
+    if (nPoints <= 0) { fprintf(stderr, "Empty root file\n"); free(roots); return 1; }
+
     /* Build rainbow palette (used for rainbow mode) */
     unsigned char rbPalR[MAXDEG], rbPalG[MAXDEG], rbPalB[MAXDEG];
     for (int i = 0; i < degree; i++)
         rainbowRGB(i, degree, &rbPalR[i], &rbPalG[i], &rbPalB[i]);
 
-    /* Allocate pixel buffer */
-    long pixelBytes = (long)W * H * 3;
-    unsigned char *pixels = calloc(pixelBytes, 1);
-    if (!pixels) {
-        fprintf(stderr, "Cannot allocate %ldMB\n", pixelBytes / (1024 * 1024));
+    /* Allocate pixel buffer, or empty tile buckets */
+    Canvas cv;
+    if (canvasInit(&cv, W, H, tile, slots, outPath) != 0) {
+        fprintf(stderr, "Cannot allocate %dx%d canvas\n", W, H);
+        canvasFree(&cv);
         free(roots);
         return 1;
     }
@@ -451,11 +453,7 @@ static int do_roots2image(int argc, char **argv) {
                 unsigned char cr, cg, cb;
                 paletteRGB(proxPal, t, &cr, &cg, &cb);
 
-                long idx = ((long)py * W + px) * 3;
-                int v;
-                v = pixels[idx]   + cr; pixels[idx]   = v > 255 ? 255 : v;
-                v = pixels[idx+1] + cg; pixels[idx+1] = v > 255 ? 255 : v;
-                v = pixels[idx+2] + cb; pixels[idx+2] = v > 255 ? 255 : v;
+                canvasPlot(&cv, px, py, cr, cg, cb);
                 rootsPlotted++;
             }
         }
@@ -469,11 +467,7 @@ static int do_roots2image(int argc, char **argv) {
                 int px = (int)(halfW + (re - centerRe) * scale);
                 int py = (int)(halfH - (im - centerIm) * scale);
                 if (px >= 0 && px < W && py >= 0 && py < H) {
-                    long idx = ((long)py * W + px) * 3;
-                    int v;
-                    v = pixels[idx]   + constR; pixels[idx]   = v > 255 ? 255 : v;
-                    v = pixels[idx+1] + constG; pixels[idx+1] = v > 255 ? 255 : v;
-                    v = pixels[idx+2] + constB; pixels[idx+2] = v > 255 ? 255 : v;
+                    canvasPlot(&cv, px, py, constR, constG, constB);
                     rootsPlotted++;
                 } else {
                     rootsClipped++;
@@ -515,12 +509,8 @@ static int do_roots2image(int argc, char **argv) {
                 int px = (int)(halfW + (re - centerRe) * scale);
                 int py = (int)(halfH - (im - centerIm) * scale);
                 if (px >= 0 && px < W && py >= 0 && py < H) {
-                    long idx = ((long)py * W + px) * 3;
                     int ci = colorMap[r];
-                    int v;
-                    v = pixels[idx]   + rbPalR[ci]; pixels[idx]   = v > 255 ? 255 : v;
-                    v = pixels[idx+1] + rbPalG[ci]; pixels[idx+1] = v > 255 ? 255 : v;
-                    v = pixels[idx+2] + rbPalB[ci]; pixels[idx+2] = v > 255 ? 255 : v;
+                    canvasPlot(&cv, px, py, rbPalR[ci], rbPalG[ci], rbPalB[ci]);
                     rootsPlotted++;
                 } else {
                     rootsClipped++;
@@ -535,15 +525,16 @@ static int do_roots2image(int argc, char **argv) {
         }
     }
 
-    /* Write raw image (12-byte header + pixel data) */
-    if (raw_write(outPath, pixels, W, H, 3) != 0) {
-        free(pixels); free(roots);
+    free(roots);
+
+    /* Write the raw image, or the tile parts still held (12-byte header +
+     * pixel data) */
+    if (cv.failed || canvasFinish(&cv) < 0) {
+        fprintf(stderr, "Cannot write the canvas (out of memory or disk)\n");
+        canvasFree(&cv);
         return 1;
     }
 
-    free(pixels);
-    free(roots);
-
     /* Output metadata as JSON */
     printf("{\"roots_plotted\":%ld,\"roots_clipped\":%ld,\"n_points\":%ld,"
            "\"degree\":%d,\"color\":\"%s\",\"match\":\"%s\"",
@@ -552,7 +543,21 @@ static int do_roots2image(int argc, char **argv) {
         printf(",\"palette\":\"%s\"", palName);
     else if (colorMode == COLOR_CONSTANT)
         printf(",\"constant_color\":\"%s\"", constColorStr);
+    if (tile) {
+        /* Non-empty tiles as [tx, ty, hits, parts] */
+        printf(",\"tile\":%d,\"tiles_x\":%d,\"tiles_y\":%d,\"resident_tiles\":%d,"
+               "\"tiles\":[", tile, cv.tilesX, cv.tilesY, cv.nSlots);
+        int first = 1;
+        for (int i = 0; i < cv.tilesX * cv.tilesY; i++) {
+            if (cv.hits[i] == 0) continue;
+            printf("%s[%d,%d,%ld,%d]", first ? "" : ",",
+                   i % cv.tilesX, i / cv.tilesX, cv.hits[i], cv.parts[i]);
+            first = 0;
+        }
+        printf("]");
+    }
     printf("}\n");
+    canvasFree(&cv);
 
     return 0;
 }
@@ -561,61 +566,119 @@ static int do_roots2image(int argc, char **argv) {
 
 static int do_reduce(int argc, char **argv) {
     if (argc < 5) {
-        fprintf(stderr, "Usage: imgpipe --reduce acc.raw next.raw out.raw [--gamma=2.2]\n");
+        fprintf(stderr, "Usage: imgpipe --reduce acc.raw next.raw out.raw [--gamma=2.2] [--over]\n");
         return 1;
     }
     const char *accPath = argv[2];
     const char *nextPath = argv[3];
     const char *outPath = argv[4];
     double gamma = getArgDouble(argc, argv, "--gamma", 2.2);
-
-    /* Load both raw images */
-    unsigned int W, H, bands;
-    unsigned int W2, H2, bands2;
-    unsigned char *accData = raw_read(accPath, &W, &H, &bands);
-    if (!accData) return 1;
-    unsigned char *nextData = raw_read(nextPath, &W2, &H2, &bands2);
-    if (!nextData) { free(accData); return 1; }
-
-    if (W != W2 || H != H2) {
-        fprintf(stderr, "Image dimension mismatch: %ux%u vs %ux%u\n", W, H, W2, H2);
-        free(accData); free(nextData);
+    int over = 0;
+    for (int i = 5; i < argc; i++)
+        if (strcmp(argv[i], "--over") == 0) over = 1;
+
+    /* Map both raw images and the output file */
+    RawMap acc, next, out;
+    if (raw_map(accPath, &acc) != 0) return 1;
+    if (raw_map(nextPath, &next) != 0) { raw_unmap(&acc); return 1; }
+    unsigned int W = acc.w, H = acc.h, bands = acc.bands;
+
+    if (W != next.w || H != next.h || bands != next.bands) {
+        fprintf(stderr, "Image dimension mismatch: %ux%u vs %ux%u\n", W, H, next.w, next.h);
+        raw_unmap(&acc); raw_unmap(&next);
+        return 1;
+    }
+    if (over && bands != 4) {
+        fprintf(stderr, "--over needs RGBA images, got %u bands\n", bands);
+        raw_unmap(&acc); raw_unmap(&next);
+        return 1;
+    }
+    if (raw_create_map(outPath, W, H, bands, &out) != 0) {
+        raw_unmap(&acc); raw_unmap(&next);
         return 1;
     }
 
     size_t n = (size_t)W * H * bands;
-
-    if (gamma > 0.01) {
+    const unsigned char *accData = acc.pixels;
+    const unsigned char *nextData = next.pixels;
+    unsigned char *outData = out.pixels;
+
+    if (over) {
+        /* Paint order: next's painted pixels replace acc's */
+        for (size_t i = 0; i < n; i += 4)
+            memcpy(outData + i, nextData[i + 3] ? nextData + i : accData + i, 4);
+    } else if (gamma > 0.01) {
         /* Gamma-correct blending via LUTs */
         buildGammaLUT(gamma);
         for (size_t i = 0; i < n; i++) {
             float sum = srgb2lin[accData[i]] + srgb2lin[nextData[i]];
             if (sum >= 1.0f) {
-                accData[i] = 255;
+                outData[i] = 255;
             } else {
                 int idx = (int)(sum * 4095.0f + 0.5f);
                 if (idx > 4095) idx = 4095;
-                accData[i] = lin2srgb[idx];
+                outData[i] = lin2srgb[idx];
             }
         }
     } else {
         /* Raw saturating add (gamma=0, backward compatible) */
         for (size_t i = 0; i < n; i++) {
             int v = accData[i] + nextData[i];
-            accData[i] = v > 255 ? 255 : (unsigned char)v;
+            outData[i] = v > 255 ? 255 : (unsigned char)v;
         }
     }
 
-    /* Write result as raw */
-    if (raw_write(outPath, accData, W, H, bands) != 0) {
-        free(accData); free(nextData);
+    raw_unmap(&acc);
+    raw_unmap(&next);
+    raw_unmap(&out);
+
+    printf("{\"status\":\"ok\",\"width\":%u,\"height\":%u,\"gamma\":%.2f,\"over\":%s}\n",
+           W, H, gamma, over ? "true" : "false");
+    return 0;
+}
+
+/* ---- hist-merge mode ---- */
+
+static int do_hist_merge(int argc, char **argv) {
+    if (argc < 4) {
+        fprintf(stderr, "Usage: imgpipe --hist-merge out.hist in.hist [in.hist ...]\n");
+        return 1;
+    }
+    const char *outPath = argv[2];
+    RootHist acc, next;
+    if (histRead(&acc, argv[3]) != 0) {
+        fprintf(stderr, "Cannot read histogram %s\n", argv[3]);
+        return 1;
+    }
+    for (int i = 4; i < argc; i++) {
+        if (histRead(&next, argv[i]) != 0) {
+            fprintf(stderr, "Cannot read histogram %s\n", argv[i]);
+            histFree(&acc);
+            return 1;
+        }
+        int rc = histMerge(&acc, &next);
+        histFree(&next);
+        if (rc != 0) {
+            fprintf(stderr, "Histogram %s does not match %s (size, center, extent or bounds)\n",
+                    argv[i], argv[3]);
+            histFree(&acc);
+            return 1;
+        }
+    }
+    if (histWrite(&acc, outPath) != 0) {
+        fprintf(stderr, "Cannot write %s\n", outPath);
+        histFree(&acc);
         return 1;
     }
 
-    free(accData);
-    free(nextData);
-
-    printf("{\"status\":\"ok\",\"width\":%u,\"height\":%u,\"gamma\":%.2f}\n", W, H, gamma);
+    double b[4];
+    histBounds(&acc, b);
+    printf("{\"status\":\"ok\",\"inputs\":%d,\"width\":%d,\"height\":%d,"
+           "\"bounds\":[%.17g,%.17g,%.17g,%.17g],\"doublings\":%d,"
+           "\"roots_counted\":%llu,\"roots_clipped\":%llu}\n",
+           argc - 3, acc.width, acc.height, b[0], b[1], b[2], b[3], acc.doublings,
+           (unsigned long long)acc.counted, (unsigned long long)acc.clipped);
+    histFree(&acc);
     return 0;
 }
 
@@ -623,26 +686,43 @@ static int do_reduce(int argc, char **argv) {
 
 static int do_encode(int argc, char **argv) {
     if (argc < 4) {
-        fprintf(stderr, "Usage: imgpipe --encode input.raw out.jpeg [--quality=90]\n");
+        fprintf(stderr, "Usage: imgpipe --encode input.raw out.jpeg [--quality=90] "
+                "[--background=RRGGBB]\n");
         return 1;
     }
     const char *inPath = argv[2];
     const char *outPath = argv[3];
     int quality = getArgInt(argc, argv, "--quality", 90);
 
-    /* Load raw image and wrap in VipsImage for encoding */
-    unsigned int W, H, bands;
-    unsigned char *data = raw_read(inPath, &W, &H, &bands);
-    if (!data) return 1;
+    /* Map the raw file straight into vips (no heap copy of the pixels) */
+    RawMap in;
+    if (raw_map(inPath, &in) != 0) return 1;
+    unsigned int W = in.w, H = in.h, bands = in.bands;
+    raw_unmap(&in);
 
-    VipsImage *img = vips_image_new_from_memory_copy(data, (size_t)W * H * bands,
-                                                      W, H, bands, VIPS_FORMAT_UCHAR);
-    free(data);
-    if (!img) {
-        fprintf(stderr, "vips_image_new_from_memory_copy failed\n");
+    VipsImage *img;
+    if (vips_rawload(inPath, &img, W, H, bands, "offset", (guint64)12, NULL)) {
+        fprintf(stderr, "vips_rawload failed: %s\n", vips_error_buffer());
         return 1;
     }
 
+    /* RGBA (sweep steploop): flatten onto the canvas color */
+    if (bands == 4) {
+        unsigned int bg = (unsigned int)strtoul(getArgStr(argc, argv, "--background", "000000"),
+                                                NULL, 16);
+        VipsArrayDouble *bgArr = vips_array_double_newv(3, (double)(bg >> 16 & 255),
+                                                        (double)(bg >> 8 & 255), (double)(bg & 255));
+        VipsImage *flat;
+        int bad = vips_flatten(img, &flat, "background", bgArr, NULL);
+        vips_area_unref(VIPS_AREA(bgArr));
+        g_object_unref(img);
+        if (bad) {
+            fprintf(stderr, "vips_flatten failed: %s\n", vips_error_buffer());
+            return 1;
+        }
+        img = flat;
+    }
+
     /* Determine format from output extension */
     const char *ext = strrchr(outPath, '.');
     int isJpeg = ext && (strcmp(ext, ".jpeg") == 0 || strcmp(ext, ".jpg") == 0);
@@ -672,6 +752,67 @@ static int do_encode(int argc, char **argv) {
     return 0;
 }
 
+/* ---- dzsave mode ---- */
+
+static int do_dzsave(int argc, char **argv) {
+    if (argc < 4) {
+        fprintf(stderr, "Usage: imgpipe --dzsave input.raw out_base [--tile_size=254] "
+                "[--overlap=1] [--suffix=jpeg|png] [--quality=90]\n");
+        return 1;
+    }
+    const char *inPath = argv[2];
+    const char *outBase = argv[3];
+    int tileSize = getArgInt(argc, argv, "--tile_size", 254);
+    int overlap = getArgInt(argc, argv, "--overlap", 1);
+    const char *suffix = getArgStr(argc, argv, "--suffix", "jpeg");
+    int quality = getArgInt(argc, argv, "--quality", 90);
+    int isPng = strcmp(suffix, "png") == 0;
+
+    if (tileSize < 1 || tileSize > 8192 || overlap < 0 || overlap >= tileSize) {
+        fprintf(stderr, "Bad tile geometry: tile_size=%d overlap=%d\n", tileSize, overlap);
+        return 1;
+    }
+
+    /* Read only the header; vips maps the pixel data after it */
+    RawMap in;
+    if (raw_map(inPath, &in) != 0) return 1;
+    unsigned int W = in.w, H = in.h, bands = in.bands;
+    raw_unmap(&in);
+
+    VipsImage *img;
+    if (vips_rawload(inPath, &img, W, H, bands, "offset", (guint64)12, NULL)) {
+        fprintf(stderr, "vips_rawload failed: %s\n", vips_error_buffer());
+        return 1;
+    }
+
+    char tileSuffix[32];
+    if (isPng)
+        snprintf(tileSuffix, sizeof tileSuffix, ".png");
+    else
+        snprintf(tileSuffix, sizeof tileSuffix, ".jpeg[Q=%d]", quality);
+
+    if (vips_dzsave(img, outBase,
+                    "tile_size", tileSize,
+                    "overlap", overlap,
+                    "suffix", tileSuffix,
+                    NULL)) {
+        fprintf(stderr, "vips_dzsave failed: %s\n", vips_error_buffer());
+        g_object_unref(img);
+        return 1;
+    }
+    g_object_unref(img);
+
+    /* Deep Zoom levels run from 1x1 up to full size, halving each step */
+    int levels = 1;
+    unsigned int maxDim = W > H ? W : H;
+    while ((1u << (levels - 1)) < maxDim) levels++;
+
+    printf("{\"status\":\"ok\",\"width\":%u,\"height\":%u,\"levels\":%d,"
+           "\"tile_size\":%d,\"overlap\":%d,\"format\":\"%s\"}\n",
+           W, H, levels, tileSize, overlap, isPng ? "png" : "jpeg");
+    return 0;
+}
+
 /* ---- Main ---- */
 
 int main(int argc, char **argv) {
@@ -684,7 +825,7 @@ int main(int argc, char **argv) {
     vips_leak_set(0);
 
     if (argc < 2) {
-        fprintf(stderr, "Usage: imgpipe --roots2image|--reduce|--encode ...\n");
+        fprintf(stderr, "Usage: imgpipe --roots2image|--reduce|--hist-merge|--encode|--dzsave ...\n");
         vips_shutdown();
         return 1;
     }
@@ -694,8 +835,12 @@ int main(int argc, char **argv) {
         ret = do_roots2image(argc, argv);
     else if (strcmp(argv[1], "--reduce") == 0)
         ret = do_reduce(argc, argv);
+    else if (strcmp(argv[1], "--hist-merge") == 0)
+        ret = do_hist_merge(argc, argv);
     else if (strcmp(argv[1], "--encode") == 0)
         ret = do_encode(argc, argv);
+    else if (strcmp(argv[1], "--dzsave") == 0)
+        ret = do_dzsave(argc, argv);
     else {
         fprintf(stderr, "Unknown mode: %s\n", argv[1]);
         ret = 1;
@@ -4,6 +4,7 @@
  * bounding box to ignore outliers.
  *
  * Input:  JSON on stdin: {"function":"giga_5","n1":1000,"n2":1000}
+ *         or {"expr":"<program>",...} for an expression family (coeff_expr.h)
  * Output: JSON to stdout: {"center_re":...,"center_im":...,"scale":...,"degree":...}
  *         Scale is computed for a 4096x4096 reference image.
  *
@@ -27,6 +28,8 @@
 #define M_PI 3.14159265358979323846
 #endif
 
+#include "coeff_expr.h"
+
 /* ---- qsort comparator for doubles ---- */
 static int cmpDouble(const void *a, const void *b) {
     double da = *(const double *)a, db = *(const double *)b;
@@ -35,12 +38,23 @@ static int cmpDouble(const void *a, const void *b) {
 
 /* ---- Ehrlich-Aberth solver ---- */
 
+/* Per-root freezing and Newton polishing, as in sweep_cli.c: converged
+ * roots stop updating, and roots with a negligible Aberth term |w*S| skip
+ * the O(n) Aberth sum. */
+#define ROOT_ACTIVE 0
+#define ROOT_POLISH 1
+#define ROOT_FROZEN 2
+#define POLISH_WS2 1e-6
+
 static int solveEA(double *cr, double *ci, int n,
                    double *rRe, double *rIm, int degree)
 {
+    unsigned char state[MAX_DEGREE];
+    memset(state, ROOT_ACTIVE, degree);
     for (int iter = 0; iter < MAX_ITER; iter++) {
         double maxCorr2 = 0;
         for (int i = 0; i < degree; i++) {
+            if (state[i] == ROOT_FROZEN) continue;
             double zR = rRe[i], zI = rIm[i];
             double pR = cr[0], pI = ci[0];
             double dpR = 0, dpI = 0;
@@ -56,26 +70,31 @@ static int solveEA(double *cr, double *ci, int n,
             if (dpM < 1e-60) continue;
             double wR = (pR * dpR + pI * dpI) / dpM;
             double wI = (pI * dpR - pR * dpI) / dpM;
-            double sR = 0, sI = 0;
-            for (int j = 0; j < degree; j++) {
-                if (j == i) continue;
-                double dR = zR - rRe[j], dI = zI - rIm[j];
-                double dM = dR * dR + dI * dI;
-                if (dM < 1e-60) continue;
-                sR += dR / dM;
-                sI += -dI / dM;
+            double crrR = wR, crrI = wI;
+            if (state[i] == ROOT_ACTIVE) {
+                double sR = 0, sI = 0;
+                for (int j = 0; j < degree; j++) {
+                    if (j == i) continue;
+                    double dR = zR - rRe[j], dI = zI - rIm[j];
+                    double dM = dR * dR + dI * dI;
+                    if (dM < 1e-60) continue;
+                    sR += dR / dM;
+                    sI += -dI / dM;
+                }
+                double wsR = wR * sR - wI * sI;
+                double wsI = wR * sI + wI * sR;
+                double dnR = 1 - wsR, dnI = -wsI;
+                double dnM = dnR * dnR + dnI * dnI;
+                if (dnM < 1e-60) continue;
+                crrR = (wR * dnR + wI * dnI) / dnM;
+                crrI = (wI * dnR - wR * dnI) / dnM;
+                if (wsR * wsR + wsI * wsI < POLISH_WS2) state[i] = ROOT_POLISH;
             }
-            double wsR = wR * sR - wI * sI;
-            double wsI = wR * sI + wI * sR;
-            double dnR = 1 - wsR, dnI = -wsI;
-            double dnM = dnR * dnR + dnI * dnI;
-            if (dnM < 1e-60) continue;
-            double crrR = (wR * dnR + wI * dnI) / dnM;
-            double crrI = (wI * dnR - wR * dnI) / dnM;
             rRe[i] -= crrR;
             rIm[i] -= crrI;
             double h2 = crrR * crrR + crrI * crrI;
             if (h2 > maxCorr2) maxCorr2 = h2;
+            if (h2 < TOL2) state[i] = ROOT_FROZEN;
         }
         if (maxCorr2 < TOL2) return iter + 1;
     }
@@ -690,16 +709,36 @@ int main(int argc, char **argv) {
     if (shim < 0) shim = 0;
     if (shim > 1.0) shim = 1.0;
 
-    CoeffFunc coeffFunc = lookupFunction(funcName);
-    if (!coeffFunc) {
-        fprintf(stderr, "Unknown function: %s\n", funcName);
-        return 1;
-    }
-
-    /* Probe degree */
+    /* Compile the expression program, or look up a built-in function */
+    CoeffFunc coeffFunc = NULL;
+    ExprProg *prog = NULL;
+    ExprState es = {0};
     double coeffRe[MAX_COEFFS], coeffIm[MAX_COEFFS];
     int nCoeffs;
-    coeffFunc(0.0, 0.0, coeffRe, coeffIm, &nCoeffs);
+    cp = findKey(buf, "expr");
+    if (cp && *cp == '"') {
+        static char src[BUF_SIZE];
+        char err[160];
+        parseString(cp, src, sizeof(src));
+        prog = exprCompile(src, err, sizeof(err));
+        if (!prog) {
+            fprintf(stderr, "Bad expr: %s\n", err);
+            return 1;
+        }
+        if (exprStateInit(&es, prog) != 0) {
+            fprintf(stderr, "Cannot allocate expression registers\n");
+            return 1;
+        }
+        nCoeffs = prog->nCoeffs;
+    } else {
+        coeffFunc = lookupFunction(funcName);
+        if (!coeffFunc) {
+            fprintf(stderr, "Unknown function: %s\n", funcName);
+            return 1;
+        }
+        /* Probe degree */
+        coeffFunc(0.0, 0.0, coeffRe, coeffIm, &nCoeffs);
+    }
     int degree = nCoeffs - 1;
 
     /* Sample grid and collect all root positions.
@@ -728,7 +767,10 @@ int main(int argc, char **argv) {
         double x1 = (double)i1 / (double)n1;
         for (int i2 = 0; i2 < n2; i2 += sampleSkip) {
             double x2 = (double)i2 / (double)n2;
-            coeffFunc(x1, x2, coeffRe, coeffIm, &nCoeffs);
+            if (prog)
+                exprEval(&es, x1, &x2, 1, coeffRe, coeffIm);
+            else
+                coeffFunc(x1, x2, coeffRe, coeffIm, &nCoeffs);
 
             /* Fresh initial guesses for each sample (no warm-start —
                sampleSkip makes consecutive points too far apart) */
@@ -817,6 +859,8 @@ int main(int argc, char **argv) {
 
     free(allRe);
     free(allIm);
+    exprStateFree(&es);
+    exprFree(prog);
 
     printf("{\"center_re\":%.15g,\"center_im\":%.15g,\"scale\":%.15g,\"degree\":%d,"
            "\"n_roots\":%d,\"q_re\":[%.6g,%.6g],\"q_im\":[%.6g,%.6g]}\n",
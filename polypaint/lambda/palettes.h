@@ -0,0 +1,87 @@
+/*
+ * palettes: the 16-step color ramps shared by imgpipe (proximity coloring)
+ * and sweep's steploop mode.  Each follows the d3 interpolator of the same
+ * name, which index.html samples at k/15 for PROX_PALETTE and DERIV_PALETTE.
+ */
+
+typedef struct { unsigned char r, g, b; } RGB;
+
+/* Inferno: black → purple → orange → yellow */
+static const RGB PAL_INFERNO[16] = {
+    {0,0,4}, {16,11,53}, {43,15,95}, {72,12,119},
+    {101,14,118}, {126,34,102}, {148,56,81}, {168,81,60},
+    {186,108,41}, {203,137,25}, {217,169,13}, {228,201,27},
+    {235,232,68}, {247,249,115}, {252,254,164}, {252,255,164}
+};
+
+/* Viridis: purple → teal → green → yellow */
+static const RGB PAL_VIRIDIS[16] = {
+    {68,1,84}, {72,20,103}, {71,40,120}, {63,57,131},
+    {55,72,137}, {46,87,140}, {38,102,141}, {31,116,140},
+    {26,131,137}, {27,146,130}, {40,161,119}, {65,175,102},
+    {102,187,79}, {149,198,50}, {201,206,22}, {253,231,37}
+};
+
+/* Magma: black → purple → pink → cream */
+static const RGB PAL_MAGMA[16] = {
+    {0,0,4}, {13,7,49}, {38,11,93}, {65,8,123},
+    {93,14,126}, {119,31,114}, {142,52,98}, {163,75,82},
+    {184,101,68}, {204,130,56}, {221,162,47}, {234,196,53},
+    {242,228,82}, {249,249,121}, {253,254,168}, {252,253,191}
+};
+
+/* Plasma: purple → magenta → orange → yellow */
+static const RGB PAL_PLASMA[16] = {
+    {13,8,135}, {47,5,146}, {79,2,150}, {107,2,145},
+    {132,9,133}, {153,21,117}, {171,38,98}, {187,58,79},
+    {201,81,59}, {213,107,39}, {223,135,22}, {231,165,11},
+    {237,196,8}, {240,225,15}, {243,249,40}, {240,249,33}
+};
+
+/* Turbo: dark blue → cyan → green → yellow → red → dark red */
+static const RGB PAL_TURBO[16] = {
+    {48,18,59}, {57,68,148}, {43,118,196}, {28,163,206},
+    {20,200,178}, {44,222,128}, {96,237,79}, {156,240,43},
+    {208,230,30}, {242,204,20}, {255,170,14}, {252,130,15},
+    {236,89,16}, {210,49,14}, {175,18,8}, {122,4,3}
+};
+
+/* Cividis: blue → yellow (colorblind-friendly) */
+static const RGB PAL_CIVIDIS[16] = {
+    {0,32,76}, {0,46,96}, {23,60,108}, {48,73,113},
+    {72,85,116}, {93,97,119}, {113,110,121}, {132,122,119},
+    {151,134,115}, {170,147,108}, {189,160,98}, {208,174,84},
+    {226,189,65}, {242,205,43}, {254,222,19}, {253,238,6}
+};
+
+/* Warm: magenta → red → orange → yellow */
+static const RGB PAL_WARM[16] = {
+    {110,64,170}, {138,60,162}, {163,62,143}, {182,72,121},
+    {196,87,97}, {208,107,75}, {216,130,56}, {222,155,42},
+    {225,180,36}, {225,205,41}, {220,226,56}, {208,243,81},
+    {190,252,108}, {168,254,139}, {145,253,168}, {122,250,196}
+};
+
+/* Cool: green → blue → purple */
+static const RGB PAL_COOL[16] = {
+    {110,64,170}, {100,82,192}, {88,101,207}, {75,119,215},
+    {62,137,217}, {52,154,213}, {44,170,203}, {40,185,188},
+    {42,199,168}, {53,211,145}, {71,222,119}, {96,230,91},
+    {126,236,65}, {160,240,44}, {194,241,32}, {228,238,29}
+};
+
+/* Named palette table */
+typedef struct { const char *name; const RGB *colors; } PalEntry;
+static const PalEntry PALETTES[] = {
+    {"inferno", PAL_INFERNO},
+    {"viridis", PAL_VIRIDIS},
+    {"magma",   PAL_MAGMA},
+    {"plasma",  PAL_PLASMA},
+    {"turbo",   PAL_TURBO},
+    {"cividis", PAL_CIVIDIS},
+    {"warm",    PAL_WARM},
+    {"cool",    PAL_COOL},
+    {NULL, NULL}
+};
+
+#define N_PALETTES 8
@@ -0,0 +1,262 @@
+/*
+ * raw_canvas: raw images and the canvas roots are plotted into.  Included
+ * by imgpipe.c (--roots2image) and sweep_cli.c ("mode": "render"), so the
+ * fused render and roots2image share one plotting path and stay
+ * byte-identical.
+ *
+ * A .raw image is a 12-byte header (uint32 width, height, bands, native
+ * endian) followed by the pixel bytes, row-major.
+ *
+ * A canvas is either one full-frame RGB buffer, written to the output path
+ * by canvasFinish, or, with a tile size, a tiled canvas whose memory does
+ * not grow with the canvas or the number of roots:
+ *   - hits go to a fixed-size bucket per output tile (CANVAS_HIT_BUDGET
+ *     hits shared out over the tiles, at least CANVAS_MIN_BUCKET each);
+ *   - a full bucket is splatted into its tile's RGB buffer, one of at most
+ *     `slots` resident tile buffers (CANVAS_RESIDENT_BYTES worth by
+ *     default);
+ *   - when every slot is taken, the least recently used tile is written
+ *     out as a part, <prefix>_<tx>_<ty>_p<part>.raw, and its slot reused.
+ * Each part written is reported on stdout as one JSON line,
+ *   {"tile":[tx,ty,part],"path":"...","bytes":N}
+ * and flushed, so the caller can upload and delete it while the run goes
+ * on; /tmp then only holds the parts not yet collected.  canvasFinish
+ * writes out the remaining buckets and slots.  Hits add with saturation,
+ * which is associative and commutes, so a tile's parts added with
+ * saturation (imgpipe --reduce --gamma=0), stitched, give exactly the
+ * full-frame pixels whatever the plot order.
+ *
+ * Needs <stdio.h>, <stdlib.h> and <string.h> from the including file.
+ */
+
+#define MAX_FRAME 16384      /* largest full-frame buffer (per side) */
+#define MAX_CANVAS 1048576   /* largest tiled canvas (per side) */
+#define CANVAS_HIT_BUDGET (1L << 22)          /* bucketed hits, all tiles */
+#define CANVAS_MIN_BUCKET 256                 /* hits per bucket, at least */
+#define CANVAS_RESIDENT_BYTES (1L << 30)      /* resident tile buffers */
+
+/* Rainbow palette: hue index / total around the HSL wheel */
+static inline void rainbowRGB(int index, int total,
+                              unsigned char *r, unsigned char *g, unsigned char *b) {
+    double hue = (double)index / (total > 0 ? total : 1);
+    double h6 = hue * 6.0;
+    int hi = (int)h6;
+    double f = h6 - hi;
+    double q = 1.0 - f;
+    switch (hi % 6) {
+        case 0: *r = 255; *g = (unsigned char)(f * 255); *b = 0; break;
+        case 1: *r = (unsigned char)(q * 255); *g = 255; *b = 0; break;
+        case 2: *r = 0; *g = 255; *b = (unsigned char)(f * 255); break;
+        case 3: *r = 0; *g = (unsigned char)(q * 255); *b = 255; break;
+        case 4: *r = (unsigned char)(f * 255); *g = 0; *b = 255; break;
+        case 5: *r = 255; *g = 0; *b = (unsigned char)(q * 255); break;
+    }
+}
+
+static inline int rawWrite(const char *path, const unsigned char *data,
+                           unsigned int w, unsigned int h, unsigned int bands) {
+    FILE *f = fopen(path, "wb");
+    if (!f) { fprintf(stderr, "Cannot create %s\n", path); return -1; }
+    fwrite(&w, 4, 1, f);
+    fwrite(&h, 4, 1, f);
+    fwrite(&bands, 4, 1, f);
+    size_t n = (size_t)w * h * bands;
+    int bad = fwrite(data, 1, n, f) != n;
+    if (fclose(f) != 0 || bad) { fprintf(stderr, "Write to %s failed\n", path); return -1; }
+    return 0;
+}
+
+typedef struct { unsigned short x, y; unsigned char r, g, b, pad; } TileHit;
+
+typedef struct {
+    int W, H;
+    int tile;               /* 0 = full frame in `pixels` */
+    int tilesX, tilesY;
+    unsigned char *pixels;
+    const char *outPath;
+    /* Tiled: per tile, row-major */
+    TileHit **buckets;      /* allocated on first hit, bucketCap hits each */
+    int *bucketN;
+    long *hits;             /* hits plotted in total */
+    int *parts;             /* parts written so far */
+    int *slotOf;            /* resident slot, or -1 */
+    int bucketCap;
+    /* Tiled: resident tile buffers */
+    int nSlots;
+    unsigned char **slotPixels;
+    int *slotTile;          /* tile held, or -1 */
+    long *slotUsed;         /* last use, for LRU eviction */
+    long tick;
+    char *path;             /* part path buffer */
+    size_t pathCap;
+    long written;           /* bytes written */
+    int failed;             /* out of memory or a write failed */
+} Canvas;
+
+/* Zeroed W x H canvas writing to outPath, tiled when tile > 0 with at most
+ * `slots` resident tile buffers (0 = CANVAS_RESIDENT_BYTES worth); tiled
+ * parts go to outPath minus a trailing .raw, plus _<tx>_<ty>_p<part>.raw.
+ * Returns -1 if out of memory. */
+static inline int canvasInit(Canvas *cv, int W, int H, int tile, int slots,
+                             const char *outPath) {
+    memset(cv, 0, sizeof(*cv));
+    cv->W = W;
+    cv->H = H;
+    cv->tile = tile;
+    cv->outPath = outPath;
+    if (!tile) {
+        cv->pixels = calloc((size_t)W * H * 3, 1);
+        return cv->pixels ? 0 : -1;
+    }
+    cv->tilesX = (W + tile - 1) / tile;
+    cv->tilesY = (H + tile - 1) / tile;
+    size_t nTiles = (size_t)cv->tilesX * cv->tilesY;
+    long cap = CANVAS_HIT_BUDGET / (long)nTiles;
+    cv->bucketCap = cap < CANVAS_MIN_BUCKET ? CANVAS_MIN_BUCKET : (int)cap;
+    if (slots <= 0) {
+        long fit = CANVAS_RESIDENT_BYTES / ((long)tile * tile * 3);
+        slots = fit < 1 ? 1 : fit > (long)nTiles ? (int)nTiles : (int)fit;
+    }
+    cv->nSlots = slots;
+    cv->buckets = calloc(nTiles, sizeof(TileHit *));
+    cv->bucketN = calloc(nTiles, sizeof(int));
+    cv->hits = calloc(nTiles, sizeof(long));
+    cv->parts = calloc(nTiles, sizeof(int));
+    cv->slotOf = malloc(nTiles * sizeof(int));
+    cv->slotPixels = calloc(slots, sizeof(unsigned char *));
+    cv->slotTile = malloc(slots * sizeof(int));
+    cv->slotUsed = calloc(slots, sizeof(long));
+    cv->pathCap = strlen(outPath) + 48;   /* "_<int>_<int>_p<int>.raw" */
+    cv->path = malloc(cv->pathCap);
+    if (!cv->buckets || !cv->bucketN || !cv->hits || !cv->parts || !cv->slotOf ||
+        !cv->slotPixels || !cv->slotTile || !cv->slotUsed || !cv->path)
+        return -1;
+    for (size_t i = 0; i < nTiles; i++) cv->slotOf[i] = -1;
+    for (int s = 0; s < slots; s++) cv->slotTile[s] = -1;
+    return 0;
+}
+
+static inline int canvasTileW(const Canvas *cv, int t) {
+    int x0 = (t % cv->tilesX) * cv->tile;
+    return cv->W - x0 < cv->tile ? cv->W - x0 : cv->tile;
+}
+
+static inline int canvasTileH(const Canvas *cv, int t) {
+    int y0 = (t / cv->tilesX) * cv->tile;
+    return cv->H - y0 < cv->tile ? cv->H - y0 : cv->tile;
+}
+
+/* Write slot s's tile as its next part, report it and free the slot */
+static inline void canvasWritePart(Canvas *cv, int s) {
+    int t = cv->slotTile[s];
+    int tx = t % cv->tilesX, ty = t / cv->tilesX;
+    int tw = canvasTileW(cv, t), th = canvasTileH(cv, t);
+    int part = cv->parts[t]++;
+    size_t plen = strlen(cv->outPath);
+    if (plen >= 4 && strcmp(cv->outPath + plen - 4, ".raw") == 0) plen -= 4;
+    int n = snprintf(cv->path, cv->pathCap, "%.*s_%d_%d_p%d.raw",
+                     (int)plen, cv->outPath, tx, ty, part);
+    if (n < 0 || (size_t)n >= cv->pathCap ||
+        rawWrite(cv->path, cv->slotPixels[s], tw, th, 3) != 0) {
+        cv->failed = 1;
+    } else {
+        long bytes = 12 + (long)tw * th * 3;
+        cv->written += bytes;
+        printf("{\"tile\":[%d,%d,%d],\"path\":\"%s\",\"bytes\":%ld}\n",
+               tx, ty, part, cv->path, bytes);
+        fflush(stdout);
+    }
+    cv->slotOf[t] = -1;
+    cv->slotTile[s] = -1;
+}
+
+/* Splat tile t's bucket into its resident buffer, taking a free slot or
+ * writing out the least recently used tile first */
+static inline void canvasSpill(Canvas *cv, int t) {
+    int s = cv->slotOf[t];
+    if (s < 0) {
+        s = 0;
+        for (int i = 0; i < cv->nSlots; i++) {
+            if (cv->slotTile[i] < 0) { s = i; break; }
+            if (cv->slotUsed[i] < cv->slotUsed[s]) s = i;
+        }
+        if (cv->slotTile[s] >= 0) canvasWritePart(cv, s);
+        if (!cv->slotPixels[s]) {
+            cv->slotPixels[s] = malloc((size_t)cv->tile * cv->tile * 3);
+            if (!cv->slotPixels[s]) { cv->failed = 1; cv->bucketN[t] = 0; return; }
+        }
+        memset(cv->slotPixels[s], 0, (size_t)canvasTileW(cv, t) * canvasTileH(cv, t) * 3);
+        cv->slotTile[s] = t;
+        cv->slotOf[t] = s;
+    }
+    cv->slotUsed[s] = ++cv->tick;
+    unsigned char *buf = cv->slotPixels[s];
+    int tw = canvasTileW(cv, t);
+    const TileHit *hit = cv->buckets[t];
+    for (int i = 0; i < cv->bucketN[t]; i++, hit++) {
+        long idx = ((long)hit->y * tw + hit->x) * 3;
+        int v;
+        v = buf[idx]   + hit->r; buf[idx]   = v > 255 ? 255 : v;
+        v = buf[idx+1] + hit->g; buf[idx+1] = v > 255 ? 255 : v;
+        v = buf[idx+2] + hit->b; buf[idx+2] = v > 255 ? 255 : v;
+    }
+    cv->bucketN[t] = 0;
+}
+
+static inline void canvasPlot(Canvas *cv, int px, int py,
+                              unsigned char r, unsigned char g, unsigned char b) {
+    if (!cv->tile) {
+        long idx = ((long)py * cv->W + px) * 3;
+        int v;
+        v = cv->pixels[idx]   + r; cv->pixels[idx]   = v > 255 ? 255 : v;
+        v = cv->pixels[idx+1] + g; cv->pixels[idx+1] = v > 255 ? 255 : v;
+        v = cv->pixels[idx+2] + b; cv->pixels[idx+2] = v > 255 ? 255 : v;
+        return;
+    }
+    int t = (py / cv->tile) * cv->tilesX + px / cv->tile;
+    if (!cv->buckets[t]) {
+        cv->buckets[t] = malloc((size_t)cv->bucketCap * sizeof(TileHit));
+        if (!cv->buckets[t]) { cv->failed = 1; return; }
+    }
+    TileHit *h = &cv->buckets[t][cv->bucketN[t]++];
+    h->x = (unsigned short)(px % cv->tile);
+    h->y = (unsigned short)(py % cv->tile);
+    h->r = r; h->g = g; h->b = b;
+    cv->hits[t]++;
+    if (cv->bucketN[t] == cv->bucketCap) canvasSpill(cv, t);
+}
+
+/* Write what is left: the full frame to outPath, or every pending bucket
+ * and resident tile as parts.  Returns the bytes written in total, or -1. */
+static inline long canvasFinish(Canvas *cv) {
+    if (!cv->tile) {
+        if (rawWrite(cv->outPath, cv->pixels, cv->W, cv->H, 3) != 0) return -1;
+        return 12 + (long)cv->W * cv->H * 3;
+    }
+    for (int t = 0; t < cv->tilesX * cv->tilesY && !cv->failed; t++) {
+        if (cv->bucketN[t]) canvasSpill(cv, t);
+        free(cv->buckets[t]);
+        cv->buckets[t] = NULL;
+    }
+    for (int s = 0; s < cv->nSlots && !cv->failed; s++)
+        if (cv->slotTile[s] >= 0) canvasWritePart(cv, s);
+    return cv->failed ? -1 : cv->written;
+}
+
+static inline void canvasFree(Canvas *cv) {
+    free(cv->pixels);
+    if (cv->buckets)
+        for (int i = 0; i < cv->tilesX * cv->tilesY; i++) free(cv->buckets[i]);
+    if (cv->slotPixels)
+        for (int s = 0; s < cv->nSlots; s++) free(cv->slotPixels[s]);
+    free(cv->buckets);
+    free(cv->bucketN);
+    free(cv->hits);
+    free(cv->parts);
+    free(cv->slotOf);
+    free(cv->slotPixels);
+    free(cv->slotTile);
+    free(cv->slotUsed);
+    free(cv->path);
+    memset(cv, 0, sizeof(*cv));
+}
@@ -0,0 +1,206 @@
+/*
+ * root_codec: compact encodings of sweep's grid-mode root files.
+ * Included by sweep_cli.c (encode) and imgpipe.c (decode).
+ *
+ * A plain .bin is interleaved float32: re, im for each of `degree` roots,
+ * per step.  An encoded file is
+ *   header   32 bytes: "PPRQ", uint16 version, uint16 encoding,
+ *            uint32 degree, uint32 n_blocks, uint32 block_steps (n2),
+ *            uint32 reserved, uint64 index_offset
+ *   blocks   one per grid row, in whatever order the threads finished
+ *   index    n_blocks uint64 file offsets, block k holding row k
+ * All fields are little-endian (native on x86-64 and Graviton).
+ *
+ * A block is independently decodable:
+ *   uint32 payload_bytes, uint32 n_steps,
+ *   float64 origin_re, origin_im, step_re, step_im,
+ *   payload
+ * and stores each coordinate x as the bin q = floor((x - origin) / step),
+ * which decodes to the bin center origin + (q + 0.5) * step.  The origin is
+ * the block's bounding-box minimum, snapped down onto the lattice
+ * anchor + k * step, per axis.
+ *   ROOTS_Q16    q as uint16; step = max(extent / 65533, quantum), so the
+ *                box spans 0..65534 and 65535 marks a non-finite root.
+ *   ROOTS_DELTA  step = quantum (or extent / 65533 without one); q minus the
+ *                same root's q at the previous step along the serpentine
+ *                row, zigzag LEB128 varints.  Warm-started roots move little
+ *                from step to step, so most deltas take one or two bytes.
+ *                ROOTS_NAN_Q marks a non-finite root.
+ * The quantum is the caller's precision floor, a fraction of a pixel at
+ * the render scale.  Decoded roots are within step / 2 of the float32.
+ * With quantum = 1 / (k * scale) and the anchor on a pixel corner of the
+ * view, every bin lies inside one pixel: the decoded roots land in the
+ * same pixels as the float32 ones, for that view.
+ *
+ * Needs <stdint.h>, <string.h> and <math.h> from the including file.
+ */
+
+#define ROOTS_MAGIC "PPRQ"
+#define ROOTS_VERSION 1
+#define ROOTS_F32 0
+#define ROOTS_Q16 1
+#define ROOTS_DELTA 2
+#define ROOTS_HEADER_BYTES 32
+#define ROOTS_BLOCK_BYTES 40
+#define ROOTS_NAN_Q (-((int64_t)1 << 48))
+
+typedef struct {
+    int encoding;
+    int degree;
+    uint32_t nBlocks, blockSteps;
+    uint64_t indexOffset;
+} RootsHeader;
+
+/* Encoding from a spec/argument name; -1 if unknown */
+static inline int rootsEncoding(const char *name) {
+    if (!name[0] || strcmp(name, "f32") == 0) return ROOTS_F32;
+    if (strcmp(name, "q16") == 0) return ROOTS_Q16;
+    if (strcmp(name, "delta") == 0) return ROOTS_DELTA;
+    return -1;
+}
+
+static inline void rootsWriteHeader(unsigned char *out, const RootsHeader *h) {
+    uint16_t version = ROOTS_VERSION, enc = (uint16_t)h->encoding;
+    uint32_t degree = (uint32_t)h->degree, reserved = 0;
+    memcpy(out, ROOTS_MAGIC, 4);
+    memcpy(out + 4, &version, 2);
+    memcpy(out + 6, &enc, 2);
+    memcpy(out + 8, &degree, 4);
+    memcpy(out + 12, &h->nBlocks, 4);
+    memcpy(out + 16, &h->blockSteps, 4);
+    memcpy(out + 20, &reserved, 4);
+    memcpy(out + 24, &h->indexOffset, 8);
+}
+
+/* 1 = encoded file (header filled in), 0 = plain float32, -1 = bad header */
+static inline int rootsReadHeader(const unsigned char *in, size_t len, RootsHeader *h) {
+    if (len < ROOTS_HEADER_BYTES || memcmp(in, ROOTS_MAGIC, 4) != 0) return 0;
+    uint16_t version, enc;
+    uint32_t degree;
+    memcpy(&version, in + 4, 2);
+    memcpy(&enc, in + 6, 2);
+    memcpy(&degree, in + 8, 4);
+    memcpy(&h->nBlocks, in + 12, 4);
+    memcpy(&h->blockSteps, in + 16, 4);
+    memcpy(&h->indexOffset, in + 24, 8);
+    h->encoding = enc;
+    h->degree = (int)degree;
+    if (version != ROOTS_VERSION || (enc != ROOTS_Q16 && enc != ROOTS_DELTA) ||
+        degree < 1 || h->indexOffset > len ||
+        (len - h->indexOffset) / 8 < h->nBlocks)
+        return -1;
+    return 1;
+}
+
+/* Largest encoded size of a block of nSteps steps */
+static inline size_t rootsBlockBound(int nSteps, int degree, int encoding) {
+    size_t coords = (size_t)nSteps * degree * 2;
+    return ROOTS_BLOCK_BYTES + coords * (encoding == ROOTS_Q16 ? 2 : 10);
+}
+
+static inline double rootsStep(double lo, double hi, double quantum, int encoding) {
+    double step = (hi - lo) / 65533.0;
+    if (encoding == ROOTS_Q16 ? step < quantum : quantum > 0) step = quantum;
+    /* Keep delta-coded integers well inside int64 */
+    if (step < (hi - lo) / 1e12) step = (hi - lo) / 1e12;
+    return step > 0 ? step : 1.0;
+}
+
+/* Encode nSteps steps of float32 roots (the .bin layout) into `out`, which
+ * holds rootsBlockBound bytes.  anchor[2] is a lattice point (re, im).
+ * Returns the block size. */
+static inline size_t rootsEncodeBlock(const float *roots, int nSteps, int degree,
+                               int encoding, double quantum, const double *anchor,
+                               unsigned char *out) {
+    size_t coords = (size_t)nSteps * degree * 2;
+    double lo[2] = {INFINITY, INFINITY}, hi[2] = {-INFINITY, -INFINITY};
+    for (size_t i = 0; i < coords; i++) {
+        double x = roots[i];
+        if (!isfinite(x)) continue;
+        if (x < lo[i & 1]) lo[i & 1] = x;
+        if (x > hi[i & 1]) hi[i & 1] = x;
+    }
+    double step[2];
+    for (int a = 0; a < 2; a++) {
+        if (lo[a] > hi[a]) lo[a] = hi[a] = anchor[a];
+        step[a] = rootsStep(lo[a], hi[a], quantum, encoding);
+        lo[a] = anchor[a] + floor((lo[a] - anchor[a]) / step[a]) * step[a];
+    }
+
+    unsigned char *p = out + ROOTS_BLOCK_BYTES;
+    if (encoding == ROOTS_Q16) {
+        for (size_t i = 0; i < coords; i++) {
+            double x = roots[i];
+            uint16_t q = 65535;
+            if (isfinite(x)) {
+                double v = floor((x - lo[i & 1]) / step[i & 1]);
+                q = (uint16_t)(v < 0 ? 0 : v > 65534 ? 65534 : v);
+            }
+            memcpy(p, &q, 2);
+            p += 2;
+        }
+    } else {
+        int64_t prev[2 * 256] = {0};   /* imgpipe's MAXDEG roots */
+        int stride = degree * 2;
+        for (size_t i = 0; i < coords; i++) {
+            double x = roots[i];
+            int64_t q = isfinite(x)
+                ? (int64_t)floor((x - lo[i & 1]) / step[i & 1]) : ROOTS_NAN_Q;
+            int64_t d = q - prev[i % stride];
+            prev[i % stride] = q;
+            uint64_t z = ((uint64_t)d << 1) ^ (uint64_t)(d >> 63);
+            while (z >= 0x80) { *p++ = (unsigned char)(z | 0x80); z >>= 7; }
+            *p++ = (unsigned char)z;
+        }
+    }
+
+    uint32_t payload = (uint32_t)(p - out - ROOTS_BLOCK_BYTES), n = (uint32_t)nSteps;
+    double fields[4] = {lo[0], lo[1], step[0], step[1]};
+    memcpy(out, &payload, 4);
+    memcpy(out + 4, &n, 4);
+    memcpy(out + 8, fields, sizeof(fields));
+    return (size_t)(p - out);
+}
+
+/* Decode the block at `in` (avail bytes) back to float32 roots; `out` holds
+ * maxSteps steps.  Returns the number of steps, or -1 if the block is
+ * malformed. */
+static inline long rootsDecodeBlock(const unsigned char *in, size_t avail, int degree,
+                             int encoding, float *out, long maxSteps) {
+    if (avail < ROOTS_BLOCK_BYTES || degree > 256) return -1;
+    uint32_t payload, n;
+    double f[4];
+    memcpy(&payload, in, 4);
+    memcpy(&n, in + 4, 4);
+    memcpy(f, in + 8, sizeof(f));
+    if (n > maxSteps || payload > avail - ROOTS_BLOCK_BYTES) return -1;
+    const unsigned char *p = in + ROOTS_BLOCK_BYTES, *end = p + payload;
+    size_t coords = (size_t)n * degree * 2;
+
+    if (encoding == ROOTS_Q16) {
+        if (payload < coords * 2) return -1;
+        for (size_t i = 0; i < coords; i++) {
+            uint16_t q;
+            memcpy(&q, p + i * 2, 2);
+            out[i] = q == 65535 ? NAN : (float)(f[i & 1] + (q + 0.5) * f[2 + (i & 1)]);
+        }
+        return n;
+    }
+    int64_t prev[2 * 256] = {0};
+    int stride = degree * 2;
+    for (size_t i = 0; i < coords; i++) {
+        uint64_t z = 0;
+        int shift = 0;
+        for (;;) {
+            if (p >= end || shift > 63) return -1;
+            unsigned char b = *p++;
+            z |= (uint64_t)(b & 0x7f) << shift;
+            if (!(b & 0x80)) break;
+            shift += 7;
+        }
+        int64_t q = prev[i % stride] + (int64_t)((z >> 1) ^ (~(z & 1) + 1));
+        prev[i % stride] = q;
+        out[i] = q == ROOTS_NAN_Q ? NAN : (float)(f[i & 1] + (q + 0.5) * f[2 + (i & 1)]);
+    }
+    return n;
+}
@@ -0,0 +1,224 @@
+/*
+ * root_hist: root-density histograms.  Included by sweep_cli.c (counting,
+ * "histogram": true) and imgpipe.c (--hist-merge).
+ *
+ * A .hist file is
+ *   header   72 bytes: "PPHG", uint16 version, uint16 flags (HIST_AUTO),
+ *            uint32 width, uint32 height, int32 doublings, uint32 reserved,
+ *            float64 center_re, center_im, half_re, half_im,
+ *            uint64 counted, uint64 clipped
+ *   counts   width x height uint32, row-major, row 0 at the top (largest
+ *            imaginary part), as roots2image lays out pixels
+ * All fields are little-endian (native on x86-64 and Graviton).
+ *
+ * The bins cover center +- half * 2^doublings on each axis.  A fixed
+ * histogram (bounds given) never doubles, and counts roots outside it as
+ * clipped.  With HIST_AUTO the extent doubles about the center whenever a
+ * root lands outside: each 2x2 block of bins sums into one bin of the
+ * middle quarter, so width and height are multiples of 4.  Non-finite
+ * roots, and roots past HIST_MAX_DOUBLINGS, are clipped.  Counts saturate
+ * at UINT32_MAX.
+ *
+ * Histograms with the same size, center, initial extent and flags merge
+ * by addition: the one with fewer doublings is folded up to the other's
+ * extent first, so stripes that expanded differently still add exactly.
+ *
+ * Needs <stdio.h>, <stdlib.h>, <string.h>, <stdint.h> and <math.h> from
+ * the including file.
+ */
+
+#define HIST_MAGIC "PPHG"
+#define HIST_VERSION 1
+#define HIST_HEADER_BYTES 72
+#define HIST_AUTO 1
+#define HIST_MAX_DOUBLINGS 40
+#define HIST_MAX_SIDE 16384
+
+typedef struct {
+    int width, height, flags, doublings;
+    double centerRe, centerIm, halfRe, halfIm;   /* extent at 0 doublings */
+    uint64_t counted, clipped;
+    uint32_t *counts;
+} RootHist;
+
+/* Zeroed histogram; auto-expanding sizes round up to a multiple of 4, and
+ * halfIm <= 0 makes the bins square.  Returns 0, or -1 on a bad size or
+ * allocation failure. */
+static inline int histInit(RootHist *h, int width, int height, double centerRe, double centerIm,
+                    double halfRe, double halfIm, int flags) {
+    if (flags & HIST_AUTO) {
+        width = (width + 3) & ~3;
+        height = (height + 3) & ~3;
+    }
+    if (halfIm <= 0 && width > 0) halfIm = halfRe * height / width;
+    memset(h, 0, sizeof(*h));
+    if (width < 1 || height < 1 || width > HIST_MAX_SIDE || height > HIST_MAX_SIDE ||
+        !(halfRe > 0) || !(halfIm > 0))
+        return -1;
+    h->width = width;
+    h->height = height;
+    h->flags = flags;
+    h->centerRe = centerRe;
+    h->centerIm = centerIm;
+    h->halfRe = halfRe;
+    h->halfIm = halfIm;
+    h->counts = calloc((size_t)width * height, sizeof(uint32_t));
+    return h->counts ? 0 : -1;
+}
+
+static inline void histFree(RootHist *h) {
+    free(h->counts);
+    h->counts = NULL;
+}
+
+static inline uint32_t histSatAdd(uint32_t a, uint32_t b) {
+    uint64_t s = (uint64_t)a + b;
+    return s > UINT32_MAX ? UINT32_MAX : (uint32_t)s;
+}
+
+/* Add src's counts into dst, src being k doublings finer: bin x lands in
+ * W/4 + x/2 per doubling.  -1 if out of memory. */
+static inline int histFold(uint32_t *dst, const uint32_t *src, int W, int H, int k) {
+    int *mapX = malloc(sizeof(int) * (W + H));
+    if (!mapX) return -1;
+    int *mapY = mapX + W;
+    for (int x = 0; x < W; x++) {
+        int t = x;
+        for (int d = 0; d < k; d++) t = W / 4 + t / 2;
+        mapX[x] = t;
+    }
+    for (int y = 0; y < H; y++) {
+        int t = y;
+        for (int d = 0; d < k; d++) t = H / 4 + t / 2;
+        mapY[y] = t;
+    }
+    for (int y = 0; y < H; y++) {
+        uint32_t *row = dst + (size_t)mapY[y] * W;
+        const uint32_t *in = src + (size_t)y * W;
+        for (int x = 0; x < W; x++)
+            if (in[x]) row[mapX[x]] = histSatAdd(row[mapX[x]], in[x]);
+    }
+    free(mapX);
+    return 0;
+}
+
+/* Double the extent about the center; -1 if out of memory */
+static inline int histDouble(RootHist *h) {
+    uint32_t *grown = calloc((size_t)h->width * h->height, sizeof(uint32_t));
+    if (!grown || histFold(grown, h->counts, h->width, h->height, 1) != 0) {
+        free(grown);
+        return -1;
+    }
+    free(h->counts);
+    h->counts = grown;
+    h->doublings++;
+    return 0;
+}
+
+/* Count one root */
+static inline void histAdd(RootHist *h, double re, double im) {
+    for (;;) {
+        double s = ldexp(1.0, h->doublings);
+        double hr = h->halfRe * s, hi = h->halfIm * s;
+        double fx = (re - (h->centerRe - hr)) / (2.0 * hr) * h->width;
+        double fy = ((h->centerIm + hi) - im) / (2.0 * hi) * h->height;
+        if (fx >= 0 && fx < h->width && fy >= 0 && fy < h->height) {
+            uint32_t *c = &h->counts[(size_t)(int)fy * h->width + (int)fx];
+            if (*c != UINT32_MAX) (*c)++;
+            h->counted++;
+            return;
+        }
+        if (!(h->flags & HIST_AUTO) || !isfinite(re) || !isfinite(im) ||
+            h->doublings >= HIST_MAX_DOUBLINGS || histDouble(h) != 0) {
+            h->clipped++;
+            return;
+        }
+    }
+}
+
+/* Add src into dst; -1 if they do not share a size, center, initial extent
+ * and flags (or out of memory) */
+static inline int histMerge(RootHist *dst, const RootHist *src) {
+    if (dst->width != src->width || dst->height != src->height ||
+        dst->flags != src->flags || dst->centerRe != src->centerRe ||
+        dst->centerIm != src->centerIm || dst->halfRe != src->halfRe ||
+        dst->halfIm != src->halfIm)
+        return -1;
+    while (dst->doublings < src->doublings)
+        if (histDouble(dst) != 0) return -1;
+    if (histFold(dst->counts, src->counts, dst->width, dst->height,
+                 dst->doublings - src->doublings) != 0)
+        return -1;
+    dst->counted += src->counted;
+    dst->clipped += src->clipped;
+    return 0;
+}
+
+/* Current bounds: re_min, re_max, im_min, im_max */
+static inline void histBounds(const RootHist *h, double *b) {
+    double s = ldexp(1.0, h->doublings);
+    b[0] = h->centerRe - h->halfRe * s;
+    b[1] = h->centerRe + h->halfRe * s;
+    b[2] = h->centerIm - h->halfIm * s;
+    b[3] = h->centerIm + h->halfIm * s;
+}
+
+static inline int histWrite(const RootHist *h, const char *path) {
+    unsigned char hdr[HIST_HEADER_BYTES];
+    uint16_t version = HIST_VERSION, flags = (uint16_t)h->flags;
+    uint32_t w = (uint32_t)h->width, ht = (uint32_t)h->height, reserved = 0;
+    int32_t d = h->doublings;
+    double f[4] = {h->centerRe, h->centerIm, h->halfRe, h->halfIm};
+    memcpy(hdr, HIST_MAGIC, 4);
+    memcpy(hdr + 4, &version, 2);
+    memcpy(hdr + 6, &flags, 2);
+    memcpy(hdr + 8, &w, 4);
+    memcpy(hdr + 12, &ht, 4);
+    memcpy(hdr + 16, &d, 4);
+    memcpy(hdr + 20, &reserved, 4);
+    memcpy(hdr + 24, f, sizeof(f));
+    memcpy(hdr + 56, &h->counted, 8);
+    memcpy(hdr + 64, &h->clipped, 8);
+
+    FILE *fp = fopen(path, "wb");
+    if (!fp) return -1;
+    size_t n = (size_t)h->width * h->height;
+    int ok = fwrite(hdr, 1, sizeof(hdr), fp) == sizeof(hdr) &&
+             fwrite(h->counts, sizeof(uint32_t), n, fp) == n;
+    return fclose(fp) == 0 && ok ? 0 : -1;
+}
+
+/* Read a .hist file into h (counts malloc'd); -1 if missing or malformed */
+static inline int histRead(RootHist *h, const char *path) {
+    FILE *fp = fopen(path, "rb");
+    if (!fp) return -1;
+    unsigned char hdr[HIST_HEADER_BYTES];
+    uint16_t version, flags;
+    uint32_t w, ht;
+    int32_t d;
+    double f[4];
+    memset(h, 0, sizeof(*h));
+    if (fread(hdr, 1, sizeof(hdr), fp) != sizeof(hdr) || memcmp(hdr, HIST_MAGIC, 4) != 0)
+        goto bad;
+    memcpy(&version, hdr + 4, 2);
+    memcpy(&flags, hdr + 6, 2);
+    memcpy(&w, hdr + 8, 4);
+    memcpy(&ht, hdr + 12, 4);
+    memcpy(&d, hdr + 16, 4);
+    memcpy(f, hdr + 24, sizeof(f));
+    if (version != HIST_VERSION || histInit(h, (int)w, (int)ht, f[0], f[1], f[2], f[3], flags) != 0 ||
+        h->width != (int)w || h->height != (int)ht || d < 0 || d > HIST_MAX_DOUBLINGS)
+        goto bad;
+    h->doublings = d;
+    memcpy(&h->counted, hdr + 56, 8);
+    memcpy(&h->clipped, hdr + 64, 8);
+    size_t n = (size_t)w * ht;
+    if (fread(h->counts, sizeof(uint32_t), n, fp) != n) goto bad;
+    fclose(fp);
+    return 0;
+
+bad:
+    histFree(h);
+    fclose(fp);
+    return -1;
+}
@@ -23,6 +23,15 @@
 
 /* ---- Ehrlich-Aberth solver (from solver.c) ---- */
 
+/* Per-root state, as solver.c's conv[] flags: a root whose correction drops
+ * below TOL2 is frozen (no more updates).  A root whose Aberth term |w*S|
+ * is below POLISH_WS2 is well separated, so it switches to Newton-only
+ * polishing and skips the O(n) Aberth sum. */
+#define ROOT_ACTIVE 0
+#define ROOT_POLISH 1
+#define ROOT_FROZEN 2
+#define POLISH_WS2 1e-6
+
 static int solveEA(double *cRe, double *cIm, int nCoeffs,
                    double *rootRe, double *rootIm)
 {
@@ -64,12 +73,16 @@ static int solveEA(double *cRe, double *cIm, int nCoeffs,
     }
 
     /* Main Ehrlich-Aberth iteration */
+    unsigned char state[MAX_DEGREE];
+    memset(state, ROOT_ACTIVE, degree);
     int totalIter = 0;
     for (int iter = 0; iter < MAX_ITER; iter++) {
         totalIter = iter + 1;
         double maxCorr2 = 0;
 
         for (int i = 0; i < degree; i++) {
+            if (state[i] == ROOT_FROZEN)
+                continue;
             double zR = rootRe[i], zI = rootIm[i];
 
             /* Horner: evaluate p(z) and p'(z) simultaneously */
@@ -90,34 +103,42 @@ static int solveEA(double *cRe, double *cIm, int nCoeffs,
             double wR = (pR * dpR + pI * dpI) / dpM;
             double wI = (pI * dpR - pR * dpI) / dpM;
 
-            /* Aberth sum: S = sum_{j!=i} 1/(z_i - z_j) */
-            double sR = 0, sI = 0;
-            for (int j = 0; j < degree; j++) {
-                if (j == i) continue;
-                double dR = zR - rootRe[j];
-                double dI = zI - rootIm[j];
-                double dM = dR * dR + dI * dI;
-                if (dM < 1e-60) continue;
-                sR += dR / dM;
-                sI += -dI / dM;
+            /* Polishing roots take the plain Newton step */
+            double crrR = wR, crrI = wI;
+            if (state[i] == ROOT_ACTIVE) {
+                /* Aberth sum: S = sum_{j!=i} 1/(z_i - z_j) */
+                double sR = 0, sI = 0;
+                for (int j = 0; j < degree; j++) {
+                    if (j == i) continue;
+                    double dR = zR - rootRe[j];
+                    double dI = zI - rootIm[j];
+                    double dM = dR * dR + dI * dI;
+                    if (dM < 1e-60) continue;
+                    sR += dR / dM;
+                    sI += -dI / dM;
+                }
+
+                /* Correction: z -= w / (1 - w * S) */
+                double wsR = wR * sR - wI * sI;
+                double wsI = wR * sI + wI * sR;
+                double dnR = 1 - wsR;
+                double dnI = -wsI;
+                double dnM = dnR * dnR + dnI * dnI;
+                if (dnM < 1e-60) continue;
+
+                crrR = (wR * dnR + wI * dnI) / dnM;
+                crrI = (wI * dnR - wR * dnI) / dnM;
+                if (wsR * wsR + wsI * wsI < POLISH_WS2)
+                    state[i] = ROOT_POLISH;
             }
 
-            /* Correction: z -= w / (1 - w * S) */
-            double wsR = wR * sR - wI * sI;
-            double wsI = wR * sI + wI * sR;
-            double dnR = 1 - wsR;
-            double dnI = -wsI;
-            double dnM = dnR * dnR + dnI * dnI;
-            if (dnM < 1e-60) continue;
-
-            double crrR = (wR * dnR + wI * dnI) / dnM;
-            double crrI = (wI * dnR - wR * dnI) / dnM;
-
             rootRe[i] -= crrR;
             rootIm[i] -= crrI;
 
             double h2 = crrR * crrR + crrI * crrI;
             if (h2 > maxCorr2) maxCorr2 = h2;
+            if (h2 < TOL2)
+                state[i] = ROOT_FROZEN;
         }
 
         if (maxCorr2 < TOL2) break;
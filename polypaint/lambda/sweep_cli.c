@@ -6,8 +6,54 @@
  * Writes packed f32 binary (root positions) to a file path given as argv[1].
  * Writes metadata JSON to stdout.
  *
- * Build: aarch64-linux-musl-gcc -O3 -static -o sweep sweep_cli.c -lm
- * Local: cc -O3 -o sweep sweep_cli.c -lm
+ * Without "mode" (animation sweep), each "animations" entry moves one
+ * coefficient along a "path" from the browser's catalogue (coeff_paths.h)
+ * or a precomputed "curve" table, at its "speed", with optional seeded
+ * "dither"; an entry with neither is a circle about the base position.
+ *
+ * Grid mode accepts "threads": N to split the stripe into N sub-stripes,
+ * each solved on its own thread with its own serpentine warm-start chain.
+ * Instead of a built-in "function", grid mode takes an "expr" program
+ * (see coeff_expr.h), compiled at startup and evaluated a batch of x2
+ * values at a time.  "simd": true solves EA_LANES rows in lockstep with
+ * the batched solver (solveEABatch).
+ *
+ * "encoding": "q16" or "delta" writes the roots in a compact quantized
+ * format (root_codec.h) instead of float32, with "quantum" as the
+ * precision floor on the lattice through "anchor_re"/"anchor_im";
+ * imgpipe reads either.
+ *
+ * Render mode ("mode": "render") is grid mode with the viewport and color
+ * settings of imgpipe --roots2image: roots are plotted into a raw image as
+ * they are solved, and no .bin is written.  With "tile" the canvas is cut
+ * into tile parts reported on stdout as they are written, at most
+ * "resident_tiles" tile buffers held at once (raw_canvas.h).  Rainbow and
+ * constant colors only; proximity coloring and imgpipe's root matching
+ * need the whole root set.
+ *
+ * Steploop mode ("mode": "steploop") replays a browser fast-mode setup the
+ * way step_loop.c's runStepLoop does, over steps [step_start, step_end) of
+ * an n_t-step pass: C and D paths, morph blending, pinned roots, root
+ * matching and the uniform/index/proximity/derivative/rel-proximity color
+ * modes.  Roots are painted into an RGBA raw (unpainted pixels transparent,
+ * so stripes composite with imgpipe --reduce --over) and the final roots
+ * are printed for the next pass's warm start.
+ *
+ * Animation and grid mode write a checkpoint (checkpoint.h) every
+ * "checkpoint_s" seconds, and "resume": true continues from it after a
+ * kill; the resumed output matches an uninterrupted run.
+ *
+ * "refine": r (animation, grid and render mode) halves a step, up to
+ * "refine_depth" times, while some root moves more than r times the
+ * distance to its nearest neighbour (Refiner); the parameter of every
+ * step written goes to <output>.pos.
+ *
+ * "histogram": true (animation and grid mode) counts roots into a
+ * fixed-resolution density histogram (root_hist.h) written to the output
+ * path instead of the .bin; imgpipe --hist-merge adds stripes' histograms.
+ *
+ * Build: aarch64-linux-musl-gcc -O3 -static -o sweep sweep_cli.c -lm -lpthread
+ * Local: cc -O3 -o sweep sweep_cli.c -lm -lpthread
  */
 
 #include <stdio.h>
@@ -15,32 +61,57 @@
 #include <string.h>
 #include <math.h>
 #include <time.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <pthread.h>
+#include <stdint.h>
 
 #define MAX_DEGREE 255
 #define MAX_COEFFS 256
-#define MAX_ANIM 64
+#define MAX_ANIM MAX_COEFFS
 #define MAX_ITER 64
 #define TOL2 1e-16
 #define BUF_SIZE (1024 * 256)
+#define MAX_THREADS 64
 
 #ifndef M_PI
 #define M_PI 3.14159265358979323846
 #endif
 
-/* ---- qsort comparator for doubles ---- */
-static int cmpDouble(const void *a, const void *b) {
-    double da = *(const double *)a, db = *(const double *)b;
-    return (da > db) - (da < db);
-}
+#include "coeff_expr.h"
+#include "root_codec.h"
+#include "coeff_paths.h"
+#include "palettes.h"
+#include "checkpoint.h"
+#include "root_hist.h"
+#include "raw_canvas.h"
 
 /* ---- Ehrlich-Aberth solver ---- */
 
+/*
+ * Per-root state.  A root whose own correction drops below TOL2 is frozen:
+ * it is no longer updated (its position still enters the other roots'
+ * Aberth sums).  A root whose Aberth term |w*S| falls below POLISH_WS2 is
+ * well separated from the rest, so the Aberth step is Newton's step to
+ * within ~1e-3; it switches to Newton-only polishing and skips the O(n)
+ * Aberth sum.  Only the remaining active roots set the iteration's max
+ * correction.
+ */
+#define ROOT_ACTIVE 0
+#define ROOT_POLISH 1
+#define ROOT_FROZEN 2
+#define POLISH_WS2 1e-6
+
 static int solveEA(double *cr, double *ci, int n,
                    double *rRe, double *rIm, int degree)
 {
+    unsigned char state[MAX_DEGREE];
+    memset(state, ROOT_ACTIVE, degree);
+
     for (int iter = 0; iter < MAX_ITER; iter++) {
         double maxCorr2 = 0;
         for (int i = 0; i < degree; i++) {
+            if (state[i] == ROOT_FROZEN) continue;
             double zR = rRe[i], zI = rIm[i];
 
             /* Horner: p(z) and p'(z) */
@@ -61,37 +132,151 @@ static int solveEA(double *cr, double *ci, int n,
             double wR = (pR * dpR + pI * dpI) / dpM;
             double wI = (pI * dpR - pR * dpI) / dpM;
 
-            /* Aberth sum */
-            double sR = 0, sI = 0;
-            for (int j = 0; j < degree; j++) {
-                if (j == i) continue;
-                double dR = zR - rRe[j], dI = zI - rIm[j];
-                double dM = dR * dR + dI * dI;
-                if (dM < 1e-60) continue;
-                sR += dR / dM;
-                sI += -dI / dM;
-            }
+            double crrR = wR, crrI = wI;
+            if (state[i] == ROOT_ACTIVE) {
+                /* Aberth sum */
+                double sR = 0, sI = 0;
+                for (int j = 0; j < degree; j++) {
+                    if (j == i) continue;
+                    double dR = zR - rRe[j], dI = zI - rIm[j];
+                    double dM = dR * dR + dI * dI;
+                    if (dM < 1e-60) continue;
+                    sR += dR / dM;
+                    sI += -dI / dM;
+                }
 
-            /* Correction */
-            double wsR = wR * sR - wI * sI;
-            double wsI = wR * sI + wI * sR;
-            double dnR = 1 - wsR, dnI = -wsI;
-            double dnM = dnR * dnR + dnI * dnI;
-            if (dnM < 1e-60) continue;
+                /* Correction */
+                double wsR = wR * sR - wI * sI;
+                double wsI = wR * sI + wI * sR;
+                double dnR = 1 - wsR, dnI = -wsI;
+                double dnM = dnR * dnR + dnI * dnI;
+                if (dnM < 1e-60) continue;
 
-            double crrR = (wR * dnR + wI * dnI) / dnM;
-            double crrI = (wI * dnR - wR * dnI) / dnM;
+                crrR = (wR * dnR + wI * dnI) / dnM;
+                crrI = (wI * dnR - wR * dnI) / dnM;
+                if (wsR * wsR + wsI * wsI < POLISH_WS2) state[i] = ROOT_POLISH;
+            }
             rRe[i] -= crrR;
             rIm[i] -= crrI;
 
             double h2 = crrR * crrR + crrI * crrI;
             if (h2 > maxCorr2) maxCorr2 = h2;
+            if (h2 < TOL2) state[i] = ROOT_FROZEN;
         }
         if (maxCorr2 < TOL2) return iter + 1;
     }
     return MAX_ITER;
 }
 
+/* ---- Batched Ehrlich-Aberth: EA_LANES polynomials in lockstep ---- */
+
+#ifndef EA_LANES
+#define EA_LANES 4  /* one AVX2 register of doubles; -DEA_LANES=8 for AVX-512 */
+#endif
+
+typedef double vdbl __attribute__((vector_size(EA_LANES * sizeof(double))));
+typedef long vmask __attribute__((vector_size(EA_LANES * sizeof(long))));
+
+/* Lanes of a where m is set, else b (a macro: vectors passed by value
+ * trip -Wpsabi on x86 builds without -mavx) */
+#define vselect(m, a, b) ((vdbl)(((vmask)(a) & (m)) | ((vmask)(b) & ~(m))))
+
+/*
+ * solveEA on EA_LANES polynomials of the same length n at once, using GCC
+ * vector extensions (AVX2/AVX-512 on x86, NEON on Graviton).  cr/ci[k] hold
+ * coefficient k of every lane; rRe/rIm[i] hold root i of every lane.  Each
+ * lane follows exactly the scalar iteration, per-root freezing and
+ * polishing included: a root is skipped once it is frozen in every lane,
+ * and the Aberth sum once it is polishing in every lane that still needs
+ * it.  A lane whose max correction drops below TOL2 stops while the others
+ * continue.  Lanes not set in `lanes` are left untouched.  Per-lane
+ * iteration counts go to iters[].
+ */
+static void solveEABatch(const vdbl *cr, const vdbl *ci, int n,
+                         vdbl *rRe, vdbl *rIm, int degree,
+                         const vmask *lanes, int *iters)
+{
+    const vdbl zero = {0};
+    const vmask none = {0};
+    vmask active = *lanes;
+    vmask frozen[MAX_DEGREE], polish[MAX_DEGREE];
+    for (int i = 0; i < degree; i++) { frozen[i] = none; polish[i] = none; }
+    for (int l = 0; l < EA_LANES; l++) iters[l] = active[l] ? MAX_ITER : 0;
+
+    for (int iter = 0; iter < MAX_ITER; iter++) {
+        vdbl maxCorr2 = zero;
+        for (int i = 0; i < degree; i++) {
+            vmask live = active & ~frozen[i];
+            int anyLive = 0, anyAberth = 0;
+            for (int l = 0; l < EA_LANES; l++) {
+                anyLive |= live[l] != 0;
+                anyAberth |= live[l] && !polish[i][l];
+            }
+            if (!anyLive) continue;
+            vdbl zR = rRe[i], zI = rIm[i];
+
+            /* Horner: p(z) and p'(z) */
+            vdbl pR = cr[0], pI = ci[0];
+            vdbl dpR = zero, dpI = zero;
+            for (int k = 1; k < n; k++) {
+                vdbl ndR = dpR * zR - dpI * zI + pR;
+                vdbl ndI = dpR * zI + dpI * zR + pI;
+                dpR = ndR; dpI = ndI;
+                vdbl npR = pR * zR - pI * zI + cr[k];
+                vdbl npI = pR * zI + pI * zR + ci[k];
+                pR = npR; pI = npI;
+            }
+
+            /* Newton: w = p/p' (lanes with p' ~ 0 skip this root) */
+            vdbl dpM = dpR * dpR + dpI * dpI;
+            vmask ok = live & ~(vmask)(dpM < 1e-60);
+            vdbl wR = (pR * dpR + pI * dpI) / dpM;
+            vdbl wI = (pI * dpR - pR * dpI) / dpM;
+
+            vdbl crrR = wR, crrI = wI;
+            if (anyAberth) {
+                /* Aberth sum */
+                vdbl sR = zero, sI = zero;
+                for (int j = 0; j < degree; j++) {
+                    if (j == i) continue;
+                    vdbl dR = zR - rRe[j], dI = zI - rIm[j];
+                    vdbl dM = dR * dR + dI * dI;
+                    vmask use = ~(vmask)(dM < 1e-60);
+                    sR += vselect(use, dR / dM, zero);
+                    sI += vselect(use, -dI / dM, zero);
+                }
+
+                /* Correction, in the lanes not yet polishing */
+                vdbl wsR = wR * sR - wI * sI;
+                vdbl wsI = wR * sI + wI * sR;
+                vdbl dnR = 1 - wsR, dnI = -wsI;
+                vdbl dnM = dnR * dnR + dnI * dnI;
+                vmask aberth = ok & ~polish[i];
+                aberth &= ~(vmask)(dnM < 1e-60);
+                ok = (ok & polish[i]) | aberth;
+
+                crrR = vselect(aberth, (wR * dnR + wI * dnI) / dnM, wR);
+                crrI = vselect(aberth, (wI * dnR - wR * dnI) / dnM, wI);
+                polish[i] |= aberth & (vmask)(wsR * wsR + wsI * wsI < POLISH_WS2);
+            }
+            rRe[i] = vselect(ok, zR - crrR, zR);
+            rIm[i] = vselect(ok, zI - crrI, zI);
+
+            vdbl h2 = crrR * crrR + crrI * crrI;
+            maxCorr2 = vselect(ok & (vmask)(h2 > maxCorr2), h2, maxCorr2);
+            frozen[i] |= ok & (vmask)(h2 < TOL2);
+        }
+        vmask done = active & (vmask)(maxCorr2 < TOL2);
+        int any = 0;
+        for (int l = 0; l < EA_LANES; l++) {
+            if (done[l]) iters[l] = iter + 1;
+            any |= active[l] && !done[l];
+        }
+        active &= ~done;
+        if (!any) return;
+    }
+}
+
 /* ---- Greedy root matching ---- */
 
 static void matchRoots(double *newRe, double *newIm,
@@ -119,6 +304,119 @@ static void matchRoots(double *newRe, double *newIm,
     memcpy(newIm, tmpIm, n * sizeof(double));
 }
 
+/* Solve one polynomial on warm-started roots: leading-zero stripping,
+ * degenerate and linear cases included. */
+static int solveLane(const double *cRe, const double *cIm, int nCoeffs,
+                     double *rootRe, double *rootIm, int degree, int *effDegOut)
+{
+    int start = 0;
+    while (start < nCoeffs - 1 &&
+           cRe[start] * cRe[start] + cIm[start] * cIm[start] < 1e-30)
+        start++;
+    int effN = nCoeffs - start;
+    int effDeg = effN - 1;
+    *effDegOut = effDeg;
+    if (effDeg <= 0) {
+        for (int i = 0; i < degree; i++) { rootRe[i] = 0; rootIm[i] = 0; }
+        return 0;
+    }
+    if (effDeg == 1) {
+        double aR = cRe[start], aI = cIm[start];
+        double bR = cRe[start+1], bI = cIm[start+1];
+        double d = aR*aR + aI*aI;
+        if (d > 1e-30) {
+            rootRe[0] = -(bR*aR + bI*aI) / d;
+            rootIm[0] = -(bI*aR - bR*aI) / d;
+        }
+        return 1;
+    }
+    return solveEA((double *)cRe + start, (double *)cIm + start, effN,
+                   rootRe, rootIm, effDeg);
+}
+
+/* ---- Adaptive refinement ---- */
+
+#define REFINE_MAX_DEPTH 16
+
+/* A step jumped if some root moved further than `ratio` times its
+ * distance to the nearest other root of the previous step: near a
+ * collision, where a uniform step undersamples the trails and matching
+ * can swap roots. */
+static int rootsJumped(const double *re, const double *im,
+                       const double *pRe, const double *pIm, int n, double ratio)
+{
+    double r2 = ratio * ratio;
+    for (int i = 0; i < n; i++) {
+        double dx = re[i] - pRe[i], dy = im[i] - pIm[i];
+        double moved = dx * dx + dy * dy;
+        if (!(moved > 0)) continue;
+        for (int j = 0; j < n; j++) {
+            if (j == i) continue;
+            double sx = pRe[j] - pRe[i], sy = pIm[j] - pIm[i];
+            if (moved > r2 * (sx * sx + sy * sy)) return 1;
+        }
+    }
+    return 0;
+}
+
+/* Solve the family at parameter t from the warm start in re/im; returns
+ * the iteration count and sets *effDeg */
+typedef int (*SolveAtFunc)(void *ctx, double t, double *re, double *im, int *effDeg);
+/* Take one accepted step; nonzero stops the sweep */
+typedef int (*EmitFunc)(void *ctx, double t, const double *re, const double *im);
+
+/* Steps through the parameter warm-starting each solve from the last
+ * accepted roots.  With maxDepth > 0, a step whose roots jumped is
+ * discarded and the interval from the last accepted step halved, down to
+ * 2^-maxDepth of it, so extra solves go only where trails move fast.
+ * maxDepth 0 is the plain uniform sweep. */
+typedef struct {
+    SolveAtFunc solve;
+    EmitFunc emit;
+    void *ctx;
+    int degree, doMatch;
+    double ratio;
+    int maxDepth;
+    int havePrev;
+    double tPrev;
+    double prevRe[MAX_DEGREE], prevIm[MAX_DEGREE];
+    long iters, solves, steps;
+} Refiner;
+
+/* Advance to t; `split` 0 takes it in one step (a grid row's first
+ * point, which does not follow on from the previous one) */
+static int refineStep(Refiner *rf, double t, int split) {
+    double st[REFINE_MAX_DEPTH + 1];
+    double re[MAX_DEGREE], im[MAX_DEGREE];
+    int top = 0;
+    st[0] = t;
+    while (top >= 0) {
+        double tt = st[top];
+        int effDeg;
+        memcpy(re, rf->prevRe, rf->degree * sizeof(double));
+        memcpy(im, rf->prevIm, rf->degree * sizeof(double));
+        rf->iters += rf->solve(rf->ctx, tt, re, im, &effDeg);
+        rf->solves++;
+
+        if (rf->doMatch && rf->havePrev && effDeg > 1)
+            matchRoots(re, im, rf->prevRe, rf->prevIm, effDeg);
+        if (split && top < rf->maxDepth && rf->havePrev && effDeg > 1 &&
+            rootsJumped(re, im, rf->prevRe, rf->prevIm, effDeg, rf->ratio)) {
+            st[++top] = 0.5 * (rf->tPrev + tt);
+            continue;
+        }
+
+        memcpy(rf->prevRe, re, rf->degree * sizeof(double));
+        memcpy(rf->prevIm, im, rf->degree * sizeof(double));
+        rf->tPrev = tt;
+        rf->havePrev = 1;
+        rf->steps++;
+        if (rf->emit(rf->ctx, tt, re, im) != 0) return -1;
+        top--;
+    }
+    return 0;
+}
+
 /* ---- Minimal JSON parsing ---- */
 
 static const char *skip(const char *p) {
@@ -194,6 +492,20 @@ static const char *findClosing(const char *p, char open, char close) {
     return p;
 }
 
+/* ---- Parse a quoted string value ---- */
+
+static int parseString(const char *p, char *out, int maxLen) {
+    p = skip(p);
+    if (*p != '"') return 0;
+    p++;
+    int i = 0;
+    while (*p && *p != '"' && i < maxLen - 1) {
+        out[i++] = *p++;
+    }
+    out[i] = '\0';
+    return i;
+}
+
 /* Animation entry */
 typedef struct {
     int coeff_index;
@@ -203,8 +515,45 @@ typedef struct {
     int ccw;
     /* center is the coefficient's base position */
     double centerRe, centerIm;
+    /* "path" or "curve": a coeff_paths.h table; neither is the legacy
+     * circle about the base position */
+    char path[32];
+    PathExtra extra;
+    PathTable table;
+    double dither;
+    int ditherDist;
+    /* steploop D-nodes: add this C-node's current position (orb- paths) */
+    int orbitRef;
 } Anim;
 
+/* [[re, im], ...] into a malloc'd table; returns the point count */
+static int parsePoints(const char *p, PathTable *out) {
+    p = skip(p);
+    if (*p != '[') return 0;
+    const char *end = findClosing(p, '[', ']');
+    int cap = 0;
+    for (const char *q = p + 1; q < end; q++)
+        if (*q == '[') cap++;
+    if (cap > PATH_MAX_POINTS) cap = PATH_MAX_POINTS;
+    out->pts = malloc(sizeof(double) * 2 * (cap > 0 ? cap : 1));
+    out->n = 0;
+    if (!out->pts) return 0;
+    p++;
+    while (out->n < cap) {
+        p = skip(p);
+        if (*p == ',') { p++; p = skip(p); }
+        if (*p != '[') break;
+        p++;
+        double re = parseNum(&p);
+        p = skip(p); if (*p == ',') p++;
+        double im = parseNum(&p);
+        p = skip(p); if (*p == ']') p++;
+        pathPush(out, cap, re, im);
+    }
+    return out->n;
+}
+
+/* Returns the entry count, or -1 after printing an error */
 static int parseAnimations(const char *p, Anim *anims) {
     p = skip(p);
     if (*p != '[') return 0;
@@ -221,6 +570,11 @@ static int parseAnimations(const char *p, Anim *anims) {
         Anim *a = &anims[count];
         a->coeff_index = 0; a->radius = 0.5; a->speed = 1.0;
         a->angle = 0.0; a->ccw = 0;
+        a->path[0] = '\0';
+        pathExtraDefaults(&a->extra);
+        a->table.pts = NULL; a->table.n = 0; a->table.cloud = 0;
+        a->dither = 0.0; a->ditherDist = DITHER_NORMAL;
+        a->orbitRef = -1;
 
         const char *v;
         v = findKeyIn(objStart, objEnd, "coeff_index");
@@ -234,7 +588,60 @@ static int parseAnimations(const char *p, Anim *anims) {
         v = findKeyIn(objStart, objEnd, "ccw");
         if (v) a->ccw = (*v == 't' || *v == '1');
 
+        v = findKeyIn(objStart, objEnd, "path");
+        if (v) parseString(v, a->path, sizeof(a->path));
+        size_t len = strlen(a->path);
+        if (len > 7 && strcmp(a->path + len - 7, "-dither") == 0) {
+            a->path[len - 7] = '\0';
+            a->dither = 0.01;
+        }
+        v = findKeyIn(objStart, objEnd, "dither");
+        if (v) a->dither = parseNum(&v);
+        v = findKeyIn(objStart, objEnd, "dither_dist");
+        if (v) {
+            char dist[16] = "";
+            parseString(v, dist, sizeof(dist));
+            if ((a->ditherDist = pathDitherDist(dist)) < 0) {
+                fprintf(stderr, "Unknown dither_dist: %s\n", dist);
+                return -1;
+            }
+        }
+
+        PathExtra *ex = &a->extra;
+        struct { const char *key; double *dst; } nums[] = {
+            {"freq_a", &ex->freqA}, {"freq_b", &ex->freqB},
+            {"mult", &ex->mult}, {"turns", &ex->turns}, {"width", &ex->width},
+            {"ctr_re", &ex->ctrRe}, {"ctr_im", &ex->ctrIm},
+            {"pow", &ex->pow}, {"r_in", &ex->rIn}, {"jit", &ex->jit},
+            {"inner_turns", &ex->innerTurns}, {"inner_ratio", &ex->innerRatio},
+            {"noise_scale", &ex->noiseScale}, {"noise_amp", &ex->noiseAmp},
+        };
+        for (size_t k = 0; k < sizeof(nums) / sizeof(nums[0]); k++)
+            if ((v = findKeyIn(objStart, objEnd, nums[k].key)))
+                *nums[k].dst = parseNum(&v);
+        v = findKeyIn(objStart, objEnd, "points");
+        if (v) ex->points = (int)parseNum(&v);
+        v = findKeyIn(objStart, objEnd, "spokes");
+        if (v) ex->spokes = (int)parseNum(&v);
+        v = findKeyIn(objStart, objEnd, "rings");
+        if (v) ex->rings = (int)parseNum(&v);
+        v = findKeyIn(objStart, objEnd, "orbit_ref");
+        if (v) a->orbitRef = (int)parseNum(&v);
+
+        /* A precomputed table (serializeFastModeData's absolute points)
+         * takes precedence over "path" */
+        v = findKeyIn(objStart, objEnd, "curve");
+        if (v) {
+            if (parsePoints(v, &a->table) < 1) {
+                fprintf(stderr, "Animation %d: empty curve\n", count);
+                return -1;
+            }
+            v = findKeyIn(objStart, objEnd, "cloud");
+            a->table.cloud = v && (*v == 't' || *v == '1');
+        }
+
         p = objEnd;
+        if (strcmp(a->path, "none") == 0 && !a->table.pts) continue;
         count++;
     }
     return count;
@@ -245,18 +652,95 @@ static int parseBool(const char *p) {
     return (*p == 't' || *p == '1');
 }
 
-/* ---- Parse a quoted string value ---- */
+/* [i, j, ...] into out; returns the count */
+static int parseIntList(const char *p, int *out, int max) {
+    p = skip(p);
+    if (*p != '[') return 0;
+    p++;
+    int count = 0;
+    while (count < max) {
+        p = skip(p);
+        if (*p == ',') p = skip(p + 1);
+        if (*p == ']' || !*p) break;
+        const char *q = p;
+        out[count] = (int)parseNum(&p);
+        if (p == q) break;
+        count++;
+    }
+    return count;
+}
 
-static int parseString(const char *p, char *out, int maxLen) {
+/* [x, y, ...] into out; returns the count */
+static int parseNumList(const char *p, double *out, int max) {
     p = skip(p);
-    if (*p != '"') return 0;
+    if (*p != '[') return 0;
     p++;
-    int i = 0;
-    while (*p && *p != '"' && i < maxLen - 1) {
-        out[i++] = *p++;
+    int count = 0;
+    while (count < max) {
+        p = skip(p);
+        if (*p == ',') p = skip(p + 1);
+        if (*p == ']' || !*p) break;
+        const char *q = p;
+        out[count] = parseNum(&p);
+        if (p == q) break;
+        count++;
     }
-    out[i] = '\0';
-    return i;
+    return count;
+}
+
+/* [r, g, b], clamped to bytes; returns 0, or -1 if p is not a list */
+static int parseRGB(const char **pp, RGB *out) {
+    const char *p = skip(*pp);
+    if (*p != '[') return -1;
+    p++;
+    double c[3];
+    for (int k = 0; k < 3; k++) {
+        c[k] = parseNum(&p);
+        p = skip(p); if (*p == ',') p++;
+    }
+    p = skip(p); if (*p == ']') p++;
+    out->r = (unsigned char)fmin(fmax(c[0], 0), 255);
+    out->g = (unsigned char)fmin(fmax(c[1], 0), 255);
+    out->b = (unsigned char)fmin(fmax(c[2], 0), 255);
+    *pp = p;
+    return 0;
+}
+
+/* [[r, g, b], ...] into out; returns the count */
+static int parseRGBList(const char *p, RGB *out, int max) {
+    p = skip(p);
+    if (*p != '[') return 0;
+    p++;
+    int count = 0;
+    while (count < max) {
+        p = skip(p);
+        if (*p == ',') p = skip(p + 1);
+        if (parseRGB(&p, &out[count]) < 0) break;
+        count++;
+    }
+    return count;
+}
+
+/* Key of the outermost object only.  findKey takes the first match
+ * anywhere, but steploop's animation entries reuse top-level names
+ * ("width", "radius", ...). */
+static const char *findTopKey(const char *json, const char *key) {
+    size_t klen = strlen(key);
+    int depth = 0;
+    for (const char *p = json; *p; p++) {
+        if (*p == '{' || *p == '[') depth++;
+        else if (*p == '}' || *p == ']') depth--;
+        else if (*p == '"') {
+            const char *s = ++p;
+            while (*p && *p != '"') { if (*p == '\\' && p[1]) p++; p++; }
+            if (!*p) return NULL;
+            if (depth == 1 && (size_t)(p - s) == klen && strncmp(s, key, klen) == 0) {
+                const char *v = skip(p + 1);
+                if (*v == ':') return skip(v + 1);
+            }
+        }
+    }
+    return NULL;
 }
 
 /* ---- Coefficient functions for grid mode ---- */
@@ -1655,86 +2139,395 @@ static CoeffFunc lookupFunction(const char *name) {
     return NULL;
 }
 
+/* ---- Fused render: plot roots straight into a raw image ---- */
+
+#define HIT_BATCH 4096       /* hits buffered per chain between canvas flushes */
+
+/* Shared by all chains of a render; the canvas is guarded by `lock` */
+typedef struct {
+    Canvas cv;
+    double centerRe, centerIm, scale;
+    unsigned char palR[MAX_DEGREE], palG[MAX_DEGREE], palB[MAX_DEGREE];
+    pthread_mutex_t lock;
+} RenderCtx;
+
+/* Per-chain hit buffer: chains project roots without the lock and flush
+ * HIT_BATCH hits at a time.  Saturating adds of non-negative values
+ * commute, so the image does not depend on the flush order. */
+typedef struct {
+    struct { int px, py; int root; } hits[HIT_BATCH];
+    int n;
+    long plotted, clipped;
+} HitBuf;
+
+static void renderFlush(RenderCtx *rc, HitBuf *hb) {
+    pthread_mutex_lock(&rc->lock);
+    for (int i = 0; i < hb->n; i++) {
+        int k = hb->hits[i].root;
+        canvasPlot(&rc->cv, hb->hits[i].px, hb->hits[i].py,
+                   rc->palR[k], rc->palG[k], rc->palB[k]);
+    }
+    pthread_mutex_unlock(&rc->lock);
+    hb->n = 0;
+}
+
+/* Project one step's roots.  Roots are rounded to float first, so pixels
+ * match imgpipe --roots2image on the f32 .bin exactly. */
+static void renderStep(RenderCtx *rc, HitBuf *hb,
+                       const double *rootRe, const double *rootIm, int degree) {
+    double halfW = rc->cv.W / 2.0, halfH = rc->cv.H / 2.0;
+    for (int i = 0; i < degree; i++) {
+        double re = (float)rootRe[i], im = (float)rootIm[i];
+        int px = (int)(halfW + (re - rc->centerRe) * rc->scale);
+        int py = (int)(halfH - (im - rc->centerIm) * rc->scale);
+        if (px < 0 || px >= rc->cv.W || py < 0 || py >= rc->cv.H) {
+            hb->clipped++;
+            continue;
+        }
+        hb->hits[hb->n].px = px;
+        hb->hits[hb->n].py = py;
+        hb->hits[hb->n].root = i;
+        hb->plotted++;
+        if (++hb->n == HIT_BATCH) renderFlush(rc, hb);
+    }
+}
+
+/* ---- Density histogram (root_hist.h) ---- */
+
+/* "histogram": true and its settings; 1 = h set up, 0 = not asked for,
+ * -1 = bad settings (reported) */
+static int parseHistogram(const char *buf, RootHist *h) {
+    const char *cp = findKey(buf, "histogram");
+    if (!cp || !parseBool(cp)) return 0;
+    int W = 512, H = 512;
+    cp = findKey(buf, "hist_width");
+    if (cp) W = (int)parseNum(&cp);
+    cp = findKey(buf, "hist_height");
+    if (cp) H = (int)parseNum(&cp);
+
+    /* Fixed bounds, or an extent that doubles as roots land outside */
+    double b[4];
+    int rc;
+    cp = findKey(buf, "hist_bounds");
+    if (cp && parseNumList(cp, b, 4) == 4) {
+        rc = histInit(h, W, H, (b[0] + b[1]) / 2, (b[2] + b[3]) / 2,
+                      (b[1] - b[0]) / 2, (b[3] - b[2]) / 2, 0);
+    } else {
+        double centerRe = 0, centerIm = 0, range = 2;
+        cp = findKey(buf, "hist_center_re");
+        if (cp) centerRe = parseNum(&cp);
+        cp = findKey(buf, "hist_center_im");
+        if (cp) centerIm = parseNum(&cp);
+        cp = findKey(buf, "hist_range");
+        if (cp) range = parseNum(&cp);
+        rc = histInit(h, W, H, centerRe, centerIm, range, 0, HIST_AUTO);
+    }
+    if (rc != 0) {
+        fprintf(stderr, "Invalid histogram: %dx%d, or empty bounds\n", W, H);
+        return -1;
+    }
+    return 1;
+}
+
+/* Histogram metadata fields, with a trailing comma */
+static void printHistogram(const RootHist *h) {
+    double b[4];
+    histBounds(h, b);
+    printf("\"hist_width\":%d,\"hist_height\":%d,"
+           "\"hist_bounds\":[%.17g,%.17g,%.17g,%.17g],\"hist_auto\":%s,"
+           "\"hist_doublings\":%d,\"roots_counted\":%llu,\"roots_clipped\":%llu,",
+           h->width, h->height, b[0], b[1], b[2], b[3],
+           h->flags & HIST_AUTO ? "true" : "false", h->doublings,
+           (unsigned long long)h->counted, (unsigned long long)h->clipped);
+}
+
 /* ---- Grid sweep (2D parameter scan) ---- */
 
-static int runGrid(const char *buf, const char *outPath) {
-    /* Parse function name */
-    char funcName[64] = "";
-    const char *cp = findKey(buf, "function");
-    if (cp) parseString(cp, funcName, sizeof(funcName));
+/* Grid-mode output: the float32 .bin (rows at fixed offsets), or an encoded
+ * root file whose row blocks the chains append under `lock`.  A refined
+ * sweep's rows vary in length, so they are appended too, with their
+ * (x1, x2) positions at the same step in `posFd`. */
+typedef struct {
+    int fd;
+    int encoding;
+    double quantum, anchor[2];
+    int i1_base;            /* first row of the stripe */
+    pthread_mutex_t lock;
+    off_t next;             /* end of the blocks written so far */
+    uint64_t *index;        /* block offset per stripe row */
+    int posFd;              /* refined sweep's positions, or -1 */
+} RootWriter;
+
+/* Write one row of nSteps float32 roots; `scratch` holds an encoded block,
+ * `pos` the refined sweep's positions */
+static int writeRow(RootWriter *w, const float *row, int i1, int nSteps, int degree,
+                    unsigned char *scratch, const double *pos) {
+    size_t len = (size_t)nSteps * degree * 2 * sizeof(float);
+    if (w->posFd >= 0) {
+        size_t posLen = (size_t)nSteps * 2 * sizeof(double);
+        pthread_mutex_lock(&w->lock);
+        off_t off = w->next;
+        w->next += len;
+        pthread_mutex_unlock(&w->lock);
+        off_t posOff = off / ((off_t)degree * 2 * sizeof(float)) * 2 * sizeof(double);
+        return pwrite(w->fd, row, len, off) == (ssize_t)len &&
+               pwrite(w->posFd, pos, posLen, posOff) == (ssize_t)posLen ? 0 : -1;
+    }
+    if (w->encoding == ROOTS_F32) {
+        off_t off = (off_t)(i1 - w->i1_base) * len;
+        return pwrite(w->fd, row, len, off) == (ssize_t)len ? 0 : -1;
+    }
+    len = rootsEncodeBlock(row, nSteps, degree, w->encoding, w->quantum, w->anchor, scratch);
+    pthread_mutex_lock(&w->lock);
+    off_t off = w->next;
+    w->next += len;
+    pthread_mutex_unlock(&w->lock);
+    w->index[i1 - w->i1_base] = off;
+    return pwrite(w->fd, scratch, len, off) == (ssize_t)len ? 0 : -1;
+}
 
-    /* Parse grid dimensions */
-    int n1 = 100, n2 = 100;
-    cp = findKey(buf, "n1");
-    if (cp) n1 = (int)parseNum(&cp);
-    cp = findKey(buf, "n2");
-    if (cp) n2 = (int)parseNum(&cp);
-    if (n1 < 1) n1 = 1;
-    if (n2 < 1) n2 = 1;
+/* Grid-mode checkpoint (checkpoint.h): one slot per chain, holding the
+ * first row it has not written and the warm-start roots to carry into it
+ * (EA_LANES lanes in the SIMD chain).  Chains update their slot after each
+ * write; whichever notices the interval has passed syncs the output and
+ * writes the slots, the encoded file's end and its row index. */
+typedef struct {
+    int next;
+    long totalIters;
+    double roots[2 * MAX_DEGREE * EA_LANES];
+} GridSlot;
 
-    /* Optional stripe range: i1_start..i1_end (for parallel fan-out) */
-    int i1_start = 0, i1_end = n1;
-    cp = findKey(buf, "i1_start");
-    if (cp) i1_start = (int)parseNum(&cp);
-    cp = findKey(buf, "i1_end");
-    if (cp) i1_end = (int)parseNum(&cp);
-    if (i1_start < 0) i1_start = 0;
-    if (i1_end > n1) i1_end = n1;
-    if (i1_start >= i1_end) {
-        fprintf(stderr, "Empty stripe: i1_start=%d >= i1_end=%d\n", i1_start, i1_end);
-        return 1;
+typedef struct {
+    pthread_mutex_t lock;
+    const char *outPath;
+    uint64_t fingerprint;
+    double interval;
+    struct timespec last;
+    RootWriter *out;
+    int stripeRows, nSlots;
+    size_t rootBytes;       /* re, then im, per slot */
+    GridSlot *slots;
+    CkptBuf buf;
+    int written;
+} GridCkpt;
+
+static void gridCkptSave(GridCkpt *ck, int slot, int next, long totalIters,
+                         const void *re, const void *im) {
+    size_t half = ck->rootBytes / 2;
+    pthread_mutex_lock(&ck->lock);
+    GridSlot *gs = &ck->slots[slot];
+    gs->next = next;
+    gs->totalIters = totalIters;
+    memcpy(gs->roots, re, half);
+    memcpy((char *)gs->roots + half, im, half);
+
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    if (ck->interval > 0 &&
+        (now.tv_sec - ck->last.tv_sec) + (now.tv_nsec - ck->last.tv_nsec) * 1e-9 >= ck->interval) {
+        RootWriter *w = ck->out;
+        CkptBuf *b = &ck->buf;
+        b->n = 0;
+        int ok = fdatasync(w->fd) == 0;
+        for (int i = 0; i < ck->nSlots && ok; i++)
+            ok = ckptPut(b, &ck->slots[i].next, sizeof(int)) == 0 &&
+                 ckptPut(b, &ck->slots[i].totalIters, sizeof(long)) == 0 &&
+                 ckptPut(b, ck->slots[i].roots, ck->rootBytes) == 0;
+        if (ok && w->index) {
+            pthread_mutex_lock(&w->lock);
+            off_t end = w->next;
+            pthread_mutex_unlock(&w->lock);
+            ok = ckptPut(b, &end, sizeof end) == 0 &&
+                 ckptPut(b, w->index, (size_t)ck->stripeRows * sizeof(uint64_t)) == 0;
+        }
+        if (ok && ckptWrite(ck->outPath, ck->fingerprint, b) == 0) ck->written++;
+        else fprintf(stderr, "Checkpoint of %s failed\n", ck->outPath);
+        ck->last = now;
     }
-    int stripeRows = i1_end - i1_start;
+    pthread_mutex_unlock(&ck->lock);
+}
 
-    if ((long)stripeRows * n2 > 10000000) {
-        fprintf(stderr, "Stripe too large: %d x %d\n", stripeRows, n2);
-        return 1;
+/* Restore slots, the encoded file's end and its index from a checkpoint
+ * payload; -1 if it does not fit this run */
+static int gridCkptLoad(GridCkpt *ck, const unsigned char *p, size_t n) {
+    const unsigned char *end = p + n;
+    RootWriter *w = ck->out;
+    for (int i = 0; i < ck->nSlots; i++)
+        if (ckptGet(&p, end, &ck->slots[i].next, sizeof(int)) != 0 ||
+            ckptGet(&p, end, &ck->slots[i].totalIters, sizeof(long)) != 0 ||
+            ckptGet(&p, end, ck->slots[i].roots, ck->rootBytes) != 0)
+            return -1;
+    if (w->index) {
+        off_t next;
+        if (ckptGet(&p, end, &next, sizeof next) != 0 ||
+            ckptGet(&p, end, w->index, (size_t)ck->stripeRows * sizeof(uint64_t)) != 0)
+            return -1;
+        w->next = next;
     }
+    return p == end ? 0 : -1;
+}
 
-    int doMatch = 1;
-    cp = findKey(buf, "match_roots");
-    if (cp) doMatch = parseBool(cp);
+/* One serpentine warm-start chain over rows [i1_start, i1_end).
+ * Each chain writes its rows into its own region of the output file
+ * (pwrite at the row's offset, or an appended block when encoded), so
+ * chains can run on separate threads.
+ * In render mode the chain plots into `render` instead, and with a
+ * histogram it counts roots into its own `hist`. */
+typedef struct {
+    CoeffFunc coeffFunc;
+    const ExprProg *prog;   /* expression program instead of coeffFunc */
+    int n1, n2, degree, doMatch;
+    int simd;               /* solve EA_LANES rows in lockstep */
+    double refine;          /* adaptive refinement along rows (Refiner) */
+    int refineDepth;
+    int i1_base;            /* first row of the whole stripe (file offset 0) */
+    int i1_start, i1_end;   /* this chain's rows */
+    RootWriter *out;
+    RenderCtx *render;      /* render mode: plot roots, write no rows */
+    RootHist *hist;         /* histogram: count roots, write no rows */
+    GridCkpt *ckpt;         /* checkpointing, with this chain's slot */
+    int slot;
+    long plotted, clipped;
+    long totalIters, solves, steps;
+    long elapsed_us;
+    int failed;
+} GridChain;
+
+/* One row of the scalar chain: the coefficients of the next uniform
+ * step, and the accepted steps so far */
+typedef struct {
+    GridChain *gc;
+    ExprState *es;
+    double x1;
+    double x2;              /* the uniform step cRe/cIm belong to */
+    const double *cRe, *cIm;
+    int nCoeffs;
+    double midRe[MAX_COEFFS], midIm[MAX_COEFFS];
+    float *row;
+    double *pos;
+    long n, cap;
+    HitBuf *hb;
+} GridRow;
+
+static int gridSolveAt(void *ctx, double x2, double *re, double *im, int *effDeg) {
+    GridRow *gr = ctx;
+    GridChain *gc = gr->gc;
+    const double *cRe = gr->cRe, *cIm = gr->cIm;
+    int nCoeffs = gr->nCoeffs;
+    /* Refined steps between the uniform ones */
+    if (x2 != gr->x2) {
+        if (gc->prog) exprEval(gr->es, gr->x1, &x2, 1, gr->midRe, gr->midIm);
+        else gc->coeffFunc(gr->x1, x2, gr->midRe, gr->midIm, &nCoeffs);
+        cRe = gr->midRe;
+        cIm = gr->midIm;
+    }
+    return solveLane(cRe, cIm, nCoeffs, re, im, gc->degree, effDeg);
+}
 
-    /* Look up coefficient function */
-    CoeffFunc coeffFunc = lookupFunction(funcName);
-    if (!coeffFunc) {
-        fprintf(stderr, "Unknown function: %s\n", funcName);
-        return 1;
+static int gridEmit(void *ctx, double x2, const double *re, const double *im) {
+    GridRow *gr = ctx;
+    int degree = gr->gc->degree;
+    if (gr->gc->hist) {
+        for (int i = 0; i < degree; i++) histAdd(gr->gc->hist, re[i], im[i]);
+        return 0;
+    }
+    if (gr->hb) {
+        renderStep(gr->gc->render, gr->hb, re, im, degree);
+        return 0;
+    }
+    if (gr->n == gr->cap) {
+        long cap = gr->cap * 2;
+        float *row = realloc(gr->row, (size_t)cap * degree * 2 * sizeof(float));
+        if (!row) return -1;
+        gr->row = row;
+        if (gr->pos) {
+            double *pos = realloc(gr->pos, (size_t)cap * 2 * sizeof(double));
+            if (!pos) return -1;
+            gr->pos = pos;
+        }
+        gr->cap = cap;
+    }
+    /* Pack into the row buffer */
+    float *stepBuf = gr->row + (size_t)gr->n * degree * 2;
+    for (int i = 0; i < degree; i++) {
+        stepBuf[i * 2]     = (float)re[i];
+        stepBuf[i * 2 + 1] = (float)im[i];
     }
+    if (gr->pos) {
+        gr->pos[gr->n * 2]     = gr->x1;
+        gr->pos[gr->n * 2 + 1] = x2;
+    }
+    gr->n++;
+    return 0;
+}
 
-    /* Probe degree by evaluating at (0,0) */
+static void *runGridChain(void *arg) {
+    GridChain *gc = (GridChain *)arg;
+    int n2 = gc->n2, degree = gc->degree;
     double coeffRe[MAX_COEFFS], coeffIm[MAX_COEFFS];
-    int nCoeffs;
-    coeffFunc(0.0, 0.0, coeffRe, coeffIm, &nCoeffs);
-    int degree = nCoeffs - 1;
 
-    /* Open output */
-    FILE *fout = fopen(outPath, "wb");
-    if (!fout) {
-        fprintf(stderr, "Cannot open %s for writing\n", outPath);
-        return 1;
+    GridRow gr = { .gc = gc, .cap = n2 };
+    unsigned char *block = NULL;
+    if (gc->render) gr.hb = calloc(1, sizeof(HitBuf));
+    else if (!gc->hist) gr.row = malloc((size_t)n2 * degree * 2 * sizeof(float));
+    if (gr.row && gc->out->posFd >= 0)
+        gr.pos = malloc((size_t)n2 * 2 * sizeof(double));
+    if (gr.row && gc->out->encoding != ROOTS_F32)
+        block = malloc(rootsBlockBound(n2, degree, gc->out->encoding));
+    if ((!gr.row && !gr.hb && !gc->hist) || (gc->out->posFd >= 0 && !gr.pos) ||
+        (gr.row && gc->out->encoding != ROOTS_F32 && !block)) {
+        free(gr.row); free(gr.pos); free(gr.hb);
+        gc->failed = 1;
+        return NULL;
     }
 
-    float *stepBuf = malloc(degree * 2 * sizeof(float));
-    double rootRe[MAX_DEGREE], rootIm[MAX_DEGREE];
-    double prevRe[MAX_DEGREE], prevIm[MAX_DEGREE];
+    /* Expression programs fill coefficients for EXPR_BATCH steps at once */
+    ExprState es = {0};
+    double *batchRe = NULL, *batchIm = NULL;
+    double batchX2[EXPR_BATCH];
+    if (gc->prog) {
+        size_t n = (size_t)EXPR_BATCH * gc->prog->nCoeffs;
+        batchRe = malloc(n * sizeof(double));
+        batchIm = malloc(n * sizeof(double));
+        if (!batchRe || !batchIm || exprStateInit(&es, gc->prog) != 0) {
+            free(batchRe); free(batchIm); exprStateFree(&es);
+            free(gr.row); free(gr.pos); free(block); free(gr.hb);
+            gc->failed = 1;
+            return NULL;
+        }
+    }
+    gr.es = &es;
+
+    Refiner rf = { .solve = gridSolveAt, .emit = gridEmit, .ctx = &gr,
+                   .degree = degree, .doMatch = gc->doMatch,
+                   .ratio = gc->refine, .maxDepth = gc->refineDepth };
 
     /* Initial guesses */
     for (int k = 0; k < degree; k++) {
         double ang = 2.0 * M_PI * k / degree + 0.3;
         double r = 1.0 + 0.1 * k / degree;
-        rootRe[k] = r * cos(ang);
-        rootIm[k] = r * sin(ang);
+        rf.prevRe[k] = r * cos(ang);
+        rf.prevIm[k] = r * sin(ang);
     }
 
     struct timespec t0, t1;
     clock_gettime(CLOCK_MONOTONIC, &t0);
 
-    long totalIters = 0;
-    long totalSteps = (long)stripeRows * n2;
+    /* Resumed: carry on from the checkpointed row with its warm start */
+    int first = gc->i1_start;
+    if (gc->ckpt && gc->ckpt->slots[gc->slot].next > first) {
+        GridSlot *gs = &gc->ckpt->slots[gc->slot];
+        first = gs->next;
+        rf.iters = gs->totalIters;
+        memcpy(rf.prevRe, gs->roots, degree * sizeof(double));
+        memcpy(rf.prevIm, (char *)gs->roots + degree * sizeof(double), degree * sizeof(double));
+        rf.havePrev = 1;
+    }
 
-    for (int i1 = i1_start; i1 < i1_end; i1++) {
-        double x1 = (double)i1 / (double)n1;
+    for (int i1 = first; i1 < gc->i1_end && !gc->failed; i1++) {
+        double x1 = (double)i1 / (double)gc->n1;
+        gr.x1 = x1;
+        gr.n = 0;
 
         for (int j = 0; j < n2; j++) {
             /* Serpentine: even rows go forward, odd rows go backward */
@@ -1742,105 +2535,1490 @@ static int runGrid(const char *buf, const char *outPath) {
             double x2 = (double)i2 / (double)n2;
 
             /* Evaluate coefficient function */
-            coeffFunc(x1, x2, coeffRe, coeffIm, &nCoeffs);
-
-            /* Strip leading zeros */
-            int start = 0;
-            while (start < nCoeffs - 1 &&
-                   coeffRe[start] * coeffRe[start] + coeffIm[start] * coeffIm[start] < 1e-30)
-                start++;
-            int effN = nCoeffs - start;
-            int effDeg = effN - 1;
-
-            /* Solve */
-            int iters;
-            if (effDeg <= 0) {
-                for (int i = 0; i < degree; i++) { rootRe[i] = 0; rootIm[i] = 0; }
-                iters = 0;
-            } else if (effDeg == 1) {
-                double aR = coeffRe[start], aI = coeffIm[start];
-                double bR = coeffRe[start+1], bI = coeffIm[start+1];
-                double d = aR*aR + aI*aI;
-                if (d > 1e-30) {
-                    rootRe[0] = -(bR*aR + bI*aI) / d;
-                    rootIm[0] = -(bI*aR - bR*aI) / d;
+            if (gc->prog) {
+                int lane = j % EXPR_BATCH;
+                gr.nCoeffs = gc->prog->nCoeffs;
+                if (lane == 0) {
+                    int nb = n2 - j < EXPR_BATCH ? n2 - j : EXPR_BATCH;
+                    for (int l = 0; l < nb; l++) {
+                        int b2 = (i1 & 1) ? (n2 - 1 - j - l) : j + l;
+                        batchX2[l] = (double)b2 / (double)n2;
+                    }
+                    exprEval(&es, x1, batchX2, nb, batchRe, batchIm);
                 }
-                iters = 1;
+                gr.cRe = batchRe + (size_t)lane * gr.nCoeffs;
+                gr.cIm = batchIm + (size_t)lane * gr.nCoeffs;
             } else {
-                iters = solveEA(coeffRe + start, coeffIm + start, effN,
-                                rootRe, rootIm, effDeg);
+                gc->coeffFunc(x1, x2, coeffRe, coeffIm, &gr.nCoeffs);
+                gr.cRe = coeffRe;
+                gr.cIm = coeffIm;
             }
-            totalIters += iters;
+            gr.x2 = x2;
 
-            /* Match roots */
-            int stepIdx = (i1 - i1_start) * n2 + j;
-            if (doMatch && stepIdx > 0 && effDeg > 1) {
-                matchRoots(rootRe, rootIm, prevRe, prevIm, effDeg);
+            /* Solve, match, and refine back toward the previous step */
+            if (refineStep(&rf, x2, j > 0) != 0) {
+                gc->failed = 1;
+                break;
             }
+        }
+        if (!gr.row || gc->failed) continue;
 
-            /* Save for warm-start */
-            memcpy(prevRe, rootRe, degree * sizeof(double));
-            memcpy(prevIm, rootIm, degree * sizeof(double));
-
-            /* Pack and write */
-            for (int i = 0; i < degree; i++) {
-                stepBuf[i * 2]     = (float)rootRe[i];
-                stepBuf[i * 2 + 1] = (float)rootIm[i];
-            }
-            fwrite(stepBuf, sizeof(float), degree * 2, fout);
+        /* Write the row at its offset in the stripe output */
+        if (writeRow(gc->out, gr.row, i1, (int)gr.n, degree, block, gr.pos) != 0) {
+            gc->failed = 1;
+            break;
         }
+        if (gc->ckpt)
+            gridCkptSave(gc->ckpt, gc->slot, i1 + 1, rf.iters, rf.prevRe, rf.prevIm);
     }
 
     clock_gettime(CLOCK_MONOTONIC, &t1);
-    long elapsed_us = (t1.tv_sec - t0.tv_sec) * 1000000L +
-                      (t1.tv_nsec - t0.tv_nsec) / 1000L;
-
-    fclose(fout);
-    free(stepBuf);
-
-    long dataBytes = totalSteps * degree * 2 * sizeof(float);
-    double avgIters = totalSteps > 0 ? (double)totalIters / totalSteps : 0;
-
-    printf("{\"mode\":\"grid\",\"function\":\"%s\","
-           "\"degree\":%d,\"n1\":%d,\"n2\":%d,"
-           "\"i1_start\":%d,\"i1_end\":%d,"
-           "\"n_t\":%ld,\"stride\":%d,\"matched\":%s,"
-           "\"data_bytes\":%ld,\"elapsed_us\":%ld,"
-           "\"avg_iterations\":%.2f}\n",
-           funcName, degree, n1, n2,
-           i1_start, i1_end,
-           totalSteps, degree * 2, doMatch ? "true" : "false",
-           dataBytes, elapsed_us, avgIters);
-
-    return 0;
+    gc->elapsed_us = (t1.tv_sec - t0.tv_sec) * 1000000L +
+                     (t1.tv_nsec - t0.tv_nsec) / 1000L;
+    gc->totalIters = rf.iters;
+    gc->solves = rf.solves;
+    gc->steps = rf.steps;
+    if (gr.hb) {
+        renderFlush(gc->render, gr.hb);
+        gc->plotted = gr.hb->plotted;
+        gc->clipped = gr.hb->clipped;
+    }
+    free(gr.row);
+    free(gr.pos);
+    free(block);
+    free(gr.hb);
+    free(batchRe);
+    free(batchIm);
+    exprStateFree(&es);
+    return NULL;
 }
 
+/* SIMD variant of runGridChain: EA_LANES consecutive rows advance in
+ * lockstep, one row per lane, all in the same serpentine direction, and
+ * each lane warm-starts from its own previous step.  Points whose
+ * polynomial loses its leading coefficient fall back to the scalar solver
+ * for that lane.  Roots agree with the scalar chain up to rounding and
+ * root order (a lane's warm start at a row boundary is EA_LANES rows back
+ * instead of one). */
+static void *runGridChainLanes(void *arg) {
+    GridChain *gc = (GridChain *)arg;
+    int n2 = gc->n2, degree = gc->degree;
+    int nC = degree + 1;
+    size_t rowFloats = (size_t)n2 * degree * 2;
+
+    float *rowBuf = NULL;
+    unsigned char *block = NULL;
+    HitBuf *hb = NULL;
+    if (gc->render) hb = calloc(1, sizeof(HitBuf));
+    else if (!gc->hist) rowBuf = malloc(EA_LANES * rowFloats * sizeof(float));
+    int encoded = rowBuf && gc->out->encoding != ROOTS_F32;
+    if (encoded) block = malloc(rootsBlockBound(n2, degree, gc->out->encoding));
+    double *laneRe = malloc((size_t)EA_LANES * MAX_COEFFS * sizeof(double));
+    double *laneIm = malloc((size_t)EA_LANES * MAX_COEFFS * sizeof(double));
+    /* Vectors need their natural alignment (32 bytes for AVX) */
+    vdbl *cv = aligned_alloc(sizeof(vdbl), 2 * (size_t)nC * sizeof(vdbl));
+    vdbl *rR = aligned_alloc(sizeof(vdbl), 2 * (size_t)MAX_DEGREE * sizeof(vdbl));
+    double (*lRe)[MAX_DEGREE] = malloc(4 * EA_LANES * sizeof(*lRe));
+    ExprState es = {0};
+    double *batchRe = NULL, *batchIm = NULL;
+    double batchX2[EXPR_BATCH];
+    int failed = (!rowBuf && !hb && !gc->hist) || (encoded && !block) || !laneRe || !laneIm || !cv || !rR || !lRe;
+    if (!failed && gc->prog) {
+        size_t n = (size_t)EA_LANES * EXPR_BATCH * nC;
+        batchRe = malloc(n * sizeof(double));
+        batchIm = malloc(n * sizeof(double));
+        failed = !batchRe || !batchIm || exprStateInit(&es, gc->prog) != 0;
+    }
+    if (failed) {
+        free(rowBuf); free(block); free(hb); free(laneRe); free(laneIm); free(cv); free(rR); free(lRe);
+        free(batchRe); free(batchIm); exprStateFree(&es);
+        gc->failed = 1;
+        return NULL;
+    }
+    vdbl *cvRe = cv, *cvIm = cv + nC;
+    vdbl *rRe = rR, *rIm = rR + MAX_DEGREE;
+    /* Per-lane scratch: roots and previous roots */
+    double (*lIm)[MAX_DEGREE] = lRe + EA_LANES;
+    double (*prevRe)[MAX_DEGREE] = lRe + 2 * EA_LANES;
+    double (*prevIm)[MAX_DEGREE] = lRe + 3 * EA_LANES;
+
+    /* Initial guesses, the same in every lane */
+    for (int k = 0; k < degree; k++) {
+        double ang = 2.0 * M_PI * k / degree + 0.3;
+        double r = 1.0 + 0.1 * k / degree;
+        for (int l = 0; l < EA_LANES; l++) {
+            rRe[k][l] = r * cos(ang);
+            rIm[k][l] = r * sin(ang);
+        }
+    }
 
+    struct timespec t0, t1;
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+
+    long totalIters = 0;
+    int havePrev = 0;
+
+    /* Resumed: carry on from the checkpointed group, each lane with its
+     * warm start */
+    int first = gc->i1_start;
+    if (gc->ckpt && gc->ckpt->slots[gc->slot].next > first) {
+        GridSlot *gs = &gc->ckpt->slots[gc->slot];
+        first = gs->next;
+        totalIters = gs->totalIters;
+        memcpy(rRe, gs->roots, degree * sizeof(vdbl));
+        memcpy(rIm, (char *)gs->roots + degree * sizeof(vdbl), degree * sizeof(vdbl));
+        for (int l = 0; l < EA_LANES; l++)
+            for (int i = 0; i < degree; i++) {
+                prevRe[l][i] = rRe[i][l];
+                prevIm[l][i] = rIm[i][l];
+            }
+        havePrev = 1;
+    }
+
+    for (int g = first; g < gc->i1_end && !gc->failed; g += EA_LANES) {
+        int nl = gc->i1_end - g < EA_LANES ? gc->i1_end - g : EA_LANES;
+        int back = ((g - gc->i1_start) / EA_LANES) & 1;
+
+        for (int j = 0; j < n2; j++) {
+            int i2 = back ? (n2 - 1 - j) : j;
+            double x2 = (double)i2 / (double)n2;
+
+            /* Coefficients per lane; lanes past the last row reuse lane 0 */
+            const double *cRe[EA_LANES], *cIm[EA_LANES];
+            if (gc->prog) {
+                int lane = j % EXPR_BATCH;
+                size_t laneStride = (size_t)EXPR_BATCH * nC;
+                if (lane == 0) {
+                    int nb = n2 - j < EXPR_BATCH ? n2 - j : EXPR_BATCH;
+                    for (int b = 0; b < nb; b++) {
+                        int b2 = back ? (n2 - 1 - j - b) : j + b;
+                        batchX2[b] = (double)b2 / (double)n2;
+                    }
+                    for (int l = 0; l < nl; l++)
+                        exprEval(&es, (double)(g + l) / (double)gc->n1, batchX2, nb,
+                                 batchRe + l * laneStride, batchIm + l * laneStride);
+                }
+                for (int l = 0; l < EA_LANES; l++) {
+                    int src = l < nl ? l : 0;
+                    cRe[l] = batchRe + src * laneStride + (size_t)lane * nC;
+                    cIm[l] = batchIm + src * laneStride + (size_t)lane * nC;
+                }
+            } else {
+                int nCoeffs;
+                for (int l = 0; l < EA_LANES; l++) {
+                    int src = l < nl ? l : 0;
+                    if (l == src)
+                        gc->coeffFunc((double)(g + l) / (double)gc->n1, x2,
+                                      laneRe + l * MAX_COEFFS, laneIm + l * MAX_COEFFS,
+                                      &nCoeffs);
+                    cRe[l] = laneRe + src * MAX_COEFFS;
+                    cIm[l] = laneIm + src * MAX_COEFFS;
+                }
+            }
+
+            /* Full-degree lanes go through the batched solver */
+            vmask vec = {0};
+            for (int l = 0; l < nl; l++) {
+                double lead = cRe[l][0] * cRe[l][0] + cIm[l][0] * cIm[l][0];
+                vec[l] = (lead >= 1e-30 && degree > 1) ? -1 : 0;
+            }
+            for (int k = 0; k < nC; k++)
+                for (int l = 0; l < EA_LANES; l++) {
+                    cvRe[k][l] = cRe[l][k];
+                    cvIm[k][l] = cIm[l][k];
+                }
+            int iters[EA_LANES];
+            solveEABatch(cvRe, cvIm, nC, rRe, rIm, degree, &vec, iters);
+
+            for (int l = 0; l < nl; l++) {
+                for (int i = 0; i < degree; i++) { lRe[l][i] = rRe[i][l]; lIm[l][i] = rIm[i][l]; }
+                int effDeg = degree;
+                if (!vec[l])
+                    iters[l] = solveLane(cRe[l], cIm[l], nC, lRe[l], lIm[l], degree, &effDeg);
+                totalIters += iters[l];
+
+                /* Match roots, save for warm-start, pack into the lane's row */
+                if (gc->doMatch && havePrev && effDeg > 1)
+                    matchRoots(lRe[l], lIm[l], prevRe[l], prevIm[l], effDeg);
+                memcpy(prevRe[l], lRe[l], degree * sizeof(double));
+                memcpy(prevIm[l], lIm[l], degree * sizeof(double));
+                for (int i = 0; i < degree; i++) {
+                    rRe[i][l] = lRe[l][i];
+                    rIm[i][l] = lIm[l][i];
+                }
+                if (hb) {
+                    renderStep(gc->render, hb, lRe[l], lIm[l], degree);
+                    continue;
+                }
+                if (gc->hist) {
+                    for (int i = 0; i < degree; i++) histAdd(gc->hist, lRe[l][i], lIm[l][i]);
+                    continue;
+                }
+                /* Same in-row layout as the scalar chain: odd rows reversed */
+                int pos = ((g + l) & 1) ? (n2 - 1 - i2) : i2;
+                float *stepBuf = rowBuf + l * rowFloats + (size_t)pos * degree * 2;
+                for (int i = 0; i < degree; i++) {
+                    stepBuf[i * 2]     = (float)lRe[l][i];
+                    stepBuf[i * 2 + 1] = (float)lIm[l][i];
+                }
+            }
+            havePrev = 1;
+        }
+
+        /* Write each lane's row at its offset in the stripe output */
+        for (int l = 0; l < nl && rowBuf; l++) {
+            if (writeRow(gc->out, rowBuf + l * rowFloats, g + l, n2, degree, block, NULL) != 0) {
+                gc->failed = 1;
+                break;
+            }
+        }
+        if (gc->ckpt && !gc->failed)
+            gridCkptSave(gc->ckpt, gc->slot, g + nl, totalIters, rRe, rIm);
+    }
+
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    gc->elapsed_us = (t1.tv_sec - t0.tv_sec) * 1000000L +
+                     (t1.tv_nsec - t0.tv_nsec) / 1000L;
+    gc->totalIters = totalIters;
+    if (hb) {
+        renderFlush(gc->render, hb);
+        gc->plotted = hb->plotted;
+        gc->clipped = hb->clipped;
+    }
+    free(rowBuf); free(block); free(hb); free(laneRe); free(laneIm); free(cv); free(rR); free(lRe);
+    free(batchRe); free(batchIm);
+    exprStateFree(&es);
+    return NULL;
+}
+
+/* Grid mode, or render mode with `render` set: outPath is then the raw
+ * image (or the tile prefix plus .raw) instead of the .bin. */
+static int runGrid(const char *buf, const char *outPath, int render) {
+    /* Parse function name */
+    char funcName[64] = "";
+    const char *cp = findKey(buf, "function");
+    if (cp) parseString(cp, funcName, sizeof(funcName));
+
+    /* Parse grid dimensions */
+    int n1 = 100, n2 = 100;
+    cp = findKey(buf, "n1");
+    if (cp) n1 = (int)parseNum(&cp);
+    cp = findKey(buf, "n2");
+    if (cp) n2 = (int)parseNum(&cp);
+    if (n1 < 1) n1 = 1;
+    if (n2 < 1) n2 = 1;
+
+    /* Optional stripe range: i1_start..i1_end (for parallel fan-out) */
+    int i1_start = 0, i1_end = n1;
+    cp = findKey(buf, "i1_start");
+    if (cp) i1_start = (int)parseNum(&cp);
+    cp = findKey(buf, "i1_end");
+    if (cp) i1_end = (int)parseNum(&cp);
+    if (i1_start < 0) i1_start = 0;
+    if (i1_end > n1) i1_end = n1;
+    if (i1_start >= i1_end) {
+        fprintf(stderr, "Empty stripe: i1_start=%d >= i1_end=%d\n", i1_start, i1_end);
+        return 1;
+    }
+    int stripeRows = i1_end - i1_start;
+
+    /* A density histogram (root_hist.h) instead of the .bin */
+    int histogram = 0;
+    cp = findKey(buf, "histogram");
+    if (cp) histogram = !render && parseBool(cp);
+
+    /* Bounds the .bin; render and histogram runs write none */
+    if (!render && !histogram && (long)stripeRows * n2 > 10000000) {
+        fprintf(stderr, "Stripe too large: %d x %d\n", stripeRows, n2);
+        return 1;
+    }
+
+    int doMatch = 1;
+    cp = findKey(buf, "match_roots");
+    if (cp) doMatch = parseBool(cp);
+
+    /* Optional threads: split the stripe into sub-stripes, one
+     * serpentine warm-start chain per thread */
+    int nThreads = 1;
+    cp = findKey(buf, "threads");
+    if (cp) nThreads = (int)parseNum(&cp);
+    if (nThreads > MAX_THREADS) nThreads = MAX_THREADS;
+    if (nThreads > stripeRows) nThreads = stripeRows;
+    if (nThreads < 1) nThreads = 1;
+
+    int simd = 0;
+    cp = findKey(buf, "simd");
+    if (cp) simd = parseBool(cp);
+
+    /* Root file encoding (root_codec.h) and its precision floor */
+    char encName[16] = "";
+    cp = findKey(buf, "encoding");
+    if (cp) parseString(cp, encName, sizeof(encName));
+    int encoding = rootsEncoding(encName);
+    if (encoding < 0) {
+        fprintf(stderr, "Unknown encoding: %s\n", encName);
+        return 1;
+    }
+    double quantum = 0, anchor[2] = {0, 0};
+    cp = findKey(buf, "quantum");
+    if (cp) quantum = parseNum(&cp);
+    cp = findKey(buf, "anchor_re");
+    if (cp) anchor[0] = parseNum(&cp);
+    cp = findKey(buf, "anchor_im");
+    if (cp) anchor[1] = parseNum(&cp);
+
+    /* Checkpointing (not render or histogram runs: their canvas lives in
+     * memory) */
+    double checkpointS = 0;
+    cp = findKey(buf, "checkpoint_s");
+    if (cp) checkpointS = parseNum(&cp);
+    int resume = 0;
+    cp = findKey(buf, "resume");
+    if (cp) resume = parseBool(cp);
+    if (render || histogram) checkpointS = 0, resume = 0;
+
+    /* Adaptive refinement along rows: appended rows of varying length */
+    double refine = 0;
+    int refineDepth = 4;
+    cp = findKey(buf, "refine");
+    if (cp) refine = parseNum(&cp);
+    cp = findKey(buf, "refine_depth");
+    if (cp) refineDepth = (int)parseNum(&cp);
+    if (refineDepth < 1) refineDepth = 1;
+    if (refineDepth > REFINE_MAX_DEPTH) refineDepth = REFINE_MAX_DEPTH;
+    if (refine <= 0) refine = 0, refineDepth = 0;
+    if (refine > 0 && !render && (encoding != ROOTS_F32 || checkpointS > 0 || resume)) {
+        fprintf(stderr, "refine needs encoding f32 and no checkpoint_s or resume\n");
+        return 1;
+    }
+    /* Refined rows cannot move in lockstep across lanes */
+    if (refine > 0 && simd) {
+        fprintf(stderr, "refine cannot be combined with simd\n");
+        return 1;
+    }
+    /* Refined stretches would be over-counted */
+    if (refine > 0 && histogram) {
+        fprintf(stderr, "refine cannot be combined with histogram\n");
+        return 1;
+    }
+    uint64_t fingerprint = ckptHash(FNV_OFFSET, funcName, strlen(funcName));
+
+    /* Compile the expression program, or look up a built-in function */
+    CoeffFunc coeffFunc = NULL;
+    ExprProg *prog = NULL;
+    int nCoeffs;
+    cp = findKey(buf, "expr");
+    if (cp && *cp == '"') {
+        char *src = malloc(strlen(cp) + 1);
+        char err[160];
+        if (!src) { fprintf(stderr, "malloc failed\n"); return 1; }
+        parseString(cp, src, (int)strlen(cp) + 1);
+        prog = exprCompile(src, err, sizeof(err));
+        fingerprint = ckptHash(fingerprint, src, strlen(src));
+        free(src);
+        if (!prog) {
+            fprintf(stderr, "Bad expr: %s\n", err);
+            return 1;
+        }
+        if (!funcName[0]) strcpy(funcName, "expr");
+        nCoeffs = prog->nCoeffs;
+    } else {
+        coeffFunc = lookupFunction(funcName);
+        if (!coeffFunc) {
+            fprintf(stderr, "Unknown function: %s\n", funcName);
+            return 1;
+        }
+        /* Probe degree by evaluating at (0,0) */
+        double coeffRe[MAX_COEFFS], coeffIm[MAX_COEFFS];
+        coeffFunc(0.0, 0.0, coeffRe, coeffIm, &nCoeffs);
+    }
+    int degree = nCoeffs - 1;
+
+    long totalSteps = (long)stripeRows * n2;
+    long f32Bytes = totalSteps * degree * 2 * sizeof(float);
+    long dataBytes = render || histogram ? 0 : f32Bytes;
+
+    /* Render mode: viewport and color settings, as imgpipe --roots2image */
+    RenderCtx *rc = NULL;
+    char colorStr[16] = "rainbow", constColorStr[16] = "ffffff";
+    if (render) {
+        rc = calloc(1, sizeof(RenderCtx));
+        if (!rc) { fprintf(stderr, "malloc failed\n"); exprFree(prog); return 1; }
+        int W = 4096, H = 4096, tile = 0, slots = 0;
+        rc->scale = 100.0;
+        cp = findKey(buf, "width");
+        if (cp) W = (int)parseNum(&cp);
+        cp = findKey(buf, "height");
+        if (cp) H = (int)parseNum(&cp);
+        cp = findKey(buf, "tile");
+        if (cp) tile = (int)parseNum(&cp);
+        cp = findKey(buf, "resident_tiles");
+        if (cp) slots = (int)parseNum(&cp);
+        cp = findKey(buf, "center_re");
+        if (cp) rc->centerRe = parseNum(&cp);
+        cp = findKey(buf, "center_im");
+        if (cp) rc->centerIm = parseNum(&cp);
+        cp = findKey(buf, "scale");
+        if (cp) rc->scale = parseNum(&cp);
+        cp = findKey(buf, "color");
+        if (cp) parseString(cp, colorStr, sizeof(colorStr));
+        cp = findKey(buf, "constant_color");
+        if (cp) parseString(cp, constColorStr, sizeof(constColorStr));
+
+        const char *bad = NULL;
+        int maxDim = tile ? MAX_CANVAS : MAX_FRAME;
+        if (W < 1 || W > maxDim || H < 1 || H > maxDim) bad = "Invalid dimensions";
+        else if (tile < 0 || tile > MAX_FRAME) bad = "Invalid tile size";
+        else if (strcmp(colorStr, "rainbow") != 0 && strcmp(colorStr, "constant") != 0)
+            bad = "Render mode supports color rainbow or constant";
+        if (bad) {
+            fprintf(stderr, "%s\n", bad);
+            free(rc); exprFree(prog);
+            return 1;
+        }
+
+        unsigned int constHex = 0xffffff;
+        sscanf(constColorStr, "%x", &constHex);
+        for (int i = 0; i < degree; i++) {
+            if (colorStr[0] == 'r') {
+                rainbowRGB(i, degree, &rc->palR[i], &rc->palG[i], &rc->palB[i]);
+            } else {
+                rc->palR[i] = (constHex >> 16) & 0xff;
+                rc->palG[i] = (constHex >> 8) & 0xff;
+                rc->palB[i] = constHex & 0xff;
+            }
+        }
+
+        if (canvasInit(&rc->cv, W, H, tile, slots, outPath) != 0) {
+            fprintf(stderr, "Cannot allocate %dx%d canvas\n", W, H);
+            canvasFree(&rc->cv);
+            free(rc); exprFree(prog);
+            return 1;
+        }
+        pthread_mutex_init(&rc->lock, NULL);
+    }
+
+    /* Histogram: one per thread, added up at the end */
+    RootHist hists[MAX_THREADS];
+    if (histogram) {
+        int ok = parseHistogram(buf, &hists[0]) == 1;
+        int made = ok;
+        for (; ok && made < nThreads; made++) {
+            RootHist *h0 = &hists[0];
+            ok = histInit(&hists[made], h0->width, h0->height, h0->centerRe, h0->centerIm,
+                          h0->halfRe, h0->halfIm, h0->flags) == 0;
+        }
+        if (!ok) {
+            for (int t = 0; t < made; t++) histFree(&hists[t]);
+            if (made) fprintf(stderr, "Cannot allocate histograms\n");
+            exprFree(prog);
+            return 1;
+        }
+    }
+
+    /* Open and preallocate output (encoded files grow block by block) */
+    RootWriter out = { .fd = -1, .encoding = render ? ROOTS_F32 : encoding,
+                       .quantum = quantum, .anchor = {anchor[0], anchor[1]},
+                       .i1_base = i1_start,
+                       .next = refine > 0 ? 0 : ROOTS_HEADER_BYTES, .posFd = -1 };
+    GridCkpt ckpt = { .outPath = outPath, .interval = checkpointS, .out = &out,
+                      .stripeRows = stripeRows, .nSlots = nThreads,
+                      .rootBytes = 2 * degree * sizeof(double) * (simd ? EA_LANES : 1) };
+    int resumed = 0;
+    if (!render && !histogram) {
+        if (encoding != ROOTS_F32)
+            out.index = calloc(stripeRows, sizeof(uint64_t));
+        if (checkpointS > 0 || resume) {
+            int dims[9] = {n1, n2, i1_start, i1_end, degree, nThreads, simd, encoding, doMatch};
+            double prec[3] = {quantum, anchor[0], anchor[1]};
+            fingerprint = ckptHash(fingerprint, dims, sizeof dims);
+            ckpt.fingerprint = ckptHash(fingerprint, prec, sizeof prec);
+            ckpt.slots = calloc(nThreads, sizeof(GridSlot));
+        }
+        /* Resume into the existing file; anything unusable starts over */
+        if (resume && ckpt.slots) {
+            size_t n;
+            unsigned char *ck = ckptRead(outPath, ckpt.fingerprint, &n);
+            if (ck && gridCkptLoad(&ckpt, ck, n) == 0)
+                out.fd = open(outPath, O_WRONLY);
+            free(ck);
+            resumed = out.fd >= 0;
+            if (!resumed) {
+                memset(ckpt.slots, 0, nThreads * sizeof(GridSlot));
+                if (out.index) memset(out.index, 0, stripeRows * sizeof(uint64_t));
+                out.next = ROOTS_HEADER_BYTES;
+            }
+        }
+        if (!resumed)
+            out.fd = open(outPath, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+        if (refine > 0) {
+            char posPath[1100];
+            snprintf(posPath, sizeof posPath, "%s.pos", outPath);
+            out.posFd = open(posPath, O_WRONLY | O_CREAT | O_TRUNC, 0644);
+        }
+        if (out.fd < 0 || (refine > 0 ? out.posFd < 0
+                           : encoding == ROOTS_F32 ? ftruncate(out.fd, dataBytes) != 0
+                                                   : !out.index) ||
+            ((checkpointS > 0 || resume) && !ckpt.slots)) {
+            fprintf(stderr, "Cannot open %s for writing\n", outPath);
+            if (out.fd >= 0) close(out.fd);
+            if (out.posFd >= 0) close(out.posFd);
+            free(out.index);
+            free(ckpt.slots);
+            exprFree(prog);
+            return 1;
+        }
+        pthread_mutex_init(&out.lock, NULL);
+        pthread_mutex_init(&ckpt.lock, NULL);
+        clock_gettime(CLOCK_MONOTONIC, &ckpt.last);
+    }
+
+    /* Sub-stripes: contiguous row ranges, as even as possible */
+    GridChain chains[MAX_THREADS];
+    for (int t = 0; t < nThreads; t++) {
+        GridChain *gc = &chains[t];
+        gc->coeffFunc = coeffFunc;
+        gc->prog = prog;
+        gc->n1 = n1; gc->n2 = n2;
+        gc->degree = degree; gc->doMatch = doMatch;
+        gc->simd = simd;
+        gc->refine = refine;
+        gc->refineDepth = refineDepth;
+        gc->i1_base = i1_start;
+        gc->i1_start = i1_start + (int)((long)stripeRows * t / nThreads);
+        gc->i1_end = i1_start + (int)((long)stripeRows * (t + 1) / nThreads);
+        gc->out = &out;
+        gc->render = rc;
+        gc->hist = histogram ? &hists[t] : NULL;
+        gc->ckpt = ckpt.slots ? &ckpt : NULL;
+        gc->slot = t;
+        gc->plotted = 0; gc->clipped = 0;
+        gc->totalIters = 0; gc->solves = 0; gc->steps = 0;
+        gc->elapsed_us = 0; gc->failed = 0;
+    }
+
+    struct timespec t0, t1;
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+
+    /* Refinement breaks the lanes' lockstep: it always runs scalar */
+    void *(*chainFn)(void *) = simd ? runGridChainLanes : runGridChain;
+    if (nThreads == 1) {
+        chainFn(&chains[0]);
+    } else {
+        pthread_t tids[MAX_THREADS];
+        int started = 0;
+        for (int t = 0; t < nThreads; t++) {
+            if (pthread_create(&tids[t], NULL, chainFn, &chains[t]) != 0) break;
+            started++;
+        }
+        /* Run anything that could not get a thread on this one */
+        for (int t = started; t < nThreads; t++) chainFn(&chains[t]);
+        for (int t = 0; t < started; t++) pthread_join(tids[t], NULL);
+    }
+
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    long elapsed_us = (t1.tv_sec - t0.tv_sec) * 1000000L +
+                      (t1.tv_nsec - t0.tv_nsec) / 1000L;
+
+    exprFree(prog);
+
+    long totalIters = 0, plotted = 0, clipped = 0, solves = 0, steps = 0;
+    int failed = 0;
+    for (int t = 0; t < nThreads; t++) {
+        if (chains[t].failed) {
+            fprintf(stderr, "%s failed (rows %d..%d)\n",
+                    render ? "Render" : histogram ? "Histogram" : "Write",
+                    chains[t].i1_start, chains[t].i1_end);
+            failed = 1;
+        }
+        totalIters += chains[t].totalIters;
+        solves += chains[t].solves;
+        steps += chains[t].steps;
+        plotted += chains[t].plotted;
+        clipped += chains[t].clipped;
+    }
+
+    /* Encoded file: the row index after the blocks, then the header */
+    if (out.index) {
+        if (!failed) {
+            unsigned char hdr[ROOTS_HEADER_BYTES];
+            RootsHeader h = { .encoding = encoding, .degree = degree,
+                              .nBlocks = (uint32_t)stripeRows, .blockSteps = (uint32_t)n2,
+                              .indexOffset = (uint64_t)out.next };
+            rootsWriteHeader(hdr, &h);
+            size_t indexBytes = (size_t)stripeRows * sizeof(uint64_t);
+            dataBytes = out.next + (long)indexBytes;
+            if (pwrite(out.fd, out.index, indexBytes, out.next) != (ssize_t)indexBytes ||
+                pwrite(out.fd, hdr, sizeof(hdr), 0) != (ssize_t)sizeof(hdr)) {
+                fprintf(stderr, "Write to %s failed (index)\n", outPath);
+                failed = 1;
+            }
+        }
+        free(out.index);
+    }
+    if (!render && !histogram) {
+        pthread_mutex_destroy(&out.lock);
+        pthread_mutex_destroy(&ckpt.lock);
+        if (close(out.fd) != 0) failed = 1;
+        if (out.posFd >= 0 && close(out.posFd) != 0) failed = 1;
+        if (refine > 0) dataBytes = out.next;
+        if (!failed && ckpt.slots) ckptRemove(outPath);
+        free(ckpt.slots);
+        free(ckpt.buf.data);
+    }
+    if (!refine) solves = steps = totalSteps;
+    double avgIters = solves > 0 ? (double)totalIters / solves : 0;
+
+    /* Render mode: write the raw image, or the tile parts still held */
+    if (rc && !failed) {
+        dataBytes = rc->cv.failed ? -1 : canvasFinish(&rc->cv);
+        if (dataBytes < 0) {
+            fprintf(stderr, "Cannot write the canvas (out of memory or disk)\n");
+            failed = 1;
+        }
+    }
+    /* Histogram: add the threads' counts and write it */
+    if (histogram && !failed) {
+        for (int t = 1; t < nThreads && !failed; t++)
+            failed = histMerge(&hists[0], &hists[t]) != 0;
+        if (!failed) failed = histWrite(&hists[0], outPath) != 0;
+        if (failed) fprintf(stderr, "Write to %s failed (histogram)\n", outPath);
+        dataBytes = HIST_HEADER_BYTES + (long)hists[0].width * hists[0].height * 4;
+    }
+    for (int t = 1; t < nThreads && histogram; t++) histFree(&hists[t]);
+    if (failed) {
+        if (rc) { canvasFree(&rc->cv); free(rc); }
+        if (histogram) histFree(&hists[0]);
+        return 1;
+    }
+
+    printf("{\"mode\":\"%s\",\"function\":\"%s\","
+           "\"degree\":%d,\"n1\":%d,\"n2\":%d,"
+           "\"i1_start\":%d,\"i1_end\":%d,"
+           "\"n_t\":%ld,\"stride\":%d,\"matched\":%s,"
+           "\"data_bytes\":%ld,\"elapsed_us\":%ld,"
+           "\"avg_iterations\":%.2f,\"simd_lanes\":%d,",
+           render ? "render" : "grid", funcName, degree, n1, n2,
+           i1_start, i1_end,
+           totalSteps, degree * 2, doMatch ? "true" : "false",
+           dataBytes, elapsed_us, avgIters, simd ? EA_LANES : 1);
+    if (refine > 0)
+        printf("\"refine\":%g,\"refine_depth\":%d,\"steps\":%ld,\"solves\":%ld,",
+               refine, refineDepth, steps, solves);
+    if (ckpt.slots)
+        printf("\"resumed\":%s,\"checkpoints\":%d,",
+               resumed ? "true" : "false", ckpt.written);
+    if (histogram) {
+        printHistogram(&hists[0]);
+        histFree(&hists[0]);
+    } else if (!render && encoding != ROOTS_F32)
+        printf("\"encoding\":\"%s\",\"quantum\":%.6g,\"f32_bytes\":%ld,",
+               encName, quantum, f32Bytes);
+    if (rc) {
+        /* Same fields as imgpipe --roots2image */
+        printf("\"roots_plotted\":%ld,\"roots_clipped\":%ld,\"color\":\"%s\","
+               "\"match\":\"none\",", plotted, clipped, colorStr);
+        if (colorStr[0] == 'c')
+            printf("\"constant_color\":\"%s\",", constColorStr);
+        if (rc->cv.tile) {
+            /* Non-empty tiles as [tx, ty, hits, parts] */
+            printf("\"tile\":%d,\"tiles_x\":%d,\"tiles_y\":%d,\"resident_tiles\":%d,"
+                   "\"tiles\":[", rc->cv.tile, rc->cv.tilesX, rc->cv.tilesY, rc->cv.nSlots);
+            int first = 1;
+            for (int i = 0; i < rc->cv.tilesX * rc->cv.tilesY; i++) {
+                if (rc->cv.hits[i] == 0) continue;
+                printf("%s[%d,%d,%ld,%d]", first ? "" : ",",
+                       i % rc->cv.tilesX, i / rc->cv.tilesX, rc->cv.hits[i], rc->cv.parts[i]);
+                first = 0;
+            }
+            printf("],");
+        }
+        canvasFree(&rc->cv);
+        pthread_mutex_destroy(&rc->lock);
+        free(rc);
+    }
+    printf("\"threads\":[");
+    for (int t = 0; t < nThreads; t++) {
+        long chainSteps = (long)(chains[t].i1_end - chains[t].i1_start) * n2;
+        long chainSolves = refine ? chains[t].solves : chainSteps;
+        printf("%s{\"i1_start\":%d,\"i1_end\":%d,\"n_t\":%ld,"
+               "\"elapsed_us\":%ld,\"avg_iterations\":%.2f}",
+               t ? "," : "", chains[t].i1_start, chains[t].i1_end, chainSteps,
+               chains[t].elapsed_us,
+               chainSolves > 0 ? (double)chains[t].totalIters / chainSolves : 0.0);
+    }
+    printf("]}\n");
+
+    return 0;
+}
+
+
+/* ---- Steploop mode: a browser fast-mode setup, run as step_loop.c does ---- */
+
+#define HUNGARIAN_MAX 32    /* step_loop.c's cap; larger root sets match greedily */
+
+/* Kuhn-Munkres assignment of new roots to old, as step_loop.c's hungarianMatch */
+static void hungarianMatch(double *newRe, double *newIm,
+                           double *oldRe, double *oldIm, int n)
+{
+    if (n > HUNGARIAN_MAX) {
+        matchRoots(newRe, newIm, oldRe, oldIm, n);
+        return;
+    }
+    double cost[HUNGARIAN_MAX * HUNGARIAN_MAX];
+    for (int i = 0; i < n; i++)
+        for (int j = 0; j < n; j++) {
+            double dr = newRe[j] - oldRe[i], di = newIm[j] - oldIm[i];
+            cost[i * n + j] = dr * dr + di * di;
+        }
+
+    double u[HUNGARIAN_MAX + 2], v[HUNGARIAN_MAX + 2];
+    int p[HUNGARIAN_MAX + 2], way[HUNGARIAN_MAX + 2];
+    for (int i = 0; i <= n; i++) { u[i] = 0; v[i] = 0; p[i] = 0; }
+
+    for (int i = 1; i <= n; i++) {
+        p[0] = i;
+        int j0 = 0;
+        double minv[HUNGARIAN_MAX + 2];
+        unsigned char used[HUNGARIAN_MAX + 2];
+        for (int j = 0; j <= n; j++) { minv[j] = 1e18; used[j] = 0; }
+        do {
+            used[j0] = 1;
+            int i0 = p[j0], j1 = -1;
+            double delta = 1e18;
+            for (int j = 1; j <= n; j++) {
+                if (used[j]) continue;
+                double cur = cost[(i0 - 1) * n + (j - 1)] - u[i0] - v[j];
+                if (cur < minv[j]) { minv[j] = cur; way[j] = j0; }
+                if (minv[j] < delta) { delta = minv[j]; j1 = j; }
+            }
+            for (int j = 0; j <= n; j++) {
+                if (used[j]) { u[p[j]] += delta; v[j] -= delta; }
+                else minv[j] -= delta;
+            }
+            j0 = j1;
+        } while (p[j0] != 0);
+        do { int j1 = way[j0]; p[j0] = p[j1]; j0 = j1; } while (j0);
+    }
+
+    double tRe[HUNGARIAN_MAX], tIm[HUNGARIAN_MAX];
+    for (int j = 1; j <= n; j++) {
+        tRe[p[j] - 1] = newRe[j - 1];
+        tIm[p[j] - 1] = newIm[j - 1];
+    }
+    memcpy(newRe, tRe, n * sizeof(double));
+    memcpy(newIm, tIm, n * sizeof(double));
+}
+
+/* Ranks of raw[] scaled to [0, 1] (ties share a rank; non-finite values
+ * rank with the largest finite one) */
+static void rankNorm(const double *raw, double *result, int n)
+{
+    double maxFinite = -1e300;
+    for (int i = 0; i < n; i++)
+        if (raw[i] == raw[i] && raw[i] < 1e300 && raw[i] > maxFinite) maxFinite = raw[i];
+    if (maxFinite <= -1e300 || n < 2) {
+        for (int i = 0; i < n; i++) result[i] = 0.5;
+        return;
+    }
+    double vals[MAX_COEFFS];
+    int idxs[MAX_COEFFS];
+    for (int i = 0; i < n; i++) {
+        vals[i] = (raw[i] == raw[i] && raw[i] < 1e300) ? raw[i] : maxFinite;
+        idxs[i] = i;
+    }
+    for (int i = 1; i < n; i++) {
+        double v = vals[i];
+        int ix = idxs[i], j = i - 1;
+        while (j >= 0 && vals[j] > v) {
+            vals[j + 1] = vals[j];
+            idxs[j + 1] = idxs[j];
+            j--;
+        }
+        vals[j + 1] = v;
+        idxs[j + 1] = ix;
+    }
+    int rank = 0;
+    for (int k = 0; k < n; k++) {
+        if (k > 0 && vals[k] != vals[k - 1]) rank = k;
+        result[idxs[k]] = (double)rank / (n - 1);
+    }
+}
+
+/* Root sensitivity to the selected coefficients: sum |z|^(deg-k) / |p'(z)| */
+static void computeSens(const double *cRe, const double *cIm, int nc,
+                        const double *rRe, const double *rIm, int nr,
+                        const int *sel, int nSel, double *sens)
+{
+    int deg = nc - 1;
+    for (int j = 0; j < nr; j++) {
+        double zRe = rRe[j], zIm = rIm[j];
+        double pRe = cRe[0], pIm = cIm[0], dpRe = 0, dpIm = 0;
+        for (int k = 1; k <= deg; k++) {
+            double ndR = dpRe * zRe - dpIm * zIm + pRe;
+            double ndI = dpRe * zIm + dpIm * zRe + pIm;
+            dpRe = ndR; dpIm = ndI;
+            double npR = pRe * zRe - pIm * zIm + cRe[k];
+            double npI = pRe * zIm + pIm * zRe + cIm[k];
+            pRe = npR; pIm = npI;
+        }
+        double dpMag2 = dpRe * dpRe + dpIm * dpIm;
+        if (dpMag2 < 1e-60) { sens[j] = 1e300; continue; }
+        double rMag = sqrt(zRe * zRe + zIm * zIm);
+        double pows[MAX_COEFFS];
+        pows[0] = 1.0;
+        for (int k = 1; k <= deg; k++) pows[k] = pows[k - 1] * rMag;
+        double sum = 0;
+        for (int s = 0; s < nSel; s++)
+            if (sel[s] >= 0 && sel[s] <= deg) sum += pows[deg - sel[s]];
+        sens[j] = sum / sqrt(dpMag2);
+    }
+}
+
+/* step_loop.c's solve: strip leading zeros, warm-start from (rRe, rIm), and
+ * re-seed non-finite roots on the unit circle.  Returns the iterations. */
+static int steploopSolve(const double *cRe, const double *cIm, int nc,
+                         double *rRe, double *rIm)
+{
+    int start = 0;
+    while (start < nc - 1 && cRe[start] * cRe[start] + cIm[start] * cIm[start] < 1e-30)
+        start++;
+    int degree = nc - 1 - start;
+    if (degree <= 0) return 0;
+    if (degree == 1) {
+        double aR = cRe[start], aI = cIm[start];
+        double bR = cRe[start + 1], bI = cIm[start + 1];
+        double d = aR * aR + aI * aI;
+        if (d < 1e-30) return 0;
+        rRe[0] = -(bR * aR + bI * aI) / d;
+        rIm[0] = -(bI * aR - bR * aI) / d;
+        return 1;
+    }
+    double cr[MAX_COEFFS], ci[MAX_COEFFS];
+    memcpy(cr, cRe + start, (degree + 1) * sizeof(double));
+    memcpy(ci, cIm + start, (degree + 1) * sizeof(double));
+    int iters = solveEA(cr, ci, degree + 1, rRe, rIm, degree);
+    for (int i = 0; i < degree; i++) {
+        if (!isfinite(rRe[i]) || !isfinite(rIm[i]) ||
+            fabs(rRe[i]) > 1e300 || fabs(rIm[i]) > 1e300) {
+            double angle = 2.0 * M_PI * i / degree + 0.37;
+            rRe[i] = cos(angle);
+            rIm[i] = sin(angle);
+        }
+    }
+    return iters;
+}
+
+/* C-D morph dither: step_loop.c's morphDitherPair */
+#define MORPH_DITHER_NORMAL 0
+#define MORPH_DITHER_DISK 1
+#define MORPH_DITHER_SQUARE 2
+
+static void morphDither(PathRng *r, double sigma, int dist, double pw,
+                        double *dRe, double *dIm) {
+    if (dist == MORPH_DITHER_DISK) {
+        double angle = pathRngUniform(r) * 2.0 * M_PI;
+        double rho = pow(pathRngUniform(r), pw) * sigma;
+        *dRe = rho * cos(angle);
+        *dIm = rho * sin(angle);
+    } else if (dist == MORPH_DITHER_SQUARE) {
+        double x = pathRngUniform(r) * 2.0 - 1.0;
+        double y = pathRngUniform(r) * 2.0 - 1.0;
+        *dRe = (x < 0 ? -1.0 : 1.0) * pow(fabs(x), pw) * sigma;
+        *dIm = (y < 0 ? -1.0 : 1.0) * pow(fabs(y), pw) * sigma;
+    } else {
+        *dRe = pathRngGauss(r) * sigma;
+        *dIm = pathRngGauss(r) * sigma;
+    }
+}
+
+/* A 16-step palette: a palettes.h name, "bwr" (index.html's buildDerivBWR)
+ * or a list of 16 [r, g, b].  Returns 0, or -1 for an unknown name. */
+static int parsePalette(const char *p, RGB *out) {
+    p = skip(p);
+    if (*p == '[') return parseRGBList(p, out, 16) == 16 ? 0 : -1;
+    char name[32] = "";
+    parseString(p, name, sizeof(name));
+    if (strcmp(name, "bwr") == 0) {
+        for (int k = 0; k < 16; k++) {
+            double t = k / 15.0, s = t <= 0.5 ? t * 2 : (t - 0.5) * 2;
+            unsigned char up = (unsigned char)lround(s * 255), dn = (unsigned char)lround((1 - s) * 255);
+            out[k] = t <= 0.5 ? (RGB){up, up, 255} : (RGB){255, dn, dn};
+        }
+        return 0;
+    }
+    for (int i = 0; PALETTES[i].name; i++)
+        if (strcmp(PALETTES[i].name, name) == 0) {
+            memcpy(out, PALETTES[i].colors, 16 * sizeof(RGB));
+            return 0;
+        }
+    return -1;
+}
+
+/* Palette position for a normalized t: linear between floor and ceiling,
+ * or a sine of freq cycles between them */
+static double paletteBand(double t, double floor_, double ceiling, double freq) {
+    if (freq > 0.0)
+        return (ceiling - floor_) * (sin(t * 2.0 * M_PI * freq) + 1.0) * 0.5 + floor_;
+    return floor_ + t * (ceiling - floor_);
+}
+
+/* step_loop.c's pixel mapping, truncating toward zero; -1 if off-canvas */
+static long steploopPixel(double re, double im, double cx, double cy,
+                          double range, int W, int H) {
+    double x = ((re - cx) / range + 1.0) * 0.5 * W;
+    double y = (1.0 - (im - cy) / range) * 0.5 * H;
+    if (!(x > -1.0 && x < W) || !(y > -1.0 && y < H)) return -1;
+    return (long)(int)y * W + (int)x;
+}
+
+#define COLOR_UNIFORM 0
+#define COLOR_INDEX 1
+#define COLOR_PROXIMITY 2
+#define COLOR_DERIVATIVE 3
+#define COLOR_REL_PROXIMITY 4
+
+static int lookupName(const char *name, const char *const *names, int n) {
+    for (int i = 0; i < n; i++)
+        if (strcmp(name, names[i]) == 0) return i;
+    return -1;
+}
+
+/* Parse steploop animation entries and build their tables about the given
+ * homes.  Returns the entry count, or -1 after printing an error. */
+static int steploopAnimations(const char *buf, const char *key, Anim *anims,
+                              const double *homeRe, const double *homeIm,
+                              int nc, PathRng *rng, long *curvePoints) {
+    const char *v = findTopKey(buf, key);
+    int n = v ? parseAnimations(v, anims) : 0;
+    for (int a = 0; a < n; a++) {
+        Anim *an = &anims[a];
+        if (an->coeff_index < 0 || an->coeff_index >= nc) {
+            fprintf(stderr, "%s %d: coeff_index %d out of range\n", key, a, an->coeff_index);
+            return -1;
+        }
+        an->centerRe = homeRe[an->coeff_index];
+        an->centerIm = homeIm[an->coeff_index];
+        if (!an->table.pts && !an->path[0]) {
+            fprintf(stderr, "%s %d: needs a path or curve\n", key, a);
+            return -1;
+        }
+        if (!an->table.pts &&
+            pathBuild(an->path, an->centerRe, an->centerIm, an->radius, an->angle,
+                      &an->extra, rng, &an->table) < 0) {
+            fprintf(stderr, "Unknown path: %s\n", an->path);
+            return -1;
+        }
+        if (an->orbitRef >= nc) an->orbitRef = nc - 1;
+        *curvePoints += an->table.n;
+    }
+    return n;
+}
+
+static int runSteploop(const char *buf, const char *outPath) {
+    static const char *const colorNames[] =
+        {"uniform", "index", "proximity", "derivative", "rel-proximity"};
+    static const char *const matchNames[] = {"assign4", "assign1", "hungarian1"};
+    static const char *const morphNames[] =
+        {"line", "circle", "ellipse", "figure8", "d-node", "c-node"};
+    static const char *const ditherNames[] = {"normal", "disk", "square"};
+    const char *v;
+    char name[32];
+
+    /* Polynomial: C-node homes, pinned roots, warm start */
+    double baseRe[MAX_COEFFS], baseIm[MAX_COEFFS];
+    int nc = 0;
+    if ((v = findTopKey(buf, "coefficients"))) nc = parseCoefficients(v, baseRe, baseIm);
+    if (nc < 2) {
+        fprintf(stderr, "Need at least 2 coefficients\n");
+        return 1;
+    }
+    double pinRe[MAX_COEFFS], pinIm[MAX_COEFFS];
+    int nPinned = 0;
+    if ((v = findTopKey(buf, "pinned"))) nPinned = parseCoefficients(v, pinRe, pinIm);
+    if (nc + nPinned > MAX_COEFFS) {
+        fprintf(stderr, "Degree plus pinned roots exceeds %d\n", MAX_DEGREE);
+        return 1;
+    }
+    double pinnedEps = 0;
+    if ((v = findTopKey(buf, "pinned_epsilon"))) pinnedEps = parseNum(&v);
+    int nr = nc - 1 + nPinned;
+    double rootRe[MAX_COEFFS], rootIm[MAX_COEFFS];
+    int nWarm = 0;
+    if ((v = findTopKey(buf, "roots"))) nWarm = parseCoefficients(v, rootRe, rootIm);
+    for (int i = nWarm; i < nr; i++) {
+        rootRe[i] = cos(2.0 * M_PI * i / nr + 0.37);
+        rootIm[i] = sin(2.0 * M_PI * i / nr + 0.37);
+    }
+
+    /* Clock: step k of n_t is at elapsed_offset + k / n_t * seconds */
+    int n_t = 1000;
+    if ((v = findTopKey(buf, "n_t"))) n_t = (int)parseNum(&v);
+    if (n_t < 1) n_t = 1;
+    int stepStart = 0, stepEnd = n_t;
+    if ((v = findTopKey(buf, "step_start"))) stepStart = (int)parseNum(&v);
+    if ((v = findTopKey(buf, "step_end"))) stepEnd = (int)parseNum(&v);
+    if (stepStart < 0) stepStart = 0;
+    if (stepEnd > n_t) stepEnd = n_t;
+    if (stepStart >= stepEnd) {
+        fprintf(stderr, "Empty step range: %d..%d\n", stepStart, stepEnd);
+        return 1;
+    }
+    double fps = 1.0, elapsedOffset = 0.0;
+    if ((v = findTopKey(buf, "seconds"))) fps = parseNum(&v);
+    if ((v = findTopKey(buf, "elapsed_offset"))) elapsedOffset = parseNum(&v);
+    /* "seed" draws the random-cloud tables, which every stripe must share;
+     * "dither_seed" (default: seed) drives the per-step dither, so stripes
+     * can draw independent sequences as the browser's workers do */
+    unsigned long long seed = 0, ditherSeed;
+    if ((v = findTopKey(buf, "seed"))) seed = strtoull(v, NULL, 10);
+    ditherSeed = seed;
+    if ((v = findTopKey(buf, "dither_seed"))) ditherSeed = strtoull(v, NULL, 10);
+    PathRng rng;
+    pathRngSeed(&rng, seed);
+
+    /* C paths, and the morph: D-node targets, their paths, follow-C nodes */
+    Anim anims[MAX_ANIM], dAnims[MAX_ANIM];
+    long curvePoints = 0;
+    int nAnims = steploopAnimations(buf, "animations", anims, baseRe, baseIm,
+                                    nc, &rng, &curvePoints);
+    if (nAnims < 0) return 1;
+
+    double tgtRe[MAX_COEFFS], tgtIm[MAX_COEFFS];
+    int morph = 0, nDAnims = 0, nFollow = 0, morphPath = 5, morphCcw = 0;
+    int morphDist = MORPH_DITHER_NORMAL, followC[MAX_COEFFS];
+    double morphRate = 0.01, morphMinor = 0.5, morphPow = 0.5;
+    double ditherStart = 0, ditherMid = 0, ditherEnd = 0;
+    if ((v = findTopKey(buf, "morph_targets"))) {
+        if (parseCoefficients(v, tgtRe, tgtIm) != nc) {
+            fprintf(stderr, "morph_targets needs one entry per coefficient\n");
+            return 1;
+        }
+        morph = 1;
+        nDAnims = steploopAnimations(buf, "morph_animations", dAnims, tgtRe, tgtIm,
+                                     nc, &rng, &curvePoints);
+        if (nDAnims < 0) return 1;
+        if ((v = findTopKey(buf, "follow_c"))) nFollow = parseIntList(v, followC, MAX_COEFFS);
+        if ((v = findTopKey(buf, "morph_rate"))) morphRate = parseNum(&v);
+        if ((v = findTopKey(buf, "morph_path"))) {
+            parseString(v, name, sizeof(name));
+            if ((morphPath = lookupName(name, morphNames, 6)) < 0) {
+                fprintf(stderr, "Unknown morph_path: %s\n", name);
+                return 1;
+            }
+        }
+        if ((v = findTopKey(buf, "morph_ccw"))) morphCcw = parseBool(v);
+        if ((v = findTopKey(buf, "morph_ellipse_minor"))) morphMinor = parseNum(&v);
+        if ((v = findTopKey(buf, "morph_dither_start"))) ditherStart = parseNum(&v);
+        if ((v = findTopKey(buf, "morph_dither_mid"))) ditherMid = parseNum(&v);
+        if ((v = findTopKey(buf, "morph_dither_end"))) ditherEnd = parseNum(&v);
+        if ((v = findTopKey(buf, "morph_dither_pow"))) morphPow = parseNum(&v);
+        if ((v = findTopKey(buf, "morph_dither_dist"))) {
+            parseString(v, name, sizeof(name));
+            if ((morphDist = lookupName(name, ditherNames, 3)) < 0) {
+                fprintf(stderr, "Unknown morph_dither_dist: %s\n", name);
+                return 1;
+            }
+        }
+    }
+    pathRngSeed(&rng, ditherSeed);
+
+    double jigRe[MAX_COEFFS] = {0}, jigIm[MAX_COEFFS] = {0};
+    if ((v = findTopKey(buf, "jiggle"))) parseCoefficients(v, jigRe, jigIm);
+
+    /* Viewport */
+    int W = 2000, H = 2000;
+    double range = 2.0, cx = 0.0, cy = 0.0;
+    if ((v = findTopKey(buf, "width"))) W = (int)parseNum(&v);
+    if ((v = findTopKey(buf, "height"))) H = (int)parseNum(&v);
+    if ((v = findTopKey(buf, "range"))) range = parseNum(&v);
+    if ((v = findTopKey(buf, "center_re"))) cx = parseNum(&v);
+    if ((v = findTopKey(buf, "center_im"))) cy = parseNum(&v);
+    if (W < 1 || H < 1 || W > MAX_FRAME || H > MAX_FRAME) {
+        fprintf(stderr, "Canvas %dx%d outside 1..%d\n", W, H, MAX_FRAME);
+        return 1;
+    }
+    if (!(range > 1e-12)) range = 2.0;
+
+    /* Coloring */
+    int colorMode = COLOR_INDEX, matchMode = 0;
+    if ((v = findTopKey(buf, "color"))) {
+        parseString(v, name, sizeof(name));
+        if ((colorMode = lookupName(name, colorNames, 5)) < 0) {
+            fprintf(stderr, "Unknown color: %s\n", name);
+            return 1;
+        }
+    }
+    if ((v = findTopKey(buf, "match"))) {
+        parseString(v, name, sizeof(name));
+        if ((matchMode = lookupName(name, matchNames, 3)) < 0) {
+            fprintf(stderr, "Unknown match: %s\n", name);
+            return 1;
+        }
+    }
+    RGB colors[MAX_COEFFS], uniform = {255, 255, 255}, proxPal[16], derivPal[16];
+    int nColors = 0;
+    if ((v = findTopKey(buf, "colors"))) nColors = parseRGBList(v, colors, MAX_COEFFS);
+    for (int i = nColors; i < nr; i++)
+        rainbowRGB(i, nr, &colors[i].r, &colors[i].g, &colors[i].b);
+    if ((v = findTopKey(buf, "uniform_color"))) parseRGB(&v, &uniform);
+    memcpy(proxPal, PAL_INFERNO, sizeof(proxPal));
+    parsePalette("\"bwr\"", derivPal);
+    if ((v = findTopKey(buf, "prox_palette")) && parsePalette(v, proxPal) < 0) {
+        fprintf(stderr, "Bad prox_palette\n");
+        return 1;
+    }
+    if ((v = findTopKey(buf, "deriv_palette")) && parsePalette(v, derivPal) < 0) {
+        fprintf(stderr, "Bad deriv_palette\n");
+        return 1;
+    }
+    struct { const char *key; double val; } band[] = {
+        {"prox_gamma", 1}, {"prox_floor", 0}, {"prox_ceiling", 1}, {"prox_freq", 0},
+        {"rel_prox_floor", 0}, {"rel_prox_ceiling", 1}, {"rel_prox_freq", 0},
+        {"deriv_floor", 0}, {"deriv_ceiling", 1}, {"deriv_freq", 0},
+    };
+    for (size_t k = 0; k < sizeof(band) / sizeof(band[0]); k++)
+        if ((v = findTopKey(buf, band[k].key))) band[k].val = parseNum(&v);
+    double proxGamma = band[0].val;
+    int sel[MAX_COEFFS], nSel = 0;
+    if ((v = findTopKey(buf, "selected"))) nSel = parseIntList(v, sel, MAX_COEFFS);
+    if (nSel == 0)
+        for (nSel = 0; nSel < nc; nSel++) sel[nSel] = nSel;
+
+    unsigned char *img = calloc((size_t)W * H, 4);
+    if (!img) { fprintf(stderr, "malloc failed\n"); return 1; }
+
+    double wRe[MAX_COEFFS], wIm[MAX_COEFFS];      /* this step's C positions */
+    double mRe[MAX_COEFFS], mIm[MAX_COEFFS];      /* this step's D positions */
+    double eRe[MAX_COEFFS], eIm[MAX_COEFFS];      /* with pinned roots expanded */
+    double tRe[MAX_COEFFS], tIm[MAX_COEFFS];      /* solver output */
+    if (morph) {
+        memcpy(mRe, tgtRe, nc * sizeof(double));
+        memcpy(mIm, tgtIm, nc * sizeof(double));
+    }
+
+    /* Morph angle by recurrence, renormalized every 1024 steps */
+    double morphCos = 1.0, morphSin = 0.0, morphCosD = 1.0, morphSinD = 0.0;
+    if (morph) {
+        double theta0 = 2.0 * M_PI * morphRate * (elapsedOffset + (double)stepStart / n_t * fps);
+        double dTheta = 2.0 * M_PI * morphRate * fps / n_t;
+        morphCos = cos(theta0); morphSin = sin(theta0);
+        morphCosD = cos(dTheta); morphSinD = sin(dTheta);
+    }
+    double proxRunMax = 1.0, proxRunMin = 1e300;
+    long painted = 0, totalIters = 0;
+
+    struct timespec t0, t1;
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+
+    for (int step = stepStart; step < stepEnd; step++) {
+        double elapsed = elapsedOffset + (double)step / n_t * fps;
+        memcpy(wRe, baseRe, nc * sizeof(double));
+        memcpy(wIm, baseIm, nc * sizeof(double));
+
+        for (int a = 0; a < nAnims; a++) {
+            Anim *an = &anims[a];
+            int idx = an->coeff_index;
+            pathSample(&an->table, elapsed, an->speed, an->ccw, &wRe[idx], &wIm[idx]);
+            if (an->dither > 0) {
+                double dRe, dIm;
+                pathDither(&rng, an->ditherDist, an->dither, &dRe, &dIm);
+                wRe[idx] += dRe;
+                wIm[idx] += dIm;
+            }
+        }
+
+        if (morph) {
+            for (int a = 0; a < nDAnims; a++) {
+                Anim *an = &dAnims[a];
+                int idx = an->coeff_index;
+                pathSample(&an->table, elapsed, an->speed, an->ccw, &mRe[idx], &mIm[idx]);
+                if (an->dither > 0) {
+                    double dRe, dIm;
+                    pathDither(&rng, an->ditherDist, an->dither, &dRe, &dIm);
+                    mRe[idx] += dRe;
+                    mIm[idx] += dIm;
+                }
+                if (an->orbitRef >= 0) {
+                    mRe[idx] += wRe[an->orbitRef];
+                    mIm[idx] += wIm[an->orbitRef];
+                }
+            }
+            for (int f = 0; f < nFollow; f++) {
+                if (followC[f] < 0 || followC[f] >= nc) continue;
+                mRe[followC[f]] = wRe[followC[f]];
+                mIm[followC[f]] = wIm[followC[f]];
+            }
+
+            /* Blend C toward D along the morph path; skipped at theta ~ 0 */
+            double cosT = morphCos, sinT = morphSin;
+            if (!(cosT >= 1.0 - 1e-14 && fabs(sinT) < 1e-14)) {
+                if (morphPath == 4) {
+                    memcpy(wRe, mRe, nc * sizeof(double));
+                    memcpy(wIm, mIm, nc * sizeof(double));
+                } else if (morphPath == 0) {
+                    double mu = 0.5 - 0.5 * cosT;
+                    for (int m = 0; m < nc; m++) {
+                        wRe[m] = wRe[m] * (1.0 - mu) + mRe[m] * mu;
+                        wIm[m] = wIm[m] * (1.0 - mu) + mIm[m] * mu;
+                    }
+                } else if (morphPath != 5) {
+                    double sign = morphCcw ? 1.0 : -1.0;
+                    for (int m = 0; m < nc; m++) {
+                        double dx = mRe[m] - wRe[m], dy = mIm[m] - wIm[m];
+                        double len2 = dx * dx + dy * dy;
+                        if (len2 < 1e-30) continue;
+                        double len = sqrt(len2), ux = dx / len, uy = dy / len;
+                        double semi = len * 0.5, lx = -semi * cosT, ly;
+                        if (morphPath == 1) ly = sign * semi * sinT;
+                        else if (morphPath == 2) ly = sign * morphMinor * semi * sinT;
+                        else ly = sign * semi * 0.5 * (2.0 * sinT * cosT);
+                        double midRe = (wRe[m] + mRe[m]) * 0.5, midIm = (wIm[m] + mIm[m]) * 0.5;
+                        wRe[m] = midRe + lx * ux - ly * uy;
+                        wIm[m] = midIm + lx * uy + ly * ux;
+                    }
+                }
+                double ds = ditherStart * (cosT > 0 ? cosT * cosT : 0) +
+                            ditherMid * sinT * sinT +
+                            ditherEnd * (cosT < 0 ? cosT * cosT : 0);
+                if (ds > 0)
+                    for (int m = 0; m < nc; m++) {
+                        double dRe, dIm;
+                        morphDither(&rng, ds, morphDist, morphPow, &dRe, &dIm);
+                        wRe[m] += dRe;
+                        wIm[m] += dIm;
+                    }
+            }
+            morphCos = cosT * morphCosD - sinT * morphSinD;
+            morphSin = sinT * morphCosD + cosT * morphSinD;
+            if (((step - stepStart) & 1023) == 0) {
+                double inv = 1.0 / sqrt(morphCos * morphCos + morphSin * morphSin);
+                morphCos *= inv;
+                morphSin *= inv;
+            }
+        }
+
+        for (int j = 0; j < nc; j++) {
+            wRe[j] += jigRe[j];
+            wIm[j] += jigIm[j];
+        }
+
+        /* P(z) = Q(z) * prod(z - pinned) (+ epsilon) */
+        const double *evRe = wRe, *evIm = wIm;
+        int evN = nc;
+        if (nPinned > 0) {
+            memcpy(eRe, wRe, nc * sizeof(double));
+            memcpy(eIm, wIm, nc * sizeof(double));
+            for (int q = 0; q < nPinned; q++, evN++) {
+                double rr = pinRe[q], ri = pinIm[q];
+                eRe[evN] = -rr * eRe[evN - 1] + ri * eIm[evN - 1];
+                eIm[evN] = -rr * eIm[evN - 1] - ri * eRe[evN - 1];
+                for (int j = evN - 1; j >= 1; j--) {
+                    double pr = eRe[j - 1], pi = eIm[j - 1];
+                    eRe[j] -= rr * pr - ri * pi;
+                    eIm[j] -= rr * pi + ri * pr;
+                }
+            }
+            eRe[evN - 1] += pinnedEps;
+            evRe = eRe; evIm = eIm;
+        }
+
+        memcpy(tRe, rootRe, nr * sizeof(double));
+        memcpy(tIm, rootIm, nr * sizeof(double));
+        totalIters += steploopSolve(evRe, evIm, evN, tRe, tIm);
+        for (int i = 0; i < nr; i++)
+            if (!isfinite(tRe[i]) || !isfinite(tIm[i])) {
+                tRe[i] = cos(2.0 * M_PI * i / nr + 0.37);
+                tIm[i] = sin(2.0 * M_PI * i / nr + 0.37);
+            }
+
+        /* Color: one palette entry per root, as runStepLoop picks it */
+        RGB stepColors[MAX_COEFFS];
+        if (colorMode == COLOR_DERIVATIVE) {
+            if ((step - stepStart) % 4 == 0) matchRoots(tRe, tIm, rootRe, rootIm, nr);
+            double raw[MAX_COEFFS], norm[MAX_COEFFS];
+            computeSens(evRe, evIm, evN, tRe, tIm, nr, sel, nSel, raw);
+            rankNorm(raw, norm, nr);
+            for (int i = 0; i < nr; i++) {
+                double td = paletteBand(norm[i], band[7].val, band[8].val, band[9].val);
+                int k = (int)(td * 15.0 + 0.5);
+                stepColors[i] = derivPal[k < 0 ? 0 : k > 15 ? 15 : k];
+            }
+        } else if (colorMode == COLOR_PROXIMITY || colorMode == COLOR_REL_PROXIMITY) {
+            double minD[MAX_COEFFS];
+            for (int i = 0; i < nr; i++) minD[i] = 1e300;
+            for (int i = 0; i < nr; i++)
+                for (int j = i + 1; j < nr; j++) {
+                    double dx = tRe[i] - tRe[j], dy = tIm[i] - tIm[j];
+                    double d2 = dx * dx + dy * dy;
+                    if (d2 < minD[i]) minD[i] = d2;
+                    if (d2 < minD[j]) minD[j] = d2;
+                }
+            for (int i = 0; i < nr; i++) {
+                minD[i] = sqrt(minD[i]);
+                if (minD[i] > proxRunMax) proxRunMax = minD[i];
+                if (minD[i] < proxRunMin) proxRunMin = minD[i];
+            }
+            proxRunMax *= 0.999;
+            proxRunMin *= 1.001;
+            for (int i = 0; i < nr; i++) {
+                double t;
+                if (colorMode == COLOR_PROXIMITY) {
+                    t = proxRunMax > 0 ? 1.0 - fmin(minD[i] / proxRunMax, 1.0) : 1.0;
+                    if (proxGamma != 1.0) t = pow(t, proxGamma);
+                    t = paletteBand(t, band[1].val, band[2].val, band[3].val);
+                } else {
+                    double span = proxRunMax - proxRunMin;
+                    t = span > 1e-12 ? (minD[i] - proxRunMin) / span : 0.5;
+                    t = paletteBand(fmin(fmax(t, 0.0), 1.0), band[4].val, band[5].val, band[6].val);
+                }
+                int k = (int)(t * 15.0);
+                stepColors[i] = proxPal[k < 0 ? 0 : k > 15 ? 15 : k];
+            }
+        } else if (colorMode == COLOR_UNIFORM) {
+            for (int i = 0; i < nr; i++) stepColors[i] = uniform;
+        } else {
+            if (matchMode == 2) hungarianMatch(tRe, tIm, rootRe, rootIm, nr);
+            else if (matchMode == 1 || (step - stepStart) % 4 == 0)
+                matchRoots(tRe, tIm, rootRe, rootIm, nr);
+            memcpy(stepColors, colors, nr * sizeof(RGB));
+        }
+        memcpy(rootRe, tRe, nr * sizeof(double));
+        memcpy(rootIm, tIm, nr * sizeof(double));
+
+        for (int i = 0; i < nr; i++) {
+            long px = steploopPixel(rootRe[i], rootIm[i], cx, cy, range, W, H);
+            if (px < 0) continue;
+            unsigned char *d = img + px * 4;
+            d[0] = stepColors[i].r; d[1] = stepColors[i].g; d[2] = stepColors[i].b; d[3] = 255;
+            painted++;
+        }
+    }
+
+    clock_gettime(CLOCK_MONOTONIC, &t1);
+    long elapsed_us = (t1.tv_sec - t0.tv_sec) * 1000000L +
+                      (t1.tv_nsec - t0.tv_nsec) / 1000L;
+
+    for (int a = 0; a < nAnims; a++) free(anims[a].table.pts);
+    for (int a = 0; a < nDAnims; a++) free(dAnims[a].table.pts);
+    int rc = rawWrite(outPath, img, W, H, 4);
+    free(img);
+    if (rc < 0) return 1;
+
+    int steps = stepEnd - stepStart;
+    printf("{\"mode\":\"steploop\",\"width\":%d,\"height\":%d,\"n_roots\":%d,"
+           "\"step_start\":%d,\"step_end\":%d,\"painted\":%ld,"
+           "\"animations\":%d,\"morph_animations\":%d,\"curve_points\":%ld,"
+           "\"seed\":%llu,\"elapsed_us\":%ld,\"avg_iterations\":%.2f,\"roots\":[",
+           W, H, nr, stepStart, stepEnd, painted, nAnims, nDAnims, curvePoints,
+           seed, elapsed_us, (double)totalIters / steps);
+    for (int i = 0; i < nr; i++)
+        printf("%s[%.17g,%.17g]", i ? "," : "", rootRe[i], rootIm[i]);
+    printf("]}\n");
+    return 0;
+}
 
 /* ---- Main ---- */
 
+/* ---- Animation sweep ---- */
+
+/* The animation sweep's Refiner context: base coefficients, the animated
+ * ones, and the open outputs */
+typedef struct {
+    const double *baseRe, *baseIm;
+    int nCoeffs, degree;
+    Anim *anims;
+    int nAnims;
+    PathRng *rng;
+    FILE *fout, *fpos;      /* .bin, and step times when refining */
+    float *stepBuf;
+    RootHist *hist;         /* counts instead of the .bin */
+} AnimSweep;
+
+static int animSolveAt(void *ctx, double t, double *re, double *im, int *effDeg) {
+    AnimSweep *as = ctx;
+    Anim *anims = as->anims;
+    double coeffRe[MAX_COEFFS], coeffIm[MAX_COEFFS];
+
+    /* Start with base coefficients */
+    memcpy(coeffRe, as->baseRe, as->nCoeffs * sizeof(double));
+    memcpy(coeffIm, as->baseIm, as->nCoeffs * sizeof(double));
+
+    /* Apply animations: path table, or the legacy circle about the base */
+    for (int a = 0; a < as->nAnims; a++) {
+        int idx = anims[a].coeff_index;
+        if (idx < 0 || idx >= as->nCoeffs) continue;
+
+        if (anims[a].table.pts) {
+            pathSample(&anims[a].table, t, anims[a].speed, anims[a].ccw,
+                       &coeffRe[idx], &coeffIm[idx]);
+        } else {
+            double dir = anims[a].ccw ? -1.0 : 1.0;
+            double phase = 2.0 * M_PI * (t * anims[a].speed * dir + anims[a].angle);
+            coeffRe[idx] = anims[a].centerRe + anims[a].radius * cos(phase);
+            coeffIm[idx] = anims[a].centerIm + anims[a].radius * sin(phase);
+        }
+        if (anims[a].dither > 0) {
+            double dRe, dIm;
+            pathDither(as->rng, anims[a].ditherDist, anims[a].dither, &dRe, &dIm);
+            coeffRe[idx] += dRe;
+            coeffIm[idx] += dIm;
+        }
+    }
+    return solveLane(coeffRe, coeffIm, as->nCoeffs, re, im, as->degree, effDeg);
+}
+
+static int animEmit(void *ctx, double t, const double *re, const double *im) {
+    AnimSweep *as = ctx;
+    if (as->hist) {
+        for (int i = 0; i < as->degree; i++) histAdd(as->hist, re[i], im[i]);
+        return 0;
+    }
+    /* Pack as f32 and write */
+    for (int i = 0; i < as->degree; i++) {
+        as->stepBuf[i * 2]     = (float)re[i];
+        as->stepBuf[i * 2 + 1] = (float)im[i];
+    }
+    if (fwrite(as->stepBuf, sizeof(float), as->degree * 2, as->fout) != (size_t)as->degree * 2)
+        return -1;
+    if (as->fpos && fwrite(&t, sizeof t, 1, as->fpos) != 1) return -1;
+    return 0;
+}
+
 int main(int argc, char **argv) {
     if (argc < 2) {
-        fprintf(stderr, "Usage: sweep <output.bin>\n");
+        fprintf(stderr, "Usage: sweep <output.bin or output.raw>\n");
         return 1;
     }
     const char *outPath = argv[1];
 
-    /* Read stdin */
-    char *buf = malloc(BUF_SIZE);
+    /* Read stdin, growing the buffer for specs carrying curve tables */
+    size_t cap = BUF_SIZE, len = 0, n;
+    char *buf = malloc(cap);
     if (!buf) { fprintf(stderr, "malloc failed\n"); return 1; }
-    int len = 0, n;
-    while ((n = fread(buf + len, 1, BUF_SIZE - len - 1, stdin)) > 0)
+    while ((n = fread(buf + len, 1, cap - len - 1, stdin)) > 0) {
         len += n;
+        if (len + 1 == cap) {
+            char *grown = realloc(buf, cap *= 2);
+            if (!grown) { fprintf(stderr, "malloc failed\n"); return 1; }
+            buf = grown;
+        }
+    }
     buf[len] = '\0';
 
-    /* Check for grid mode */
+    /* Check for grid, render or steploop mode */
     {
         char mode[32] = "";
         const char *mp = findKey(buf, "mode");
         if (mp) parseString(mp, mode, sizeof(mode));
-        if (strcmp(mode, "grid") == 0) {
-            int rc = runGrid(buf, outPath);
+        int render = strcmp(mode, "render") == 0;
+        if (render || strcmp(mode, "grid") == 0) {
+            int rc = runGrid(buf, outPath, render);
+            free(buf);
+            return rc;
+        }
+        if (strcmp(mode, "steploop") == 0) {
+            int rc = runSteploop(buf, outPath);
             free(buf);
             return rc;
         }
@@ -1861,6 +4039,7 @@ int main(int argc, char **argv) {
     int nAnims = 0;
     cp = findKey(buf, "animations");
     if (cp) nAnims = parseAnimations(cp, anims);
+    if (nAnims < 0) return 1;
 
     int n_t = 1000;
     cp = findKey(buf, "n_t");
@@ -1872,126 +4051,240 @@ int main(int argc, char **argv) {
     cp = findKey(buf, "match_roots");
     if (cp) doMatch = parseBool(cp);
 
-    /* Set animation centers from base coefficients */
+    /* Step k is at elapsed time elapsed_offset + k / n_t * seconds, the
+     * browser's fast-mode clock (one pass = one second) */
+    double seconds = 1.0, elapsedOffset = 0.0;
+    cp = findKey(buf, "seconds");
+    if (cp) seconds = parseNum(&cp);
+    cp = findKey(buf, "elapsed_offset");
+    if (cp) elapsedOffset = parseNum(&cp);
+
+    unsigned long long seed = 0;
+    cp = findKey(buf, "seed");
+    if (cp) seed = strtoull(cp, NULL, 10);
+    PathRng rng;
+    pathRngSeed(&rng, seed);
+
+    /* Checkpoint every checkpoint_s seconds of solving; "resume" picks up
+     * from <output>.ckpt */
+    double checkpointS = 0;
+    cp = findKey(buf, "checkpoint_s");
+    if (cp) checkpointS = parseNum(&cp);
+    int resume = 0;
+    cp = findKey(buf, "resume");
+    if (cp) resume = parseBool(cp);
+
+    /* Adaptive refinement: extra steps where roots jump, with every step's
+     * time in <output>.pos */
+    double refine = 0;
+    int refineDepth = 4;
+    cp = findKey(buf, "refine");
+    if (cp) refine = parseNum(&cp);
+    cp = findKey(buf, "refine_depth");
+    if (cp) refineDepth = (int)parseNum(&cp);
+    if (refineDepth < 1) refineDepth = 1;
+    if (refineDepth > REFINE_MAX_DEPTH) refineDepth = REFINE_MAX_DEPTH;
+    if (refine <= 0) refine = 0, refineDepth = 0;
+
+    /* A density histogram (root_hist.h) instead of the .bin */
+    RootHist hist;
+    int histogram = parseHistogram(buf, &hist);
+    if (histogram < 0) return 1;
+    if (histogram && (checkpointS > 0 || resume || refine > 0)) {
+        fprintf(stderr, "histogram cannot be combined with checkpoint_s, resume or refine\n");
+        return 1;
+    }
+
+    /* Set animation centers from base coefficients, and build path tables
+     * with the base position as home */
+    long curvePoints = 0;
     for (int a = 0; a < nAnims; a++) {
         int idx = anims[a].coeff_index;
         if (idx >= 0 && idx < nCoeffs) {
             anims[a].centerRe = baseRe[idx];
             anims[a].centerIm = baseIm[idx];
         }
+        if (anims[a].path[0] && !anims[a].table.pts &&
+            pathBuild(anims[a].path, anims[a].centerRe, anims[a].centerIm,
+                      anims[a].radius, anims[a].angle, &anims[a].extra,
+                      &rng, &anims[a].table) < 0) {
+            fprintf(stderr, "Unknown path: %s\n", anims[a].path);
+            return 1;
+        }
+        curvePoints += anims[a].table.n;
     }
+    pathRngSeed(&rng, seed);
 
-    /* Open output file */
-    FILE *fout = fopen(outPath, "wb");
-    if (!fout) {
-        fprintf(stderr, "Cannot open %s for writing\n", outPath);
-        return 1;
+    /* Fingerprint: everything that shapes the .bin */
+    uint64_t fingerprint = FNV_OFFSET;
+    {
+        double clock[3] = {seconds, elapsedOffset, refine};
+        int dims[5] = {degree, n_t, doMatch, nAnims, refineDepth};
+        fingerprint = ckptHash(fingerprint, dims, sizeof dims);
+        fingerprint = ckptHash(fingerprint, clock, sizeof clock);
+        fingerprint = ckptHash(fingerprint, &seed, sizeof seed);
+        fingerprint = ckptHash(fingerprint, baseRe, nCoeffs * sizeof(double));
+        fingerprint = ckptHash(fingerprint, baseIm, nCoeffs * sizeof(double));
+        for (int a = 0; a < nAnims; a++) {
+            double p[6] = {anims[a].radius, anims[a].speed, anims[a].angle,
+                           anims[a].dither, anims[a].centerRe, anims[a].centerIm};
+            int q[4] = {anims[a].coeff_index, anims[a].ccw, anims[a].ditherDist,
+                        anims[a].table.cloud};
+            fingerprint = ckptHash(fingerprint, p, sizeof p);
+            fingerprint = ckptHash(fingerprint, q, sizeof q);
+            if (anims[a].table.pts)
+                fingerprint = ckptHash(fingerprint, anims[a].table.pts,
+                                       anims[a].table.n * 2 * sizeof(double));
+        }
     }
 
-    /* Allocate output buffer for one step */
-    float *stepBuf = malloc(degree * 2 * sizeof(float));
-
-    /* Root arrays */
-    double rootRe[MAX_DEGREE], rootIm[MAX_DEGREE];
-    double prevRe[MAX_DEGREE], prevIm[MAX_DEGREE];
-    double coeffRe[MAX_COEFFS], coeffIm[MAX_COEFFS];
+    AnimSweep as = { .baseRe = baseRe, .baseIm = baseIm, .nCoeffs = nCoeffs,
+                     .degree = degree, .anims = anims, .nAnims = nAnims, .rng = &rng,
+                     .hist = histogram ? &hist : NULL };
+    as.stepBuf = malloc(degree * 2 * sizeof(float));
+    Refiner rf = { .solve = animSolveAt, .emit = animEmit, .ctx = &as,
+                   .degree = degree, .doMatch = doMatch,
+                   .ratio = refine, .maxDepth = refineDepth };
 
     /* Initial guesses */
     for (int k = 0; k < degree; k++) {
         double ang = 2.0 * M_PI * k / degree + 0.3;
         double r = 1.0 + 0.1 * k / degree;
-        rootRe[k] = r * cos(ang);
-        rootIm[k] = r * sin(ang);
+        rf.prevRe[k] = r * cos(ang);
+        rf.prevIm[k] = r * sin(ang);
     }
 
-    struct timespec t0, t1;
-    clock_gettime(CLOCK_MONOTONIC, &t0);
-
-    long totalIters = 0;
-
-    for (int step = 0; step < n_t; step++) {
-        double t = (double)step / (double)n_t;  /* t in [0, 1) */
-
-        /* Start with base coefficients */
-        memcpy(coeffRe, baseRe, nCoeffs * sizeof(double));
-        memcpy(coeffIm, baseIm, nCoeffs * sizeof(double));
-
-        /* Apply animations: circle path */
-        for (int a = 0; a < nAnims; a++) {
-            int idx = anims[a].coeff_index;
-            if (idx < 0 || idx >= nCoeffs) continue;
-
-            double dir = anims[a].ccw ? -1.0 : 1.0;
-            double phase = 2.0 * M_PI * (t * anims[a].speed * dir + anims[a].angle);
-            coeffRe[idx] = anims[a].centerRe + anims[a].radius * cos(phase);
-            coeffIm[idx] = anims[a].centerIm + anims[a].radius * sin(phase);
-        }
-
-        /* Strip leading zeros */
-        int start = 0;
-        while (start < nCoeffs - 1 &&
-               coeffRe[start] * coeffRe[start] + coeffIm[start] * coeffIm[start] < 1e-30)
-            start++;
-        int effN = nCoeffs - start;
-        int effDeg = effN - 1;
-
-        /* Solve */
-        int iters;
-        if (effDeg <= 0) {
-            /* Degenerate: zero roots */
-            for (int i = 0; i < degree; i++) { rootRe[i] = 0; rootIm[i] = 0; }
-            iters = 0;
-        } else if (effDeg == 1) {
-            /* Linear */
-            double aR = coeffRe[start], aI = coeffIm[start];
-            double bR = coeffRe[start+1], bI = coeffIm[start+1];
-            double d = aR*aR + aI*aI;
-            if (d > 1e-30) {
-                rootRe[0] = -(bR*aR + bI*aI) / d;
-                rootIm[0] = -(bI*aR - bR*aI) / d;
+    /* Resume: step index, steps written, iteration counts, RNG state and
+     * warm roots; the .bin (and .pos) are cut back to the steps the
+     * checkpoint covers */
+    int step0 = 0;
+    size_t stepBytes = (size_t)degree * 2 * sizeof(float);
+    if (resume) {
+        size_t n;
+        unsigned char *ck = ckptRead(outPath, fingerprint, &n);
+        if (ck) {
+            const unsigned char *p = ck, *end = ck + n;
+            PathRng saved;
+            int s0;
+            long counts[3];
+            double re[MAX_DEGREE], im[MAX_DEGREE];
+            if (ckptGet(&p, end, &s0, sizeof s0) == 0 &&
+                ckptGet(&p, end, counts, sizeof counts) == 0 &&
+                ckptGet(&p, end, &saved, sizeof saved) == 0 &&
+                ckptGet(&p, end, re, degree * sizeof(double)) == 0 &&
+                ckptGet(&p, end, im, degree * sizeof(double)) == 0 &&
+                s0 > 0 && s0 <= n_t) {
+                step0 = s0;
+                rf.steps = counts[0];
+                rf.solves = counts[1];
+                rf.iters = counts[2];
+                rng = saved;
+                memcpy(rf.prevRe, re, degree * sizeof(double));
+                memcpy(rf.prevIm, im, degree * sizeof(double));
+                rf.havePrev = 1;
+                rf.tPrev = elapsedOffset + (double)(step0 - 1) / (double)n_t * seconds;
             }
-            iters = 1;
-        } else {
-            iters = solveEA(coeffRe + start, coeffIm + start, effN,
-                            rootRe, rootIm, effDeg);
+            free(ck);
         }
-        totalIters += iters;
+    }
 
-        /* Match roots to previous step */
-        if (doMatch && step > 0 && effDeg > 1) {
-            matchRoots(rootRe, rootIm, prevRe, prevIm, effDeg);
+    /* Open output files */
+    char posPath[1100];
+    snprintf(posPath, sizeof posPath, "%s.pos", outPath);
+    if (step0 > 0) {
+        int fd = open(outPath, O_WRONLY);
+        if (fd >= 0 && ftruncate(fd, (off_t)rf.steps * stepBytes) == 0)
+            as.fout = fdopen(fd, "ab");
+        else if (fd >= 0)
+            close(fd);
+        if (refine > 0) {
+            fd = open(posPath, O_WRONLY);
+            if (fd >= 0 && ftruncate(fd, (off_t)rf.steps * sizeof(double)) == 0)
+                as.fpos = fdopen(fd, "ab");
+            else if (fd >= 0)
+                close(fd);
         }
+    } else if (!histogram) {
+        as.fout = fopen(outPath, "wb");
+        if (refine > 0) as.fpos = fopen(posPath, "wb");
+    }
+    if ((!as.fout && !histogram) || (refine > 0 && !as.fpos) || !as.stepBuf) {
+        fprintf(stderr, "Cannot open %s for writing\n", outPath);
+        return 1;
+    }
 
-        /* Save for next step's warm-start and matching */
-        memcpy(prevRe, rootRe, degree * sizeof(double));
-        memcpy(prevIm, rootIm, degree * sizeof(double));
+    struct timespec t0, t1, tCkpt;
+    clock_gettime(CLOCK_MONOTONIC, &t0);
+    tCkpt = t0;
+    CkptBuf ckb = {0};
+    int checkpoints = 0;
+
+    for (int step = step0; step < n_t; step++) {
+        double t = elapsedOffset + (double)step / (double)n_t * seconds;
+        if (refineStep(&rf, t, 1) != 0) {
+            fprintf(stderr, "Write to %s failed\n", outPath);
+            return 1;
+        }
 
-        /* Pack as f32 and write */
-        for (int i = 0; i < degree; i++) {
-            stepBuf[i * 2]     = (float)rootRe[i];
-            stepBuf[i * 2 + 1] = (float)rootIm[i];
+        /* Checkpoint: the steps so far reach the disk first */
+        if (checkpointS > 0 && (step & 1023) == 1023 && step + 1 < n_t) {
+            struct timespec now;
+            clock_gettime(CLOCK_MONOTONIC, &now);
+            if ((now.tv_sec - tCkpt.tv_sec) + (now.tv_nsec - tCkpt.tv_nsec) * 1e-9 >= checkpointS) {
+                int next = step + 1;
+                long counts[3] = {rf.steps, rf.solves, rf.iters};
+                ckb.n = 0;
+                if (fflush(as.fout) == 0 && fdatasync(fileno(as.fout)) == 0 &&
+                    (!as.fpos || (fflush(as.fpos) == 0 && fdatasync(fileno(as.fpos)) == 0)) &&
+                    ckptPut(&ckb, &next, sizeof next) == 0 &&
+                    ckptPut(&ckb, counts, sizeof counts) == 0 &&
+                    ckptPut(&ckb, &rng, sizeof rng) == 0 &&
+                    ckptPut(&ckb, rf.prevRe, degree * sizeof(double)) == 0 &&
+                    ckptPut(&ckb, rf.prevIm, degree * sizeof(double)) == 0 &&
+                    ckptWrite(outPath, fingerprint, &ckb) == 0)
+                    checkpoints++;
+                else
+                    fprintf(stderr, "Checkpoint at step %d failed\n", next);
+                tCkpt = now;
+            }
         }
-        fwrite(stepBuf, sizeof(float), degree * 2, fout);
     }
 
     clock_gettime(CLOCK_MONOTONIC, &t1);
     long elapsed_us = (t1.tv_sec - t0.tv_sec) * 1000000L +
                       (t1.tv_nsec - t0.tv_nsec) / 1000L;
 
-    fclose(fout);
-    free(stepBuf);
+    if ((as.fout && fclose(as.fout) != 0) || (as.fpos && fclose(as.fpos) != 0) ||
+        (histogram && histWrite(&hist, outPath) != 0)) {
+        fprintf(stderr, "Write to %s failed\n", outPath);
+        return 1;
+    }
+    if (checkpointS > 0 || resume) ckptRemove(outPath);
+    free(ckb.data);
+    free(as.stepBuf);
     free(buf);
+    for (int a = 0; a < nAnims; a++) free(anims[a].table.pts);
 
     /* Output metadata to stdout */
-    long dataBytes = (long)n_t * degree * 2 * sizeof(float);
-    double avgIters = n_t > 0 ? (double)totalIters / n_t : 0;
+    long dataBytes = histogram ? HIST_HEADER_BYTES + (long)hist.width * hist.height * 4
+                               : rf.steps * (long)stepBytes;
+    double avgIters = rf.solves > 0 ? (double)rf.iters / rf.solves : 0;
 
     printf("{\"degree\":%d,\"n_t\":%d,\"stride\":%d,"
            "\"matched\":%s,\"data_bytes\":%ld,"
-           "\"elapsed_us\":%ld,\"avg_iterations\":%.2f}\n",
+           "\"animations\":%d,\"curve_points\":%ld,\"seed\":%llu,"
+           "\"resumed_from\":%d,\"checkpoints\":%d,",
            degree, n_t, degree * 2,
            doMatch ? "true" : "false",
-           dataBytes, elapsed_us, avgIters);
+           dataBytes, nAnims, curvePoints, seed, step0, checkpoints);
+    if (refine > 0)
+        printf("\"refine\":%g,\"refine_depth\":%d,\"steps\":%ld,\"solves\":%ld,",
+               refine, refineDepth, rf.steps, rf.solves);
+    if (histogram) {
+        printHistogram(&hist);
+        histFree(&hist);
+    }
+    printf("\"elapsed_us\":%ld,\"avg_iterations\":%.2f}\n", elapsed_us, avgIters);
 
     return 0;
 }
@@ -0,0 +1,376 @@
+"""Tests for the Lambda binaries (polypaint/lambda): sweep, and imgpipe
+when libvips is available, built from source and run on small grids."""
+
+import array
+import json
+import shutil
+import signal
+import struct
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+LAMBDA_DIR = Path(__file__).parent.parent / "polypaint" / "lambda"
+
+
+def _compiler():
+    cc = shutil.which("cc") or shutil.which("gcc")
+    if cc is None:
+        pytest.skip("no C compiler")
+    return cc
+
+
+@pytest.fixture(scope="module")
+def sweep(tmp_path_factory):
+    """sweep_cli.c built into a temporary directory."""
+    out = tmp_path_factory.mktemp("bin") / "sweep"
+    subprocess.run([_compiler(), "-O2", "-o", str(out), str(LAMBDA_DIR / "sweep_cli.c"),
+                    "-lm", "-lpthread"], check=True)
+    return out
+
+
+@pytest.fixture(scope="module")
+def imgpipe(tmp_path_factory):
+    """imgpipe.c built against the system libvips, or skip."""
+    pkg = subprocess.run(["pkg-config", "--cflags", "--libs", "vips"],
+                         capture_output=True, text=True) if shutil.which("pkg-config") else None
+    if pkg is None or pkg.returncode != 0:
+        pytest.skip("libvips not available")
+    out = tmp_path_factory.mktemp("bin") / "imgpipe"
+    subprocess.run([_compiler(), "-O2", "-o", str(out), str(LAMBDA_DIR / "imgpipe.c"),
+                    *pkg.stdout.split(), "-lm"], check=True)
+    return out
+
+
+def run_sweep(sweep, spec, out_path):
+    """Run sweep on a JSON spec; returns its metadata."""
+    result = subprocess.run([str(sweep), str(out_path)], input=json.dumps(spec),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def run_tiled(args, spec=None):
+    """Run a tiled render; returns (metadata, reported tile parts)."""
+    result = subprocess.run([str(a) for a in args],
+                            input=json.dumps(spec) if spec else None,
+                            capture_output=True, text=True, check=True)
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    return lines[-1], lines[:-1]
+
+
+def read_raw(path):
+    """(width, height, bands, pixel bytes) of a .raw image."""
+    data = Path(path).read_bytes()
+    w, h, bands = struct.unpack_from("<III", data)
+    return w, h, bands, data[12:]
+
+
+def stitch(parts, width, height, tile):
+    """Add tile parts with saturation into one RGB canvas."""
+    canvas = bytearray(width * height * 3)
+    for part in parts:
+        tx, ty, _ = part["tile"]
+        w, h, _, pixels = read_raw(part["path"])
+        for y in range(h):
+            row = ((ty * tile + y) * width + tx * tile) * 3
+            for i in range(w * 3):
+                canvas[row + i] = min(255, canvas[row + i] + pixels[y * w * 3 + i])
+    return bytes(canvas)
+
+
+def grid_spec(**extra):
+    return {"mode": "grid", "function": "giga_5", "n1": 30, "n2": 40,
+            "match_roots": False, "threads": 1, **extra}
+
+
+GIGA_5_EXPR = (
+    "t1 = exp(2i*pi*x1); t2 = exp(2i*pi*x2); "
+    "c[0] = 1; c[4] = 4; c[12] = 4; c[19] = -9; c[20] = -1.9; c[24] = 0.2; "
+    "c[6] = 100i*(t2^3 + t2^2 - t2 - 1); "
+    "c[8] = 100i*(t1^3 + t1^2 + t2 - 1); "
+    "c[14] = 100i*(t2^3 - t2^2 + t2 - 1); "
+    "c[25] = 0"
+)
+
+
+def read_f32(path):
+    """Roots of a plain .bin as a flat list of floats."""
+    values = array.array("f")
+    values.frombytes(Path(path).read_bytes())
+    return values.tolist()
+
+
+def decode_roots(path):
+    """Decode a PPRQ file (root_codec.h): degree and, per row, the decoded
+    coordinates (re, im interleaved) with the block's (step_re, step_im)."""
+    data = Path(path).read_bytes()
+    magic, _, encoding, degree, n_blocks, _, _, index_offset = struct.unpack_from(
+        "<4sHHIIIIQ", data)
+    assert magic == b"PPRQ"
+    offsets = struct.unpack_from(f"<{n_blocks}Q", data, index_offset)
+    rows = []
+    for off in offsets:
+        payload, n = struct.unpack_from("<II", data, off)
+        origin_re, origin_im, step_re, step_im = struct.unpack_from("<4d", data, off + 8)
+        origin, step = (origin_re, origin_im), (step_re, step_im)
+        body = data[off + 40:off + 40 + payload]
+        coords = n * degree * 2
+        if encoding == 1:
+            q = list(struct.unpack_from(f"<{coords}H", body))
+        else:
+            # zigzag LEB128 deltas against the same root at the previous step
+            q, prev, pos = [], [0] * (degree * 2), 0
+            for i in range(coords):
+                z = shift = 0
+                while True:
+                    b = body[pos]
+                    pos += 1
+                    z |= (b & 0x7F) << shift
+                    if not b & 0x80:
+                        break
+                    shift += 7
+                prev[i % (degree * 2)] += (z >> 1) ^ -(z & 1)
+                q.append(prev[i % (degree * 2)])
+        rows.append(([origin[i & 1] + (v + 0.5) * step[i & 1] for i, v in enumerate(q)], step))
+    return degree, rows
+
+
+def read_hist(path):
+    """Header fields and row-major counts of a PPHG file (root_hist.h)."""
+    data = Path(path).read_bytes()
+    magic, _, flags, w, h, doublings, _ = struct.unpack_from("<4sHHIIiI", data)
+    assert magic == b"PPHG"
+    counted, clipped = struct.unpack_from("<QQ", data, 56)
+    counts = list(struct.unpack_from(f"<{w * h}I", data, 72))
+    return {"flags": flags, "width": w, "height": h, "doublings": doublings,
+            "counted": counted, "clipped": clipped}, counts
+
+
+def fold_into(merged, hdr, counts, k):
+    """Add counts into merged, k doublings coarser, as histFold does."""
+    w, h = hdr["width"], hdr["height"]
+    xs, ys = list(range(w)), list(range(h))
+    for _ in range(k):
+        xs = [w // 4 + x // 2 for x in xs]
+        ys = [h // 4 + y // 2 for y in ys]
+    for y in range(h):
+        for x in range(w):
+            merged[ys[y] * w + xs[x]] += counts[y * w + x]
+
+
+class TestGridCheckpoint:
+    def test_killed_run_resumes_identical(self, sweep, tmp_path):
+        """A grid killed mid-run and resumed matches an uninterrupted run."""
+        spec = grid_spec(n1=300, n2=400, threads=2, checkpoint_s=0.05)
+        run_sweep(sweep, spec, tmp_path / "full.bin")
+
+        out = tmp_path / "killed.bin"
+        ckpt = tmp_path / "killed.bin.ckpt"
+        proc = subprocess.Popen([str(sweep), str(out)], stdin=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL)
+        proc.stdin.write(json.dumps(spec).encode())
+        proc.stdin.close()
+        deadline = time.time() + 30
+        while not ckpt.exists() and proc.poll() is None and time.time() < deadline:
+            time.sleep(0.01)
+        if proc.poll() is not None:
+            pytest.skip("sweep finished before it could be killed")
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+
+        meta = run_sweep(sweep, {**spec, "resume": True}, out)
+        assert meta["resumed"] is True
+        assert out.read_bytes() == (tmp_path / "full.bin").read_bytes()
+        assert not ckpt.exists()
+
+
+class TestRootCodec:
+    @pytest.mark.parametrize("encoding", ["q16", "delta"])
+    def test_round_trip_within_half_step(self, sweep, tmp_path, encoding):
+        """Decoded roots are within step / 2 of the float32 roots."""
+        run_sweep(sweep, grid_spec(), tmp_path / "f32.bin")
+        meta = run_sweep(sweep, grid_spec(encoding=encoding, quantum=1e-4),
+                         tmp_path / "enc.bin")
+        assert meta["encoding"] == encoding
+        assert meta["data_bytes"] < meta["f32_bytes"]
+
+        f32 = read_f32(tmp_path / "f32.bin")
+        degree, rows = decode_roots(tmp_path / "enc.bin")
+        assert degree == 25 and len(rows) == 30
+        row_len = len(f32) // 30
+        for k, (decoded, step) in enumerate(rows):
+            expected = f32[k * row_len:(k + 1) * row_len]
+            assert len(decoded) == row_len
+            for i, (a, b) in enumerate(zip(decoded, expected)):
+                # float32 rounding of the input, and double rounding of
+                # the bin center, on top of the half step
+                assert abs(a - b) <= step[i & 1] * (0.5 + 1e-9) + abs(b) * 1e-7
+
+
+class TestHistogramMerge:
+    STRIPES = [(0, 10), (10, 17), (17, 30)]
+
+    def _stripes(self, sweep, tmp_path, **hist):
+        spec = grid_spec(histogram=True, hist_width=64, hist_height=64, **hist)
+        full = tmp_path / "full.hist"
+        run_sweep(sweep, spec, full)
+        parts = []
+        for s, (start, end) in enumerate(self.STRIPES):
+            parts.append(tmp_path / f"stripe_{s}.hist")
+            run_sweep(sweep, {**spec, "i1_start": start, "i1_end": end}, parts[-1])
+        return full, parts
+
+    def test_auto_stripes_sum_to_full(self, sweep, tmp_path):
+        """Auto-expanding stripe histograms fold and add up to the full grid's."""
+        full, parts = self._stripes(sweep, tmp_path, hist_range=0.25)
+        full_hdr, full_counts = read_hist(full)
+        assert full_hdr["doublings"] > 0
+        merged = [0] * len(full_counts)
+        for part in parts:
+            hdr, counts = read_hist(part)
+            fold_into(merged, hdr, counts, full_hdr["doublings"] - hdr["doublings"])
+        assert merged == full_counts
+        assert sum(merged) == full_hdr["counted"]
+
+    def test_fixed_bounds_clip_the_same(self, sweep, tmp_path):
+        """Fixed-bounds stripes count and clip exactly what the full grid does."""
+        full, parts = self._stripes(sweep, tmp_path, hist_bounds=[-1, 1, -1, 1])
+        full_hdr, full_counts = read_hist(full)
+        assert full_hdr["clipped"] > 0
+        hdrs, counts = zip(*(read_hist(p) for p in parts))
+        assert [sum(c) for c in zip(*counts)] == full_counts
+        assert sum(h["clipped"] for h in hdrs) == full_hdr["clipped"]
+
+    def test_imgpipe_hist_merge(self, sweep, imgpipe, tmp_path):
+        """imgpipe --hist-merge reproduces the full grid's file."""
+        full, parts = self._stripes(sweep, tmp_path, hist_range=0.25)
+        merged = tmp_path / "merged.hist"
+        subprocess.run([str(imgpipe), "--hist-merge", str(merged), *map(str, parts)],
+                       check=True, capture_output=True)
+        assert merged.read_bytes() == full.read_bytes()
+
+
+class TestExpr:
+    def test_giga_5_expr_matches_builtin(self, sweep, tmp_path):
+        """The giga_5 program in coeff_expr.h gives the built-in's roots."""
+        run_sweep(sweep, grid_spec(), tmp_path / "builtin.bin")
+        spec = grid_spec(expr=GIGA_5_EXPR)
+        del spec["function"]
+        meta = run_sweep(sweep, spec, tmp_path / "expr.bin")
+        assert meta["degree"] == 25
+        builtin = read_f32(tmp_path / "builtin.bin")
+        expr = read_f32(tmp_path / "expr.bin")
+        assert len(expr) == len(builtin)
+        assert max(abs(a - b) for a, b in zip(expr, builtin)) < 1e-5
+
+
+class TestGridModes:
+    @pytest.mark.parametrize("extra", [{"simd": True}, {"threads": 3},
+                                       {"simd": True, "threads": 3}])
+    def test_same_roots_as_scalar(self, sweep, tmp_path, extra):
+        """SIMD lanes and threads change the warm-start chains, not the
+        root set of any grid point."""
+        run_sweep(sweep, grid_spec(), tmp_path / "scalar.bin")
+        run_sweep(sweep, grid_spec(**extra), tmp_path / "grid.bin")
+        scalar = read_f32(tmp_path / "scalar.bin")
+        grid = read_f32(tmp_path / "grid.bin")
+        assert len(grid) == len(scalar) == 30 * 40 * 25 * 2
+        for s in range(0, len(scalar), 50):
+            expected = [complex(*scalar[i:i + 2]) for i in range(s, s + 50, 2)]
+            roots = [complex(*grid[i:i + 2]) for i in range(s, s + 50, 2)]
+            for z in expected:
+                assert min(abs(z - w) for w in roots) <= 1e-5 * max(1, abs(z))
+
+    def test_refine_rejects_simd(self, sweep, tmp_path):
+        result = subprocess.run([str(sweep), str(tmp_path / "out.bin")],
+                                input=json.dumps(grid_spec(refine=0.5, simd=True)),
+                                capture_output=True, text=True)
+        assert result.returncode != 0
+        assert "simd" in result.stderr
+
+
+class TestFusedRender:
+    VIEW = {"width": 200, "height": 160, "scale": 40, "center_re": 0.1, "center_im": -0.2}
+
+    @pytest.mark.parametrize("color", [{"color": "rainbow"},
+                                       {"color": "constant", "constant_color": "ffa040"}])
+    def test_matches_roots2image(self, sweep, imgpipe, tmp_path, color):
+        """Render mode equals a grid followed by imgpipe --roots2image."""
+        meta = run_sweep(sweep, grid_spec(threads=2), tmp_path / "grid.bin")
+        v = self.VIEW
+        result = subprocess.run(
+            [str(imgpipe), "--roots2image", str(tmp_path / "grid.bin"),
+             str(tmp_path / "unfused.raw"), f"--width={v['width']}",
+             f"--height={v['height']}", f"--center_re={v['center_re']}",
+             f"--center_im={v['center_im']}", f"--scale={v['scale']}",
+             f"--degree={meta['degree']}", f"--color={color['color']}", "--match=none",
+             f"--constant_color={color.get('constant_color', 'ffffff')}"],
+            capture_output=True, text=True, check=True)
+        unfused = json.loads(result.stdout)
+        fused = run_sweep(sweep, grid_spec(mode="render", threads=2, **v, **color),
+                          tmp_path / "fused.raw")
+        assert fused["roots_plotted"] == unfused["roots_plotted"] > 0
+        assert fused["roots_clipped"] == unfused["roots_clipped"]
+        assert read_raw(tmp_path / "fused.raw") == read_raw(tmp_path / "unfused.raw")
+
+
+class TestRefine:
+    def test_refined_grid_keeps_coarse_roots(self, sweep, tmp_path):
+        """A refined grid writes every coarse cell's roots, plus extra steps
+        between cells of a row, and counts them in its metadata."""
+        n1, n2 = 20, 60
+        run_sweep(sweep, grid_spec(n1=n1, n2=n2), tmp_path / "coarse.bin")
+        meta = run_sweep(sweep, grid_spec(n1=n1, n2=n2, refine=0.5),
+                         tmp_path / "refined.bin")
+        coarse = read_f32(tmp_path / "coarse.bin")
+        refined = read_f32(tmp_path / "refined.bin")
+        pos = array.array("d")
+        pos.frombytes((tmp_path / "refined.bin.pos").read_bytes())
+
+        step_len = meta["degree"] * 2
+        assert meta["steps"] == len(refined) // step_len == len(pos) // 2 > n1 * n2
+        # Every discarded trial step pushes one midpoint, which is later
+        # accepted: steps = cells + discards, solves = steps + discards
+        assert meta["solves"] == 2 * meta["steps"] - n1 * n2
+        assert meta["data_bytes"] == len(refined) * 4
+
+        cells = {}
+        for k in range(meta["steps"]):
+            x1, x2 = pos[2 * k], pos[2 * k + 1]
+            i, j = round(x1 * n1), round(x2 * n2)
+            assert abs(x1 * n1 - i) < 1e-9
+            if abs(x2 * n2 - j) < 1e-9:
+                cells[i, j] = refined[k * step_len:(k + 1) * step_len]
+        assert sorted(cells) == [(i, j) for i in range(n1) for j in range(n2)]
+        for (i, j), roots in cells.items():
+            # Rows are written in solve order, and odd rows run backward
+            start = (i * n2 + (n2 - 1 - j if i & 1 else j)) * step_len
+            expected = coarse[start:start + step_len]
+            for z in (complex(*expected[r:r + 2]) for r in range(0, step_len, 2)):
+                assert min(abs(z - complex(*roots[r:r + 2]))
+                           for r in range(0, step_len, 2)) <= 1e-5 * max(1, abs(z))
+
+
+class TestTiledCanvas:
+    VIEW = {"width": 300, "height": 250, "scale": 40, "center_re": 0, "center_im": 0}
+
+    @pytest.mark.parametrize("resident", [0, 1])
+    def test_tile_parts_stitch_to_full_frame(self, sweep, tmp_path, resident):
+        """Tile parts, added and stitched, equal the full-frame render, also
+        when a single resident tile forces tiles out in several parts."""
+        spec = grid_spec(mode="render", n1=200, n2=200, threads=3, **self.VIEW)
+        run_sweep(sweep, spec, tmp_path / "full.raw")
+        meta, parts = run_tiled([sweep, tmp_path / "tiled.raw"],
+                                {**spec, "tile": 64, "resident_tiles": resident})
+
+        assert meta["resident_tiles"] == (resident or meta["tiles_x"] * meta["tiles_y"])
+        assert sum(t[2] for t in meta["tiles"]) == meta["roots_plotted"]
+        assert sorted(p["tile"] for p in parts) == sorted(
+            [tx, ty, k] for tx, ty, _, n in meta["tiles"] for k in range(n))
+        if resident == 1:
+            assert max(t[3] for t in meta["tiles"]) > 1
+        assert sorted(tmp_path.glob("tiled_*.raw")) == sorted(Path(p["path"]) for p in parts)
+        _, _, _, full = read_raw(tmp_path / "full.raw")
+        assert stitch(parts, 300, 250, 64) == full
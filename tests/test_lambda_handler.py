@@ -0,0 +1,362 @@
+"""Tests for the Lambda render coordinator (polypaint/lambda/handler.py),
+with S3 and the worker invocations replaced by in-memory fakes."""
+
+import io
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("boto3")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, str(Path(__file__).parent.parent / "polypaint" / "lambda"))
+
+import handler  # noqa: E402
+
+
+class FakeS3:
+    """The subset of the S3 client handler.py uses, over a dict."""
+
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        with self.lock:
+            self.objects[Key] = Body.encode() if isinstance(Body, str) else Body
+
+    def get_object(self, Bucket, Key):
+        with self.lock:
+            if Key not in self.objects:
+                raise handler.ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            return {"Body": io.BytesIO(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        with self.lock:
+            if Key not in self.objects:
+                raise handler.ClientError({"Error": {"Code": "404"}}, "HeadObject")
+            return {"ContentLength": len(self.objects[Key])}
+
+    def delete_objects(self, Bucket, Delete):
+        with self.lock:
+            for o in Delete["Objects"]:
+                self.objects.pop(o["Key"], None)
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        with self.lock:
+            return {"Contents": [{"Key": k} for k in sorted(self.objects)
+                                 if k.startswith(Prefix)]}
+
+    def json(self, key):
+        return json.loads(self.objects[key])
+
+
+class FakeLambda:
+    """Runs each invocation synchronously through `worker(route, body)`,
+    which returns the worker's result dict or raises."""
+
+    class exceptions:
+        TooManyRequestsException = type("TooManyRequestsException", (Exception,), {})
+
+    def __init__(self):
+        self.worker = None
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        event = json.loads(Payload)
+        body = json.loads(event["body"])
+        with self.lock:
+            self.calls.append((event["rawPath"], body))
+        result = self.worker(event["rawPath"], body)
+        return {"Payload": io.BytesIO(json.dumps(
+            {"statusCode": 200, "body": json.dumps(result)}).encode())}
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """(fake s3, fake lambda client) patched into handler, without retry
+    backoff."""
+    s3, lam = FakeS3(), FakeLambda()
+    monkeypatch.setattr(handler, "s3", s3)
+    monkeypatch.setattr(handler, "lambda_client", lam)
+    monkeypatch.setattr(handler, "RETRY_BASE_S", 0)
+    return s3, lam
+
+
+def wait_for(cond, timeout=10):
+    deadline = time.time() + timeout
+    while not cond():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestInvokeWorker:
+    def test_retries_stop_at_max_attempts(self, aws):
+        """A worker that keeps failing is invoked max_attempts times."""
+        _, lam = aws
+
+        def worker(route, body):
+            raise RuntimeError("stripe crashed")
+        lam.worker = worker
+        with pytest.raises(RuntimeError, match="stripe crashed"):
+            handler.invoke_worker("/compute-render-stripe", {}, max_attempts=3)
+        assert len(lam.calls) == 3
+
+    def test_retry_returns_first_success(self, aws):
+        """A failed attempt is retried; the first success is returned."""
+        _, lam = aws
+
+        def worker(route, body):
+            if len(lam.calls) < 2:
+                raise RuntimeError("transient")
+            return {"stripe_idx": 0}
+        lam.worker = worker
+        assert handler.invoke_worker("/compute-render-stripe", {},
+                                     max_attempts=3) == {"stripe_idx": 0}
+        assert len(lam.calls) == 2
+
+
+class TestHedging:
+    def test_winner_kept_and_loser_deleted(self, aws):
+        """A straggling stripe is hedged; the hedge's result becomes the
+        stripe's sidecar and the straggler's objects are deleted when it
+        finishes."""
+        s3, lam = aws
+        release, loser_wrote = threading.Event(), threading.Event()
+
+        def worker(route, body):
+            idx, copy = body["stripe_idx"], body.get("copy")
+            if idx == 3 and copy == 0:
+                release.wait(10)
+            key = f"renders/{body['job_id']}/stripe_{idx}{handler.copy_suffix(body)}.bin"
+            s3.put_object(Bucket=handler.BUCKET, Key=key, Body=b"roots")
+            if idx == 3 and copy == 0:
+                loser_wrote.set()
+            return {"stripe_idx": idx, "copy": copy, "key": key}
+        lam.worker = worker
+
+        results, stats, _ = handler.fan_out_stripes(
+            "j", 40, 4, {}, {"hedge": True, "hedge_multiplier": 1.5})
+        assert stats == {"hedges_fired": 1, "hedges_won": 1}
+        assert results[3]["copy"] == 1
+        assert s3.json("renders/j/stripe_3.json")["copy"] == 1
+
+        release.set()
+        assert loser_wrote.wait(10)
+        assert wait_for(lambda: "renders/j/stripe_3_c0.bin" not in s3.objects)
+        assert "renders/j/stripe_3_c1.bin" in s3.objects
+        assert sorted(k for k in s3.objects if k.endswith(".bin")) == [
+            f"renders/j/stripe_{i}_c{0 if i < 3 else 1}.bin" for i in range(4)]
+
+
+def render(route, **params):
+    """(status code, body) of a coordinator route."""
+    resp = handler.handler({"rawPath": route, "body": json.dumps(params)}, None)
+    return resp["statusCode"], json.loads(resp["body"])
+
+
+@pytest.fixture
+def viewport(monkeypatch):
+    """A fixed viewport, so renders need no lores_viewport binary."""
+    monkeypatch.setattr(handler, "compute_viewport",
+                        lambda *a: (0.0, 0.0, 1.0, 25, {"manual": True}))
+
+
+def stripe_worker(s3, fail=None, before_failing=lambda: True):
+    """Fake /compute-render-stripe and /reduce-pair workers writing
+    placeholder objects; stripe `fail` raises once before_failing() holds."""
+    def worker(route, body):
+        prefix = f"renders/{body['job_id']}/"
+        if route == "/reduce-pair":
+            s3.put_object(Bucket=handler.BUCKET, Key=body["out_key"], Body=b"merged")
+            return {"out_key": body["out_key"]}
+        idx = body["stripe_idx"]
+        if idx == fail:
+            wait_for(before_failing)
+            raise RuntimeError(f"stripe {idx} crashed")
+        meta = {"stripe_idx": idx, "rows": [body["i1_start"], body["i1_end"]],
+                "s3_key": f"{prefix}stripe_{idx}.raw"}
+        s3.put_object(Bucket=handler.BUCKET, Key=meta["s3_key"], Body=b"raw")
+        s3.put_object(Bucket=handler.BUCKET, Key=f"{prefix}stripe_{idx}.json",
+                      Body=json.dumps(meta))
+        return meta
+    return worker
+
+
+class TestPipelinedReduce:
+    def test_failed_fan_out_drops_merges(self, aws, viewport):
+        """When a stripe fails after merges have started, the merges stop
+        and their outputs are deleted; finished stripes stay for a resume."""
+        s3, lam = aws
+        merged = lambda: any("/merge" in k for k in list(s3.objects))  # noqa: E731
+        lam.worker = stripe_worker(s3, fail=5, before_failing=merged)
+
+        code, body = render("/render", job_id="j", n1=60, n2=10, width=64, height=64,
+                            n_stripes=6, stripes_per_worker=1, hedge=False,
+                            max_attempts=1, preview=False, trace=False)
+        assert code == 502 and body["resumable"] is True
+        assert any(route == "/reduce-pair" for route, _ in lam.calls)
+        assert not [k for k in s3.objects if "/merge" in k]
+        assert sorted(k for k in s3.objects if k.endswith(".json")) == [
+            "renders/j/plan.json", "renders/j/status.json",
+            *(f"renders/j/stripe_{i}.json" for i in range(5))]
+        assert s3.json("renders/j/status.json")["status"] == "failed"
+
+
+class TestSnapshot:
+    DOC = {
+        "degree": 2,
+        "coefficients": [{"pos": [1, 0], "pathType": "circle", "radius": 50, "speed": 2},
+                         [0, 1],
+                         {"pos": [-1, 0], "pathType": "spiral"}],
+        "roots": [[0.5, 0], [-0.5, 0]],
+        "bitmapColorMode": "custom-prox",
+        "bitmapCanvasColor": "#102030",
+        "numWorkers": 4,
+        "morph": {"cdPathType": "line"},
+    }
+
+    def test_snapshot_spec(self):
+        """A saved document becomes a steploop spec as the browser restores it."""
+        spec, canvas, workers = handler.snapshot_spec(self.DOC, 500, 320, 240)
+        assert (canvas, workers) == ("102030", 4)
+        assert spec["mode"] == "steploop" and spec["n_t"] == 500
+        assert spec["coefficients"] == [[1, 0], [0, 1], [-1, 0]]
+        assert spec["morph_targets"] == spec["coefficients"]
+        assert spec["morph_path"] == "line"
+        # Legacy percentage radius against the 2-unit extent; old spiral name
+        circle, spiral = spec["animations"]
+        assert circle == {"coeff_index": 0, "path": "circle", "radius": 1.0, "angle": 0,
+                          "speed": 2, "ccw": False, "points": 500}
+        assert (spiral["coeff_index"], spiral["path"], spiral["radius"]) == (2, "o-spiral", 0.5)
+        assert spec["color"] == "proximity"
+        assert spec["roots"] == [[0.5, 0], [-0.5, 0]]
+
+    @pytest.mark.parametrize("change", [{"bitmapColorMode": "ratio"},
+                                        {"morph": {"cdPathType": "zigzag"}},
+                                        {"coefficients": None}])
+    def test_snapshot_spec_rejects(self, change):
+        """Snapshots the native step loop cannot replay raise ValueError."""
+        with pytest.raises(ValueError):
+            handler.snapshot_spec({**self.DOC, **change}, 500, 320, 240)
+
+    def test_failed_pass_deletes_its_stripes(self, aws):
+        """A failed pass deletes the earlier passes' stripes and its own,
+        including those that finish after the failure."""
+        s3, lam = aws
+        failed = threading.Event()
+
+        def worker(route, body):
+            pass_, stripe = body["out_key"].rsplit("/", 1)[-1][:-4].split("_")[1::2]
+            if (pass_, stripe) == ("1", "2"):
+                failed.set()
+                raise RuntimeError("steploop crashed")
+            if pass_ == "1":
+                failed.wait(10)
+                time.sleep(0.05)
+            s3.put_object(Bucket=handler.BUCKET, Key=body["out_key"], Body=b"rgba")
+            return {"out_key": body["out_key"], "painted": 1, "avg_iterations": 1,
+                    "elapsed_us": 1, "roots": [[0.5, 0], [-0.5, 0]]}
+        lam.worker = worker
+
+        code, body = render("/render-snapshot", job_id="s", snapshot=self.DOC, steps=30,
+                            width=32, passes=2, n_stripes=3, max_attempts=1, trace=False)
+        assert code == 502 and "pass 1" in body["error"]
+        assert len(lam.calls) == 6
+        assert not s3.objects
+
+
+class TestVariants:
+    def test_too_many_variants_rejected(self, aws, viewport):
+        """Lists over MAX_VARIANTS are rejected, not truncated."""
+        _, lam = aws
+        code, body = render("/render", job_id="v", n_stripes=2, trace=False,
+                            variants=[{}] * (handler.MAX_VARIANTS + 1))
+        assert code == 400 and str(handler.MAX_VARIANTS) in body["error"]
+        assert not lam.calls
+
+    def test_gamma_needs_several_stripes(self, aws, viewport):
+        """Gamma only blends stripes, so a single stripe rejects it."""
+        _, lam = aws
+        code, body = render("/render", job_id="v", n1=10, n2=10, n_stripes=1, trace=False,
+                            variants=[{"color": "index"}, {"gamma": 1.0}])
+        assert code == 400 and "gamma" in body["error"]
+        assert not lam.calls
+
+    def test_each_variant_reduces_with_its_gamma(self, aws, viewport):
+        """Each variant's stripes blend with that variant's gamma."""
+        _, lam = aws
+
+        def worker(route, body):
+            if route == "/reduce-pair":
+                return {"out_key": body["out_key"]}
+            if route == "/encode-upload":
+                return {"image_url": body["out_key"], "file_size": 1}
+            prefix = f"renders/{body['job_id']}/"
+            idx = body["stripe_idx"]
+            views = [{"s3_key": f"{prefix}stripe_{idx}_v{k}.raw", "roots_plotted": 1}
+                     for k in range(len(body["views"]))]
+            return {"stripe_idx": idx, "views": views, "n_t": 1, "avg_iterations": 1,
+                    "compute_us": 1, "render_us": 1}
+        lam.worker = worker
+
+        code, body = render("/render", job_id="v", n1=10, n2=10, n_stripes=2,
+                            hedge=False, trace=False, gamma=2.0,
+                            variants=[{}, {"gamma": 1.0, "format": "png"}])
+        assert code == 200
+        assert [v["gamma"] for v in body["variants"]] == [2.0, 1.0]
+        reduces = sorted((b["out_key"], b["gamma"]) for r, b in lam.calls if r == "/reduce-pair")
+        assert reduces == [("renders/v/merge_v0_0_0.raw", 2.0),
+                           ("renders/v/merge_v1_0_0.raw", 1.0)]
+
+
+class TestPlanner:
+    @pytest.fixture
+    def history(self, monkeypatch):
+        records = []
+        monkeypatch.setattr(handler, "load_history", lambda: records)
+        return records
+
+    def test_heuristic_reports_unapplied_budget(self, history):
+        """Without history the budget cannot be priced, and the plan says so."""
+        plan = handler.plan_render("giga_5", 300, 300, 1024, 1024, 25, cost_budget_s=5)
+        assert plan["source"] == "heuristic" and plan["n_stripes"] == 2
+        assert plan["budget_applied"] is False and plan["cost_budget_s"] == 5
+        assert "budget_applied" not in handler.plan_render("giga_5", 300, 300, 1024, 1024, 25)
+
+    def test_history_plan_stays_in_clamped_range(self, history):
+        """With few records, candidates stay within the clamp factor of the
+        heuristic count."""
+        history.extend({"function": "giga_5", "degree": 25, "cells": 90000, "n_stripes": 2,
+                        "mpix": 1.0, "total_compute_us": 2e6, "total_render_us": 1e5,
+                        "compute_wall_us": 1.5e6, "reduce_us": 1e5, "reduce_rounds": 1,
+                        "encode_us": 5e4} for _ in range(handler.PLANNER_MIN_RECORDS))
+        plan = handler.plan_render("giga_5", 300, 300, 1024, 1024, 25)
+        assert plan["source"] == "history"
+        assert plan["stripe_range"] == [2, 2 * handler.PLANNER_CLAMP_FACTOR]
+        assert 2 <= plan["n_stripes"] <= 2 * handler.PLANNER_CLAMP_FACTOR
+
+
+class TestBatching:
+    def test_batches_cover_every_stripe(self, aws):
+        """Consecutive stripes group into batches; the last may be short."""
+        _, lam = aws
+
+        def worker(route, body):
+            assert route == "/compute-render-batch"
+            return {"batch_idx": body["batch_idx"], "stripes": body["stripes"]}
+        lam.worker = worker
+
+        results, _, _ = handler.fan_out_stripes("b", 70, 7, {}, {"hedge": False},
+                                                per_worker=3)
+        assert [r["batch_idx"] for r in results] == [0, 1, 2]
+        assert [s for r in results for s in r["stripes"]] == [
+            [s, s * 10, s * 10 + 10] for s in range(7)]
+        assert [len(r["stripes"]) for r in results] == [3, 3, 1]